@@ -0,0 +1,127 @@
+# bench/bench_adaptive_diagnostic.py
+"""
+Benchmark: adaptive diagnostic (AssessmentAgent.start_adaptive / submit_many) vs a fixed
+test form, with simulated learners (true ability ~ N(0, 1)) answering the item bank's
+items with the 2PL probabilities of its own parameters.
+
+  precision   ability error and standard error after n questions, fixed form (items at
+              evenly spaced difficulties, as a linear test would be built) vs adaptive,
+              and how many questions each needs to reach the SE target
+  throughput  a class of concurrent sessions answering question by question: one submit()
+              per learner vs one submit_many() per round (one grade_batch call and one
+              vectorized ability update for the whole class)
+
+Run from the adaptive-coach folder:  python bench/bench_adaptive_diagnostic.py [learners] [se_target]
+"""
+import os
+import random
+import re
+import statistics
+from fractions import Fraction
+
+import harness
+
+from tools.persistence import ConnectionPool
+from tools.item_bank import (ability_prior, configure_item_bank, estimate_ability, get_item_bank,
+                             probability, update_ability)
+from agents.assessment_agent import CAT_SE_TARGET, AssessmentAgent
+
+MAX_ITEMS = 20
+
+
+def solve(equation: str) -> str:
+    a, b, c = map(int, re.match(r"(-?\d+)\*x \+ \(?(-?\d+)\)? = (-?\d+)", equation).groups())
+    return str(float(Fraction(c - b, a)))
+
+
+def answer(rng: random.Random, theta: float, item) -> str:
+    eq = item["expected_expr"]
+    params = item["params"]
+    return solve(eq) if rng.random() < probability(theta, params["difficulty"], params["discrimination"]) else "999"
+
+
+def fixed_form(thetas, rng: random.Random):
+    """SE and error per test length for a linear form of MAX_ITEMS items at evenly spaced difficulties."""
+    bank = get_item_bank()
+    form = [bank.select(-2.5 + 5.0 * i / (MAX_ITEMS - 1))[0] for i in range(MAX_ITEMS)]
+    rng.shuffle(form)
+    log_post = ability_prior(0.0, 1.0, len(thetas))
+    history = []
+    for item in form:
+        correct = [rng.random() < probability(t, item["difficulty"], item["discrimination"]) for t in thetas]
+        log_post = update_ability(log_post, [item["difficulty"]] * len(thetas),
+                                  [item["discrimination"]] * len(thetas), correct)
+        history.append(estimate_ability(log_post))
+    return history
+
+
+def adaptive(agent: AssessmentAgent, thetas, rng: random.Random, se_target: float, batched: bool = True):
+    """Run every learner's session to the end; per-round estimates and the wall time of the submits."""
+    bank = get_item_bank()
+    pending = {}
+    for i, theta in enumerate(thetas):
+        q = agent.start_adaptive(f"learner_{i:05d}", max_items=MAX_ITEMS, se_target=se_target)
+        pending[q["session_id"]] = (i, q)
+    estimates = [[] for _ in thetas]
+    wall = 0.0
+    while pending:
+        answers = {}
+        for session_id, (i, q) in pending.items():
+            q["params"] = bank.parameters([q["expected_expr"]])[q["expected_expr"]]
+            answers[session_id] = answer(rng, thetas[i], q)
+        with harness.Timer() as t:
+            if batched:
+                out = agent.submit_many(answers)
+            else:
+                out = {session_id: agent.submit(session_id, text) for session_id, text in answers.items()}
+        wall += t.seconds
+        for session_id, r in out.items():
+            i, _ = pending.pop(session_id)
+            estimates[i].append((r["ability"], r["ability_se"]))
+            if not r["done"]:
+                pending[session_id] = (i, r["next_item"])
+    return estimates, wall
+
+
+def main():
+    learners, se_target = harness.args(("learners", int, 500), ("se_target", float, CAT_SE_TARGET))
+    harness.quiet()
+    tmp = harness.scratch()
+    configure_item_bank(os.path.join(tmp, "items.db"))
+    conn = ConnectionPool(os.path.join(tmp, "diagnostic.db"), size=2)
+    agent = AssessmentAgent(conn=conn)
+    rng = random.Random(21)
+    thetas = [rng.gauss(0.0, 1.0) for _ in range(learners)]
+
+    fixed = fixed_form(thetas, rng)
+    estimates, _ = adaptive(agent, thetas, rng, se_target=0.0)  # full length, for the curves
+
+    print(f"{learners} learners, item bank: {get_item_bank().stats()['items']} items")
+    print(f"{'questions':>9} {'fixed RMSE':>11} {'fixed SE':>9} {'adaptive RMSE':>14} {'adaptive SE':>12}")
+    for n in (3, 6, 9, 12, 15, 20):
+        f_theta, f_se = fixed[n - 1]
+        f_rmse = statistics.fmean((t - e) ** 2 for t, e in zip(thetas, f_theta.tolist())) ** 0.5
+        a_rmse = statistics.fmean((t - e[n - 1][0]) ** 2 for t, e in zip(thetas, estimates)) ** 0.5
+        print(f"{n:>9} {f_rmse:>11.3f} {f_se.mean():>9.3f} {a_rmse:>14.3f} "
+              f"{statistics.fmean(e[n - 1][1] for e in estimates):>12.3f}")
+    needed_fixed = [next((n + 1 for n, (_, se) in enumerate(fixed) if se[i] <= se_target), None)
+                    for i in range(learners)]
+    needed_adaptive = [next((n + 1 for n, (_, se) in enumerate(e) if se <= se_target), None) for e in estimates]
+    reached = lambda needed: [n for n in needed if n is not None]
+    print(f"Questions to SE <= {se_target}: fixed {statistics.fmean(reached(needed_fixed) or [0]):.1f} "
+          f"({len(reached(needed_fixed))}/{learners} reach it in {MAX_ITEMS}), "
+          f"adaptive {statistics.fmean(reached(needed_adaptive) or [0]):.1f} "
+          f"({len(reached(needed_adaptive))}/{learners})")
+
+    # throughput: the same class with the default stopping rule, per-learner vs batched submits
+    n = min(learners, 200)
+    _, serial_wall = adaptive(agent, thetas[:n], random.Random(3), se_target, batched=False)
+    estimates, batched_wall = adaptive(agent, thetas[:n], random.Random(3), se_target, batched=True)
+    answers = sum(len(e) for e in estimates)
+    print(f"{'submits':<26} {'answers':>8} {'wall s':>7} {'answers/s':>10}")
+    print(f"{'submit() per learner':<26} {answers:>8} {serial_wall:>7.2f} {answers / serial_wall:>10.0f}")
+    print(f"{'submit_many() per round':<26} {answers:>8} {batched_wall:>7.2f} {answers / batched_wall:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench/bench_codec.py
+"""
+Benchmark: memory row codecs (size, encode time, decode time) across history lengths.
+
+One learning session is recorded by running the same flow as smoke_feedback.py
+(diagnostic -> lesson -> quiz -> grading -> feedback) against an in-memory database.
+Learners with 1..N sessions are then built from independent copies of that session,
+with scores varied so entries are not byte-identical.
+Run from the adaptive-coach folder:  python bench/bench_codec.py [max_sessions]
+"""
+import copy
+import time
+
+import harness
+
+from tools import persistence
+from tools.persistence import CODECS, decode_memory, encode_memory, init_db, load_memory
+from agents.assessment_agent import AssessmentAgent
+from agents.lesson_agent import LessonAgent
+from agents.quiz_agent import QuizAgent
+from agents.feedback_agent import FeedbackAgent
+
+
+def record_session() -> dict:
+    conn = init_db(":memory:")
+    user_id = "bench_codec"
+    assessment = AssessmentAgent(conn=conn).run_diagnostic(user_id, ["4", "3", "0"])
+    lesson = LessonAgent(conn=conn).plan(user_id, [assessment])
+    quiz_agent = QuizAgent(conn=conn)
+    quiz = quiz_agent.generate_quiz(user_id, lesson)
+    graded = quiz_agent.grade_quiz(user_id, quiz, ["4", "3", "0"])
+    FeedbackAgent(conn=conn).provide_feedback(user_id, graded)
+    return load_memory(conn, user_id).copy()
+
+
+def learner(session: dict, sessions: int) -> dict:
+    memory = {k: copy.deepcopy(v) for k, v in session.items() if k not in persistence.HISTORY_KEYS}
+    memory["name"] = "Bench Student"
+    for key in persistence.HISTORY_KEYS:
+        entries = []
+        for i in range(sessions):
+            for entry in session.get(key, []):
+                entry = copy.deepcopy(entry)
+                if "score_percent" in entry:
+                    entry["score_percent"] = (entry["score_percent"] + i) % 101
+                entries.append(entry)
+        memory[key] = entries
+    return memory
+
+
+def timed(fn, arg, min_seconds: float = 0.2) -> float:
+    """Mean microseconds per call."""
+    runs, start = 0, time.perf_counter()
+    while True:
+        fn(arg)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / runs * 1e6
+
+
+def main():
+    max_sessions = harness.args(("max_sessions", int, 200))
+    harness.quiet()
+    session = record_session()
+
+    lengths = [n for n in (1, 10, 50, 200, 1000) if n <= max_sessions]
+    print(f"{'sessions':>8}  {'codec':<13} {'bytes':>10} {'encode us':>11} {'decode us':>11}")
+    for n in lengths:
+        memory = learner(session, n)
+        baseline = None
+        for codec in CODECS:
+            data = encode_memory(memory, codec)
+            assert decode_memory(data) == memory
+            size = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+            enc = timed(lambda m: encode_memory(m, codec), memory)
+            dec = timed(decode_memory, data)
+            baseline = baseline or (size, enc, dec)
+            print(f"{n:>8}  {codec:<13} {size:>10} {enc:>11.1f} {dec:>11.1f}"
+                  f"   ({size / baseline[0]:.2f}x size, {baseline[1] / enc:.1f}x enc, {baseline[2] / dec:.1f}x dec)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench/bench_cohort.py
+"""
+Benchmark: cohort analytics over the learner_summary table vs decoding every memory blob.
+
+Populates a temporary database with N learners (default 100k), backfills their
+summaries and times the eval/cohort.py queries.
+Run from the adaptive-coach folder:  python bench/bench_cohort.py [learners]
+"""
+import json
+import os
+import random
+
+import harness
+
+from tools.persistence import _UPSERT_MEMORY_SQL, init_db, rebuild_summaries, save_memory
+from eval.cohort import at_risk, cohort_overview, histogram, percentiles
+from bench_persistence import sample_memory
+
+
+def populate(conn, learners: int):
+    rng = random.Random(7)
+    memory = sample_memory(sessions=3)
+    rows = []
+    for u in range(learners):
+        pre = rng.randint(0, 100)
+        memory["diagnostics"][-1] = {"score_percent": pre, "per_question": [], "total_questions": 3}
+        memory["last_quiz"] = {"answers": {"score_percent": min(100, pre + rng.randint(-20, 40))}}
+        memory["topic_mastery"]["linear_equations"] = rng.randint(0, 100)
+        rows.append((f"learner_{u}", json.dumps(memory), "2025-01-01 00:00:00.000000"))
+    conn.executemany(_UPSERT_MEMORY_SQL, rows)
+    conn.commit()
+
+
+def timed(label: str, fn, repeat: int = 5):
+    with harness.Timer() as t:
+        for _ in range(repeat):
+            result = fn()
+    ms = t.seconds / repeat * 1000
+    print(f"{label:<28} {ms:9.2f} ms")
+    return result
+
+
+def full_scan(conn):
+    """What the same overview costs without the summary table."""
+    masteries = []
+    for (data,) in conn.execute("SELECT data FROM memory"):
+        m = json.loads(data).get("topic_mastery", {}).get("linear_equations")
+        if m is not None:
+            masteries.append(m)
+    return sum(masteries) / len(masteries)
+
+
+def main():
+    learners = harness.args(("learners", int, 100_000))
+    harness.quiet()
+
+    conn = init_db(os.path.join(harness.scratch(), "cohort.db"))
+    populate(conn, learners)
+    with harness.Timer() as t:
+        rebuild_summaries(conn)
+    print(f"Learners: {learners} (summary backfill {t.seconds:.2f}s)")
+
+    overview = timed("cohort_overview", lambda: cohort_overview(conn))
+    timed("histogram(mastery)", lambda: histogram(conn, "mastery"))
+    timed("percentiles(mastery)", lambda: percentiles(conn, "mastery"))
+    timed("percentiles(delta)", lambda: percentiles(conn, "delta"))
+    timed("at_risk(limit=50)", lambda: at_risk(conn, 30))
+    avg = timed("full scan + json.loads", lambda: full_scan(conn), repeat=1)
+    assert abs(avg - overview["avg_mastery"]) < 0.1
+
+    # cost the summary adds to a single save
+    memory = sample_memory()
+    timed("save_memory (with summary)", lambda: save_memory(conn, "learner_0", memory), repeat=200)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
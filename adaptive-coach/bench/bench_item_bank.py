@@ -0,0 +1,95 @@
+# bench/bench_item_bank.py
+"""
+Benchmark: the IRT item bank (tools.item_bank).
+
+  select      most informative item at a random theta from a 1M-item bank: the difficulty
+              index (ItemBank.select) vs scoring every item with numpy
+  recalibrate simulated learners (true abilities, true item parameters) answer quizzes that
+              are stored like QuizAgent stores them; recalibrate() fits the bank from storage.
+              Reports fit time and the difficulty/discrimination error before and after.
+
+Run from the adaptive-coach folder:  python bench/bench_item_bank.py [items] [learners] [answers_per_learner]
+"""
+import os
+import random
+
+import numpy as np
+
+import harness
+
+from tools.persistence import ConnectionPool, save_memory
+from tools.item_bank import ItemBank, QUESTION_PREFIX, probability
+from tools.problem_bank import get_problem_bank
+
+
+def bench_select(path: str, n_items: int, rounds: int = 2000):
+    rng = np.random.default_rng(5)
+    difficulty = rng.normal(0.0, 1.5, n_items)
+    discrimination = rng.lognormal(0.0, 0.4, n_items)
+    bank = ItemBank(path, seed=False)
+    with harness.Timer() as t:
+        bank.add_items((f"synthetic_{i:07d}", i % 16, float(b), float(a))
+                       for i, (b, a) in enumerate(zip(difficulty.tolist(), discrimination.tolist())))
+    print(f"Build: {n_items} items in {t.seconds:.1f}s, {os.path.getsize(path) / 1e6:.0f} MB")
+
+    thetas = rng.normal(0.0, 1.5, rounds).tolist()
+    with harness.Timer() as t:
+        picked = [bank.select(theta)[0] for theta in thetas]
+    indexed = t.seconds / rounds
+    best = []
+    with harness.Timer() as t:
+        for theta in thetas[:50]:
+            p = 1.0 / (1.0 + np.exp(-discrimination * (theta - difficulty)))
+            best.append(float((discrimination ** 2 * p * (1 - p)).max()))
+    scan = t.seconds / 50
+    # how close the windowed pick is to the exact maximum over the whole bank
+    ratio = min(item["information"] / exact for item, exact in zip(picked, best))
+    print(f"{'select':<28} {'ms/call':>9} {'speedup':>8}")
+    print(f"{'numpy scan of every item':<28} {scan * 1e3:>9.3f} {'1x':>8}")
+    print(f"{'difficulty index':<28} {indexed * 1e3:>9.3f} {scan / indexed:>7.0f}x")
+    print(f"Windowed pick vs exact maximum information: worst {ratio:.3f}")
+
+
+def bench_recalibrate(tmp: str, learners: int, per_learner: int, pool_items: int = 300):
+    rnd = random.Random(7)
+    bank = ItemBank(os.path.join(tmp, "calibration_items.db"))
+    equations = rnd.sample([eq for a, b, c, eq, mask in get_problem_bank().rows()], pool_items)
+    items = [dict(params, equation=eq) for eq, params in bank.parameters(equations).items()]
+    # true parameters: the prior is off by N(0, 0.7), discrimination varies around 1
+    truth = {it["equation"]: (it["difficulty"] + rnd.gauss(0, 0.7), rnd.lognormvariate(0, 0.3)) for it in items}
+    prior_error = np.sqrt(np.mean([(it["difficulty"] - truth[it["equation"]][0]) ** 2 for it in items]))
+
+    conn = ConnectionPool(os.path.join(tmp, "calibration_memory.db"), size=2)
+    for u in range(learners):
+        theta = rnd.gauss(0.5, 1.0)
+        quizzes = []
+        for i in range(0, per_learner, 3):
+            per_q = []
+            for q_index, it in enumerate(rnd.sample(items, min(3, per_learner - i))):
+                b, a = truth[it["equation"]]
+                per_q.append({"q_index": q_index, "question": QUESTION_PREFIX + it["equation"],
+                              "correct": rnd.random() < probability(theta, b, a)})
+            quizzes.append({"quiz_meta": {}, "answers": {"per_question": per_q}})
+        save_memory(conn, f"learner_{u:05d}", {"quizzes": quizzes})
+
+    summary = bank.recalibrate(conn)
+    fitted = bank.parameters(truth)
+    b_error = np.sqrt(np.mean([(fitted[eq]["difficulty"] - b) ** 2 for eq, (b, a) in truth.items()]))
+    a_error = np.sqrt(np.mean([(np.log(fitted[eq]["discrimination"]) - np.log(a)) ** 2 for eq, (b, a) in truth.items()]))
+    print(f"Recalibrate: {summary}")
+    print(f"Difficulty RMSE: prior {prior_error:.2f} -> fitted {b_error:.2f}; "
+          f"log-discrimination RMSE: prior {np.sqrt(np.mean([np.log(a) ** 2 for b, a in truth.values()])):.2f} "
+          f"-> fitted {a_error:.2f}")
+
+
+def main():
+    n_items, learners, per_learner = harness.args(
+        ("items", int, 1_000_000), ("learners", int, 2000), ("answers_per_learner", int, 30))
+    harness.quiet()
+    tmp = harness.scratch()
+    bench_select(os.path.join(tmp, "items_1m.db"), n_items)
+    bench_recalibrate(tmp, learners, per_learner)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench/bench_lesson_cache.py
+"""
+Benchmark: lesson planning for a class with a (simulated, slow) llm_hook, with the
+cross-user lesson template cache disabled vs enabled. Reports LLM calls and wall time:
+without the cache both grow with the number of learners, with it they are bounded by
+the number of (tier, learning_style, difficulty_curve) combinations.
+Run from the adaptive-coach folder:  python bench/bench_lesson_cache.py [learners] [threads] [llm_ms]
+"""
+import os
+import random
+import threading
+import time
+
+import harness
+
+from tools.persistence import ConnectionPool
+from tools.llm import CallableBackend, LLMExecutor
+from agents.lesson_agent import LessonAgent, configure_lesson_cache
+
+
+def run_class(conn, learners: int, threads: int, llm_seconds: float) -> int:
+    calls = []
+
+    def llm_hook(text: str) -> str:
+        calls.append(text)
+        time.sleep(llm_seconds)
+        return f"Expanded: {text}"
+
+    rng = random.Random(11)
+    work = [(f"learner_{i:05d}", rng.randint(0, 100), rng.choice(["textual", "visual", "step-by-step"]),
+             rng.choice(["easy", "normal", "hard"])) for i in range(learners)]
+    lock, cursor = threading.Lock(), iter(work)
+
+    # without tools.llm's own response cache, so only the template cache saves calls
+    llm = LLMExecutor(CallableBackend(llm_hook), cache_size=0)
+
+    def worker():
+        agent = LessonAgent(conn=conn, llm=llm)
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            user_id, score, style, curve = item
+            agent.plan(user_id, [{"score_percent": score}], {"learning_style": style, "difficulty_curve": curve})
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return len(calls)
+
+
+def main():
+    learners, threads, llm_ms = harness.args(("learners", int, 300), ("threads", int, 8), ("llm_ms", float, 50))
+    llm_seconds = llm_ms / 1e3
+    harness.quiet()
+
+    tmp = harness.scratch()
+    print(f"{'template cache':<16} {'learners':>9} {'llm calls':>10} {'wall s':>8} {'lessons/s':>10}")
+    for label, size in (("off", 0), ("on", 256)):
+        cache = configure_lesson_cache(max_entries=size)
+        conn = ConnectionPool(os.path.join(tmp, f"lessons_{label}.db"), size=threads)
+        with harness.Timer() as t:
+            calls = run_class(conn, learners, threads, llm_seconds)
+        print(f"{label:<16} {learners:>9} {calls:>10} {t.seconds:>8.2f} {harness.rate(learners, t.seconds):>10.0f}")
+    print("Template cache:", cache.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# bench/bench_persistence.py
+"""
+Benchmark: saves/sec of the synchronous save_memory path vs write-behind mode.
+
+Each simulated learner repeatedly saves a memory document shaped like the
+smoke scripts' learners (a few diagnostics, lessons, quizzes and feedbacks).
+Run from the adaptive-coach folder:  python bench/bench_persistence.py [users] [saves_per_user]
+"""
+import os
+
+import harness
+
+from tools.persistence import init_db, save_memory, load_memory, enable_write_behind, disable_write_behind, flush
+
+
+def sample_memory(sessions: int = 5):
+    quiz = {
+        "quiz_meta": {
+            "user_id": "bench",
+            "created_at": "2025-11-28T19:07:15.660016Z",
+            "questions": [{"q": "Solve for x: 2*x + 3 = 11", "expected_expr": "2*x + 3 = 11"}] * 3,
+        },
+        "answers": {"score_percent": 66, "per_question": [{"q_index": i, "correct": i != 2} for i in range(3)]},
+    }
+    return {
+        "name": "Bench Student",
+        "topic_mastery": {"linear_equations": 50},
+        "preferences": {"learning_style": "textual", "difficulty_curve": "normal"},
+        "diagnostics": [{"score_percent": 33, "per_question": [], "total_questions": 3}] * sessions,
+        "lessons": [{"topic": "linear_equations", "difficulty": "Remedial", "focus": "Isolate x."}] * sessions,
+        "quizzes": [quiz] * sessions,
+        "feedbacks": [{"quiz_score": 66, "items": []}] * sessions,
+    }
+
+
+def run(path: str, users: int, saves_per_user: int, write_behind: bool) -> float:
+    conn = init_db(path)
+    memory = sample_memory()
+    if write_behind:
+        enable_write_behind(conn)
+    with harness.Timer() as t:
+        for i in range(saves_per_user):
+            for u in range(users):
+                memory["topic_mastery"]["linear_equations"] = i
+                save_memory(conn, f"bench_{u}", memory)
+        flush(conn)
+    if write_behind:
+        disable_write_behind(conn)
+    # sanity check: the last save of every learner is durable
+    assert load_memory(conn, "bench_0")["topic_mastery"]["linear_equations"] == saves_per_user - 1
+    conn.close()
+    return harness.rate(users * saves_per_user, t.seconds)
+
+
+def main():
+    users, saves_per_user = harness.args(("users", int, 50), ("saves_per_user", int, 20))
+    # keep per-save console logging out of the measurement
+    harness.quiet()
+
+    tmp = harness.scratch()
+    sync_rate = run(os.path.join(tmp, "sync.db"), users, saves_per_user, write_behind=False)
+    wb_rate = run(os.path.join(tmp, "write_behind.db"), users, saves_per_user, write_behind=True)
+
+    print(f"Saves: {users} users x {saves_per_user} saves each")
+    print(f"Synchronous:  {sync_rate:10.0f} saves/sec")
+    print(f"Write-behind: {wb_rate:10.0f} saves/sec  ({wb_rate / sync_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# bench/bench_problem_bank.py
+"""
+Benchmark: worked-example generation, per-call sympy solving (how LessonAgent used to build
+every example) vs sampling the precomputed problem bank, plus bank build time and size.
+Run from the adaptive-coach folder:  python bench/bench_problem_bank.py [samples] [bank_path]
+"""
+import os
+import random
+
+import harness
+
+from tools.problem_bank import ProblemBank, make_problem
+from agents.lesson_agent import DIFFICULTY_FEATURES
+
+
+def sympy_example(rng: random.Random):
+    import sympy as sp
+    a, b = rng.choice([1, 2, 3, 4, 5]), rng.choice([-6, -4, -2, 0, 2, 3, 4])
+    c = a * rng.choice([-3, -2, -1, 1, 2, 3, 4, 5]) + b
+    x = sp.symbols('x')
+    sol = sp.solve(sp.Eq(sp.sympify(a)*x + sp.sympify(b), sp.sympify(c)), x)
+    example = make_problem(a, b, c)
+    example["solution"] = float(sol[0].evalf()) if sol else None
+    return example
+
+
+def rate(fn, n: int) -> float:
+    with harness.Timer() as t:
+        for _ in range(n):
+            fn()
+    return harness.rate(n, t.seconds)
+
+
+def main():
+    n, path = harness.args(("samples", int, 20000), ("bank_path", str, None))
+    path = path or os.path.join(harness.scratch(), "problem_bank.db")
+    rng = random.Random(3)
+
+    bank = ProblemBank(path)
+    with harness.Timer() as t:
+        bank.build(force=True)
+    print(f"Build: {t.seconds:.2f}s, {bank.count()} problems, "
+          f"{os.path.getsize(path) / 1e6:.1f} MB at {path}")
+
+    sympy_example(rng)  # import sympy outside the timing
+    slow = rate(lambda: sympy_example(rng), max(1, n // 100))
+    print(f"{'source':<36} {'examples/s':>12} {'speedup':>9}")
+    print(f"{'sympy per call':<36} {slow:>12.0f} {'1x':>9}")
+    for difficulty, features in DIFFICULTY_FEATURES.items():
+        fast = rate(lambda: bank.sample(rng, **features), n)
+        print(f"{'bank ' + difficulty:<36} {fast:>12.0f} {fast / slow:>8.0f}x")
+    fast = rate(lambda: bank.sample_many(2, rng, non_unit_coefficient=True, negative_constant=True), n)
+    print(f"{'bank sample_many(2) (quiz)':<36} {fast:>12.0f} {fast / slow:>8.0f}x")
+    print("Bank:", bank.stats())
+
+
+if __name__ == "__main__":
+    main()
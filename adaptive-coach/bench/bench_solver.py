@@ -0,0 +1,87 @@
+# bench/bench_solver.py
+"""
+Benchmark: solve_for_x / grade_answer throughput, exact linear fast path vs sympy,
+and with the memoizing solve cache warm (the common case: the same equations for every learner),
+then a whole class graded answer by answer vs one grade_batch call.
+
+The corpus is the shape the agents generate ("a*x + b = c", "a*x + (-b) = c") plus
+learner-style variants ("5x+2=12", decimals), graded against typical answers.
+Run from the adaptive-coach folder:  python bench/bench_solver.py [equations]
+"""
+import random
+
+import harness
+
+from tools import code_executor
+from tools.code_executor import (
+    configure_solve_cache, grade_answer, grade_batch, solve_for_x, solve_cache_stats,
+)
+from tools.persistence import init_db
+from agents.assessment_agent import AssessmentAgent
+
+
+def corpus(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    equations = []
+    for _ in range(n):
+        a, x, b = rng.randint(1, 12), rng.randint(-10, 10), rng.randint(-20, 20)
+        c = a * x + b
+        equations.append(rng.choice([
+            f"{a}*x + {b} = {c}" if b >= 0 else f"{a}*x + ({b}) = {c}",
+            f"{a}x+{b}={c}",
+            f"{a / 2}*x - {abs(b)} = {a / 2 * x - abs(b)}",
+        ]))
+    answers = [rng.choice(["4", "x=4", "-2.5", "1/2", str(rng.randint(-10, 10))]) for _ in range(n)]
+    return equations, answers
+
+
+def throughput(fn, items) -> float:
+    with harness.Timer() as t:
+        for item in items:
+            fn(*item)
+    return harness.rate(len(items), t.seconds)
+
+
+def main():
+    n = harness.args(("equations", int, 2000))
+    equations, answers = corpus(n)
+    solves = [(eq,) for eq in equations]
+    grades = list(zip(equations, answers))
+
+    print(f"{'operation':<14} {'sympy/s':>10} {'fast/s':>12} {'cached/s':>12} {'speedup':>9}")
+    for name, fn, items in (("solve_for_x", solve_for_x, solves), ("grade_answer", grade_answer, grades)):
+        configure_solve_cache(max_entries=0, path=None)
+        code_executor.FAST_PATH = False
+        # sympy is slow: time a slice of the corpus
+        slow = throughput(fn, items[:max(1, n // 10)])
+        code_executor.FAST_PATH = True
+        fast = throughput(fn, items)
+        configure_solve_cache(max_entries=2 * n, path=None)
+        throughput(fn, items)  # warm up
+        cached = throughput(fn, items)
+        print(f"{name:<14} {slow:>10.0f} {fast:>12.0f} {cached:>12.0f} {cached / slow:>8.0f}x")
+
+    harness.quiet()
+    agent = AssessmentAgent(conn=init_db(":memory:"))
+    configure_solve_cache()
+    for user_id in ("cold", "warm"):
+        before = solve_cache_stats()["computed"]
+        agent.run_diagnostic(user_id, ["4", "3", "0"])
+        print(f"Diagnostic ({user_id} cache): {solve_cache_stats()['computed'] - before} solves/parses computed")
+
+    rng = random.Random(7)
+    expected = [q for _, q in agent.questions]
+    klass = [[rng.choice(["4", "5", "-3", "x=4", "3", "", "1/2"]) for _ in expected] for _ in range(n)]
+    grade_batch(expected, klass[:1])  # numpy is imported on first use; keep that out of the timing
+    with harness.Timer() as looped_t:
+        looped = [[grade_answer(e, a) for e, a in zip(expected, row)] for row in klass]
+    with harness.Timer() as batch_t:
+        batch = grade_batch(expected, klass)
+    looped_s, batch_s = looped_t.seconds, batch_t.seconds
+    assert batch["correct"].tolist() == [[g["correct"] for g in row] for row in looped]
+    print(f"Class of {n} x {len(expected)} answers: grade_answer loop {looped_s * 1e3:.1f} ms, "
+          f"grade_batch {batch_s * 1e3:.1f} ms ({looped_s / batch_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
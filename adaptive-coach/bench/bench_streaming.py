@@ -0,0 +1,87 @@
+# bench/bench_streaming.py
+"""
+Benchmark: time to first content and total time, blocking plan()/provide_feedback() vs
+plan_stream()/provide_feedback_stream(), with the stub LLM backend (tools.llm).
+The blocking calls show nothing until everything (LLM expansion included) is built and
+saved; the streams yield the deterministic sections immediately and LLM text as it arrives.
+Run from the adaptive-coach folder:  python bench/bench_streaming.py [llm_latency_ms] [rounds]
+"""
+import contextlib
+import os
+import statistics
+import time
+
+import harness
+
+from tools.persistence import ConnectionPool
+from tools.llm import LLMExecutor, StubBackend
+from agents.lesson_agent import LessonAgent, configure_lesson_cache
+from agents.feedback_agent import FeedbackAgent
+
+
+class _NoSpans:
+    # keep the console span exporter out of the measurement
+    def start_as_current_span(self, name):
+        return contextlib.nullcontext()
+
+    def start_span(self, name):
+        class _Span:
+            def end(self):
+                pass
+        return _Span()
+
+
+def graded_quiz(seed: int):
+    per_q = [{"q_index": i, "question": f"Solve for x: {i + 2}*x + {seed} = 9", "expected": f"{i + 2}*x + {seed} = 9",
+              "user_answer_raw": "7", "user_answer_parsed": 7.0, "correct": i == 0} for i in range(3)]
+    return {"score_percent": 33, "per_question": per_q}
+
+
+def blocking(fn):
+    with harness.Timer() as t:
+        fn()
+    return t.seconds, t.seconds
+
+
+def streaming(events):
+    start, first = time.perf_counter(), None
+    for _ in events:
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main():
+    latency, rounds = harness.args(("llm_latency_ms", float, 300), ("rounds", int, 5))
+    harness.quiet()
+    conn = ConnectionPool(os.path.join(harness.scratch(), "bench_streaming.db"), size=2)
+
+    results = {}
+    for r in range(rounds):
+        # fresh executors and template cache: every round pays the LLM latency
+        configure_lesson_cache(max_entries=0)
+        llm = LLMExecutor(StubBackend(latency), cache_size=0)
+        lesson_agent = LessonAgent(conn=conn, llm=llm)
+        feedback_agent = FeedbackAgent(conn=conn, llm=llm)
+        feedback_agent._tracer = _NoSpans()
+        diagnostics = [{"score_percent": 10 * r}]
+        runs = {
+            "lesson plan()": lambda: blocking(lambda: lesson_agent.plan(f"b{r}", diagnostics)),
+            "lesson plan_stream()": lambda: streaming(lesson_agent.plan_stream(f"s{r}", diagnostics)),
+            "feedback provide_feedback()": lambda: blocking(lambda: feedback_agent.provide_feedback(f"b{r}", graded_quiz(r))),
+            "feedback provide_feedback_stream()": lambda: streaming(feedback_agent.provide_feedback_stream(f"s{r}", graded_quiz(r + 100))),
+        }
+        for name, run in runs.items():
+            results.setdefault(name, []).append(run())
+    configure_lesson_cache()
+
+    print(f"LLM latency {latency:.0f} ms, median of {rounds} rounds")
+    print(f"{'call':<36} {'first content ms':>17} {'total ms':>9}")
+    for name, samples in results.items():
+        first = statistics.median(s[0] for s in samples) * 1e3
+        total = statistics.median(s[1] for s in samples) * 1e3
+        print(f"{name:<36} {first:>17.2f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
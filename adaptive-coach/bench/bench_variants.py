@@ -0,0 +1,86 @@
+# bench/bench_variants.py
+"""
+Benchmark: quiz variants from coefficient arrays (tools.variants) vs the string surgery
+QuizAgent used before (split on "=", regex on "a*x", str.replace on the left side).
+
+  throughput  variants per second for every equation of the problem bank: the old text
+              edits one equation at a time vs one equation_variants() call for all of them
+  quality     how many old variants are wrong (e.g. replace("2*x") also rewrites "12*x"),
+              change the solution's kind (whole number -> fraction) or lose the example's
+              difficulty features, vs the structured ones (constraints enforced by masks)
+
+Run from the adaptive-coach folder:  python bench/bench_variants.py [rounds]
+"""
+import re
+from fractions import Fraction
+
+import harness
+
+from tools.problem_bank import feature_mask, get_problem_bank
+from tools.variants import equation_variants, parse_equation, render
+
+
+def string_surgery(eq: str):
+    """The former QuizAgent._derive_questions_from_example, without the question text."""
+    questions = [eq]
+    try:
+        left, right = eq.split("=")
+        right_val = float(right.strip())
+        questions.append(f"{left.strip()} = {int(right_val + 2)}")
+        m = re.search(r"(?P<a>-?\d+)\*x", left.replace(" ", ""))
+        if m:
+            a = int(m.group("a"))
+            questions.append(f"{left.replace(f'{a}*x', f'{a + 1}*x')} = {right.strip()}")
+        else:
+            questions.append(f"{left.strip()} = {int(right_val) - 1}")
+    except Exception:
+        questions = [eq]
+    return questions[:3]
+
+
+def check(base, variants):
+    """(wrong, kind_changed, features_lost) counts of variants of base (a, b, c)."""
+    a, b, c = base
+    x = Fraction(c - b, a)
+    wrong = kind = lost = 0
+    for eq in variants:
+        coefficients = parse_equation(eq)
+        if coefficients is None:
+            wrong += 1
+            continue
+        va, vb, vc = coefficients
+        vx = Fraction(vc - vb, va)
+        kind += (vx.denominator == 1) != (x.denominator == 1)
+        lost += feature_mask(va, vb, vx) != feature_mask(a, b, x)
+    return wrong, kind, lost
+
+
+def main():
+    rounds = harness.args(("rounds", int, 5))
+    rows = get_problem_bank().rows()
+    a, b, c = ([row[i] for row in rows] for i in range(3))
+    integer = [(ci - bi) % ai == 0 for ai, bi, ci in zip(a, b, c)]
+    print(f"{len(rows)} base equations, 2 variants each")
+
+    with harness.Timer() as t:
+        for _ in range(rounds):
+            old = [string_surgery(row[3])[1:] for row in rows]
+    old_time = t.seconds / rounds
+
+    equation_variants(a[:10], b[:10], c[:10])  # loads numpy
+    with harness.Timer() as t:
+        for r in range(rounds):
+            new = render(equation_variants(a, b, c, n=2, rng=r, integer_solution=integer, same_features=True))
+    new_time = t.seconds / rounds
+
+    print(f"{'generator':<22} {'variants':>9} {'ms':>8} {'variants/s':>11} {'wrong':>6} {'kind':>6} {'features':>9}")
+    for name, out, wall in (("string surgery", old, old_time), ("equation_variants", new, new_time)):
+        made = sum(len(v) for v in out)
+        wrong, kind, lost = map(sum, zip(*(check((ai, bi, ci), v) for ai, bi, ci, v in zip(a, b, c, out))))
+        print(f"{name:<22} {made:>9} {wall * 1e3:>8.1f} {made / wall:>11.0f} {wrong:>6} {kind:>6} {lost:>9}")
+    for eq in ("x + 3 = 5", "3*x + 2*x = 10", "2*x + 3 = 11.5"):
+        print(f"string surgery on {eq!r}: {string_surgery(eq)[1:]}")
+
+
+if __name__ == "__main__":
+    main()
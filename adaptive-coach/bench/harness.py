@@ -0,0 +1,84 @@
+# bench/harness.py
+"""
+Shared setup of the benchmark, stress and parity scripts in this folder.
+
+Every script imports it first: `import harness` puts src/ on sys.path, so `tools`, `agents`
+and `eval` import exactly as they do in the app. The rest is the boilerplate the scripts
+would otherwise each repeat:
+
+  learners, threads = harness.args(("learners", int, 200), ("threads", int, 16))
+      positional command-line arguments with defaults; -h prints them with the script's docstring
+  harness.quiet()
+      no per-call console lines or INFO logs inside a measurement
+  tmp = harness.scratch()
+      a temporary directory for the script's databases, removed at exit
+  with harness.Timer() as t: ...
+      wall time of a block in t.seconds
+  harness.rate(count, seconds)
+      count per second (0 for an empty interval)
+
+Run a script from the adaptive-coach folder:  python bench/<script>.py [args]
+"""
+import argparse
+import atexit
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+Arg = Tuple[str, Callable[[str], Any], Any]
+
+
+def args(*spec: Arg) -> Any:
+    """
+    Parse optional positional arguments given as (name, type, default).
+    Returns the single value for one argument, else a tuple in spec order.
+    """
+    main = sys.modules.get("__main__")
+    parser = argparse.ArgumentParser(description=getattr(main, "__doc__", None),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    for name, kind, default in spec:
+        parser.add_argument(name, nargs="?", type=kind, default=default, help=f"default: {default}")
+    parsed = parser.parse_args()
+    values = tuple(getattr(parsed, name) for name, _, _ in spec)
+    return values[0] if len(values) == 1 else values
+
+
+def quiet():
+    """Silence the memory console and INFO logging (they would dominate per-call timings)."""
+    from tools import persistence
+    persistence.console.quiet = True
+    logging.disable(logging.INFO)
+
+
+def scratch() -> str:
+    """A fresh temporary directory, removed when the script exits."""
+    path = tempfile.mkdtemp(prefix="coach-bench-")
+    atexit.register(shutil.rmtree, path, True)
+    return path
+
+
+class Timer:
+    """Wall time of a with-block: `with Timer() as t: ...`, then t.seconds."""
+
+    def __init__(self):
+        self.start = 0.0
+        self.seconds = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+
+def rate(count: float, seconds: float) -> float:
+    return count / seconds if seconds > 0 else 0.0
@@ -0,0 +1,129 @@
+# bench/parity_solver.py
+"""
+Parity check: the exact linear fast path in tools.code_executor against the sympy path.
+
+A seeded corpus of equations is generated in every shape the app produces or a learner
+might type (implicit multiplication, spaces, upper-case X, decimals, exponents, fractions,
+parentheses, x on both sides, no/infinite solutions) plus inputs the fast path must hand
+to sympy (powers, other symbols, leading zeros, malformed text). Every equation is solved,
+and graded against a spread of answers, with FAST_PATH on and off; results must agree.
+Run from the adaptive-coach folder:  python bench/parity_solver.py [cases] [seed]
+"""
+import math
+import random
+import sys
+
+import harness
+
+from tools import code_executor
+from tools.code_executor import grade_answer, solve_for_x
+
+REL_TOL = 1e-9
+# answers graded against each expected expression (sampled from answers())
+ANSWERS_PER_EXPRESSION = 3
+
+
+def number(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.6:
+        return str(rng.randint(-20, 20))
+    if kind < 0.8:
+        return f"{rng.uniform(-20, 20):.{rng.randint(1, 3)}f}"
+    if kind < 0.9:
+        return rng.choice(["0.5", ".25", "2.", "1e2", "2.5E-1", "00.5", "0"])
+    return f"({rng.randint(-9, 9)}/{rng.randint(1, 9)})"
+
+
+def coefficient(rng: random.Random) -> str:
+    n = number(rng)
+    if n[0] in "-(":
+        return f"{n}*x"
+    # digit directly before x is implicit multiplication; '.' before x is not
+    return rng.choice([f"{n}*x", f"{n}x", f"{n} x", f"{n}*X", f"{n}X"])
+
+
+def linear_side(rng: random.Random) -> str:
+    parts = [coefficient(rng) if rng.random() < 0.7 else number(rng) for _ in range(rng.randint(1, 3))]
+    side = parts[0]
+    for part in parts[1:]:
+        side += rng.choice([" + ", " - ", "+", "-"]) + part
+    shape = rng.random()
+    if shape < 0.1:
+        side = f"{number(rng)}*({side})"
+    elif shape < 0.2:
+        side = f"({side})/{rng.choice(['2', '3', '-4', '0', '0.5'])}"
+    elif shape < 0.25:
+        side = f"-({side})"
+    return side
+
+
+def equation(rng: random.Random) -> str:
+    shape = rng.random()
+    if shape < 0.75:
+        return f"{linear_side(rng)} = {linear_side(rng) if rng.random() < 0.3 else number(rng)}"
+    if shape < 0.8:
+        side = linear_side(rng)
+        return f"{side} = {side}" if rng.random() < 0.5 else f"{side} = {side} + 1"
+    # outside the linear grammar: sympy decides
+    return rng.choice([
+        f"x**2 = {rng.randint(0, 30)}", f"x^2 - {rng.randint(1, 9)} = 0", f"x*x = {rng.randint(1, 9)}",
+        f"{rng.randint(1, 9)}/x = 2", f"y + {rng.randint(1, 9)} = 3", "2(x+1) = 4", "(1+2)x = 3",
+        "2x2 = 4", "007x = 14", "x2 = 3", "2.x = 4", "2*x + = 3", "x = 1 = 2", "2*x + 3",
+        "= 5", "sqrt(x) = 3", "2*pi*x = 1", "x/0 = 1", "1e400*x = 1", "((x) = 2", "x + 1 = 2)",
+    ])
+
+
+def answers(rng: random.Random, expected) -> list:
+    base = [number(rng), "pi", "abc", "", "2x", "x=4", "X = -1.5", "1/3", "4,", "1_000", "007", "3**2"]
+    if expected is not None:
+        base += [str(expected), f"x={expected}", repr(round(expected, 3))]
+    return base
+
+
+def same(a, b) -> bool:
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=REL_TOL, abs_tol=1e-12)
+
+
+def run(cases: int, seed: int):
+    rng = random.Random(seed)
+    # compare computations, not memoized results
+    code_executor.configure_solve_cache(max_entries=0, path=None)
+    solves = grades = 0
+    mismatches = []
+    for _ in range(cases):
+        eq = equation(rng)
+        code_executor.FAST_PATH = True
+        fast = solve_for_x(eq)
+        code_executor.FAST_PATH = False
+        slow = solve_for_x(eq)
+        solves += 1
+        if not same(fast, slow):
+            mismatches.append(("solve_for_x", eq, fast, slow))
+        expected_exprs = [eq] + ([str(slow)] if slow is not None else []) + [number(rng)]
+        for expected_expr in expected_exprs:
+            for answer in rng.sample(answers(rng, slow), ANSWERS_PER_EXPRESSION):
+                code_executor.FAST_PATH = True
+                fast = grade_answer(expected_expr, answer)
+                code_executor.FAST_PATH = False
+                slow_grade = grade_answer(expected_expr, answer)
+                grades += 1
+                if (fast["correct"] != slow_grade["correct"] or not same(fast["expected"], slow_grade["expected"])
+                        or not same(fast["user"], slow_grade["user"])):
+                    mismatches.append(("grade_answer", (expected_expr, answer), fast, slow_grade))
+    code_executor.FAST_PATH = True
+    return solves, grades, mismatches
+
+
+def main():
+    cases, seed = harness.args(("cases", int, 1000), ("seed", int, 1234))
+    solves, grades, mismatches = run(cases, seed)
+    for kind, case, fast, slow in mismatches[:20]:
+        print(f"MISMATCH {kind} {case!r}: fast={fast!r} sympy={slow!r}")
+    print(f"{solves} equations solved and {grades} answers graded both ways: {len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
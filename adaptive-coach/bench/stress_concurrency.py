@@ -0,0 +1,187 @@
+# bench/stress_concurrency.py
+"""
+Stress test: many threads doing read-modify-write on the SAME learner.
+
+Each thread repeatedly increments a counter in the learner's memory:
+  - unguarded: load_memory + save_memory (last writer wins, updates get lost)
+  - guarded:   update_memory (version compare-and-swap + retry)
+and a third run grades quizzes concurrently through QuizAgent, whose mastery update
+is version-guarded. The guarded runs must not lose a single update: the committed
+mastery values must chain through every graded score (each one derived from the one
+before it), and a mastery written behind the memory cache's back must be built on.
+Run from the adaptive-coach folder:  python bench/stress_concurrency.py [threads] [increments_per_thread]
+"""
+import os
+import sqlite3
+import threading
+from typing import List, Tuple
+
+import harness
+
+from tools.persistence import (
+    ConnectionPool, concurrency_stats, get_path, load_memory, reading, save_memory, set_path, update_memory,
+)
+from tools.code_executor import solve_linear
+from agents.quiz_agent import QuizAgent
+
+USER = "stress_student"
+
+
+def hammer(fn, threads: int) -> float:
+    start_gate = threading.Barrier(threads)
+    errors = []
+
+    def worker():
+        start_gate.wait()
+        try:
+            fn()
+        except Exception as e:  # surfaced after join
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    with harness.Timer() as t:
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    if errors:
+        raise errors[0]
+    return t.seconds
+
+
+def bump(memory):
+    memory["counter"] = memory.get("counter", 0) + 1
+
+
+def run_unguarded(pool, threads: int, increments: int) -> int:
+    save_memory(pool, USER, {"counter": 0})
+
+    def fn():
+        for _ in range(increments):
+            memory = dict(load_memory(pool, USER))
+            bump(memory)
+            save_memory(pool, USER, memory)
+
+    hammer(fn, threads)
+    return load_memory(pool, USER)["counter"]
+
+
+def run_guarded(pool, threads: int, increments: int) -> Tuple[int, float]:
+    save_memory(pool, USER, {"counter": 0})
+
+    def fn():
+        for _ in range(increments):
+            update_memory(pool, USER, bump, retries=100)
+
+    elapsed = hammer(fn, threads)
+    return load_memory(pool, USER)["counter"], elapsed
+
+
+def next_mastery(prior, score: int) -> int:
+    """QuizAgent's mastery rule."""
+    return int((prior + score) / 2) if prior else score
+
+
+def answers_for(quiz, correct: int) -> List[str]:
+    """Answers to the quiz with exactly the first `correct` of them right."""
+    solutions = [solve_linear(q["expected_expr"]) for q in quiz["questions"]]
+    return [f"x={float(x)}" if i < correct else f"x={float(x) + 1}" for i, x in enumerate(solutions)]
+
+
+def committed_mastery(pool) -> List[int]:
+    with reading(pool) as c:
+        rows = c.execute("SELECT mastery FROM mastery_history WHERE user_id=? AND topic='linear_equations' "
+                         "ORDER BY rowid", (USER,)).fetchall()
+    return [r[0] for r in rows]
+
+
+def run_quiz_grading(pool, threads: int, rounds: int) -> Tuple[int, int]:
+    """
+    Concurrent graders with different scores. Returns (committed updates, final mastery)
+    after checking that every committed value is the rule applied to the previous one and
+    one of the graded scores, each score used exactly once.
+    """
+    agent = QuizAgent(conn=pool)
+    quiz = agent.generate_quiz(USER, {"worked_example": {"equation_str": "2*x + 3 = 11", "solution": 4}})
+    n_questions = len(quiz["questions"])
+    scores = {k: int(k / n_questions * 100) for k in range(n_questions + 1)}
+    submitted = {}
+    lock = threading.Lock()
+    before = len(committed_mastery(pool))
+    prior = get_path(pool, USER, "topic_mastery.linear_equations")
+
+    def fn():
+        for i in range(rounds):
+            correct = (threading.get_ident() + i) % (n_questions + 1)
+            agent.grade_quiz(USER, quiz, answers_for(quiz, correct))
+            with lock:
+                submitted[scores[correct]] = submitted.get(scores[correct], 0) + 1
+
+    hammer(fn, threads)
+    consumed = {}
+    for value in committed_mastery(pool)[before:]:
+        used = [score for score in scores.values() if next_mastery(prior, score) == value]
+        assert used, f"mastery {value} does not follow from {prior}: an update was computed from stale data"
+        consumed[used[0]] = consumed.get(used[0], 0) + 1
+        prior = value
+    assert consumed == submitted, f"graded scores {submitted}, built on {consumed}"
+    final = get_path(pool, USER, "topic_mastery.linear_equations")
+    assert final == prior, f"final mastery {final}, expected {prior}"
+    return sum(consumed.values()), final
+
+
+def run_stale_cache(pool, path: str) -> int:
+    """
+    A session in another process raises the mastery while this process still has the old
+    value cached; grading here must build on the new value (the reviewer's 20 -> 90 case).
+    """
+    agent = QuizAgent(conn=pool)
+    quiz = agent.generate_quiz(USER, {"worked_example": {"equation_str": "2*x + 3 = 11", "solution": 4}})
+    set_path(pool, USER, "topic_mastery.linear_equations", 20)
+    assert load_memory(pool, USER)["topic_mastery"]["linear_equations"] == 20  # now cached
+    other = sqlite3.connect(path)
+    other.execute("UPDATE memory SET data=json_set(data, '$.topic_mastery.linear_equations', 90), "
+                  "version=version+1 WHERE user_id=?", (USER,))
+    other.commit()
+    other.close()
+    agent.grade_quiz(USER, quiz, answers_for(quiz, len(quiz["questions"])))
+    final = get_path(pool, USER, "topic_mastery.linear_equations")
+    assert final == next_mastery(90, 100), f"mastery {final} was computed from the stale cached 20"
+    return final
+
+
+def main():
+    threads, increments = harness.args(("threads", int, 16), ("increments_per_thread", int, 50))
+    expected = threads * increments
+    harness.quiet()
+
+    tmp = harness.scratch()
+    pool = ConnectionPool(os.path.join(tmp, "stress.db"), size=threads)
+
+    lost = expected - run_unguarded(pool, threads, increments)
+    print(f"Unguarded load+save:  {expected - lost}/{expected} increments kept ({lost} lost)")
+
+    before = concurrency_stats()
+    counter, elapsed = run_guarded(pool, threads, increments)
+    after = concurrency_stats()
+    conflicts = after["conflicts"] - before["conflicts"]
+    writes = after["cas_writes"] - before["cas_writes"]
+    print(f"update_memory (CAS):  {counter}/{expected} increments kept in {elapsed:.2f}s "
+          f"({counter / elapsed:.0f}/s, {conflicts} conflicts, "
+          f"conflict rate {conflicts / (writes + conflicts):.1%})")
+    assert counter == expected, "optimistic concurrency lost an update"
+
+    rounds = max(1, increments // 10)
+    points, final = run_quiz_grading(pool, threads, rounds)
+    print(f"Concurrent grade_quiz: {points}/{threads * rounds} guarded mastery updates committed, "
+          f"each built on the previous one (final mastery {final})")
+    assert points == threads * rounds
+
+    final = run_stale_cache(pool, os.path.join(tmp, "stress.db"))
+    print(f"Mastery changed behind the cache (20 -> 90), then a perfect quiz: {final}")
+    print("Totals:", concurrency_stats())
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
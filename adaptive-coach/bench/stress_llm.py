@@ -0,0 +1,109 @@
+# bench/stress_llm.py
+"""
+Stress test: feedback LLM expansion through tools.llm against the local stub backend.
+
+  serial     one blocking call per incorrect question, back to back (the old inline hook)
+  executor   concurrent calls (bounded), batched across sessions, cached by prompt hash
+  repeat     the same class again: answers come from the response cache
+  outage     the backend fails every call: after a few failures the circuit breaker opens
+             and feedback falls back to the deterministic guidance without waiting
+  slow       the backend is slower than the timeout: feedback waits at most the timeout
+
+Every learner gets a quiz with three wrong answers; reports per-feedback p50/p99 latency,
+backend calls and the executor stats.
+Run from the adaptive-coach folder:  python bench/stress_llm.py [learners] [threads] [latency_ms]
+"""
+import contextlib
+import os
+import random
+import threading
+from typing import Any, Dict, List
+
+import harness
+
+from tools.persistence import ConnectionPool
+from tools.llm import LLMExecutor, StubBackend
+from agents.feedback_agent import FeedbackAgent
+
+
+class _NoSpans:
+    # keep the console span exporter out of the measurement
+    def start_as_current_span(self, name):
+        return contextlib.nullcontext()
+
+
+def quizzes(learners: int, seed: int = 9) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(learners):
+        per_q = []
+        for i in range(3):
+            a, x = rng.randint(2, 6), rng.randint(-5, 5)
+            b = rng.randint(-9, 9)
+            eq = f"{a}*x + {b} = {a * x + b}"
+            per_q.append({"q_index": i, "question": f"Solve for x: {eq}", "expected": eq,
+                          "user_answer_raw": str(x + rng.choice([-2, -1, 1, 2])), "correct": False})
+        out.append({"score_percent": 0, "per_question": per_q})
+    return out
+
+
+def run(conn, llm: LLMExecutor, work: List[Dict[str, Any]], threads: int):
+    latencies, expanded, lock, cursor = [], [0, 0], threading.Lock(), iter(enumerate(work))
+
+    def worker():
+        agent = FeedbackAgent(conn=conn, llm=llm)
+        agent._tracer = _NoSpans()
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            i, quiz = item
+            with harness.Timer() as timer:
+                report = agent.provide_feedback(f"learner_{i:05d}", quiz)
+            with lock:
+                latencies.append(timer.seconds)
+                expanded[0] += sum("llm_expanded" in it for it in report["items"])
+                expanded[1] += len(report["items"])
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sorted(latencies), expanded
+
+
+def main():
+    learners, threads, latency = harness.args(("learners", int, 200), ("threads", int, 16), ("latency_ms", float, 100))
+    harness.quiet()
+    conn = ConnectionPool(os.path.join(harness.scratch(), "stress_llm.db"), size=threads)
+    work = quizzes(learners)
+
+    shared = LLMExecutor(StubBackend(latency, jitter_ms=latency / 5, seed=1), max_concurrency=8)
+    scenarios = [
+        ("serial", LLMExecutor(StubBackend(latency, jitter_ms=latency / 5, seed=1), max_concurrency=threads,
+                               cache_size=0, max_batch=1), work),
+        ("executor", shared, work),
+        ("repeat", shared, work),
+        ("outage", LLMExecutor(StubBackend(latency, failure_rate=1.0), max_concurrency=8), work),
+        ("slow", LLMExecutor(StubBackend(latency * 20), max_concurrency=8, timeout=latency * 3 / 1e3), work[:threads * 2]),
+    ]
+    print(f"{'scenario':<10} {'feedbacks':>9} {'p50 ms':>8} {'p99 ms':>8} {'wall s':>7} {'expanded':>9} {'backend calls':>14}")
+    for name, llm, items in scenarios:
+        calls_before = llm.backend.calls
+        if name == "serial":
+            # the old agent: one blocking hook call per incorrect question
+            llm.expand_many = lambda prompts, fallbacks=None, timeout=None, _llm=llm: [_llm.expand(p) for p in prompts]
+        with harness.Timer() as t:
+            latencies, (done, total) = run(conn, llm, items, threads)
+        wall = t.seconds
+        at = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3
+        print(f"{name:<10} {len(latencies):>9} {at(0.5):>8.1f} {at(0.99):>8.1f} {wall:>7.2f} "
+              f"{done:>4}/{total:<4} {llm.backend.calls - calls_before:>14}")
+        if name in ("executor", "outage"):
+            print(f"{'':<10} {llm.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench/stress_sandbox.py
+"""
+Stress test: grading latency through tools.sandbox under adversarial input mixes.
+
+Threads grade answers concurrently with grade_answer_safe, for three mixes:
+  benign       plain numbers and "x = ..." answers (parsed in-process)
+  symbolic     answers only sympy can read ("sqrt(49)", "pi", "2^5"), all in the sandbox
+  adversarial  benign + symbolic traffic with hostile answers mixed in: some are
+               rejected by the precheck, others (factorial(10**6), 10**100000000)
+               run until the wall-clock limit kills their worker
+and reports status counts and p50/p99/max latency per kind of answer. Benign answers
+must stay fast even while hostile ones are being killed.
+Run from the adaptive-coach folder:  python bench/stress_sandbox.py [requests_per_mix] [threads] [sandbox_workers]
+"""
+import random
+import threading
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import harness
+
+from tools.code_executor import configure_solve_cache
+from tools.sandbox import configure_sandbox, grade_answer_safe, sandbox_stats
+
+EXPECTED = "2*x + 3 = 11"
+
+
+def benign(rng: random.Random, i: int) -> str:
+    return rng.choice(["4", "x = 4", "-3", "x=2.5", "1/2", f"{i % 97}"])
+
+
+def symbolic(rng: random.Random, i: int) -> str:
+    # distinct text so the solve cache can't answer for the sandbox
+    return rng.choice([f"sqrt({i})", f"{i}^2/{i}", f"pi*{i}/{i}", f"Rational({i}, 7)"])
+
+
+def hostile(rng: random.Random, i: int) -> str:
+    return rng.choice([
+        f"factorial({10 ** 6 + i})",        # runs until killed
+        f"10**{100000000 + i}",             # runs until killed
+        f"{i}**{i}**{i}",                   # rejected: powers
+        "(" * 10 + f"{i}" + ")" * 10,       # rejected: nesting
+        f"x.__class__{i}",                  # rejected: characters
+        "9" * 200,                          # rejected: length
+    ])
+
+
+MIXES = {
+    "benign": [(benign, 1.0)],
+    "symbolic": [(symbolic, 1.0)],
+    "adversarial": [(benign, 0.8), (symbolic, 0.1), (hostile, 0.1)],
+}
+
+
+def workload(mix: str, requests: int, seed: int = 5) -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    kinds, weights = zip(*MIXES[mix])
+    return [(kind.__name__, kind(rng, i)) for i, kind in enumerate(rng.choices(kinds, weights, k=requests))]
+
+
+def run(items: List[Tuple[str, str]], threads: int) -> List[Tuple[str, str, float]]:
+    results, lock, cursor = [], threading.Lock(), iter(items)
+
+    def worker():
+        while True:
+            with lock:
+                item = next(cursor, None)
+            if item is None:
+                return
+            kind, answer = item
+            with harness.Timer() as timer:
+                status = grade_answer_safe(EXPECTED, answer)["status"]
+            with lock:
+                results.append((kind, status, timer.seconds))
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return results
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    at = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e3
+    return {"p50": at(50), "p99": at(99), "max": latencies[-1] * 1e3}
+
+
+def main():
+    requests, threads, workers = harness.args(
+        ("requests_per_mix", int, 300), ("threads", int, 8), ("sandbox_workers", int, 4))
+    configure_solve_cache()
+    configure_sandbox(workers=workers, timeout=1.0, max_tasks=50)
+    # wait until the workers have imported sympy, so the first measurements are not startup time
+    run([("symbolic", f"sqrt({n})") for n in range(2, 6)], 2)
+
+    print(f"{'mix':<12} {'answers':<9} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses")
+    for mix in MIXES:
+        with harness.Timer() as t:
+            results = run(workload(mix, requests), threads)
+        wall = t.seconds
+        for kind in [k.__name__ for k, _ in MIXES[mix]] + (["all"] if len(MIXES[mix]) > 1 else []):
+            rows = [r for r in results if kind in ("all", r[0])]
+            if not rows:
+                continue
+            pct = percentiles([r[2] for r in rows])
+            statuses = dict(Counter(r[1] for r in rows))
+            print(f"{mix:<12} {kind:<9} {len(rows):>5} {pct['p50']:>9.2f} {pct['p99']:>9.2f} {pct['max']:>9.2f}  {statuses}")
+        print(f"{'':<12} {harness.rate(len(results), wall):.0f} answers/s over {wall:.1f}s")
+        if mix != "adversarial":
+            assert all(r[1] == "ok" for r in results), "benign/symbolic answers must all be graded"
+    print("Sandbox:", sandbox_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,123 @@
 # src/agents/assessment_agent.py
-from typing import List, Dict, Any
-from tools.persistence import init_db, save_memory, load_memory
+import asyncio
+import contextlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from datetime import datetime
+from tools.persistence import apply_updates, run_io
+from tools.storage import get_storage
 from observability.logging_setup import get_logger
-from tools.code_executor import grade_answer
+from tools.code_executor import grade_batch, grades_from_batch
+from tools.sandbox import grade_answer_safe, grade_answer_safe_async, parse_answer_safe
+from tools.item_bank import (QUESTION_PREFIX, ability_prior, estimate_ability, get_item_bank,
+                             percent_from_ability, update_ability)
 
 logger = get_logger("assessment_agent")
 
+# Adaptive diagnostic: stop once the ability's standard error is at most CAT_SE_TARGET
+# (after at least CAT_MIN_ITEMS answers) or after CAT_MAX_ITEMS answers
+CAT_MAX_ITEMS = int(os.environ.get("COACH_CAT_MAX_ITEMS", "12"))
+CAT_MIN_ITEMS = int(os.environ.get("COACH_CAT_MIN_ITEMS", "3"))
+CAT_SE_TARGET = float(os.environ.get("COACH_CAT_SE_TARGET", "0.6"))
+# unfinished sessions are dropped after this long without an answer
+CAT_SESSION_TTL_SECONDS = float(os.environ.get("COACH_CAT_SESSION_TTL", "3600"))
+# how often submit_async retries a session another answer is being folded into
+SESSION_LOCK_POLL_SECONDS = 0.005
+
+
+class DiagnosticSession:
+    """
+    One adaptive diagnostic in progress: the learner's ability posterior over
+    item_bank.ability_grid(), the answers so far and the item waiting for an answer.
+    lock is held from reading the pending item until the graded answer has advanced the
+    session, so concurrent answers to one session are folded in one at a time.
+    """
+
+    def __init__(self, user_id: str, max_items: int, se_target: float, prior_mean: float, prior_sd: float):
+        self.session_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.max_items = max_items
+        self.se_target = se_target
+        self.log_posterior = ability_prior(prior_mean, prior_sd)[0]
+        self.ability, self.ability_se = prior_mean, prior_sd
+        self.per_question: List[Dict[str, Any]] = []
+        self.item: Optional[Dict[str, Any]] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    async def lock_async(self):
+        """Acquire lock without blocking the event loop (answers to one session rarely overlap)."""
+        while not self.lock.acquire(blocking=False):
+            await asyncio.sleep(SESSION_LOCK_POLL_SECONDS)
+
+    def question(self) -> Optional[Dict[str, Any]]:
+        """The item waiting for an answer, None once the diagnostic is over."""
+        if self.item is None:
+            return None
+        eq = self.item["equation"]
+        return {"session_id": self.session_id, "q_index": len(self.per_question),
+                "q": f"{QUESTION_PREFIX}{eq}", "expected_expr": eq}
+
+    def pending(self) -> Dict[str, Any]:
+        if self.item is None:
+            raise ValueError(f"diagnostic session {self.session_id} is finished")
+        return self.item
+
+
+# Sessions by id, least recently answered first, shared by every AssessmentAgent in the process
+_sessions: "OrderedDict[str, DiagnosticSession]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def _register(session: DiagnosticSession):
+    now = time.monotonic()
+    with _sessions_lock:
+        while _sessions:
+            oldest = next(iter(_sessions.values()))
+            if now - oldest.touched < CAT_SESSION_TTL_SECONDS:
+                break
+            _sessions.popitem(last=False)
+        _sessions[session.session_id] = session
+
+
+def _session(session_id: str) -> DiagnosticSession:
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"unknown or expired diagnostic session {session_id!r}")
+        session.touched = time.monotonic()
+        _sessions.move_to_end(session_id)
+    return session
+
+
+def _discard(session: DiagnosticSession):
+    with _sessions_lock:
+        _sessions.pop(session.session_id, None)
+
+
+def diagnostic_session_stats() -> Dict[str, Any]:
+    with _sessions_lock:
+        return {"active_sessions": len(_sessions)}
+
 class AssessmentAgent:
     """
     Minimal Assessment Agent that:
     - Holds a small diagnostic question set
     - Presents questions (here we simulate by reading prefilled answers)
-    - Grades answers using the code_executor.grade_answer()
+    - Grades answers using sandbox.grade_answer_safe() (code_executor.grade_answer, isolated)
     - Saves diagnostic results into the memory DB under key 'last_diagnostic'
+    - Adaptive mode (start_adaptive / next_item / submit): items come one at a time from the
+      calibrated item bank, each the most informative at the running ability estimate, until
+      the estimate is precise enough (CAT_SE_TARGET) or CAT_MAX_ITEMS were asked
     """
 
     def __init__(self, conn=None):
-        self.conn = conn or init_db()
+        self.conn = conn or get_storage()
         # Minimal diagnostic for linear equations (3 questions)
         # Questions are tuples: (prompt_text, expected_expression)
         self.questions = [
@@ -25,18 +126,14 @@ class AssessmentAgent:
             ("Solve for x: 3*x + 9 = 0", "3*x + 9 = 0"),
         ]
 
-    def run_diagnostic(self, user_id: str, user_answers: List[str]) -> Dict[str, Any]:
-        """
-        user_answers: list of strings corresponding to answers for each question
-        Returns: result dict with per-question grading and summary
-        """
+    def _answers(self, user_answers: List[str]) -> List[str]:
+        return [user_answers[idx] if idx < len(user_answers) else "" for idx in range(len(self.questions))]
+
+    def _build_result(self, user_id: str, answers: List[str], grades: List[Dict[str, Any]]) -> Dict[str, Any]:
         trace_id = f"assess-{user_id}"
-        logger.info("intent_before_assessment", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
         per_q = []
         correct_count = 0
-        for idx, (q, expected) in enumerate(self.questions):
-            ans = user_answers[idx] if idx < len(user_answers) else ""
-            grade = grade_answer(expected, ans)
+        for idx, ((q, expected), ans, grade) in enumerate(zip(self.questions, answers, grades)):
             per_q.append({
                 "q_index": idx,
                 "question": q,
@@ -51,22 +148,229 @@ class AssessmentAgent:
             logger.info("question_graded", extra={"extra": {"trace_id": trace_id, "q_index": idx, "correct": grade["correct"]}})
 
         score = 0 if not self.questions else int((correct_count / len(self.questions)) * 100)
-        result = {
+        return {
             "user_id": user_id,
-            "timestamp": None,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
             "per_question": per_q,
             "correct_count": correct_count,
             "total_questions": len(self.questions),
             "score_percent": score
         }
 
-        # Save to memory under 'last_diagnostic' and update mastery for this topic (simple logic)
-        mem = load_memory(self.conn, user_id) or {}
-        mem.setdefault("diagnostics", [])
-        mem["diagnostics"].append(result)
-        # Simplest mastery update: store latest score for topic "linear_equations"
-        mem.setdefault("topic_mastery", {})
-        mem["topic_mastery"]["linear_equations"] = score
-        save_memory(self.conn, user_id, mem)
-        logger.info("assessment_completed", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": score}})
+    def _save_result(self, user_id: str, result: Dict[str, Any]):
+        # Save to memory (append to 'diagnostics') and update mastery for this topic (simple logic).
+        # Partial updates: the stored history is never loaded here.
+        apply_updates(self.conn, user_id, [
+            ("append", "diagnostics", result),
+            # Simplest mastery update: store latest score for topic "linear_equations"
+            ("set", "topic_mastery.linear_equations", result["score_percent"]),
+        ])
+
+    def run_diagnostic(self, user_id: str, user_answers: List[str]) -> Dict[str, Any]:
+        """
+        user_answers: list of strings corresponding to answers for each question
+        Returns: result dict with per-question grading and summary
+        """
+        trace_id = f"assess-{user_id}"
+        logger.info("intent_before_assessment", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        answers = self._answers(user_answers)
+        grades = [grade_answer_safe(expected, ans) for (_, expected), ans in zip(self.questions, answers)]
+        result = self._build_result(user_id, answers, grades)
+        self._save_result(user_id, result)
+        logger.info("assessment_completed", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": result["score_percent"]}})
         return result
+
+    def run_diagnostic_batch(self, answers_by_user: Dict[str, List[str]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Diagnostic for a whole class: answers_by_user maps user_id -> answers (as for run_diagnostic).
+        Every answer is graded in one grade_batch call (each question solved once);
+        each learner's result is saved and returned like run_diagnostic's, keyed by user_id.
+        """
+        user_ids = list(answers_by_user)
+        logger.info("intent_before_class_assessment", extra={"extra": {"learners": len(user_ids)}})
+        answers = [self._answers(answers_by_user[user_id]) for user_id in user_ids]
+        batch = grade_batch([expected for _, expected in self.questions], answers, parse_answer=parse_answer_safe)
+        results = {}
+        for row, user_id in enumerate(user_ids):
+            result = self._build_result(user_id, answers[row], grades_from_batch(batch, row))
+            self._save_result(user_id, result)
+            results[user_id] = result
+        scores = [r["score_percent"] for r in results.values()]
+        logger.info("class_assessment_completed", extra={"extra": {
+            "learners": len(user_ids),
+            "avg_score": round(sum(scores) / len(scores), 1) if scores else None,
+        }})
+        return results
+
+    async def run_diagnostic_async(self, user_id: str, user_answers: List[str]) -> Dict[str, Any]:
+        """
+        Async run_diagnostic: answers are graded concurrently (untrusted text on the sandbox pool)
+        and the result is persisted on the memory I/O executor.
+        """
+        trace_id = f"assess-{user_id}"
+        logger.info("intent_before_assessment", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        answers = self._answers(user_answers)
+        grades = await asyncio.gather(*(
+            grade_answer_safe_async(expected, ans) for (_, expected), ans in zip(self.questions, answers)
+        ))
+        result = self._build_result(user_id, answers, list(grades))
+        await run_io(self._save_result, user_id, result)
+        logger.info("assessment_completed", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": result["score_percent"]}})
+        return result
+
+    # ---------------- adaptive diagnostic ----------------
+    @staticmethod
+    def _pick(session: DiagnosticSession) -> Optional[Dict[str, Any]]:
+        asked = [q["expected_expr"] for q in session.per_question]
+        items = get_item_bank().select(session.ability, k=1, exclude=asked)
+        return items[0] if items else None
+
+    def start_adaptive(self, user_id: str, max_items: int = CAT_MAX_ITEMS,
+                       se_target: float = CAT_SE_TARGET) -> Dict[str, Any]:
+        """
+        Open an adaptive diagnostic for user_id and return its first question:
+          {"session_id": "...", "q_index": 0, "q": "Solve for x: ...", "expected_expr": "..."}
+        The ability prior is the learner population fitted by the last item bank recalibration.
+        """
+        bank = get_item_bank()
+        session = DiagnosticSession(user_id, max_items, se_target, *bank.population())
+        session.item = self._pick(session)
+        if session.item is None:
+            raise ValueError("the item bank has no items for an adaptive diagnostic")
+        _register(session)
+        logger.info("intent_before_adaptive_assessment", extra={"extra": {
+            "trace_id": f"assess-{user_id}", "user_id": user_id, "session_id": session.session_id}})
+        return session.question()
+
+    def next_item(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The question waiting for an answer in session_id, None once the diagnostic is over."""
+        return _session(session_id).question()
+
+    def _advance(self, sessions: List[DiagnosticSession], answers: List[str],
+                 grades: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fold one graded answer into each session: every ability posterior is updated in one
+        vectorized step, then each session gets its next item or, when it stops, its result
+        is saved like run_diagnostic's. The caller holds every session's lock.
+        """
+        items = [session.pending() for session in sessions]
+        log_posterior = update_ability([session.log_posterior for session in sessions],
+                                       [item["difficulty"] for item in items],
+                                       [item["discrimination"] for item in items],
+                                       [grade["correct"] for grade in grades])
+        thetas, ses = estimate_ability(log_posterior)
+        out = {}
+        for session, row, theta, se, item, ans, grade in zip(sessions, log_posterior, thetas.tolist(), ses.tolist(),
+                                                             items, answers, grades):
+            trace_id = f"assess-{session.user_id}"
+            session.log_posterior, session.ability, session.ability_se = row, theta, se
+            idx = len(session.per_question)
+            session.per_question.append({
+                "q_index": idx,
+                "question": f"{QUESTION_PREFIX}{item['equation']}",
+                "expected_expr": item["equation"],
+                "expected": grade["expected"],
+                "user_answer_raw": ans,
+                "user_answer_parsed": grade["user"],
+                "correct": grade["correct"],
+                "explanation": grade["explanation"],
+                "difficulty": round(item["difficulty"], 3),
+                "discrimination": round(item["discrimination"], 3),
+            })
+            logger.info("question_graded", extra={"extra": {"trace_id": trace_id, "q_index": idx, "correct": grade["correct"]}})
+
+            asked = len(session.per_question)
+            stop = None
+            if asked >= session.max_items:
+                stop = "max_items"
+            elif asked >= CAT_MIN_ITEMS and se <= session.se_target:
+                stop = "precision"
+            else:
+                session.item = self._pick(session)
+                if session.item is None:
+                    stop = "bank_exhausted"
+            if stop:
+                session.item = None
+                session.result = self._adaptive_result(session, stop)
+                self._save_result(session.user_id, session.result)
+                _discard(session)
+                logger.info("assessment_completed", extra={"extra": {
+                    "trace_id": trace_id, "user_id": session.user_id, "score": session.result["score_percent"],
+                    "questions": asked, "ability_se": session.result["ability_se"], "stop_reason": stop}})
+            out[session.session_id] = {
+                "session_id": session.session_id,
+                "correct": grade["correct"],
+                "explanation": grade["explanation"],
+                "ability": round(theta, 3),
+                "ability_se": round(se, 3),
+                "done": session.result is not None,
+                "next_item": session.question(),
+                "result": session.result,
+            }
+        return out
+
+    def _adaptive_result(self, session: DiagnosticSession, stop_reason: str) -> Dict[str, Any]:
+        correct_count = sum(q["correct"] for q in session.per_question)
+        return {
+            "user_id": session.user_id,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "mode": "adaptive",
+            "per_question": session.per_question,
+            "correct_count": correct_count,
+            "total_questions": len(session.per_question),
+            # on the adaptive test every learner gets about half right, so the score
+            # (and topic mastery) come from the ability estimate instead
+            "score_percent": percent_from_ability(session.ability),
+            "ability": round(session.ability, 3),
+            "ability_se": round(session.ability_se, 3),
+            "stop_reason": stop_reason,
+        }
+
+    def submit(self, session_id: str, answer: str) -> Dict[str, Any]:
+        """
+        Grade the answer to the session's current question and advance it. Returns
+          {"correct", "explanation", "ability", "ability_se", "done", "next_item", "result"}
+        with the next question already in next_item (one round-trip per question), or,
+        when the diagnostic stops, next_item None and the saved result.
+        """
+        session = _session(session_id)
+        with session.lock:
+            grade = grade_answer_safe(session.pending()["equation"], answer)
+            return self._advance([session], [answer], [grade])[session_id]
+
+    def submit_many(self, answers: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        submit() for many sessions at once (e.g. a class taking the diagnostic together):
+        answers maps session_id -> answer. All answers are graded in one grade_batch call and
+        all ability estimates updated in one vectorized step. Returns submit()'s dict per session.
+        """
+        if not answers:
+            return {}
+        sessions = [_session(session_id) for session_id in answers]
+        texts = [answers[session.session_id] for session in sessions]
+        with contextlib.ExitStack() as held:
+            # in session_id order, so two overlapping submit_many calls cannot deadlock
+            for session in sorted(sessions, key=lambda s: s.session_id):
+                held.enter_context(session.lock)
+            batch = grade_batch([session.pending()["equation"] for session in sessions], texts,
+                                parse_answer=parse_answer_safe)
+            return self._advance(sessions, texts, grades_from_batch(batch))
+
+    def _advance_and_release(self, session: DiagnosticSession, answer: str,
+                             grade: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return self._advance([session], [answer], [grade])[session.session_id]
+        finally:
+            session.lock.release()
+
+    async def submit_async(self, session_id: str, answer: str) -> Dict[str, Any]:
+        """Async submit: the answer is graded on the sandbox pool, selection and saving run on the I/O executor."""
+        session = _session(session_id)
+        await session.lock_async()
+        try:
+            grade = await grade_answer_safe_async(session.pending()["equation"], answer)
+        except BaseException:
+            session.lock.release()
+            raise
+        # released on the I/O thread once the session has advanced, even if this task is cancelled
+        return await run_io(self._advance_and_release, session, answer, grade)
@@ -1,13 +1,15 @@
 # src/agents/feedback_agent.py
-from typing import Dict, Any, List, Optional
+import asyncio
+from typing import Dict, Any, Iterator, List, Optional
 from datetime import datetime
 from observability.logging_setup import get_logger
-from tools.persistence import init_db, load_memory, save_memory
-from tools.code_executor import grade_answer, solve_for_x
-from observability.tracing import init_tracing
+from tools.persistence import apply_updates, run_io
+from tools.storage import get_storage
+from tools.code_executor import grade_answer, solve_for_x, solve_for_x_async
+from observability.tracing import get_tracer
+from tools.llm import LLMExecutor, executor_for
 
 logger = get_logger("feedback_agent")
-tracer = init_tracing("feedback_agent")  # simple local tracer
 
 def deterministic_hint_for_mistake(question: str, expected: float, user_val: Optional[float]) -> str:
     """
@@ -29,7 +31,8 @@ def deterministic_hint_for_mistake(question: str, expected: float, user_val: Opt
     # otherwise generic hint
     return "Verify you first subtracted/added the constant term, then divided by the coefficient. Show each step."
 
-def build_step_by_step_explanation(question: str, expected_expr: str, user_answer_raw: str) -> Dict[str, Any]:
+def build_step_by_step_explanation(question: str, expected_expr: str, user_answer_raw: str,
+                                   expected_value: Optional[float] = None) -> Dict[str, Any]:
     """
     Build a small structured feedback object:
       - parsed expected and user values
@@ -40,9 +43,12 @@ def build_step_by_step_explanation(question: str, expected_expr: str, user_answe
       question: original question text (for context)
       expected_expr: the expected equation string like "2*x+3=11"
       user_answer_raw: the raw answer string provided by the user
+      expected_value: already-solved expected value (skips solving expected_expr again)
     """
     # compute expected numeric solution (if possible)
-    exp_val = solve_for_x(expected_expr) if expected_expr else None
+    exp_val = expected_value
+    if exp_val is None:
+        exp_val = solve_for_x(expected_expr) if expected_expr else None
 
     # parse user's numeric value if possible
     try:
@@ -84,17 +90,76 @@ class FeedbackAgent:
     FeedbackAgent:
     - For each incorrectly answered quiz question, produce:
         * a deterministic explanation & checklist,
-        * an optional LLM-expanded feedback text (if llm_hook provided)
+        * an optional LLM-expanded feedback text (if llm_hook provided, or a shared LLM backend is
+          configured, see tools.llm); expansions for all incorrect questions run concurrently,
+          cached and with a timeout, falling back to the deterministic guidance alone
     - Persist feedback to memory under 'last_feedback' and append to 'feedbacks'
     - Emit tracing spans for the feedback generation step to support observability
     """
 
-    def __init__(self, conn=None, llm_hook: Optional[callable] = None):
-        self.conn = conn or init_db()
+    def __init__(self, conn=None, llm_hook: Optional[callable] = None, llm: Optional[LLMExecutor] = None):
+        self.conn = conn or get_storage()
         self.llm_hook = llm_hook
-        # reuse tracer from tracing module
-        from opentelemetry import trace
-        self.tracer = trace.get_tracer("feedback_agent")
+        self.llm = llm or executor_for(llm_hook)
+        self._tracer = None
+
+    @property
+    def tracer(self):
+        # tracing (and the OpenTelemetry SDK) is set up on the first span, not at import
+        if self._tracer is None:
+            self._tracer = get_tracer("feedback_agent")
+        return self._tracer
+
+    def _correct_item(self, q: Dict[str, Any]) -> Dict[str, Any]:
+        # short praise message
+        return {
+            "q_index": q["q_index"],
+            "status": "correct",
+            "message": "Good job — solution is correct.",
+            "details": {"expected": q.get("expected"), "user": q.get("user_answer_parsed")}
+        }
+
+    def _incorrect_item(self, q: Dict[str, Any], det: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "q_index": q["q_index"],
+            "status": "incorrect",
+            "message": "See step-by-step guidance and hint below.",
+            "details": det
+        }
+
+    def _llm_prompt(self, q: Dict[str, Any], det: Dict[str, Any]) -> Dict[str, Any]:
+        # pass a concise prompt; llm_hook returns expanded text
+        return {
+            "question": q.get("question"),
+            "expected_expr": q.get("expected"),
+            "user_answer": q.get("user_answer_raw"),
+            "deterministic": det
+        }
+
+    def _attach_expansions(self, user_id: str, pending: List[Dict[str, Any]], expanded: List[Optional[str]]):
+        """Add llm_expanded to items whose expansion succeeded; the rest keep only the deterministic guidance."""
+        for item, text in zip(pending, expanded):
+            if text is not None:
+                item["llm_expanded"] = text
+        failed = sum(text is None for text in expanded)
+        if failed:
+            logger.info("llm_expansion_skipped", extra={"extra": {"user_id": user_id, "items": failed}})
+
+    def _build_report(self, user_id: str, quiz_answers: Dict[str, Any], feedback_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # assemble feedback report
+        return {
+            "user_id": user_id,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "quiz_score": quiz_answers.get("score_percent"),
+            "items": feedback_items
+        }
+
+    def _save_report(self, user_id: str, report: Dict[str, Any]):
+        # persist
+        apply_updates(self.conn, user_id, [
+            ("append", "feedbacks", report),
+            ("set", "last_feedback", report),
+        ])
 
     def provide_feedback(self, user_id: str, quiz_answers: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -104,55 +169,103 @@ class FeedbackAgent:
         trace_id = f"feedback-{user_id}"
         logger.info("intent_before_feedback", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
 
-        feedback_items = []
+        feedback_items, pending, prompts = [], [], []
         with self.tracer.start_as_current_span("feedback-generation"):
             for q in quiz_answers.get("per_question", []):
                 if q.get("correct"):
-                    # short praise message
-                    item = {
-                        "q_index": q["q_index"],
-                        "status": "correct",
-                        "message": "Good job — solution is correct.",
-                        "details": {"expected": q.get("expected"), "user": q.get("user_answer_parsed")}
-                    }
+                    item = self._correct_item(q)
                 else:
                     # deterministic analysis
                     det = build_step_by_step_explanation(q.get("question"), q.get("expected"), q.get("user_answer_raw"))
-                    item = {
-                        "q_index": q["q_index"],
-                        "status": "incorrect",
-                        "message": "See step-by-step guidance and hint below.",
-                        "details": det
-                    }
-                    # optional LLM expansion
-                    if self.llm_hook:
-                        try:
-                            # pass a concise prompt; llm_hook returns expanded text
-                            expanded = self.llm_hook({
-                                "question": q.get("question"),
-                                "expected_expr": q.get("expected"),
-                                "user_answer": q.get("user_answer_raw"),
-                                "deterministic": det
-                            })
-                            item["llm_expanded"] = expanded
-                        except Exception as e:
-                            logger.info("llm_hook_failed", extra={"extra": {"error": str(e), "user_id": user_id}})
+                    item = self._incorrect_item(q, det)
+                    pending.append(item)
+                    prompts.append(self._llm_prompt(q, det))
                 feedback_items.append(item)
+            # optional LLM expansion, all incorrect questions at once
+            if self.llm is not None and prompts:
+                self._attach_expansions(user_id, pending, self.llm.expand_many(prompts))
 
-        # assemble feedback report
-        report = {
-            "user_id": user_id,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "quiz_score": quiz_answers.get("score_percent"),
-            "items": feedback_items
-        }
+        report = self._build_report(user_id, quiz_answers, feedback_items)
+        self._save_report(user_id, report)
 
-        # persist
-        mem = load_memory(self.conn, user_id) or {}
-        mem.setdefault("feedbacks", [])
-        mem["feedbacks"].append(report)
-        mem["last_feedback"] = report
-        save_memory(self.conn, user_id, mem)
+        logger.info("feedback_saved", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": report["quiz_score"]}})
+        return report
+
+    def provide_feedback_stream(self, user_id: str, quiz_answers: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming provide_feedback for the UI: yields sections as soon as each is ready, then persists once.
+          {"section": "item", "item"}                     per question, deterministic feedback first
+          {"section": "llm_token", "q_index", "text"}     expansion chunks, question by question
+          {"section": "done", "report"}                   the saved report, same shape as provide_feedback()
+        Expansions for all incorrect questions start together; later ones are usually buffered
+        by the time the earlier ones finish streaming.
+        """
+        trace_id = f"feedback-{user_id}"
+        logger.info("intent_before_feedback", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "stream": True}})
+
+        # an explicit span, not the current one: the consumer runs between our yields
+        span = self.tracer.start_span("feedback-generation")
+        try:
+            feedback_items, pending, prompts = [], [], []
+            for q in quiz_answers.get("per_question", []):
+                if q.get("correct"):
+                    item = self._correct_item(q)
+                else:
+                    det = build_step_by_step_explanation(q.get("question"), q.get("expected"), q.get("user_answer_raw"))
+                    item = self._incorrect_item(q, det)
+                    pending.append(item)
+                    prompts.append(self._llm_prompt(q, det))
+                feedback_items.append(item)
+                yield {"section": "item", "item": item}
+
+            if self.llm is not None and prompts:
+                streams = [self.llm.stream(prompt) for prompt in prompts]
+                for item, tokens in zip(pending, streams):
+                    for token in tokens:
+                        yield {"section": "llm_token", "q_index": item["q_index"], "text": token}
+                self._attach_expansions(user_id, pending, [tokens.text for tokens in streams])
+        finally:
+            span.end()
+
+        report = self._build_report(user_id, quiz_answers, feedback_items)
+        self._save_report(user_id, report)
+
+        logger.info("feedback_saved", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": report["quiz_score"]}})
+        yield {"section": "done", "report": report}
+
+    async def provide_feedback_async(self, user_id: str, quiz_answers: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async provide_feedback: expected values are solved on the grading process pool,
+        LLM expansions for all incorrect questions run concurrently on the LLM executor,
+        and the report is persisted on the I/O executor.
+        """
+        trace_id = f"feedback-{user_id}"
+        logger.info("intent_before_feedback", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+
+        pending, prompts = [], []
+
+        async def incorrect(q):
+            expr = q.get("expected")
+            exp_val = await solve_for_x_async(expr) if expr else None
+            det = build_step_by_step_explanation(q.get("question"), expr, q.get("user_answer_raw"), expected_value=exp_val)
+            item = self._incorrect_item(q, det)
+            pending.append(item)
+            prompts.append(self._llm_prompt(q, det))
+            return item
+
+        async def correct(q):
+            return self._correct_item(q)
+
+        with self.tracer.start_as_current_span("feedback-generation"):
+            feedback_items = await asyncio.gather(*(
+                correct(q) if q.get("correct") else incorrect(q)
+                for q in quiz_answers.get("per_question", [])
+            ))
+            if self.llm is not None and prompts:
+                self._attach_expansions(user_id, pending, await self.llm.expand_many_async(prompts))
+
+        report = self._build_report(user_id, quiz_answers, list(feedback_items))
+        await run_io(self._save_report, user_id, report)
 
         logger.info("feedback_saved", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": report["quiz_score"]}})
         return report
@@ -1,26 +1,76 @@
 # src/agents/lesson_agent.py
+import copy
+import os
 import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, Optional, Tuple
 
 from observability.logging_setup import get_logger
-from tools.persistence import init_db, load_memory, save_memory
-import sympy as sp
+from tools.persistence import apply_updates, run_io
+from tools.storage import get_storage
+from tools.problem_bank import get_problem_bank, make_problem
+from tools.llm import LLMExecutor, executor_for
 
 logger = get_logger("lesson_agent")
 
+# Difficulty tiers, easiest first; a learner's difficulty_curve preference shifts the tier
+TIERS = ("Foundational", "Remedial", "Practice")
+CURVE_SHIFT = {"easy": -1, "normal": 0, "hard": 1}
+DEFAULT_PREFERENCES = {"learning_style": "textual", "difficulty_curve": "normal"}
 
-def generate_linear_equation_example(a: int = None, b: int = None, c: int = None) -> Dict[str, Any]:
+FOCUS = {
+    "Practice": "Practice solving linear equations quickly and check steps.",
+    "Remedial": "Work on correctly isolating variables and handling negative constants.",
+    "Foundational": "Begin with isolating the variable, move step-by-step, and verify each operation.",
+}
+# Added to the explanation for learning styles other than plain text
+STYLE_NOTES = {
+    "visual": "Picture the equation as a balance: whatever you do to one side, do to the other.",
+    "step-by-step": "Write each operation on its own line before moving on to the next one.",
+}
+
+# Lesson template cache (see LessonTemplateCache)
+LESSON_CACHE_SIZE = int(os.environ.get("COACH_LESSON_CACHE_SIZE", "256"))
+LESSON_CACHE_TTL_SECONDS = float(os.environ.get("COACH_LESSON_CACHE_TTL", "3600"))
+# how long a request waits for another thread that is already building the same template
+LESSON_BUILD_WAIT_SECONDS = 30.0
+
+
+# Problem-bank features per lesson difficulty (see tools.problem_bank.FEATURES; omitted = either)
+DIFFICULTY_FEATURES = {
+    "Foundational": {"negative_constant": False, "fractional_solution": False, "negative_solution": False},
+    "Remedial": {"negative_constant": True, "fractional_solution": False},
+    "Practice": {"non_unit_coefficient": True},
+}
+
+
+def generate_linear_equation_example(a: int = None, b: int = None, c: int = None,
+                                     **features: Optional[bool]) -> Dict[str, Any]:
     """
-    Build a simple linear equation of the form a*x + b = c (integers),
-    solve it symbolically with sympy, and produce step-by-step reasoning.
+    Build a simple linear equation of the form a*x + b = c (integers)
+    with its exact solution and step-by-step reasoning.
+    With no coefficients given, a problem matching `features` is drawn from the
+    precomputed problem bank (tools.problem_bank); otherwise the missing ones are random.
     Returns a dict:
       {
         "equation_str": "2*x + 3 = 11",
+        "coefficients": [2, 3, 11],
         "solution": 4.0,
-        "steps": ["2*x + 3 = 11", "2*x = 8", "x = 4"]
+        "steps": ["Start: 2*x + 3 = 11", "Subtract 3 from both sides: 2*x = 8", "Divide both sides by 2: x = 4.0"],
+        "features": ["non_unit_coefficient"]
       }
     """
+    if a is None and b is None and c is None:
+        try:
+            return get_problem_bank().sample(**features)
+        except (sqlite3.Error, OSError) as e:
+            # e.g. a read-only working directory: fall back to drawing coefficients here
+            logger.info("problem_bank_unavailable", extra={"extra": {"error": str(e)}})
+
     # Choose random coefficients if not given (avoid zero for a)
     if a is None:
         a = random.choice([1, 2, 3, 4, 5])
@@ -30,104 +80,250 @@ def generate_linear_equation_example(a: int = None, b: int = None, c: int = None
         # ensure solution is integer by picking x_sol then computing c = a*x_sol + b
         x_sol = random.choice([-3, -2, -1, 1, 2, 3, 4, 5])
         c = a * x_sol + b
+    return make_problem(a, b, c)
+
+
+class LessonTemplateCache:
+    """
+    Cross-user cache of lesson templates: everything in a lesson except the per-user parts
+    (created_at, worked_example, score_prior), including the llm_hook expansion.
+
+    Keyed by (topic, difficulty tier, learning_style, difficulty_curve, with_llm), so with
+    three tiers the LLM is called once per tier and preference combination, not once per lesson.
+    - max_entries: least recently used templates are evicted beyond this size (0 disables the cache)
+    - ttl: templates older than this many seconds are rebuilt (fresh LLM text)
+    Concurrent misses on one key build it once; the other requests wait for that build.
+    """
+
+    def __init__(self, max_entries: int = LESSON_CACHE_SIZE, ttl: float = LESSON_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (template, stored_at)
+        self._entries: "OrderedDict[Tuple, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._building: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _fresh(self, key: Tuple, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry[1] > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get_or_build(self, key: Tuple, build: Callable[[], Tuple[Dict[str, Any], bool]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        (copy of the template, cache_hit). build() returns (template, cacheable); templates
+        whose build partly failed (e.g. the LLM call) are returned but not stored.
+        """
+        if self.max_entries <= 0:
+            with self._lock:
+                self.misses += 1
+                self.builds += 1
+            return build()[0], False
+
+        with self._lock:
+            template = self._fresh(key, time.monotonic())
+            if template is None:
+                building = self._building.get(key)
+                owner = building is None
+                if owner:
+                    building = self._building[key] = threading.Event()
+        if template is None and not owner:
+            building.wait(LESSON_BUILD_WAIT_SECONDS)
+            with self._lock:
+                template = self._fresh(key, time.monotonic())
+        if template is not None:
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(template), True
 
-    x = sp.symbols('x')
-    left = f"{a}*x + ({b})" if b < 0 else f"{a}*x + {b}"
-    equation = f"{left} = {c}"
-
-    # Solve with sympy
-    sol = sp.solve(sp.Eq(sp.sympify(a)*x + sp.sympify(b), sp.sympify(c)), x)
-    solution = float(sol[0].evalf()) if sol else None
-
-    # Build human steps:
-    steps = []
-    steps.append(f"Start: {equation}")
-    # isolate ax term
-    if b != 0:
-        steps.append(f"Subtract {b} from both sides: {a}*x = {c - b}")
-    else:
-        steps.append(f"No subtraction needed: {a}*x = {c}")
-    # divide by a
-    if a != 1:
-        steps.append(f"Divide both sides by {a}: x = {(c - b)/a}")
-    else:
-        steps.append(f"x = {c - b}")
-    return {
-        "equation_str": equation,
-        "solution": solution,
-        "steps": steps
-    }
+        with self._lock:
+            self.misses += 1
+            self.builds += 1
+        try:
+            template, cacheable = build()
+            if cacheable:
+                self.put(key, template)
+        finally:
+            if owner:
+                with self._lock:
+                    self._building.pop(key, None)
+                building.set()
+        return template, False
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Copy of the cached template for key, or None (no building; used by plan_stream)."""
+        with self._lock:
+            template = self._fresh(key, time.monotonic()) if self.max_entries > 0 else None
+            if template is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return copy.deepcopy(template)
+
+    def put(self, key: Tuple, template: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(template), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+# Shared by every LessonAgent in the process
+lesson_template_cache = LessonTemplateCache()
+
+
+def configure_lesson_cache(max_entries: int = LESSON_CACHE_SIZE, ttl: float = LESSON_CACHE_TTL_SECONDS) -> LessonTemplateCache:
+    """Replace the shared template cache (max_entries=0 disables it)."""
+    global lesson_template_cache
+    lesson_template_cache = LessonTemplateCache(max_entries, ttl)
+    return lesson_template_cache
+
+
+def lesson_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the shared lesson template cache."""
+    return lesson_template_cache.stats()
 
 
 class LessonAgent:
     """
     Lightweight Lesson Planner:
     - Accepts the assessment result structure and produces a short micro-lesson.
+    - The topic/tier/preference dependent part of a lesson (and its LLM expansion) comes from
+      the shared LessonTemplateCache; only the worked example is drawn per user.
     - Stores lesson into persistent memory (under 'last_lesson' and appends to 'lessons').
-    - If an LLM is available, you can hook `expand_with_llm(lesson_text)` to produce richer text.
+    - If an LLM is available, you can hook `expand_with_llm(lesson_text)` to produce richer text;
+      it is called through tools.llm (cached, with a timeout and circuit breaker).
     """
 
-    def __init__(self, conn=None, llm_hook: Optional[callable] = None):
-        self.conn = conn or init_db()
+    def __init__(self, conn=None, llm_hook: Optional[callable] = None, llm: Optional[LLMExecutor] = None):
+        self.conn = conn or get_storage()
         # Optional hook: a function that takes short lesson dict and returns expanded lesson text
         self.llm_hook = llm_hook
+        self.llm = llm or executor_for(llm_hook)
 
-    def _build_short_lesson_text(self, topic: str, diagnostics: Dict[str, Any]) -> Dict[str, Any]:
-        """
-        Construct a micro-lesson based on topic and diagnostic summary.
-        For this capstone we focus on 'linear_equations'.
-        """
-        timestamp = datetime.utcnow().isoformat() + "Z"
-        # simple diagnosis: use latest diagnostic score
-        latest_diag = diagnostics[-1] if diagnostics else {}
-        score = latest_diag.get("score_percent", 0)
-
-        # Decide focus area
+    @staticmethod
+    def _difficulty(score: int, difficulty_curve: str) -> str:
+        # Decide focus area from the latest score, shifted by the learner's difficulty curve
         if score >= 80:
-            focus = "Practice solving linear equations quickly and check steps."
-            difficulty = "Practice"
+            tier = 2
         elif score >= 50:
-            focus = "Work on correctly isolating variables and handling negative constants."
-            difficulty = "Remedial"
+            tier = 1
         else:
-            focus = "Begin with isolating the variable, move step-by-step, and verify each operation."
-            difficulty = "Foundational"
+            tier = 0
+        tier = min(len(TIERS) - 1, max(0, tier + CURVE_SHIFT.get(difficulty_curve, 0)))
+        return TIERS[tier]
 
-        # Create a worked example programmatically
-        example = generate_linear_equation_example()
-
-        lesson = {
+    def _build_template(self, topic: str, difficulty: str, learning_style: str,
+                        difficulty_curve: str, expand: bool = True) -> Tuple[Dict[str, Any], bool]:
+        """The shared part of a lesson; (template, cacheable) for LessonTemplateCache."""
+        explanation = (
+            "To solve equations like a*x + b = c, first move constants to the right side "
+            "by subtracting b, then divide by a to get x. Keep each step explicit."
+        )
+        if learning_style in STYLE_NOTES:
+            explanation += " " + STYLE_NOTES[learning_style]
+        template = {
             "topic": topic,
-            "created_at": timestamp,
             "difficulty": difficulty,
             "learning_objectives": [
                 "Isolate the variable x in single-variable linear equations",
                 "Perform arithmetic operations on both sides of the equation",
                 "Check solutions by substitution"
             ],
-            "focus": focus,
-            "short_explanation": (
-                "To solve equations like a*x + b = c, first move constants to the right side "
-                "by subtracting b, then divide by a to get x. Keep each step explicit."
-            ),
-            "worked_example": example,
+            "focus": FOCUS[difficulty],
+            "short_explanation": explanation,
             "practice_prompt": "Solve 3 similar equations and check your steps. Try both positive and negative constants.",
-            "score_prior": score
+            "learning_style": learning_style,
+            "difficulty_curve": difficulty_curve,
         }
 
         # Optionally expand text with an LLM if hook provided (no keys in repo)
-        if self.llm_hook:
-            try:
-                lesson["expanded_explanation"] = self.llm_hook(lesson["short_explanation"])
-            except Exception as e:
-                logger.info("llm_hook_failed", extra={"extra": {"error": str(e)}})
+        cacheable = True
+        if self.llm is not None and expand:
+            expanded = self.llm.expand(template["short_explanation"])
+            if expanded is not None:
+                template["expanded_explanation"] = expanded
+            else:
+                # failed or timed out: retry on the next request instead of caching a lesson without it
+                cacheable = False
+                logger.info("llm_expansion_skipped", extra={"extra": {"topic": topic, "difficulty": difficulty}})
+        return template, cacheable
 
+    def _lesson_context(self, topic: str, diagnostics: Dict[str, Any],
+                        preferences: Optional[Dict[str, Any]]) -> Tuple[int, str, str, str, Tuple]:
+        """(score, difficulty, learning_style, difficulty_curve, template cache key)."""
+        # simple diagnosis: use latest diagnostic score
+        latest_diag = diagnostics[-1] if diagnostics else {}
+        score = latest_diag.get("score_percent", 0)
+        prefs = {**DEFAULT_PREFERENCES, **{k: v for k, v in (preferences or {}).items() if v}}
+        learning_style, difficulty_curve = prefs["learning_style"], prefs["difficulty_curve"]
+        difficulty = self._difficulty(score, difficulty_curve)
+        # LLM backends are assumed interchangeable within a process: key only on whether one is set
+        key = (topic, difficulty, learning_style, difficulty_curve, self.llm is not None)
+        return score, difficulty, learning_style, difficulty_curve, key
+
+    def _build_short_lesson_text(self, topic: str, diagnostics: Dict[str, Any],
+                                 preferences: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Construct a micro-lesson based on topic, diagnostic summary and learner preferences
+        (learning_style, difficulty_curve). For this capstone we focus on 'linear_equations'.
+        """
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        score, difficulty, learning_style, difficulty_curve, key = self._lesson_context(topic, diagnostics, preferences)
+        lesson, _ = lesson_template_cache.get_or_build(
+            key, lambda: self._build_template(topic, difficulty, learning_style, difficulty_curve)
+        )
+        # Draw a worked example of matching difficulty from the problem bank
+        lesson.update({
+            "created_at": timestamp,
+            "worked_example": generate_linear_equation_example(**DIFFICULTY_FEATURES[difficulty]),
+            "score_prior": score,
+        })
         return lesson
 
-    def plan(self, user_id: str, diagnostics: Dict[str, Any]) -> Dict[str, Any]:
+    def _save_lesson(self, user_id: str, lesson: Dict[str, Any]):
+        # Persist lesson into memory
+        apply_updates(self.conn, user_id, [
+            ("append", "lessons", lesson),
+            ("set", "last_lesson", lesson),
+        ])
+
+    def plan(self, user_id: str, diagnostics: Dict[str, Any],
+             preferences: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Main entry point:
-        - Build a lesson tailored to diagnostics
+        - Build a lesson tailored to diagnostics and preferences
         - Save to DB under last_lesson and append to lessons
         - Emit structured logs for observability
         """
@@ -135,15 +331,81 @@ class LessonAgent:
         logger.info("intent_before_lesson_plan", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
 
         # Build lesson only for linear_equations (for this capstone)
-        lesson = self._build_short_lesson_text("linear_equations", diagnostics)
+        lesson = self._build_short_lesson_text("linear_equations", diagnostics, preferences)
+        self._save_lesson(user_id, lesson)
 
-        # Persist lesson into memory
-        mem = load_memory(self.conn, user_id) or {}
-        mem.setdefault("lessons", [])
-        mem["lessons"].append(lesson)
-        mem["last_lesson"] = lesson
-        save_memory(self.conn, user_id, mem)
+        logger.info("lesson_planned", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "topic": lesson["topic"], "difficulty": lesson["difficulty"]}})
+
+        return lesson
+
+    async def plan_async(self, user_id: str, diagnostics: Dict[str, Any],
+                         preferences: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Async plan: lesson building (template cache, problem bank lookup and, on a cache miss,
+        the blocking llm_hook) and persistence both run on the memory I/O executor, off the event loop.
+        """
+        trace_id = f"lesson-{user_id}"
+        logger.info("intent_before_lesson_plan", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+
+        lesson = await run_io(self._build_short_lesson_text, "linear_equations", diagnostics, preferences)
+        await run_io(self._save_lesson, user_id, lesson)
 
         logger.info("lesson_planned", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "topic": lesson["topic"], "difficulty": lesson["difficulty"]}})
 
         return lesson
+
+    def plan_stream(self, user_id: str, diagnostics: Dict[str, Any],
+                    preferences: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming plan for the UI: yields sections as soon as each is ready, then persists once.
+          {"section": "overview", "topic", "difficulty", "focus", "learning_objectives", ...}
+          {"section": "explanation", "text"}
+          {"section": "worked_example", "equation_str", "solution", "features"}
+          {"section": "example_step", "index", "text"}          one per step
+          {"section": "practice", "text"}
+          {"section": "llm_token", "text"}                      expansion chunks (LLM configured)
+          {"section": "done", "lesson"}                         the saved lesson, same shape as plan()
+        A cached template's expansion arrives as one llm_token; a fresh one is streamed and, when
+        complete, stored in the template cache (concurrent misses are not merged here, unlike plan).
+        """
+        trace_id = f"lesson-{user_id}"
+        logger.info("intent_before_lesson_plan", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "stream": True}})
+        topic = "linear_equations"
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        score, difficulty, learning_style, difficulty_curve, key = self._lesson_context(topic, diagnostics, preferences)
+
+        template = lesson_template_cache.get(key)
+        cached = template is not None
+        if template is None:
+            template, _ = self._build_template(topic, difficulty, learning_style, difficulty_curve, expand=False)
+        yield {"section": "overview", "topic": topic, "difficulty": difficulty, "focus": template["focus"],
+               "learning_objectives": template["learning_objectives"],
+               "learning_style": learning_style, "difficulty_curve": difficulty_curve}
+        yield {"section": "explanation", "text": template["short_explanation"]}
+
+        example = generate_linear_equation_example(**DIFFICULTY_FEATURES[difficulty])
+        yield {"section": "worked_example", "equation_str": example["equation_str"],
+               "solution": example["solution"], "features": example.get("features", [])}
+        for index, step in enumerate(example["steps"]):
+            yield {"section": "example_step", "index": index, "text": step}
+        yield {"section": "practice", "text": template["practice_prompt"]}
+
+        if cached:
+            if "expanded_explanation" in template:
+                yield {"section": "llm_token", "text": template["expanded_explanation"]}
+        elif self.llm is not None:
+            tokens = self.llm.stream(template["short_explanation"])
+            for token in tokens:
+                yield {"section": "llm_token", "text": token}
+            if tokens.text is not None:
+                template["expanded_explanation"] = tokens.text
+                lesson_template_cache.put(key, template)
+            else:
+                logger.info("llm_expansion_skipped", extra={"extra": {"topic": topic, "difficulty": difficulty}})
+        else:
+            lesson_template_cache.put(key, template)
+
+        lesson = dict(template, created_at=timestamp, worked_example=example, score_prior=score)
+        self._save_lesson(user_id, lesson)
+        logger.info("lesson_planned", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "topic": lesson["topic"], "difficulty": lesson["difficulty"]}})
+        yield {"section": "done", "lesson": lesson}
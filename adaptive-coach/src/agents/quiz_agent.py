@@ -1,9 +1,14 @@
 # src/agents/quiz_agent.py
+import asyncio
+import sqlite3
 from typing import Dict, Any, List, Tuple
 from datetime import datetime
 from observability.logging_setup import get_logger
-from tools.persistence import init_db, load_memory, save_memory
-from tools.code_executor import grade_answer
+from tools.persistence import apply_updates, get_path, get_paths_versioned, retry_on_conflict, run_io
+from tools.storage import get_storage
+from tools.sandbox import grade_answer_safe, grade_answer_safe_async
+from tools.item_bank import QUESTION_PREFIX, ability_from_percent, get_item_bank
+from tools.variants import equation_variants, parse_equation, render
 
 logger = get_logger("quiz_agent")
 
@@ -11,88 +16,106 @@ logger = get_logger("quiz_agent")
 class QuizAgent:
     """
     QuizAgent:
-    - Given a lesson dict, generate a short quiz (3 questions) derived from the lesson's worked example.
-    - Grade answers using grade_answer (safe tool).
+    - Given a lesson dict, generate a short quiz (3 questions): the lesson's worked example plus
+      the two items of the calibrated item bank that are most informative at the learner's
+      ability, among those with at least the example's difficulty features (or, if the item
+      bank is unavailable, structured variants of the example: tools.variants).
+    - Grade answers using grade_answer_safe (grade_answer with untrusted text isolated).
     - Persist quiz results into memory under 'last_quiz' and append to 'quizzes'.
     """
 
     def __init__(self, conn=None):
-        self.conn = conn or init_db()
+        self.conn = conn or get_storage()
+
+    def _ability(self, user_id: str) -> float:
+        """Ability estimate (logits) for item selection, from the learner's topic mastery."""
+        mastery = get_path(self.conn, user_id, "topic_mastery.linear_equations")
+        return 0.0 if mastery is None else ability_from_percent(mastery)
+
+    def _questions_from_bank(self, user_id: str, worked_example: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """
+        The worked example plus the two items most informative at the learner's ability that
+        keep every difficulty feature of the example (e.g. negative constant), as
+        (question_text, expected_expression). Strong learners may get items with extra features.
+        """
+        eq = worked_example["equation_str"]
+        bank = get_item_bank()
+        theta = self._ability(user_id)
+        items = bank.select(theta, k=2, exclude=[eq],
+                            features={name: True for name in worked_example.get("features", [])})
+        if len(items) < 2:
+            items += bank.select(theta, k=2 - len(items), exclude=[eq] + [item["equation"] for item in items])
+        return [(f"{QUESTION_PREFIX}{p}", p) for p in [eq] + [item["equation"] for item in items]]
 
     def _derive_questions_from_example(self, worked_example: Dict[str, Any]) -> List[Tuple[str, str]]:
         """
-        Derive simple variation questions from the worked example.
-        Returns list of tuples: (question_text, expected_expression)
-        Example: if worked_example has equation "2*x + 3 = 11" and solution 4,
-        produce 3 variations with different constants/coefs.
+        The worked example plus two structured variants of it (tools.variants): new coefficients
+        with the example's difficulty features and a whole-number solution (or a short decimal
+        one if the example has one). Returns list of tuples: (question_text, expected_expression).
+        Example: "2*x + 3 = 11" -> also e.g. "3*x + 1 = 13" and "4*x + 5 = 25".
         """
         eq = worked_example.get("equation_str")
-        solution = worked_example.get("solution")
-        questions = []
-
-        # Base question: same pattern
-        questions.append((f"Solve for x: {eq}", eq))
-
-        # Variation 1: change RHS by +2 => expected new solution
-        try:
-            import re
-            # crude parsing to change RHS numeric value
-            left, right = eq.split("=")
-            right_val = float(right.strip())
-            new_right1 = int(right_val + 2)
-            q1 = (f"Solve for x: {left.strip()} = {new_right1}", f"{left.strip()} = {new_right1}")
-            questions.append(q1)
-            # Variation 2: change coefficient a by +1 if present like '2*x'
-            m = re.search(r"(?P<a>-?\d+)\*x", left.replace(" ", ""))
-            if m:
-                a = int(m.group("a"))
-                new_a = a + 1
-                left2 = left.replace(f"{a}*x", f"{new_a}*x")
-                q2 = (f"Solve for x: {left2} = {right.strip()}", f"{left2} = {right.strip()}")
-                questions.append(q2)
-            else:
-                # fallback simple arithmetic change
-                questions.append((f"Solve for x: {left.strip()} = {int(right_val)-1}", f"{left.strip()} = {int(right_val)-1}"))
-        except Exception:
-            # fallback trivial repeats if parsing fails
-            questions = [(f"Solve for x: {eq}", eq)]
-
-        # limit to 3 questions
-        return questions[:3]
+        coefficients = worked_example.get("coefficients") or parse_equation(eq)
+        equations = [eq]
+        if coefficients:
+            a, b, c = coefficients
+            integer = (c - b) % a == 0
+            equations += render(equation_variants(a, b, c, n=2, same_features=True, integer_solution=integer))[0]
+            if len(equations) < 3:
+                more = render(equation_variants(a, b, c, n=3, integer_solution=integer))[0]
+                equations += [p for p in more if p not in equations][:3 - len(equations)]
+        return [(f"{QUESTION_PREFIX}{p}", p) for p in equations]
 
-    def generate_quiz(self, user_id: str, lesson: Dict[str, Any]) -> Dict[str, Any]:
-        trace_id = f"quiz-gen-{user_id}"
-        logger.info("intent_before_quiz_generate", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+    def _build_quiz(self, user_id: str, lesson: Dict[str, Any]) -> Dict[str, Any]:
         worked = lesson.get("worked_example", {})
-        questions = self._derive_questions_from_example(worked)
-        quiz = {
+        questions = None
+        if worked.get("equation_str"):
+            try:
+                questions = self._questions_from_bank(user_id, worked)
+            except (sqlite3.Error, OSError) as e:
+                logger.info("item_bank_unavailable", extra={"extra": {"user_id": user_id, "error": str(e)}})
+        if questions is None:
+            questions = self._derive_questions_from_example(worked)
+        return {
             "user_id": user_id,
             "created_at": datetime.utcnow().isoformat() + "Z",
             "questions": [{"q": q, "expected_expr": exp} for q, exp in questions]
         }
+
+    def _save_quiz(self, user_id: str, quiz: Dict[str, Any]):
         # Persist skeleton quiz (no answers yet)
-        mem = load_memory(self.conn, user_id) or {}
-        mem.setdefault("quizzes", [])
-        mem["quizzes"].append({"quiz_meta": quiz, "answers": None})
-        mem["last_quiz"] = {"quiz_meta": quiz, "answers": None}
-        save_memory(self.conn, user_id, mem)
-        logger.info("quiz_generated", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "num_q": len(questions)}})
+        apply_updates(self.conn, user_id, [
+            ("append", "quizzes", {"quiz_meta": quiz, "answers": None}),
+            ("set", "last_quiz", {"quiz_meta": quiz, "answers": None}),
+        ])
+
+    def generate_quiz(self, user_id: str, lesson: Dict[str, Any]) -> Dict[str, Any]:
+        trace_id = f"quiz-gen-{user_id}"
+        logger.info("intent_before_quiz_generate", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        quiz = self._build_quiz(user_id, lesson)
+        self._save_quiz(user_id, quiz)
+        logger.info("quiz_generated", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "num_q": len(quiz["questions"])}})
         return quiz
 
-    def grade_quiz(self, user_id: str, quiz: Dict[str, Any], user_answers: List[str]) -> Dict[str, Any]:
-        """
-        Grade the quiz using grade_answer for each expected_expr.
-        Returns result with per-question grading and summary.
-        """
+    async def generate_quiz_async(self, user_id: str, lesson: Dict[str, Any]) -> Dict[str, Any]:
+        """Async generate_quiz: the quiz is persisted on the memory I/O executor."""
+        trace_id = f"quiz-gen-{user_id}"
+        logger.info("intent_before_quiz_generate", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        # item selection reads the learner's mastery: keep it off the event loop too
+        quiz = await run_io(self._build_quiz, user_id, lesson)
+        await run_io(self._save_quiz, user_id, quiz)
+        logger.info("quiz_generated", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "num_q": len(quiz["questions"])}})
+        return quiz
+
+    def _answers(self, quiz: Dict[str, Any], user_answers: List[str]) -> List[str]:
+        return [user_answers[idx] if idx < len(user_answers) else "" for idx in range(len(quiz.get("questions", [])))]
+
+    def _build_result(self, user_id: str, quiz: Dict[str, Any], answers: List[str], grades: List[Dict[str, Any]]) -> Dict[str, Any]:
         trace_id = f"quiz-grade-{user_id}"
-        logger.info("intent_before_quiz_grade", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
         per_q = []
         correct_count = 0
         qs = quiz.get("questions", [])
-        for idx, q in enumerate(qs):
-            expected = q["expected_expr"]
-            ans = user_answers[idx] if idx < len(user_answers) else ""
-            grade = grade_answer(expected, ans)
+        for idx, (q, ans, grade) in enumerate(zip(qs, answers, grades)):
             per_q.append({
                 "q_index": idx,
                 "question": q["q"],
@@ -107,7 +130,7 @@ class QuizAgent:
             logger.info("quiz_question_graded", extra={"extra": {"trace_id": trace_id, "q_index": idx, "correct": grade["correct"]}})
 
         score = int((correct_count / max(1, len(qs))) * 100)
-        result = {
+        return {
             "user_id": user_id,
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "per_question": per_q,
@@ -116,25 +139,67 @@ class QuizAgent:
             "score_percent": score
         }
 
-        # Update memory: append answers and update topic mastery simple delta
-        mem = load_memory(self.conn, user_id) or {}
-        mem.setdefault("quizzes", [])
-        # replace last quiz skeleton with graded answers
-        if mem.get("last_quiz"):
-            mem["last_quiz"]["answers"] = result
-            # also update the last appended quiz
-            if mem["quizzes"]:
-                mem["quizzes"][-1]["answers"] = result
-        else:
-            mem["quizzes"].append({"quiz_meta": quiz, "answers": result})
-            mem["last_quiz"] = {"quiz_meta": quiz, "answers": result}
-
-        # Simple mastery update rule: average with prior mastery
-        prior = mem.get("topic_mastery", {}).get("linear_equations", 0)
-        new_mastery = int((prior + score) / 2) if prior else score
-        mem.setdefault("topic_mastery", {})["linear_equations"] = new_mastery
-
-        save_memory(self.conn, user_id, mem)
-        logger.info("quiz_graded", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": score, "new_mastery": new_mastery}})
+    def _save_graded(self, user_id: str, quiz: Dict[str, Any], result: Dict[str, Any]) -> int:
+        """
+        Store graded answers and the new topic mastery. Returns the new mastery.
+        The new mastery is derived from the stored one, so the write is guarded by the
+        learner's version and recomputed if another session wrote in between.
+        """
+        def attempt() -> int:
+            # values and version straight from the database: a cached value could be older
+            # than the version and let the guarded write commit a stale mastery
+            (last_quiz, last_entry, prior), version = get_paths_versioned(
+                self.conn, user_id, ["last_quiz", "quizzes[-1]", "topic_mastery.linear_equations"])
+            # Update memory: append answers and update topic mastery simple delta
+            updates = []
+            # replace last quiz skeleton with graded answers
+            if last_quiz:
+                updates.append(("set", "last_quiz.answers", result))
+                # also update the last appended quiz
+                if last_entry is not None:
+                    updates.append(("set", "quizzes[-1].answers", result))
+            else:
+                updates.append(("append", "quizzes", {"quiz_meta": quiz, "answers": result}))
+                updates.append(("set", "last_quiz", {"quiz_meta": quiz, "answers": result}))
+
+            # Simple mastery update rule: average with prior mastery
+            score = result["score_percent"]
+            new_mastery = int((prior + score) / 2) if prior else score
+            updates.append(("set", "topic_mastery.linear_equations", new_mastery))
+
+            apply_updates(self.conn, user_id, updates, expected_version=version)
+            return new_mastery
+
+        return retry_on_conflict(attempt)
+
+    def grade_quiz(self, user_id: str, quiz: Dict[str, Any], user_answers: List[str]) -> Dict[str, Any]:
+        """
+        Grade the quiz using grade_answer_safe for each expected_expr.
+        Returns result with per-question grading and summary.
+        """
+        trace_id = f"quiz-grade-{user_id}"
+        logger.info("intent_before_quiz_grade", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        answers = self._answers(quiz, user_answers)
+        grades = [grade_answer_safe(q["expected_expr"], ans) for q, ans in zip(quiz.get("questions", []), answers)]
+        result = self._build_result(user_id, quiz, answers, grades)
+        new_mastery = self._save_graded(user_id, quiz, result)
+        logger.info("quiz_graded", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": result["score_percent"], "new_mastery": new_mastery}})
+
+        return result
+
+    async def grade_quiz_async(self, user_id: str, quiz: Dict[str, Any], user_answers: List[str]) -> Dict[str, Any]:
+        """
+        Async grade_quiz: answers are graded concurrently (untrusted text on the sandbox pool)
+        and the result is persisted on the memory I/O executor.
+        """
+        trace_id = f"quiz-grade-{user_id}"
+        logger.info("intent_before_quiz_grade", extra={"extra": {"trace_id": trace_id, "user_id": user_id}})
+        answers = self._answers(quiz, user_answers)
+        grades = await asyncio.gather(*(
+            grade_answer_safe_async(q["expected_expr"], ans) for q, ans in zip(quiz.get("questions", []), answers)
+        ))
+        result = self._build_result(user_id, quiz, answers, list(grades))
+        new_mastery = await run_io(self._save_graded, user_id, quiz, result)
+        logger.info("quiz_graded", extra={"extra": {"trace_id": trace_id, "user_id": user_id, "score": result["score_percent"], "new_mastery": new_mastery}})
 
         return result
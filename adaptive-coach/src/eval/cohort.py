@@ -0,0 +1,171 @@
+# src/eval/cohort.py
+"""
+Class-level analytics over every learner.
+
+All queries read the narrow `learner_summary` table that persistence keeps up to
+date on each save, so they never decode memory blobs and stay in the millisecond
+range at 100k learners (see bench/bench_cohort.py). Sharded stores are queried
+shard by shard and the partial results merged.
+"""
+import math
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from tools.persistence import Conn, reading, flush, rebuild_summaries, shards_of
+from tools.storage import get_storage
+
+# Columns that can be aggregated (mastery and delta are indexed)
+SUMMARY_COLUMNS = ("mastery", "pre_score", "post_score", "delta", "diagnostics", "quizzes")
+DEFAULT_AT_RISK_THRESHOLD = 50
+
+
+def _column(column: str) -> str:
+    if column not in SUMMARY_COLUMNS:
+        raise ValueError(f"unknown summary column: {column!r} (expected one of {SUMMARY_COLUMNS})")
+    return column
+
+
+def cohort_overview(conn: Conn, at_risk_threshold: int = DEFAULT_AT_RISK_THRESHOLD) -> Dict[str, Any]:
+    """Learner count, averages and how many learners improved / are below the threshold."""
+    flush(conn)
+    # (count, sum) pairs are summed across shards, then divided once
+    totals = [0] * 10
+    for shard in shards_of(conn):
+        with reading(shard) as c:
+            row = c.execute(
+                """
+                SELECT COUNT(*),
+                       COUNT(mastery), SUM(mastery),
+                       COUNT(pre_score), SUM(pre_score),
+                       COUNT(post_score), SUM(post_score),
+                       COUNT(delta), SUM(delta),
+                       SUM(delta > 0)
+                FROM learner_summary
+                """
+            ).fetchone()
+        totals = [t + (v or 0) for t, v in zip(totals, row)]
+    learners, n_mastery, s_mastery, n_pre, s_pre, n_post, s_post, n_delta, s_delta, improved = totals
+    avg = lambda total, n: round(total / n, 1) if n else None
+    return {
+        "learners": learners,
+        "with_mastery": n_mastery,
+        "avg_mastery": avg(s_mastery, n_mastery),
+        "avg_pre_score": avg(s_pre, n_pre),
+        "avg_post_score": avg(s_post, n_post),
+        "with_pre_and_post": n_delta,
+        "avg_delta": avg(s_delta, n_delta),
+        "improved": improved,
+        "at_risk": sum(n for value, n in _value_counts(conn, "mastery") if value < at_risk_threshold),
+        "at_risk_threshold": at_risk_threshold,
+    }
+
+
+def _value_counts(conn: Conn, column: str) -> List[Tuple[Any, int]]:
+    """
+    (value, learners) for every distinct value of a summary column, ascending, over all shards.
+    Distinct values are few (scores are 0-100), and for mastery/delta the GROUP BY just walks the index.
+    """
+    column = _column(column)
+    counts: Dict[Any, int] = {}
+    for shard in shards_of(conn):
+        with reading(shard) as c:
+            for value, n in c.execute(
+                f"SELECT {column}, COUNT(*) FROM learner_summary WHERE {column} IS NOT NULL GROUP BY {column}"
+            ):
+                counts[value] = counts.get(value, 0) + n
+    return sorted(counts.items())
+
+
+def histogram(conn: Conn, column: str = "mastery", bins: int = 10,
+              low: int = 0, high: int = 100) -> List[Dict[str, Any]]:
+    """
+    Learner counts in `bins` equal-width buckets over [low, high].
+    Values outside the range are clamped into the first/last bucket; NULLs are skipped.
+    """
+    flush(conn)
+    width = (high - low) / bins
+    counts = [0] * bins
+    for value, n in _value_counts(conn, column):
+        counts[min(max(int((value - low) // width), 0), bins - 1)] += n
+    return [
+        {"from": round(low + i * width, 2), "to": round(low + (i + 1) * width, 2), "count": counts[i]}
+        for i in range(bins)
+    ]
+
+
+def percentiles(conn: Conn, column: str = "mastery",
+                points: Sequence[float] = (10, 25, 50, 75, 90)) -> Dict[float, Optional[float]]:
+    """Nearest-rank percentiles of a summary column."""
+    flush(conn)
+    values = _value_counts(conn, column)
+    total = sum(n for _, n in values)
+    result: Dict[float, Optional[float]] = {}
+    for p in points:
+        if not total:
+            result[p] = None
+            continue
+        rank, seen = max(1, math.ceil(p / 100 * total)), 0
+        for value, n in values:
+            seen += n
+            if seen >= rank:
+                result[p] = value
+                break
+    return result
+
+
+def at_risk(conn: Conn, threshold: int = DEFAULT_AT_RISK_THRESHOLD, limit: int = 50,
+            include_unassessed: bool = False) -> List[Dict[str, Any]]:
+    """
+    Learners whose mastery is below `threshold`, weakest first.
+    include_unassessed: also list learners with no stored mastery yet (after the others).
+    """
+    flush(conn)
+    where, order = "mastery < ?", "mastery"
+    if include_unassessed:
+        where, order = "mastery < ? OR mastery IS NULL", "mastery IS NULL, mastery"
+    rows = []
+    for shard in shards_of(conn):
+        with reading(shard) as c:
+            rows += c.execute(
+                f"""
+                SELECT user_id, mastery, pre_score, post_score, delta, updated_at
+                FROM learner_summary WHERE {where}
+                ORDER BY {order}
+                LIMIT ?
+                """,
+                (threshold, limit)
+            ).fetchall()
+    rows.sort(key=lambda r: (r[1] is None, r[1] or 0, r[0]))
+    keys = ("user_id", "mastery", "pre_score", "post_score", "delta", "updated_at")
+    return [dict(zip(keys, row)) for row in rows[:limit]]
+
+
+def build_cohort_report(conn: Optional[Conn] = None, threshold: int = DEFAULT_AT_RISK_THRESHOLD) -> str:
+    conn = conn or get_storage()
+    overview = cohort_overview(conn, threshold)
+    pct = percentiles(conn, "mastery", (25, 50, 75))
+    lines = [
+        "Adaptive Learning Coach - Cohort Report",
+        "",
+        f"Learners: {overview['learners']} ({overview['with_mastery']} with stored mastery)",
+        f"Average mastery: {overview['avg_mastery']}%  (p25 {pct[25]}, median {pct[50]}, p75 {pct[75]})",
+        f"Average pre/post score: {overview['avg_pre_score']}% -> {overview['avg_post_score']}%",
+        f"Average delta: {overview['avg_delta']} points ({overview['improved']} of "
+        f"{overview['with_pre_and_post']} learners improved)",
+        "",
+        "Mastery distribution:",
+    ]
+    for b in histogram(conn, "mastery", bins=5):
+        lines.append(f"  {b['from']:>5}-{b['to']:<5} {'#' * min(b['count'], 50)} {b['count']}")
+    lines += ["", f"At risk (mastery < {threshold}%): {overview['at_risk']}"]
+    for learner in at_risk(conn, threshold, limit=10):
+        lines.append(f"  - {learner['user_id']}: {learner['mastery']}%")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "--rebuild":
+        rebuild_summaries(get_storage())
+        args = args[1:]
+    print(build_cohort_report(threshold=int(args[0]) if args else DEFAULT_AT_RISK_THRESHOLD))
@@ -2,7 +2,8 @@
 import json
 from typing import Dict, Any
 from observability.logging_setup import get_logger
-from tools.persistence import init_db, load_memory
+from tools.persistence import load_memory
+from tools.storage import get_storage
 
 logger = get_logger("evaluator")
 
@@ -33,7 +34,7 @@ def lm_as_judge_stub(expected: Dict[str, Any], actual: Dict[str, Any]) -> Dict[s
     return {"score": 100 if passed else 0, "comment": commentary, "passed": passed}
 
 def run_evaluation(conn=None, golden_path: str = "adaptive-coach/src/eval/golden_cases.json"):
-    conn = conn or init_db()
+    conn = conn or get_storage()
     with open(golden_path, "r", encoding="utf-8") as f:
         cases = json.load(f)
 
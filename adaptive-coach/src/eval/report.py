@@ -1,11 +1,12 @@
 # src/eval/report.py
 import sys, os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from tools.persistence import init_db, load_memory
+from tools.persistence import load_memory, mastery_series
+from tools.storage import get_storage
 from datetime import datetime
 
 def build_report_for_user(user_id: str, conn=None) -> str:
-    conn = conn or init_db()
+    conn = conn or get_storage()
     mem = load_memory(conn, user_id)
     diagnostics = mem.get("diagnostics", [])
     last_diag = diagnostics[-1] if diagnostics else {}
@@ -24,6 +25,16 @@ def build_report_for_user(user_id: str, conn=None) -> str:
         f"Post-quiz score: {post_score}%",
         f"Delta (post - pre): {delta} percentage points",
         f"Current stored mastery for linear_equations: {mastery}%",
+    ]
+
+    series = mastery_series(conn, user_id, "linear_equations", bucket="day")
+    if len(series) > 1:
+        first, last = series[0], series[-1]
+        report.append(
+            f"Mastery trend: {first['mastery']}% ({first['timestamp']}) -> {last['mastery']}% ({last['timestamp']})"
+        )
+
+    report += [
         "",
         "Summary:",
     ]
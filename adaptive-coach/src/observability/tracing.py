@@ -1,22 +1,40 @@
 # src/observability/tracing.py
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import (
-    ConsoleSpanExporter,
-    SimpleSpanProcessor,
-)
+# The OpenTelemetry SDK is imported inside these functions, not at module import:
+# agents import this module at startup but only need a tracer once they emit a span.
+import threading
+
+_init_lock = threading.Lock()
+_initialized = False
 
 def init_tracing(service_name: str = "adaptive_coach"):
     """Initialize a simple console exporter for local tracing."""
+    global _initialized
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        ConsoleSpanExporter,
+        SimpleSpanProcessor,
+    )
+
     provider = TracerProvider()
     exporter = ConsoleSpanExporter()
     processor = SimpleSpanProcessor(exporter)
     provider.add_span_processor(processor)
     trace.set_tracer_provider(provider)
+    _initialized = True
     tracer = trace.get_tracer(service_name)
     return tracer
 
+def get_tracer(service_name: str = "adaptive_coach"):
+    """Tracer for service_name, running init_tracing once on first call."""
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                init_tracing(service_name)
+    from opentelemetry import trace
+    return trace.get_tracer(service_name)
+
 # Use like:
-# tracer = init_tracing()
+# tracer = get_tracer("my_service")   # first call sets up the console exporter
 # with tracer.start_as_current_span("my-span"):
 #     ... do instrumented work ...
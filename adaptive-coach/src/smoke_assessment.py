@@ -27,5 +27,13 @@ def run_demo():
     mem = load_memory(conn, user_id)
     print("Memory snapshot after diagnostics:", mem)
 
+    # Adaptive diagnostic: answer every item with 0 until the session stops
+    question = agent.start_adaptive(user_id)
+    while question is not None:
+        print("Adaptive question:", question["q"])
+        step = agent.submit(question["session_id"], "0")
+        question = step["next_item"]
+    print("Adaptive result:", {k: v for k, v in step["result"].items() if k != "per_question"})
+
 if __name__ == "__main__":
     run_demo()
@@ -2,23 +2,181 @@
 """
 Safe math & algebra checker tool.
 Provides helpers to grade numeric or algebraic answers for simple equations.
-Uses sympy to symbolically solve simple linear equations and compare user answers.
+Linear equations in x are solved exactly with Fractions; sympy is the fallback
+for anything else (and was the only solver before the fast path existed).
 """
-from typing import Dict, Any, Union
-import sympy as sp
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple, Union
 
-def solve_for_x(equation: str) -> Union[float, None]:
+from utils.lazy import lazy_import
+
+# imported on first use: most answers never need sympy (fast path) and numpy is only for batches
+np = lazy_import("numpy")
+sp = lazy_import("sympy")
+
+# ------------------------------------------------------------------
+# Exact linear fast path
+# ------------------------------------------------------------------
+# Every question in the system is "a*x + b = c"-shaped, which needs neither sympify
+# nor solve: a tiny tokenizer and recursive-descent parser reduce each side to
+# a*x + b over Fractions (exact), and anything outside that grammar (powers,
+# other symbols, functions, ...) falls back to sympy with the original behaviour.
+FAST_PATH = True
+
+# larger decimal exponents (1e999999999) would make Fraction build a huge integer
+_MAX_EXPONENT = 400
+_TOKEN = re.compile(r"(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|(?P<name>[A-Za-z_]\w*)|(?P<op>[-+*/()])")
+# sympy path: insert '*' between a digit and x (e.g., 5x -> 5*x)
+_IMPLICIT_MUL = re.compile(r"(?P<num>\d)(?P<var>x\b)")
+
+
+class _Unsupported(ValueError):
+    """Input outside the linear grammar; the caller falls back to sympy."""
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise _Unsupported(f"unexpected {text[pos]!r}")
+        if text.startswith("**", pos):
+            raise _Unsupported("power")
+        tokens.append((m.lastgroup, m.group()))
+        pos = m.end()
+    return tokens
+
+
+class _LinearParser:
     """
-    Solve simple linear equation in one variable (x).
-    Example inputs: "2*x + 3 = 11", "3*x-6=0", "5x+2=12"
-    Returns a float (solution for x) or None if not solvable with this helper.
+    expr   := term (('+' | '-') term)*
+    term   := factor (('*' | '/') factor | x)*      (a bare x right after a number: 5x)
+    factor := ('+' | '-') factor | number | 'x' | '(' expr ')'
+    Values are (a, b) pairs meaning a*x + b.
     """
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.i = 0
+
+    def parse(self) -> Tuple[Fraction, Fraction]:
+        if not self.tokens:
+            raise _Unsupported("empty expression")
+        value = self.expr()
+        if self.i != len(self.tokens):
+            raise _Unsupported(f"unexpected {self.tokens[self.i][1]!r}")
+        return value
+
+    def peek(self) -> Tuple[Optional[str], Optional[str]]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def expr(self) -> Tuple[Fraction, Fraction]:
+        a, b = self.term()
+        while self.peek()[1] in ("+", "-"):
+            op = self.tokens[self.i][1]
+            self.i += 1
+            c, d = self.term()
+            a, b = (a + c, b + d) if op == "+" else (a - c, b - d)
+        return a, b
+
+    def term(self) -> Tuple[Fraction, Fraction]:
+        a, b = self.factor()
+        while True:
+            kind, text = self.peek()
+            if text in ("*", "/"):
+                self.i += 1
+                c, d = self.factor()
+            elif kind == "name" and text == "x" and self.tokens[self.i - 1][0] == "num" \
+                    and self.tokens[self.i - 1][1][-1].isdigit():
+                c, d = self.factor()
+                text = "*"
+            else:
+                return a, b
+            if text == "*":
+                if a and c:
+                    raise _Unsupported("non-linear term")
+                a, b = a * d + c * b, b * d
+            else:
+                if c or not d:
+                    raise _Unsupported("division by x or zero")
+                a, b = a / d, b / d
+
+    def factor(self) -> Tuple[Fraction, Fraction]:
+        kind, text = self.peek()
+        self.i += 1
+        if text in ("+", "-"):
+            a, b = self.factor()
+            return (a, b) if text == "+" else (-a, -b)
+        if kind == "num":
+            if text[0] == "0" and text.isdigit() and text.strip("0"):
+                raise _Unsupported("leading zeros")  # not a Python/sympy literal
+            mantissa, _, exponent = text.lower().partition("e")
+            if exponent and abs(int(exponent)) > _MAX_EXPONENT:
+                raise _Unsupported("exponent too large")
+            return Fraction(0), Fraction(text)
+        if kind == "name" and text == "x":
+            return Fraction(1), Fraction(0)
+        if text == "(":
+            value = self.expr()
+            if self.peek()[1] != ")":
+                raise _Unsupported("unbalanced parentheses")
+            self.i += 1
+            return value
+        raise _Unsupported(f"unexpected {text!r}")
+
+
+def parse_linear(expr: str) -> Tuple[Fraction, Fraction]:
+    """(a, b) with expr == a*x + b exactly. Raises ValueError outside the linear grammar."""
+    return _LinearParser(_tokenize(expr)).parse()
+
+
+def solve_linear(equation: str) -> Optional[Fraction]:
+    """
+    Exact solution of a linear equation in x, e.g. "2*x + 3 = 11" -> Fraction(4).
+    None if it has no unique solution; ValueError if it isn't a linear equation in x.
+    """
+    eq = equation.replace(" ", "").replace("X", "x")
+    left, right = eq.split("=")
+    a1, b1 = parse_linear(left)
+    a2, b2 = parse_linear(right)
+    if a1 == a2:
+        return None
+    return (b2 - b1) / (a1 - a2)
+
+
+def _compute_number(text: str) -> Optional[float]:
+    if FAST_PATH:
+        try:
+            a, b = parse_linear(text)
+            if not a:
+                return float(b)
+        except (ValueError, OverflowError):
+            pass
+    try:
+        return float(sp.sympify(text))
+    except Exception:
+        return None
+
+
+def _number(text: str) -> Optional[float]:
+    """Value of a constant expression such as "4", "-2.5" or "1/2" (None if it isn't one)."""
+    if not isinstance(text, str):
+        return None
+    return solve_cache.lookup("number", text, _compute_number)
+
+
+def _solve_for_x_sympy(equation: str) -> Union[float, None]:
     try:
         # Replace common implicit multiplication like '5x' -> '5*x' for sympy
-        eq = equation.replace(" ", "").replace("X", "x").replace("X", "x")
-        # insert '*' between digit and x (e.g., 5x -> 5*x)
-        import re
-        eq = re.sub(r"(?P<num>\d)(?P<var>x\b)", r"\g<num>*\g<var>", eq)
+        eq = equation.replace(" ", "").replace("X", "x")
+        eq = _IMPLICIT_MUL.sub(r"\g<num>*\g<var>", eq)
         left, right = eq.split("=")
         x = sp.symbols('x')
         sol = sp.solve(sp.Eq(sp.sympify(left), sp.sympify(right)), x)
@@ -30,6 +188,33 @@ def solve_for_x(equation: str) -> Union[float, None]:
     except Exception:
         return None
 
+
+def _compute_solution(eq: str) -> Union[float, None]:
+    if FAST_PATH:
+        try:
+            sol = solve_linear(eq)
+            return None if sol is None else float(sol)
+        except (_Unsupported, OverflowError):
+            pass
+        except ValueError:
+            # wrong number of '=' signs: sympy can't split it either
+            return None
+    return _solve_for_x_sympy(eq)
+
+
+def solve_for_x(equation: str) -> Union[float, None]:
+    """
+    Solve simple linear equation in one variable (x).
+    Example inputs: "2*x + 3 = 11", "3*x-6=0", "5x+2=12"
+    Returns a float (solution for x) or None if not solvable with this helper.
+    Linear equations are solved exactly without sympy; anything else goes through sympy.
+    Results are memoized in solve_cache, keyed by the equation without spaces.
+    """
+    if not isinstance(equation, str):
+        return None
+    return solve_cache.lookup("solve", equation.replace(" ", "").replace("X", "x"), _compute_solution)
+
+
 def grade_answer(expected_expr: str, user_answer: str, tolerance: float = 1e-6) -> Dict[str, Any]:
     """
     Compare the user's numeric answer to the expected expression.
@@ -37,18 +222,13 @@ def grade_answer(expected_expr: str, user_answer: str, tolerance: float = 1e-6)
     user_answer: string provided by user like "4", "4.0"
     Returns dict: {"correct": bool, "expected": float|None, "user": float|None, "explanation": str}
     """
-    result = {"correct": False, "expected": None, "user": None, "explanation": ""}
-
     # Try to find the expected numeric answer:
     expected_val = None
     # If expected_expr looks like an equation, try to solve for x
     if "=" in expected_expr:
         expected_val = solve_for_x(expected_expr)
     else:
-        try:
-            expected_val = float(sp.sympify(expected_expr))
-        except Exception:
-            expected_val = None
+        expected_val = _number(expected_expr)
 
     # Try to parse user answer as a number
     user_val = None
@@ -57,26 +237,264 @@ def grade_answer(expected_expr: str, user_answer: str, tolerance: float = 1e-6)
         ua = user_answer.strip().replace(" ", "")
         if ua.lower().startswith("x="):
             ua = ua.split("=", 1)[1]
-        user_val = float(sp.sympify(ua))
+        user_val = _number(ua)
     except Exception:
         user_val = None
 
-    result["expected"] = expected_val
-    result["user"] = user_val
+    return _grade_values(expected_val, user_val, tolerance)
 
-    if expected_val is None:
-        result["explanation"] = "Unable to compute expected answer from the expected expression."
-        return result
 
+def _explanation(expected_val: Optional[float], user_val: Optional[float], correct: bool) -> str:
+    if expected_val is None:
+        return "Unable to compute expected answer from the expected expression."
     if user_val is None:
-        result["explanation"] = "Unable to parse user's numeric answer."
-        return result
+        return "Unable to parse user's numeric answer."
+    if correct:
+        return f"Correct — expected {expected_val}, got {user_val}."
+    return f"Incorrect — expected {expected_val}, got {user_val}."
 
+
+def _grade_values(expected_val: Optional[float], user_val: Optional[float], tolerance: float) -> Dict[str, Any]:
     # compare with tolerance
-    if abs(user_val - expected_val) <= tolerance:
-        result["correct"] = True
-        result["explanation"] = f"Correct — expected {expected_val}, got {user_val}."
-    else:
-        result["explanation"] = f"Incorrect — expected {expected_val}, got {user_val}."
+    correct = expected_val is not None and user_val is not None and abs(user_val - expected_val) <= tolerance
+    return {"correct": correct, "expected": expected_val, "user": user_val,
+            "explanation": _explanation(expected_val, user_val, correct)}
+
+
+# ------------------------------------------------------------------
+# Batch grading
+# ------------------------------------------------------------------
+# A class exam repeats the same few expected expressions for every learner and
+# many identical answers, so each distinct string is solved/parsed once and the
+# tolerance check runs on NumPy arrays. NaN stands for "could not be computed".
+def _answer_text(user_answer: str) -> Optional[str]:
+    """The user answer as grade_answer parses it (spaces and a leading 'x=' removed)."""
+    if not isinstance(user_answer, str):
+        return None
+    ua = user_answer.strip().replace(" ", "")
+    if ua.lower().startswith("x="):
+        ua = ua.split("=", 1)[1]
+    return ua
+
+
+def _expected_value(expected_expr: str) -> Optional[float]:
+    if isinstance(expected_expr, str) and "=" in expected_expr:
+        return solve_for_x(expected_expr)
+    return _number(expected_expr)
+
+
+def grade_batch(expected_exprs: Sequence[str], user_answers: Sequence[Any], tolerance: float = 1e-6,
+                parse_answer: Optional[Callable[[str], Optional[float]]] = None) -> Dict[str, Any]:
+    """
+    grade_answer over many answers at once, with columnar results.
+    expected_exprs: one expression per question, shape (Q,)
+    user_answers: one answer per question (Q,), or one row of Q answers per learner (N, Q)
+    Returns {"correct": bool array, "expected": float array, "user": float array,
+             "explanation": nested list of str} shaped like user_answers; NaN marks values
+    grade_answer reports as None. grades_from_batch() turns it back into grade_answer dicts.
+    parse_answer: how a normalized answer becomes a number (default: as grade_answer does;
+    tools.sandbox.parse_answer_safe for untrusted text)
+    """
+    parse_answer = parse_answer or _number
+    answers = np.array(user_answers, dtype=object)
+    if not len(user_answers):
+        answers = answers.reshape((0, len(expected_exprs)))  # no learners
+    if answers.size and (answers.ndim not in (1, 2) or answers.shape[-1] != len(expected_exprs)):
+        raise ValueError(f"expected {len(expected_exprs)} answers per learner, got shape {answers.shape}")
+
+    solved = {expr: _expected_value(expr) for expr in set(expected_exprs)}
+    expected_vals = np.array([solved[expr] for expr in expected_exprs], dtype=float)
+    flat = answers.ravel().tolist()
+    parsed = {a: parse_answer(_answer_text(a)) for a in set(flat)}
+    user_vals = np.array([parsed[a] for a in flat], dtype=float).reshape(answers.shape)
+
+    expected_vals = np.broadcast_to(expected_vals, answers.shape).copy()
+    with np.errstate(invalid="ignore"):
+        correct = np.abs(user_vals - expected_vals) <= tolerance
+    # few distinct (expected, user) pairs: format each explanation once
+    explained: Dict[tuple, str] = {}
+    explanation = []
+    for key in zip(expected_vals.ravel().tolist(), user_vals.ravel().tolist(), correct.ravel().tolist()):
+        text = explained.get(key)
+        if text is None:
+            e, u, c = key
+            text = explained[key] = _explanation(None if e != e else e, None if u != u else u, c)
+        explanation.append(text)
+    if answers.ndim == 2:
+        width = answers.shape[1]
+        explanation = [explanation[i * width:(i + 1) * width] for i in range(answers.shape[0])]
+    return {"correct": correct, "expected": expected_vals, "user": user_vals, "explanation": explanation}
+
+
+def grades_from_batch(batch: Dict[str, Any], row: Optional[int] = None) -> List[Dict[str, Any]]:
+    """grade_answer-style dicts for a 1-D batch, or for one learner (row) of a 2-D batch."""
+    pick = (lambda a: a) if row is None else (lambda a: a[row])
+    return [
+        {"correct": bool(c), "expected": None if e != e else e, "user": None if u != u else u, "explanation": x}
+        for c, e, u, x in zip(pick(batch["correct"]).tolist(), pick(batch["expected"]).tolist(),
+                              pick(batch["user"]).tolist(), pick(batch["explanation"]))
+    ]
+
+
+# ------------------------------------------------------------------
+# Memoization
+# ------------------------------------------------------------------
+# The same few equations are solved for every learner (the diagnostic questions,
+# quiz variants that FeedbackAgent solves again), so solutions and parsed answers
+# are memoized. With COACH_SOLVE_CACHE pointing at a file, results are also kept
+# in SQLite and shared by every process (app workers, the grading process pool),
+# so a warm cache answers a whole diagnostic without solving anything.
+SOLVE_CACHE_SIZE = int(os.environ.get("COACH_SOLVE_CACHE_SIZE", 4096))
+SOLVE_CACHE_PATH = os.environ.get("COACH_SOLVE_CACHE") or None
+
+
+class SolveCache:
+    """
+    Bounded LRU of computed results keyed by (kind, normalized text); None results are cached too.
+
+    - max_entries: least recently used entries are evicted beyond this size (0 disables the LRU)
+    - path: optional SQLite file consulted on an LRU miss and filled on every computation.
+      Rows never change (a given text always has the same answer), so there is nothing to invalidate.
+    """
+
+    def __init__(self, max_entries: int = SOLVE_CACHE_SIZE, path: Optional[str] = SOLVE_CACHE_PATH):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: "OrderedDict[Tuple[str, str], Optional[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # one connection per process: a forked grading worker must not reuse its parent's
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.computed = 0
+        self.evictions = 0
+        self.disk_errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None or self._db_pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS solve_cache ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, value REAL, PRIMARY KEY (kind, key)) WITHOUT ROWID"
+            )
+            db.commit()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _load(self, key: Tuple[str, str]) -> Optional[tuple]:
+        try:
+            with self._lock:
+                return self._connection().execute(
+                    "SELECT value FROM solve_cache WHERE kind=? AND key=?", key
+                ).fetchone()
+        except sqlite3.Error:
+            self.disk_errors += 1
+            return None
+
+    def _store(self, key: Tuple[str, str], value: Optional[float]):
+        try:
+            with self._lock:
+                db = self._connection()
+                db.execute("INSERT OR IGNORE INTO solve_cache(kind, key, value) VALUES (?, ?, ?)", (*key, value))
+                db.commit()
+        except sqlite3.Error:
+            self.disk_errors += 1
+
+    def _remember(self, key: Tuple[str, str], value: Optional[float]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def lookup(self, kind: str, text: str, compute: Callable[[str], Optional[float]]) -> Optional[float]:
+        """compute(text), or its remembered result."""
+        key = (kind, text)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        if self.path:
+            row = self._load(key)
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, row[0])
+                return row[0]
+        value = compute(text)
+        with self._lock:
+            self.computed += 1
+        self._remember(key, value)
+        if self.path:
+            self._store(key, value)
+        return value
+
+    def clear(self):
+        """Drop the in-process entries (the SQLite file, if any, is kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "path": self.path,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "computed": self.computed,
+                "evictions": self.evictions,
+                "disk_errors": self.disk_errors,
+                "hit_rate": ((self.hits + self.disk_hits) / lookups) if lookups else 0.0,
+            }
+
+
+solve_cache = SolveCache()
+
+
+def configure_solve_cache(max_entries: int = SOLVE_CACHE_SIZE, path: Optional[str] = SOLVE_CACHE_PATH) -> SolveCache:
+    """Replace the shared cache, e.g. configure_solve_cache(path="solve_cache.db") for a warm cache on disk."""
+    global solve_cache
+    solve_cache = SolveCache(max_entries, path)
+    return solve_cache
+
+
+def solve_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the shared solve cache."""
+    return solve_cache.stats()
+
+
+# ------------------------------------------------------------------
+# Asyncio API
+# ------------------------------------------------------------------
+# Symbolic solving is CPU-bound, so async callers get it from a bounded process
+# pool: the event loop keeps serving other sessions while answers are graded.
+GRADING_WORKERS = min(4, os.cpu_count() or 1)
+_grading_executor: Optional[ProcessPoolExecutor] = None
+
+
+def grading_executor() -> ProcessPoolExecutor:
+    global _grading_executor
+    if _grading_executor is None:
+        _grading_executor = ProcessPoolExecutor(max_workers=GRADING_WORKERS)
+    return _grading_executor
+
+
+async def solve_for_x_async(equation: str) -> Union[float, None]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(grading_executor(), solve_for_x, equation)
+
 
-    return result
+async def grade_answer_async(expected_expr: str, user_answer: str, tolerance: float = 1e-6) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(grading_executor(), grade_answer, expected_expr, user_answer, tolerance)
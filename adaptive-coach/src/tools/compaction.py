@@ -0,0 +1,264 @@
+# src/tools/compaction.py
+"""
+History compaction for learner memory.
+
+Long-term learners accumulate diagnostics, lessons, quizzes and feedbacks
+forever. Compaction keeps only the newest entries of each history list in the
+hot memory document, moves older ones into a zlib-compressed archive table,
+and folds them into per-topic aggregates under memory["history_summary"] so
+mastery/score views stay correct. load_history() reads one learner's full
+history back for the reports that need it; iter_full_history() streams it for
+every learner (e.g. item-bank recalibration).
+"""
+import json
+import sys
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from tools.persistence import (
+    CAS_RETRIES, Conn, HISTORY_KEYS, flush, is_normalized, iter_history, json_column, load_memory,
+    load_memory_versioned, log, reading, retry_on_conflict, save_memory, shard_for, shards_of, writing,
+)
+
+DEFAULT_TOPIC = "linear_equations"
+
+
+class RetentionPolicy:
+    """
+    How much history stays hot.
+    keep_last: newest entries kept per history list
+    min_batch: don't compact a list until at least this many entries would move
+               (avoids rewriting the document for one or two old entries)
+    keys: which history lists are compacted
+    """
+
+    def __init__(self, keep_last: int = 20, min_batch: int = 10, keys=HISTORY_KEYS):
+        if keep_last < 0 or min_batch < 1:
+            raise ValueError("keep_last must be >= 0 and min_batch >= 1")
+        self.keep_last = keep_last
+        self.min_batch = min_batch
+        self.keys = tuple(keys)
+
+    def excess(self, length: int) -> int:
+        """How many of `length` entries should move to the archive."""
+        n = length - self.keep_last
+        return n if n >= self.min_batch else 0
+
+
+def init_archive(conn: Conn):
+    with writing(conn) as c:
+        # One row per compaction run and history list; payload is a zlib-compressed JSON list.
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS memory_archive (
+            user_id TEXT NOT NULL,
+            key TEXT NOT NULL,
+            first_seq INTEGER NOT NULL,
+            entries INTEGER NOT NULL,
+            first_ts TEXT,
+            last_ts TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            payload BLOB NOT NULL,
+            PRIMARY KEY (user_id, key, first_seq)
+        )
+        """)
+        c.commit()
+
+
+def entry_timestamp(key: str, entry: Dict[str, Any]) -> Optional[str]:
+    """ISO timestamp of a history entry (None if it never recorded one)."""
+    if key == "lessons":
+        return entry.get("created_at")
+    if key == "quizzes":
+        answers = entry.get("answers") or {}
+        return answers.get("timestamp") or (entry.get("quiz_meta") or {}).get("created_at")
+    return entry.get("timestamp")
+
+
+def entry_topic_score(key: str, entry: Dict[str, Any]):
+    """(topic, score percent or None) used for the rolled-up aggregates."""
+    if key == "diagnostics":
+        return DEFAULT_TOPIC, entry.get("score_percent")
+    if key == "lessons":
+        return entry.get("topic", DEFAULT_TOPIC), entry.get("score_prior")
+    if key == "quizzes":
+        return DEFAULT_TOPIC, (entry.get("answers") or {}).get("score_percent")
+    return DEFAULT_TOPIC, entry.get("quiz_score")
+
+
+def _roll_up(summary: Dict[str, Any], key: str, entries: List[Dict[str, Any]]):
+    s = summary.setdefault(key, {"archived": 0, "by_topic": {}})
+    s["archived"] += len(entries)
+    for entry in entries:
+        topic, score = entry_topic_score(key, entry)
+        t = s["by_topic"].setdefault(topic, {"count": 0, "scored": 0, "score_sum": 0, "score_mean": None})
+        t["count"] += 1
+        if isinstance(score, (int, float)):
+            t["scored"] += 1
+            t["score_sum"] += score
+            t["score_mean"] = round(t["score_sum"] / t["scored"], 2)
+    ts = [t for t in (entry_timestamp(key, e) for e in entries) if t]
+    if ts:
+        s["archived_until"] = max(ts)
+
+
+def compact_memory(conn: Conn, user_id: str, policy: Optional[RetentionPolicy] = None,
+                   retries: int = CAS_RETRIES) -> Dict[str, int]:
+    """
+    Move the old part of each history list into the archive.
+    Returns {history key: entries moved}; an empty dict means nothing was due.
+    The document is read with its version and written back with a compare-and-swap in the
+    same transaction as the archive rows, so a concurrent write is never overwritten: the
+    compaction is redone on the fresh document instead (at most `retries` times).
+    """
+    policy = policy or RetentionPolicy()
+    conn = shard_for(conn, user_id)
+    init_archive(conn)
+
+    def attempt() -> Dict[str, int]:
+        mem, version = load_memory_versioned(conn, user_id)
+        if not mem:
+            return {}
+        mem = mem.copy()  # plain dict; a LazyMemory materializes every list here
+
+        moved: Dict[str, int] = {}
+        archive_rows = []
+        summary = dict(mem.get("history_summary") or {})
+        for key in policy.keys:
+            entries = mem.get(key)
+            if not isinstance(entries, list):
+                continue
+            n = policy.excess(len(entries))
+            if not n:
+                continue
+            old, mem[key] = entries[:n], entries[n:]
+            first_seq = summary.get(key, {}).get("archived", 0)
+            stamps = [t for t in (entry_timestamp(key, e) for e in old) if t]
+            payload = zlib.compress(json.dumps(old, ensure_ascii=False).encode("utf-8"), 9)
+            archive_rows.append((user_id, key, first_seq, n, min(stamps, default=None), max(stamps, default=None), payload))
+            _roll_up(summary, key, old)
+            moved[key] = n
+        if not moved:
+            return {}
+        mem["history_summary"] = summary
+
+        def archive(c):
+            c.executemany(
+                """
+                INSERT INTO memory_archive(user_id, key, first_seq, entries, first_ts, last_ts, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                archive_rows
+            )
+
+        # plain dict: for the normalized layout the kept entries replace the stored history
+        save_memory(conn, user_id, mem, expected_version=version, in_transaction=archive)
+        return moved
+
+    moved = retry_on_conflict(attempt, retries)
+    if moved:
+        log(f"[OK] Compacted history for {user_id}: {moved}", "cyan")
+    return moved
+
+
+def _candidates(conn: Conn, policy: RetentionPolicy) -> List[str]:
+    threshold = policy.keep_last + policy.min_batch
+    normalized = is_normalized(conn)
+    with reading(conn) as c:
+        if normalized:
+            sql = " UNION ".join(
+                f"SELECT user_id FROM {key} GROUP BY user_id HAVING COUNT(*) >= :n" for key in policy.keys
+            )
+            return [r[0] for r in c.execute(sql, {"n": threshold})]
+        lengths = " OR ".join(
+            f"COALESCE(json_array_length({json_column()}, '$.{key}'), 0) >= :n" for key in policy.keys
+        )
+        return [r[0] for r in c.execute(f"SELECT user_id FROM memory WHERE {lengths}", {"n": threshold})]
+
+
+def compact_all(conn: Conn, policy: Optional[RetentionPolicy] = None) -> Dict[str, Dict[str, int]]:
+    """Compact every learner whose history exceeds the policy. Returns {user_id: moved counts}."""
+    policy = policy or RetentionPolicy()
+    flush(conn)
+    results = {}
+    for shard in shards_of(conn):
+        for user_id in _candidates(shard, policy):
+            moved = compact_memory(shard, user_id, policy)
+            if moved:
+                results[user_id] = moved
+    return results
+
+
+def _as_iso(since: Union[str, datetime, None]) -> Optional[str]:
+    if since is None or isinstance(since, str):
+        return since
+    return since.isoformat()
+
+
+def load_history(conn: Conn, user_id: str, key: str, since: Union[str, datetime, None] = None) -> List[Dict[str, Any]]:
+    """
+    Full history list for `key`: archived entries followed by the hot ones, oldest first.
+    since: only entries at or after this ISO timestamp (entries without a timestamp are kept).
+    """
+    if key not in HISTORY_KEYS:
+        raise ValueError(f"unknown history key: {key!r}")
+    since = _as_iso(since)
+    conn = shard_for(conn, user_id)
+
+    entries: List[Dict[str, Any]] = []
+    with reading(conn) as c:
+        if _has_archive(c):
+            rows = c.execute(
+                """
+                SELECT payload FROM memory_archive
+                WHERE user_id=? AND key=? AND (? IS NULL OR last_ts IS NULL OR last_ts >= ?)
+                ORDER BY first_seq
+                """,
+                (user_id, key, since, since)
+            ).fetchall()
+            for (payload,) in rows:
+                entries.extend(json.loads(zlib.decompress(payload).decode("utf-8")))
+
+    hot = load_memory(conn, user_id).get(key) or []
+    entries.extend(hot)
+    if since is None:
+        return entries
+    return [e for e in entries if (entry_timestamp(key, e) or since) >= since]
+
+
+def _has_archive(c) -> bool:
+    return c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='memory_archive'").fetchone() is not None
+
+
+def iter_full_history(conn: Conn, key: str, batch_size: int = 1000) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (user_id, entry) for every entry of one history list of every learner, archived ones
+    included: per shard, the archived entries (one payload decompressed at a time) and then
+    the hot ones (persistence.iter_history).
+    """
+    if key not in HISTORY_KEYS:
+        raise ValueError(f"unknown history key: {key!r}")
+    flush(conn)
+    for shard in shards_of(conn):
+        with reading(shard) as c:
+            if _has_archive(c):
+                cur = c.execute(
+                    "SELECT user_id, payload FROM memory_archive WHERE key=? ORDER BY user_id, first_seq", (key,)
+                )
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for user_id, payload in rows:
+                        for entry in json.loads(zlib.decompress(payload).decode("utf-8")):
+                            yield user_id, entry
+        yield from iter_history(shard, key, batch_size)
+
+
+if __name__ == "__main__":
+    # python -m tools.compaction [db_path] [keep_last]
+    from tools.persistence import DB_PATH, init_db
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    keep = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    results = compact_all(init_db(db_path), RetentionPolicy(keep_last=keep))
+    print(f"Compacted {len(results)} learners.")
@@ -0,0 +1,482 @@
+# src/tools/item_bank.py
+"""
+IRT-calibrated item bank: the problem-bank equations as quiz items with a two-parameter
+logistic (2PL) difficulty b and discrimination a, so quizzes can pick the items that tell
+the most about a learner of ability theta:
+
+  P(correct | theta) = 1 / (1 + exp(-a * (theta - b)))
+  information(theta) = a^2 * P * (1 - P)
+
+For a given a the information peaks where b == theta, and it grows with a. Items are
+therefore grouped into discrimination bands (a within a factor BAND_RATIO) and indexed by
+(band, difficulty): select() seeks to theta in each band (O(log n)), from the most
+discriminating down until no remaining band can beat what it has, and scores only the
+`window` nearest items on either side. That stays well under a millisecond at 1M items and
+lands within a few percent of the bank-wide maximum (see bench/bench_item_bank.py).
+
+New items start at a prior difficulty derived from their features (prior_difficulty) with
+a = 1. recalibrate() refits them from the graded quizzes and diagnostics of every learner,
+archived history included (tools.compaction.iter_full_history), by marginal
+maximum likelihood (EM over a grid of abilities, vectorized with numpy over all responses),
+with priors that keep items with few responses close to their starting values.
+
+The bank file (COACH_ITEM_BANK, default item_bank.db in persistence.DATA_DIR; "" keeps it
+in memory) is seeded from the problem bank on first use. Rebuild or recalibrate it from the command line:
+  python -m tools.item_bank [recalibrate|stats]    (from src/)
+"""
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.lazy import lazy_import
+from tools.persistence import data_path
+from tools.problem_bank import ProblemBank, feature_names, get_problem_bank
+
+np = lazy_import("numpy")
+
+ITEM_BANK_PATH = os.environ.get("COACH_ITEM_BANK", data_path("item_bank.db"))
+# items scored on each side of theta, per discrimination band, by select()
+SELECT_WINDOW = 8
+BAND_RATIO = 1.25
+QUESTION_PREFIX = "Solve for x: "
+
+# Prior difficulty (logits): a plain one-step equation is easy, each feature adds to it,
+# and larger numbers add a little more, which also spreads out (and interleaves) the
+# items of one feature combination
+PRIOR_BASE_DIFFICULTY = -1.5
+FEATURE_DIFFICULTY = {
+    "negative_constant": 0.4,
+    "non_unit_coefficient": 0.6,
+    "fractional_solution": 0.9,
+    "negative_solution": 0.5,
+}
+MAGNITUDE_DIFFICULTY = 0.02
+
+# Recalibration: ability grid, item priors b ~ N(prior, DIFFICULTY_SD) and
+# log a ~ N(0, LOG_DISCRIMINATION_SD), bounds and EM stopping rule
+ABILITY_GRID = (-4.5, 4.5, 15)
+DIFFICULTY_SD = 1.0
+LOG_DISCRIMINATION_SD = 0.5
+DIFFICULTY_RANGE = (-6.0, 6.0)
+DISCRIMINATION_RANGE = (0.2, 4.0)
+RECALIBRATE_ITERATIONS = 100
+RECALIBRATE_TOLERANCE = 1e-3
+LOOKUP_CHUNK = 500
+
+# Ability estimation in adaptive diagnostics (EAP over a grid)
+ABILITY_RANGE = (-4.5, 4.5)
+ABILITY_POINTS = 61
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    equation TEXT NOT NULL UNIQUE,
+    features INTEGER NOT NULL DEFAULT 0,
+    prior_difficulty REAL NOT NULL,
+    difficulty REAL NOT NULL,
+    discrimination REAL NOT NULL DEFAULT 1.0,
+    band INTEGER NOT NULL DEFAULT 0,
+    responses INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_by_band ON items(band, difficulty);
+CREATE INDEX IF NOT EXISTS items_by_features ON items(features, band, difficulty);
+"""
+
+
+def probability(theta: float, difficulty: float, discrimination: float = 1.0) -> float:
+    """2PL probability of a correct answer."""
+    return 1.0 / (1.0 + math.exp(-discrimination * (theta - difficulty)))
+
+
+def information(theta: float, difficulty: float, discrimination: float = 1.0) -> float:
+    """Fisher information of one item at theta."""
+    p = probability(theta, difficulty, discrimination)
+    return discrimination * discrimination * p * (1.0 - p)
+
+
+def band_of(discrimination: float) -> int:
+    """Discrimination band of an item (see BAND_RATIO)."""
+    return round(math.log(discrimination) / math.log(BAND_RATIO))
+
+
+def prior_difficulty(a: int, b: int, c: int, mask: int) -> float:
+    """Starting difficulty of a*x + b = c before any responses (see FEATURE_DIFFICULTY)."""
+    return (PRIOR_BASE_DIFFICULTY + sum(FEATURE_DIFFICULTY[name] for name in feature_names(mask))
+            + MAGNITUDE_DIFFICULTY * (abs(a) + abs(b) + abs(c)))
+
+
+def ability_from_percent(percent: float) -> float:
+    """Rough ability (logits) from a 0-100 score or mastery, for learners without a fitted estimate."""
+    p = min(max(percent / 100.0, 0.05), 0.95)
+    return math.log(p / (1.0 - p))
+
+
+def ability_grid():
+    """Ability points at which adaptive diagnostics track each learner's posterior."""
+    return np.linspace(ABILITY_RANGE[0], ABILITY_RANGE[1], ABILITY_POINTS)
+
+
+def ability_prior(mean: float = 0.0, sd: float = 1.0, sessions: int = 1):
+    """Log prior over ability_grid(), one row per session: shape (sessions, ABILITY_POINTS)."""
+    row = -0.5 * ((ability_grid() - mean) / sd) ** 2
+    return np.repeat(row[None, :], sessions, axis=0)
+
+
+def update_ability(log_posterior, difficulty, discrimination, correct):
+    """
+    Add one answered item per row to a stack of log posteriors, for any number of sessions
+    at once: log_posterior (S, points) or a list of S rows, difficulty / discrimination /
+    correct shaped (S,).
+    """
+    z = np.asarray(discrimination, dtype=float)[:, None] * (ability_grid() - np.asarray(difficulty, dtype=float)[:, None])
+    # log P(correct) = -log(1 + e^-z), log P(wrong) = -log(1 + e^z)
+    sign = np.where(np.asarray(correct, dtype=bool), -1.0, 1.0)[:, None]
+    return np.asarray(log_posterior, dtype=float) - np.logaddexp(0, sign * z)
+
+
+def estimate_ability(log_posterior):
+    """Posterior mean (EAP) ability and its standard error per row: two arrays shaped (S,)."""
+    weights = np.exp(log_posterior - log_posterior.max(axis=1, keepdims=True))
+    weights /= weights.sum(axis=1, keepdims=True)
+    grid = ability_grid()
+    theta = weights @ grid
+    se = np.sqrt(np.maximum(weights @ grid ** 2 - theta ** 2, 0.0))
+    return theta, se
+
+
+def percent_from_ability(theta: float) -> int:
+    """0-100 scale of an ability: the chance of answering an item of difficulty 0 (inverse of ability_from_percent)."""
+    return int(round(100 * probability(theta, 0.0)))
+
+
+def equation_of(question: str) -> str:
+    """Item equation of a quiz question text ("Solve for x: 2*x + 3 = 11" -> "2*x + 3 = 11")."""
+    return question[len(QUESTION_PREFIX):] if question.startswith(QUESTION_PREFIX) else question
+
+
+class ItemBank:
+    """
+    select(theta, k, exclude, features) picks items, recalibrate(conn) refits them.
+    `features` follows ProblemBank: True (must have), False (must not have), omitted (either).
+    """
+
+    def __init__(self, path: str = ITEM_BANK_PATH, window: int = SELECT_WINDOW, seed: bool = True):
+        self.path = path or ":memory:"
+        self.window = window
+        self.seed = seed
+        self._lock = threading.Lock()
+        # one connection per process (see code_executor.SolveCache)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        # {feature mask: [bands with items]}, refreshed whenever items change
+        self._bands: Dict[int, List[int]] = {}
+        self.selections = 0
+
+    # ---------------- storage ----------------
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None or self._db_pid != os.getpid():
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            if self.path != ":memory:":
+                db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            if self.seed and db.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0:
+                self._seed(db)
+            self._db, self._db_pid = db, os.getpid()
+            self._load_bands(db)
+        return self._db
+
+    def _load_bands(self, db: sqlite3.Connection):
+        self._bands = {}
+        for mask, band in db.execute("SELECT DISTINCT features, band FROM items"):
+            self._bands.setdefault(mask, []).append(band)
+
+    def _seed(self, db: sqlite3.Connection):
+        rows = get_problem_bank().rows()
+        self._insert(db, ((eq, mask, prior_difficulty(a, b, c, mask), 1.0) for a, b, c, eq, mask in rows))
+
+    @staticmethod
+    def _insert(db: sqlite3.Connection, items: Iterable[Tuple[str, int, float, float]]) -> int:
+        before = db.total_changes
+        db.executemany(
+            "INSERT OR IGNORE INTO items (equation, features, prior_difficulty, difficulty, discrimination, band) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            ((eq, mask, prior, prior, a, band_of(a)) for eq, mask, prior, a in items)
+        )
+        db.commit()
+        return db.total_changes - before
+
+    def add_items(self, items: Iterable[Tuple[str, int, float, float]]) -> int:
+        """Insert (equation, feature mask, prior difficulty, discrimination) rows; known equations are skipped."""
+        with self._lock:
+            db = self._connection()
+            added = self._insert(db, items)
+            self._load_bands(db)
+        return added
+
+    def _close(self):
+        if self._db is not None and self._db_pid == os.getpid():
+            self._db.close()
+        self._db = self._db_pid = None
+
+    # ---------------- selection ----------------
+    def _groups(self, features: Optional[Dict[str, Optional[bool]]]) -> List[Tuple[Optional[int], int]]:
+        """(feature mask or None for any, band) index ranges that select() seeks into."""
+        if not features:
+            return [(None, band) for band in sorted({b for bands in self._bands.values() for b in bands})]
+        care, want = ProblemBank._filter(features)
+        return [(mask, band) for mask, bands in self._bands.items() if mask & care == want for band in bands]
+
+    def _neighbours(self, db: sqlite3.Connection, theta: float, mask: Optional[int], band: int, n: int) -> List[tuple]:
+        """Up to n items of one band on each side of theta, straight off the (band, difficulty) index."""
+        cols = "SELECT id, equation, features, difficulty, discrimination FROM items"
+        where, params = ("band=?", [band]) if mask is None else ("features=? AND band=?", [mask, band])
+        above = db.execute(f"{cols} WHERE {where} AND difficulty >= ? ORDER BY difficulty LIMIT ?",
+                           params + [theta, n]).fetchall()
+        below = db.execute(f"{cols} WHERE {where} AND difficulty < ? ORDER BY difficulty DESC LIMIT ?",
+                           params + [theta, n]).fetchall()
+        return above + below
+
+    def select(self, theta: float, k: int = 1, exclude: Iterable[str] = (),
+               features: Optional[Dict[str, Optional[bool]]] = None,
+               window: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        The k items (fewer if the bank has fewer) with the most information at theta, skipping
+        equations in exclude, most informative first:
+          [{"item_id": 812, "equation": "3*x + 2 = 11", "features": ["non_unit_coefficient"],
+            "difficulty": 0.12, "discrimination": 1.3, "information": 0.42}, ...]
+        """
+        excluded = set(exclude)
+        n = max(window or self.window, k) + len(excluded)
+        best: List[Tuple[float, int, tuple]] = []  # min-heap of the k best (information, id, row)
+        with self._lock:
+            db = self._connection()
+            # highest discrimination first: once a band's ceiling (a_max^2 / 4, at b == theta)
+            # cannot beat the k-th best item found so far, no lower band can either
+            for mask, band in sorted(self._groups(features), key=lambda group: -group[1]):
+                if len(best) == k and BAND_RATIO ** (2 * band + 1) / 4 <= best[0][0]:
+                    break
+                for row in self._neighbours(db, theta, mask, band, n):
+                    if row[1] in excluded:
+                        continue
+                    entry = (information(theta, row[3], row[4]), row[0], row)
+                    if len(best) < k:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+            self.selections += 1
+        return [
+            {"item_id": item_id, "equation": eq, "features": feature_names(mask),
+             "difficulty": b, "discrimination": a, "information": info}
+            for info, _, (item_id, eq, mask, b, a) in sorted(best, reverse=True)
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    # ---------------- calibration ----------------
+    def _lookup(self, db: sqlite3.Connection, equations: Sequence[str]) -> Dict[str, tuple]:
+        """{equation: (id, prior_difficulty, difficulty, discrimination)} for the known equations."""
+        found = {}
+        for i in range(0, len(equations), LOOKUP_CHUNK):
+            chunk = equations[i:i + LOOKUP_CHUNK]
+            marks = ", ".join("?" * len(chunk))
+            for eq, *params in db.execute(
+                f"SELECT equation, id, prior_difficulty, difficulty, discrimination FROM items WHERE equation IN ({marks})",
+                chunk
+            ):
+                found[eq] = tuple(params)
+        return found
+
+    def parameters(self, equations: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """{equation: {"item_id", "difficulty", "discrimination"}} for the equations in the bank."""
+        with self._lock:
+            found = self._lookup(self._connection(), list(equations))
+        return {eq: {"item_id": item_id, "difficulty": b, "discrimination": a}
+                for eq, (item_id, _, b, a) in found.items()}
+
+    def recalibrate(self, conn, iterations: int = RECALIBRATE_ITERATIONS) -> Dict[str, Any]:
+        """
+        Refit difficulty and discrimination of every item that appears in a graded quiz or
+        diagnostic of any learner in conn (all shards, compacted history included). Items
+        without responses keep their parameters. The fitted ability distribution becomes the
+        prior of adaptive diagnostics.
+        """
+        from tools.compaction import iter_full_history
+
+        start = time.perf_counter()
+        users: Dict[str, int] = {}
+        responses: List[Tuple[int, str, bool]] = []
+        for key in ("quizzes", "diagnostics"):
+            for user_id, entry in iter_full_history(conn, key):
+                graded = (entry.get("answers") or {}) if key == "quizzes" else entry
+                for q in graded.get("per_question", []):
+                    if q.get("question"):
+                        u = users.setdefault(user_id, len(users))
+                        responses.append((u, equation_of(q["question"]), bool(q.get("correct"))))
+
+        with self._lock:
+            known = self._lookup(self._connection(), sorted({eq for _, eq, _ in responses}))
+        matched = [(u, known[eq][0], y) for u, eq, y in responses if eq in known]
+        summary = {"responses": len(matched), "unmatched": len(responses) - len(matched),
+                   "learners": len({u for u, _, _ in matched}), "items": 0, "iterations": 0}
+        if matched:
+            params = {item_id: (prior, b, a) for item_id, prior, b, a in known.values()}
+            _, u_idx = np.unique(np.fromiter((u for u, _, _ in matched), dtype=np.int64, count=len(matched)),
+                                 return_inverse=True)
+            item_ids, i_idx = np.unique(np.fromiter((i for _, i, _ in matched), dtype=np.int64,
+                                                    count=len(matched)), return_inverse=True)
+            y = np.fromiter((y for _, _, y in matched), dtype=np.float64, count=len(matched))
+            prior = np.array([params[i][0] for i in item_ids.tolist()])
+            b = np.array([params[i][1] for i in item_ids.tolist()])
+            a = np.array([params[i][2] for i in item_ids.tolist()])
+            b, a, fit = fit_2pl(u_idx, i_idx, y, prior, b, a, iterations)
+            summary.update(fit)
+            counts = np.bincount(i_idx, minlength=len(item_ids))
+            hits = np.bincount(i_idx, weights=y, minlength=len(item_ids))
+            with self._lock:
+                db = self._connection()
+                db.executemany(
+                    "UPDATE items SET difficulty=?, discrimination=?, band=?, responses=?, correct=? WHERE id=?",
+                    zip(b.tolist(), a.tolist(), [band_of(v) for v in a.tolist()], counts.tolist(),
+                        hits.astype(np.int64).tolist(), item_ids.tolist())
+                )
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('calibrated_at', ?)",
+                           (datetime.utcnow().isoformat() + "Z",))
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('population', ?)",
+                           (json.dumps([fit["ability_mean"], fit["ability_sd"]]),))
+                db.commit()
+                self._load_bands(db)
+            summary["items"] = len(item_ids)
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    def population(self) -> Tuple[float, float]:
+        """(mean, sd) of learner ability from the last recalibration, (0, 1) before the first."""
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM meta WHERE key='population'").fetchone()
+        mean, sd = json.loads(row[0]) if row else (0.0, 1.0)
+        return mean, sd
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._connection()
+            items, calibrated, lo, avg, hi = db.execute(
+                "SELECT COUNT(*), SUM(responses > 0), MIN(difficulty), AVG(difficulty), MAX(difficulty) FROM items"
+            ).fetchone()
+            row = db.execute("SELECT value FROM meta WHERE key='calibrated_at'").fetchone()
+        rounded = lambda v: None if v is None else round(v, 2)
+        return {"path": self.path, "items": items, "calibrated_items": calibrated or 0,
+                "difficulty": {"min": rounded(lo), "mean": rounded(avg), "max": rounded(hi)},
+                "calibrated_at": row[0] if row else None, "selections": self.selections}
+
+
+def fit_2pl(u_idx, i_idx, y, prior, b, a, iterations: int = RECALIBRATE_ITERATIONS):
+    """
+    Marginal maximum likelihood (Bock-Aitkin EM) fit of 2PL item parameters from flat
+    response arrays: learner index, item index and 0/1 outcome per response.
+
+    Abilities are integrated out over a fixed grid (ABILITY_GRID) under a normal population
+    whose mean and spread are re-estimated every cycle, so the bank keeps the scale of the
+    item priors instead of assuming the learners average 0. E-step: every learner's posterior
+    over the grid, via reduceat over responses sorted by learner. M-step: expected correct /
+    total counts per item and grid point (reduceat over responses sorted by item), then
+    Newton steps on b and log a for all items at once.
+    Returns (b, a, {"iterations", "ability_mean", "ability_sd"}).
+    """
+    grid = np.linspace(*ABILITY_GRID)
+    n_items = len(b)
+    log_a, mean, sd = np.log(a), 0.0, 1.0
+    by_user = np.argsort(u_idx, kind="stable")
+    user_starts = np.flatnonzero(np.r_[True, np.diff(u_idx[by_user]) != 0])
+    by_item = np.argsort(i_idx, kind="stable")
+    item_starts = np.flatnonzero(np.r_[True, np.diff(i_idx[by_item]) != 0])
+    items, item_of_user_row, correct_by_user = i_idx[by_item][item_starts], i_idx[by_user], y[by_user] > 0
+    user_of_item_row, y_by_item = u_idx[by_item], y[by_item][:, None]
+
+    for iteration in range(1, iterations + 1):
+        # E-step: log-likelihood of each learner's answers at every grid point
+        z = np.exp(log_a)[:, None] * (grid - b[:, None])
+        log_p, log_q = -np.logaddexp(0, -z), -np.logaddexp(0, z)
+        loglik = np.add.reduceat(np.where(correct_by_user[:, None], log_p[item_of_user_row],
+                                          log_q[item_of_user_row]), user_starts, axis=0)
+        loglik -= 0.5 * ((grid - mean) / sd) ** 2
+        loglik -= loglik.max(axis=1, keepdims=True)
+        posterior = np.exp(loglik)
+        posterior /= posterior.sum(axis=1, keepdims=True)
+        weights = posterior.mean(axis=0)
+        mean = float(weights @ grid)
+        sd = float(np.sqrt(weights @ (grid - mean) ** 2))
+
+        # M-step: expected answers per item and grid point, then Newton on b and log a
+        per_row = posterior[user_of_item_row]
+        total = np.zeros((n_items, len(grid)))
+        right = np.zeros((n_items, len(grid)))
+        total[items] = np.add.reduceat(per_row, item_starts, axis=0)
+        right[items] = np.add.reduceat(per_row * y_by_item, item_starts, axis=0)
+        old_b, old_log_a = b, log_a
+        for _ in range(2):
+            disc = np.exp(log_a)[:, None]
+            p = 1.0 / (1.0 + np.exp(-disc * (grid - b[:, None])))
+            resid, w = right - total * p, total * p * (1.0 - p)
+            grad = -(disc * resid).sum(axis=1) - (b - prior) / DIFFICULTY_SD ** 2
+            hess = (disc * disc * w).sum(axis=1) + 1 / DIFFICULTY_SD ** 2
+            b = np.clip(b + np.clip(grad / hess, -1, 1), *DIFFICULTY_RANGE)
+
+            p = 1.0 / (1.0 + np.exp(-disc * (grid - b[:, None])))
+            resid, w = right - total * p, total * p * (1.0 - p)
+            d = disc * (grid - b[:, None])
+            grad = (d * resid).sum(axis=1) - log_a / LOG_DISCRIMINATION_SD ** 2
+            hess = (d * d * w).sum(axis=1) + 1 / LOG_DISCRIMINATION_SD ** 2
+            log_a = np.clip(log_a + np.clip(grad / hess, -0.5, 0.5), *np.log(DISCRIMINATION_RANGE))
+        if max(np.abs(b - old_b).max(), np.abs(log_a - old_log_a).max()) < RECALIBRATE_TOLERANCE:
+            break
+    return b, np.exp(log_a), {"iterations": iteration, "ability_mean": round(mean, 3), "ability_sd": round(sd, 3)}
+
+
+_item_bank: Optional[ItemBank] = None
+_item_bank_lock = threading.Lock()
+
+
+def get_item_bank() -> ItemBank:
+    """Shared item bank at COACH_ITEM_BANK (seeded from the problem bank on first use)."""
+    global _item_bank
+    if _item_bank is None:
+        with _item_bank_lock:
+            if _item_bank is None:
+                _item_bank = ItemBank()
+    return _item_bank
+
+
+def configure_item_bank(path: str = ITEM_BANK_PATH, **options) -> ItemBank:
+    """Point the shared item bank at another file (see ItemBank for options)."""
+    global _item_bank
+    with _item_bank_lock:
+        if _item_bank is not None:
+            with _item_bank._lock:
+                _item_bank._close()
+        _item_bank = ItemBank(path, **options)
+    return _item_bank
+
+
+def main(argv: Optional[List[str]] = None):
+    """python -m tools.item_bank [recalibrate|stats]  -- recalibrate from the app's storage (COACH_STORAGE)."""
+    import sys
+    from tools.storage import get_storage
+    argv = sys.argv[1:] if argv is None else argv
+    bank = get_item_bank()
+    if (argv[0] if argv else "recalibrate") == "recalibrate":
+        print(json.dumps(bank.recalibrate(get_storage()), indent=2))
+    print(json.dumps(bank.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,636 @@
+# src/tools/llm.py
+"""
+LLM execution layer for the agents' optional text expansion (lessons, feedback).
+
+Agents used to call their `llm_hook` inline, one blocking call per prompt. LLMExecutor
+wraps a backend and adds:
+
+- bounded concurrency: prompts run on a pool of max_concurrency threads, so the three
+  expansions of a 3-wrong quiz overlap instead of running back to back
+- batching: when the backend has complete_batch(prompts), prompts arriving within
+  batch_window seconds of each other (from any session) go out as one call
+- a response cache keyed by the SHA-256 of the normalized prompt (bounded LRU + TTL), and
+  identical prompts already in flight share one call
+- per-call timeouts: a caller waits at most `timeout` seconds and then gets its fallback
+  (the call itself keeps running and still fills the cache)
+- a circuit breaker: after breaker_threshold consecutive failures/timeouts, calls get the
+  fallback immediately for breaker_reset seconds, then one trial call decides
+
+stream(prompt) returns a TokenStream: chunks are yielded as the backend produces them (for
+the streaming lesson/feedback UI), with the same cache, breaker and deadline; streams bypass
+batching and in-flight sharing.
+
+Backends: CallableBackend(llm_hook) adapts the agents' hooks (prompt in, text out; a hook with
+a .stream(prompt) attribute streams); StubBackend answers locally after a configurable
+latency, for offline load tests.
+get_llm_executor() builds the process-wide executor from COACH_LLM_BACKEND ("stub" or unset).
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from observability.logging_setup import get_logger
+
+logger = get_logger("llm")
+
+LLM_BACKEND = os.environ.get("COACH_LLM_BACKEND", "")
+LLM_CONCURRENCY = int(os.environ.get("COACH_LLM_CONCURRENCY", "4"))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("COACH_LLM_TIMEOUT", "8.0"))
+LLM_CACHE_SIZE = int(os.environ.get("COACH_LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("COACH_LLM_CACHE_TTL", "3600"))
+LLM_STUB_LATENCY_MS = float(os.environ.get("COACH_LLM_STUB_LATENCY_MS", "200"))
+# batching (only for backends with complete_batch)
+LLM_MAX_BATCH = 8
+LLM_BATCH_WINDOW_SECONDS = 0.01
+DISPATCHER_IDLE_SECONDS = 5.0
+# circuit breaker
+LLM_BREAKER_THRESHOLD = 5
+LLM_BREAKER_RESET_SECONDS = 30.0
+LATENCY_WINDOW = 2048
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised by backends (or the breaker) when no answer can be produced."""
+
+
+def prompt_key(prompt: Any) -> str:
+    """
+    Cache key of a prompt: SHA-256 of its normalized text. Strings are stripped with runs of
+    whitespace collapsed; dicts/lists (feedback prompts) are serialized with sorted keys.
+    """
+    if isinstance(prompt, str):
+        text = _WHITESPACE.sub(" ", prompt).strip()
+    else:
+        text = json.dumps(prompt, sort_keys=True, default=str, separators=(",", ":"))
+        text = _WHITESPACE.sub(" ", text)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ---------------- backends ----------------
+class CallableBackend:
+    """
+    An agent llm_hook (prompt -> text), optionally with a batch_fn (prompts -> texts).
+    weak=True holds the hook by weak reference (executor_for's shared executors must not keep
+    their hook alive); calls fail with LLMUnavailable once it has been collected.
+    """
+
+    def __init__(self, fn: Callable[[Any], str], batch_fn: Optional[Callable[[List[Any]], List[str]]] = None,
+                 weak: bool = False):
+        self._batch_fn = batch_fn
+        self.supports_batch = batch_fn is not None or getattr(fn, "batch", None) is not None
+        if weak:
+            self._ref = weakref.WeakMethod(fn) if inspect.ismethod(fn) else weakref.ref(fn)
+        else:
+            self._ref = lambda: fn
+
+    @property
+    def fn(self) -> Callable[[Any], str]:
+        fn = self._ref()
+        if fn is None:
+            raise LLMUnavailable("llm_hook was released")
+        return fn
+
+    @property
+    def batch_fn(self) -> Optional[Callable[[List[Any]], List[str]]]:
+        # looked up per call: a hook's own .batch would otherwise keep the hook alive
+        return self._batch_fn or getattr(self.fn, "batch", None)
+
+    def complete(self, prompt: Any) -> str:
+        return self.fn(prompt)
+
+    def complete_batch(self, prompts: List[Any]) -> List[str]:
+        return list(self.batch_fn(prompts))
+
+    def stream(self, prompt: Any) -> Iterator[str]:
+        stream_fn = getattr(self.fn, "stream", None)
+        if stream_fn is not None:
+            yield from stream_fn(prompt)
+        else:
+            yield self.fn(prompt)
+
+
+class StubBackend:
+    """
+    Local stand-in for a hosted model: sleeps latency (+ uniform jitter) per call, batch or
+    single, fails with probability failure_rate, and returns deterministic text.
+    """
+
+    supports_batch = True
+
+    def __init__(self, latency_ms: float = LLM_STUB_LATENCY_MS, jitter_ms: float = 0.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency_ms / 1e3
+        self.jitter = jitter_ms / 1e3
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompts = 0
+
+    def _call(self, n: int):
+        with self._lock:
+            self.calls += 1
+            self.prompts += n
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.failure_rate
+        time.sleep(delay)
+        if failed:
+            raise LLMUnavailable("stub backend failure")
+
+    @staticmethod
+    def _answer(prompt: Any) -> str:
+        if isinstance(prompt, dict):
+            det = prompt.get("deterministic") or {}
+            return (f"[stub] For {prompt.get('question')}: {det.get('hint', '')} "
+                    f"Expected x = {det.get('expected_value')}.").strip()
+        return f"[stub] {_WHITESPACE.sub(' ', str(prompt)).strip()}"
+
+    def complete(self, prompt: Any) -> str:
+        self._call(1)
+        return self._answer(prompt)
+
+    def complete_batch(self, prompts: List[Any]) -> List[str]:
+        self._call(len(prompts))
+        return [self._answer(p) for p in prompts]
+
+    def stream(self, prompt: Any) -> Iterator[str]:
+        """The answer word by word, the latency spread evenly over the words."""
+        words = re.findall(r"\S+\s*", self._answer(prompt))
+        with self._lock:
+            self.calls += 1
+            self.prompts += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            failed = self._rng.random() < self.failure_rate
+        for word in words:
+            time.sleep(delay / len(words))
+            if failed:
+                raise LLMUnavailable("stub backend failure")
+            yield word
+
+
+# ---------------- circuit breaker ----------------
+class CircuitBreaker:
+    """
+    closed -> (threshold consecutive failures) -> open -> (reset_after seconds) -> half-open:
+    one trial call is let through; success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_after: float = LLM_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_after or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or (self._opened_at is None and self._failures >= self.threshold):
+                self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+# ---------------- streaming ----------------
+_END = object()
+_FAILED = object()
+
+
+class TokenStream:
+    """
+    Iterator over the chunks of one streamed completion, produced on the executor's pool.
+    Iteration stops at the end, on a backend failure, or at the deadline; afterwards
+    .text is the full text, or None when the stream did not complete.
+    """
+
+    def __init__(self, deadline: Optional[float] = None, on_timeout: Optional[Callable[[], None]] = None):
+        self.text: Optional[str] = None
+        self._chunks: "queue.Queue[Any]" = queue.Queue()
+        self._deadline = deadline
+        self._on_timeout = on_timeout
+
+    @classmethod
+    def of(cls, text: Optional[str]) -> "TokenStream":
+        """An already finished stream (cached text, or None for a refused call)."""
+        stream = cls()
+        if text is not None:
+            stream._chunks.put(text)
+            stream._chunks.put(_END)
+        else:
+            stream._chunks.put(_FAILED)
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        received = []
+        while True:
+            remaining = None if self._deadline is None else self._deadline - time.monotonic()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                chunk = self._chunks.get(timeout=remaining)
+            except queue.Empty:
+                if self._on_timeout is not None:
+                    self._on_timeout()
+                return
+            if chunk is _END:
+                self.text = "".join(received)
+                return
+            if chunk is _FAILED:
+                return
+            received.append(chunk)
+            yield chunk
+
+
+# ---------------- executor ----------------
+class LLMExecutor:
+    """
+    expand(prompt, fallback) / expand_many(prompts, fallbacks) and their async variants.
+    Each returns the backend text, or the fallback when the call fails, times out, or the
+    circuit breaker is open. Callers never see backend exceptions.
+    """
+
+    def __init__(self, backend, max_concurrency: int = LLM_CONCURRENCY, timeout: float = LLM_TIMEOUT_SECONDS,
+                 cache_size: int = LLM_CACHE_SIZE, cache_ttl: float = LLM_CACHE_TTL_SECONDS,
+                 max_batch: int = LLM_MAX_BATCH, batch_window: float = LLM_BATCH_WINDOW_SECONDS,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_batch = max_batch if getattr(backend, "supports_batch", False) else 1
+        self.batch_window = batch_window
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        # key -> (text, stored_at); key -> Future shared by identical prompts in flight
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        # batching: a dispatcher thread groups queued (key, prompt, future) items
+        self._queue: "queue.Queue[Optional[Tuple[str, Any, Future]]]" = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hits = 0
+        self.calls = 0
+        self.batches = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.short_circuited = 0
+
+    # ---- cache ----
+    def _cached(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key: str, text: str):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (text, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---- backend calls (pool threads) ----
+    def _finish(self, items: Sequence[Tuple[str, Any, Future]], texts: Optional[List[str]], error: Optional[BaseException]):
+        with self._lock:
+            for key, _, _ in items:
+                self._inflight.pop(key, None)
+        if error is None and texts is not None and len(texts) == len(items):
+            self.breaker.record_success()
+            for (key, _, future), text in zip(items, texts):
+                self._remember(key, text)
+                future.set_result(text)
+            return
+        if error is None:
+            error = LLMUnavailable(f"backend returned {len(texts or [])} answers for {len(items)} prompts")
+        with self._lock:
+            self.errors += 1
+        self.breaker.record_failure()
+        logger.info("llm_call_failed", extra={"extra": {"error": str(error), "prompts": len(items)}})
+        for _, _, future in items:
+            future.set_exception(error)
+
+    def _call(self, items: List[Tuple[str, Any, Future]]):
+        start = time.perf_counter()
+        batched = len(items) > 1 or self.max_batch > 1
+        try:
+            if batched:
+                texts = self.backend.complete_batch([prompt for _, prompt, _ in items])
+            else:
+                texts = [self.backend.complete(items[0][1])]
+            error = None
+        except Exception as e:
+            texts, error = None, e
+        with self._lock:
+            self.calls += 1
+            self.batches += batched
+            self._latencies.append(time.perf_counter() - start)
+        self._finish(items, texts, error)
+
+    def _dispatch(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=DISPATCHER_IDLE_SECONDS)
+            except queue.Empty:
+                # idle: exit (submit starts a new dispatcher), so an unused executor can be collected
+                with self._lock:
+                    if self._queue.empty():
+                        self._dispatcher = None
+                        return
+                continue
+            if item is None:
+                return
+            items = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                items.append(nxt)
+            self._pool.submit(self._call, items)
+
+    # ---- submission ----
+    def submit(self, prompt: Any) -> Future:
+        """Future of the backend text for prompt (served from the cache or an identical call in flight when possible)."""
+        key = prompt_key(prompt)
+        with self._lock:
+            self.requests += 1
+            text = self._cached(key)
+            if text is not None:
+                self.hits += 1
+                future = Future()
+                future.set_result(text)
+                return future
+            future = self._inflight.get(key)
+            if future is not None:
+                self.hits += 1
+                return future
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                future = Future()
+                future.set_exception(LLMUnavailable("circuit breaker open"))
+                return future
+            future = self._inflight[key] = Future()
+            if self.max_batch > 1:
+                self._queue.put((key, prompt, future))
+                if self._dispatcher is None:
+                    self._dispatcher = threading.Thread(target=self._dispatch, name="llm-batcher", daemon=True)
+                    self._dispatcher.start()
+                return future
+        self._pool.submit(self._call, [(key, prompt, future)])
+        return future
+
+    def _produce(self, key: str, prompt: Any, stream: TokenStream):
+        start = time.perf_counter()
+        chunks = []
+        try:
+            source = self.backend.stream(prompt) if hasattr(self.backend, "stream") else [self.backend.complete(prompt)]
+            for chunk in source:
+                chunks.append(chunk)
+                stream._chunks.put(chunk)
+            error = None
+        except Exception as e:
+            error = e
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(time.perf_counter() - start)
+        if error is None:
+            self.breaker.record_success()
+            self._remember(key, "".join(chunks))
+            stream._chunks.put(_END)
+            return
+        with self._lock:
+            self.errors += 1
+        self.breaker.record_failure()
+        logger.info("llm_call_failed", extra={"extra": {"error": str(error), "prompts": 1, "streamed_chunks": len(chunks)}})
+        stream._chunks.put(_FAILED)
+
+    def _stream_timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    def stream(self, prompt: Any, timeout: Optional[float] = None) -> TokenStream:
+        """
+        Stream the completion of prompt: iterate the result for chunks; its .text is the full
+        text once it completed. A cached answer arrives as one chunk; an open breaker gives an
+        empty stream. The whole stream must finish within the timeout.
+        """
+        key = prompt_key(prompt)
+        with self._lock:
+            self.requests += 1
+            text = self._cached(key)
+            if text is not None:
+                self.hits += 1
+                return TokenStream.of(text)
+        if not self.breaker.allow():
+            with self._lock:
+                self.short_circuited += 1
+            return TokenStream.of(None)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        stream = TokenStream(deadline, on_timeout=self._stream_timed_out)
+        self._pool.submit(self._produce, key, prompt, stream)
+        return stream
+
+    def _outcome(self, future: Future, fallback: Any) -> Any:
+        if not future.done():
+            with self._lock:
+                self.timeouts += 1
+            self.breaker.record_failure()
+            return fallback
+        if future.exception() is not None:
+            return fallback
+        return future.result()
+
+    def expand(self, prompt: Any, fallback: Any = None, timeout: Optional[float] = None) -> Any:
+        """Backend text for prompt, or fallback on failure, timeout or open breaker."""
+        future = self.submit(prompt)
+        try:
+            future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            pass
+        except Exception:
+            pass
+        return self._outcome(future, fallback)
+
+    def expand_many(self, prompts: Sequence[Any], fallbacks: Optional[Sequence[Any]] = None,
+                    timeout: Optional[float] = None) -> List[Any]:
+        """expand() for every prompt concurrently, under one shared deadline."""
+        fallbacks = list(fallbacks) if fallbacks is not None else [None] * len(prompts)
+        futures = [self.submit(p) for p in prompts]
+        wait(futures, timeout=self.timeout if timeout is None else timeout)
+        return [self._outcome(f, fb) for f, fb in zip(futures, fallbacks)]
+
+    async def expand_async(self, prompt: Any, fallback: Any = None, timeout: Optional[float] = None) -> Any:
+        return (await self.expand_many_async([prompt], [fallback], timeout))[0]
+
+    async def expand_many_async(self, prompts: Sequence[Any], fallbacks: Optional[Sequence[Any]] = None,
+                                timeout: Optional[float] = None) -> List[Any]:
+        """Async expand_many: waits on the backend futures without blocking the event loop."""
+        fallbacks = list(fallbacks) if fallbacks is not None else [None] * len(prompts)
+        futures = [self.submit(p) for p in prompts]
+        pending = [asyncio.wrap_future(f) for f in futures if not f.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=self.timeout if timeout is None else timeout)
+            for p in pending:
+                # a timed-out call keeps running on the pool; don't warn about its unretrieved result
+                p.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return [self._outcome(f, fb) for f, fb in zip(futures, fallbacks)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            at = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e3, 2) if latencies else 0.0
+            return {
+                "requests": self.requests,
+                "cache_hits": self.hits,
+                "hit_rate": (self.hits / self.requests) if self.requests else 0.0,
+                "backend_calls": self.calls,
+                "batches": self.batches,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "short_circuited": self.short_circuited,
+                "breaker": self.breaker.state,
+                "breaker_opened": self.breaker.opened,
+                "cache_entries": len(self._cache),
+                "p50_ms": at(0.50),
+                "p99_ms": at(0.99),
+            }
+
+    def close(self, wait: bool = True):
+        """Stop the batch dispatcher and the thread pool (wait=False: don't join the dispatcher)."""
+        with self._lock:
+            dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None:
+            self._queue.put(None)
+            if wait and dispatcher is not threading.current_thread():
+                dispatcher.join()
+        self._pool.shutdown(wait=False)
+
+
+# ---------------- shared executors ----------------
+_default: Optional[LLMExecutor] = None
+_default_configured = False
+# hook key -> executor (see _hook_key); an entry lives as long as its hook
+_by_hook: Dict[Any, LLMExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def configure_llm(backend=None, **options) -> Optional[LLMExecutor]:
+    """
+    Set the process-wide executor agents use when they have no llm_hook of their own,
+    e.g. configure_llm(StubBackend(latency_ms=150)); configure_llm(None) turns LLM expansion off.
+    """
+    global _default, _default_configured
+    with _executors_lock:
+        if _default is not None:
+            _default.close()
+        _default = LLMExecutor(backend, **options) if backend is not None else None
+        _default_configured = True
+    return _default
+
+
+def get_llm_executor() -> Optional[LLMExecutor]:
+    """The process-wide executor: configure_llm()'s, else from COACH_LLM_BACKEND ("stub"), else None."""
+    if not _default_configured:
+        configure_llm(StubBackend() if LLM_BACKEND == "stub" else None)
+    return _default
+
+
+def _hook_key(llm_hook: Callable) -> Tuple[Any, Any]:
+    """
+    (registry key, object whose lifetime bounds the entry) for a hook. Keys are identities, so
+    unhashable hooks work too; bound methods of one object share a key (each attribute access
+    makes a new method object).
+    """
+    if inspect.ismethod(llm_hook):
+        return (id(llm_hook.__self__), id(llm_hook.__func__)), llm_hook.__self__
+    return id(llm_hook), llm_hook
+
+
+def _release_hook(key: Any):
+    """The hook behind key was collected: drop its executor and stop its threads."""
+    executor = _by_hook.pop(key, None)
+    if executor is not None:
+        # may run from the garbage collector on any thread, the executor's own included
+        executor.close(wait=False)
+
+
+def executor_for(llm_hook: Optional[Callable]) -> Optional[LLMExecutor]:
+    """
+    Executor for an agent: one shared LLMExecutor per llm_hook (so its cache and breaker
+    outlive the per-request agent objects), or the process-wide one without a hook.
+    The executor holds its hook weakly and is shut down once the hook is collected.
+    """
+    if llm_hook is None:
+        return get_llm_executor()
+    key, owner = _hook_key(llm_hook)
+    with _executors_lock:
+        executor = _by_hook.get(key)
+        if executor is None:
+            try:
+                executor = LLMExecutor(CallableBackend(llm_hook, weak=True))
+                weakref.finalize(owner, _release_hook, key)
+            except TypeError:
+                # not weakly referenceable (e.g. a builtin): the executor holds it for the life
+                # of the process, which also keeps its id (the key) from being reused
+                executor = LLMExecutor(CallableBackend(llm_hook))
+            _by_hook[key] = executor
+        return executor
+
+
+def llm_stats() -> Dict[str, Any]:
+    """Stats of the process-wide executor (empty when LLM expansion is off)."""
+    executor = get_llm_executor()
+    return executor.stats() if executor is not None else {}
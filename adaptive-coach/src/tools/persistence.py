@@ -1,14 +1,81 @@
 # src/tools/persistence.py
 
+import argparse
+import asyncio
+import atexit
+import copy
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
+import os
+import random
 import sqlite3
 import json
-from typing import Dict, Any
-from rich.console import Console
+import marshal
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Any, IO, Iterator, List, Optional, Tuple, Union
 
-# Rich console (Windows-safe)
-console = Console(soft_wrap=True, force_jupyter=False)
+from utils.lazy import LazyObject
 
-DB_PATH = "memory.db"
+
+def _make_console():
+    from rich.console import Console
+    return Console(soft_wrap=True, force_jupyter=False)
+
+
+# Rich console (Windows-safe); rich is imported on the first log line, not at import
+console = LazyObject(_make_console)
+
+# Default home of the app's data files (memory, problem bank, item bank): the adaptive-coach
+# folder, whatever the working directory; COACH_DATA_DIR moves them all at once.
+DATA_DIR = os.environ.get("COACH_DATA_DIR") or os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def data_path(name: str) -> str:
+    """Absolute path of a default data file, e.g. data_path("memory.db")."""
+    return os.path.join(DATA_DIR, name)
+
+
+DB_PATH = data_path("memory.db")
+
+# History lists that grow with every session. In normalized mode each of these
+# lives in its own append-only table instead of inside the memory JSON blob.
+HISTORY_KEYS = ("diagnostics", "lessons", "quizzes", "feedbacks")
+
+# Decoded-memory cache defaults (see MemoryCache)
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 300.0
+CACHE_REVALIDATE_SECONDS = 1.0
+
+# Write-behind defaults (see enable_write_behind)
+WRITE_BEHIND_INTERVAL = 0.05
+WRITE_BEHIND_BATCH_SIZE = 256
+
+_UPSERT_MEMORY_SQL = """
+    INSERT INTO memory(user_id, data, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(user_id)
+    DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at, version=version+1
+"""
+
+# Optimistic concurrency (see save_memory(expected_version=...) and update_memory)
+CAS_RETRIES = 16
+CAS_BACKOFF_SECONDS = 0.002
+CAS_BACKOFF_MAX_SECONDS = 0.1
+
+# Codec used for new memory rows (see set_codec)
+MEMORY_CODEC = os.environ.get("COACH_MEMORY_CODEC", "json")
 
 
 def sanitize(msg: str) -> str:
@@ -38,48 +105,1999 @@ def log(msg: str, style: str = "green"):
     console.print(f"[{style}]{msg}[/]", markup=False)
 
 
-def init_db(path: str = DB_PATH):
-    conn = sqlite3.connect(path, check_same_thread=False)
+_memory_db_ids = itertools.count()
+
+
+class MemoryConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that remembers which database it was opened on,
+    so decoded memory can be cached per (database, user_id).
+    Threads sharing it (e.g. the async API's I/O executor) take turns at write transactions.
+    """
+    cache_key: Optional[str] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_lock = threading.RLock()
+
+
+def _create_tables(conn: sqlite3.Connection, normalized: bool = False):
     conn.execute("""
     CREATE TABLE IF NOT EXISTS memory (
         user_id TEXT PRIMARY KEY,
         data TEXT,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+    _ensure_version_column(conn, "memory")
+    # Time series of mastery updates (see record_mastery / mastery_series)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS mastery_history (
+        user_id TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        ts TEXT NOT NULL,
+        mastery INTEGER NOT NULL
     )
     """)
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_mastery_history_user_topic_ts
+    ON mastery_history(user_id, topic, ts)
+    """)
+    created = _create_summary_table(conn)
     conn.commit()
 
+    if normalized:
+        migrate_to_normalized(conn)
+    if created:
+        # backfill databases written before the summary table existed
+        _refresh_summaries(conn, None, is_normalized(conn))
+        conn.commit()
+
+
+def _ensure_version_column(conn: sqlite3.Connection, table: str):
+    # databases created before optimistic concurrency existed start every row at version 1
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if "version" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def init_db(path: str = DB_PATH, normalized: bool = False):
+    """
+    Open (and create if needed) the memory database.
+    normalized=True switches the database to append-only history tables and
+    migrates any existing memory blobs over (see migrate_to_normalized).
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, factory=MemoryConnection)
+    _register_functions(conn)
+    if path == ":memory:":
+        # every in-memory connection is its own database
+        conn.cache_key = f":memory:{next(_memory_db_ids)}"
+    else:
+        conn.cache_key = os.path.abspath(path)
+    _create_tables(conn, normalized)
+    _forget_layout(conn)
+
     log("[OK] SQLite memory database initialized.", "green")
     return conn
 
 
-def save_memory(conn: sqlite3.Connection, user_id: str, memory: Dict[str, Any]):
-    data = json.dumps(memory, ensure_ascii=False)
+# ------------------------------------------------------------------
+# Memory row codecs
+# ------------------------------------------------------------------
+# A blob-layout row is either JSON TEXT (the original format, always readable) or a BLOB
+# whose first byte tags the format: the low bits name the codec, 0x80 marks a
+# zlib-compressed payload. Normalized-layout rows are small and always stay JSON text.
+#
+#   json          JSON TEXT, untagged (default; what every older database holds)
+#   json+zlib     tagged UTF-8 JSON, compressed when larger than COMPRESS_MIN_BYTES
+#   marshal       tagged marshal (version 4): several times faster than json for
+#                 history-sized documents; round-trips Python types exactly
+#   marshal+zlib  marshal, compressed when larger than COMPRESS_MIN_BYTES
+#
+# JSON1 queries (partial updates, get_path, summaries) see tagged rows through the
+# memory_json() SQL function, so switching codecs needs no migration.
+_TAG_JSON = 0x01
+_TAG_MARSHAL = 0x02
+_TAG_ZLIB = 0x80
+CODECS = ("json", "json+zlib", "marshal", "marshal+zlib")
+COMPRESS_MIN_BYTES = 512
+ZLIB_LEVEL = 6
+MARSHAL_VERSION = 4
+
+
+def set_codec(name: str):
+    """Choose the codec for rows written from now on (existing rows stay readable)."""
+    global MEMORY_CODEC
+    if name not in CODECS:
+        raise ValueError(f"unknown memory codec: {name!r} (expected one of {CODECS})")
+    MEMORY_CODEC = name
+
+
+def encode_memory(memory: Dict[str, Any], codec: Optional[str] = None) -> Union[str, bytes]:
+    codec = codec or MEMORY_CODEC
+    if codec == "json":
+        return json.dumps(memory, ensure_ascii=False)
+    base, _, compression = codec.partition("+")
+    if base == "marshal":
+        tag, payload = _TAG_MARSHAL, marshal.dumps(memory, MARSHAL_VERSION)
+    elif base == "json" and compression == "zlib":
+        tag, payload = _TAG_JSON, json.dumps(memory, ensure_ascii=False).encode("utf-8")
+    else:
+        raise ValueError(f"unknown memory codec: {codec!r} (expected one of {CODECS})")
+    if compression == "zlib" and len(payload) > COMPRESS_MIN_BYTES:
+        tag, payload = tag | _TAG_ZLIB, zlib.compress(payload, ZLIB_LEVEL)
+    return bytes((tag,)) + payload
+
+
+def decode_memory(data: Union[str, bytes, None]) -> Dict[str, Any]:
+    if data is None:
+        return {}
+    if isinstance(data, str):
+        return json.loads(data)
+    tag, payload = data[0], data[1:]
+    if tag & _TAG_ZLIB:
+        payload = zlib.decompress(payload)
+    kind = tag & ~_TAG_ZLIB
+    if kind == _TAG_MARSHAL:
+        return marshal.loads(payload)
+    if kind == _TAG_JSON:
+        return json.loads(payload)
+    raise ValueError(f"unknown memory row format tag: {tag:#x}")
+
+
+# Last blob converted by memory_json(): one statement usually extracts several paths
+# from the same row, and this keeps that to a single decode.
+_last_json = (None, None)
+
+
+def _memory_json(data):
+    """SQL memory_json(data): JSON text of a row in any format (text rows pass through)."""
+    global _last_json
+    if not isinstance(data, bytes):
+        return data
+    blob, text = _last_json
+    if blob is not data and blob != data:
+        text = json.dumps(decode_memory(data), ensure_ascii=False)
+        _last_json = (data, text)
+    return text
+
+
+def _memory_encode(text):
+    """SQL memory_encode(json_text): re-encode a JSON1 result with the current codec."""
+    if text is None or MEMORY_CODEC == "json":
+        return text
+    return encode_memory(json.loads(text))
+
+
+def _register_functions(conn: sqlite3.Connection):
+    conn.create_function("memory_json", 1, _memory_json, deterministic=True)
+    conn.create_function("memory_encode", 1, _memory_encode)
+
+
+def json_column(column: str = "data") -> str:
+    """SQL expression giving the JSON text of a blob-layout row without a Python call for text rows."""
+    return f"(CASE WHEN typeof({column})='blob' THEN memory_json({column}) ELSE {column} END)"
+
+
+# ------------------------------------------------------------------
+# Connection pool
+# ------------------------------------------------------------------
+POOL_SIZE = 4
+
+
+class ConnectionPool:
+    """
+    Thread-safe access to one memory database for many concurrent sessions.
+
+    - Reads check out one of up to `size` reader connections; a thread keeps the
+      same connection for nested checkouts, and waits when all are in use.
+    - Writes go through a single writer connection, one thread at a time, so
+      transactions from different sessions never interleave.
+    - The database runs in WAL mode, so readers don't block the writer.
+      In-memory pools (":memory:") can't use WAL, so there reads share the writer.
+
+    Anything that accepts `conn` in this module (and every agent's conn=) accepts a pool.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE, normalized: bool = False,
+                 timeout: float = 30.0):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.size = size
+        self.timeout = timeout
+        self.in_memory = path == ":memory:"
+        if self.in_memory:
+            token = next(_memory_db_ids)
+            self.path = ":memory:"
+            self.cache_key = f":memory:{token}"
+        else:
+            self.path = path
+            self.cache_key = os.path.abspath(path)
+
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        _create_tables(self._writer, normalized)
+        _forget_layout(self)
+        self._write_lock = threading.RLock()
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "read_checkouts": 0, "read_wait_total": 0.0, "read_wait_max": 0.0,
+            "write_checkouts": 0, "write_wait_total": 0.0, "write_wait_max": 0.0,
+            "timeouts": 0,
+        }
+        log(f"[OK] SQLite connection pool initialized (size={size}).", "green")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout)
+        _register_functions(conn)
+        return conn
+
+    def _record(self, kind: str, waited: float):
+        with self._metrics_lock:
+            self._metrics[f"{kind}_checkouts"] += 1
+            self._metrics[f"{kind}_wait_total"] += waited
+            self._metrics[f"{kind}_wait_max"] = max(self._metrics[f"{kind}_wait_max"], waited)
+
+    def _timed_out(self, what: str):
+        with self._metrics_lock:
+            self._metrics["timeouts"] += 1
+        raise TimeoutError(f"timed out after {self.timeout}s waiting for a {what} connection")
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Check out a read connection for the current thread."""
+        if self.in_memory:
+            with self.writer() as conn:
+                yield conn
+            return
+
+        held = getattr(self._local, "reader", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._timed_out("read")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._open_lock:
+                self._opened += 1
+            conn = self._connect()
+        self._record("read", time.perf_counter() - start)
+        self._local.reader, self._local.depth = conn, 1
+        try:
+            yield conn
+        finally:
+            self._local.reader = None
+            self._idle.put(conn)
+            self._slots.release()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Check out the single writer connection (serialized across threads)."""
+        start = time.perf_counter()
+        if not self._write_lock.acquire(timeout=self.timeout):
+            self._timed_out("write")
+        self._record("write", time.perf_counter() - start)
+        try:
+            yield self._writer
+        except BaseException:
+            self._writer.rollback()
+            raise
+        finally:
+            self._write_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        reads, writes = m["read_checkouts"], m["write_checkouts"]
+        return {
+            "size": self.size,
+            "readers_open": self._opened,
+            "readers_idle": self._idle.qsize(),
+            "read_checkouts": reads,
+            "read_wait_avg_ms": 1000 * m["read_wait_total"] / reads if reads else 0.0,
+            "read_wait_max_ms": 1000 * m["read_wait_max"],
+            "write_checkouts": writes,
+            "write_wait_avg_ms": 1000 * m["write_wait_total"] / writes if writes else 0.0,
+            "write_wait_max_ms": 1000 * m["write_wait_max"],
+            "timeouts": m["timeouts"],
+        }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._write_lock:
+            self._writer.close()
+
+
+# ------------------------------------------------------------------
+# Sharding
+# ------------------------------------------------------------------
+def shard_index(user_id: str, shards: int) -> int:
+    """
+    Stable shard number in [0, shards) for a learner (jump consistent hash over blake2b).
+    Growing from N to M shards only moves about (M - N) / M of the learners.
+    """
+    key = int.from_bytes(hashlib.blake2b(user_id.encode("utf-8"), digest_size=8).digest(), "little")
+    b, j = -1, 0
+    while j < shards:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+class ShardedStore:
+    """
+    Learners spread over several databases (usually one ConnectionPool per file),
+    routed by shard_index(user_id). Writers on different shards never contend.
+
+    Every per-learner function in this module routes to the learner's shard;
+    whole-database operations (export/import, summaries, migration, cohort queries,
+    compaction) visit every shard. See tools/storage.py for opening one.
+    """
+
+    def __init__(self, shards: List["Conn"]):
+        if not shards:
+            raise ValueError("a sharded store needs at least one shard")
+        self.shards = list(shards)
+        self.cache_key = "sharded:" + "|".join(str(getattr(s, "cache_key", id(s))) for s in self.shards)
+
+    def shard_for(self, user_id: str) -> "Conn":
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shards": len(self.shards),
+            "per_shard": [s.stats() if hasattr(s, "stats") else {} for s in self.shards],
+        }
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+
+Conn = Union[sqlite3.Connection, ConnectionPool, ShardedStore]
+
+
+def shard_for(conn: Conn, user_id: str) -> Conn:
+    """The database holding user_id (conn itself unless it is sharded)."""
+    return conn.shard_for(user_id) if isinstance(conn, ShardedStore) else conn
+
+
+def shards_of(conn: Conn) -> List[Conn]:
+    """Every database behind conn, for operations that span all learners."""
+    return list(conn.shards) if isinstance(conn, ShardedStore) else [conn]
+
+
+@contextmanager
+def reading(conn: Conn) -> Iterator[sqlite3.Connection]:
+    """A connection for reads: a pooled reader, or conn itself."""
+    if isinstance(conn, ConnectionPool):
+        with conn.reader() as c:
+            yield c
+    else:
+        yield conn
+
+
+@contextmanager
+def writing(conn: Conn) -> Iterator[sqlite3.Connection]:
+    """The connection for one write transaction (the pool's writer, held until the block ends); commit inside."""
+    if isinstance(conn, ConnectionPool):
+        with conn.writer() as c:
+            yield c
+    elif isinstance(conn, MemoryConnection):
+        with conn.write_lock:
+            yield conn
+    else:
+        yield conn
+
+
+# ------------------------------------------------------------------
+# Normalized storage mode
+# ------------------------------------------------------------------
+def _create_normalized_tables(conn: sqlite3.Connection):
+    # Small per-learner row: topic_mastery, preferences, last_* and any other scalar keys
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS memory_profile (
+        user_id TEXT PRIMARY KEY,
+        data TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        version INTEGER NOT NULL DEFAULT 1
+    )
+    """)
+    _ensure_version_column(conn, "memory_profile")
+    # One append-only table per history list, keyed by (user_id, seq)
+    for key in HISTORY_KEYS:
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {key} (
+            user_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, seq)
+        )
+        """)
+
+
+# Layout of every database opened through init_db/ConnectionPool, keyed like the memory
+# cache: nearly every load, save and partial update asks, so sqlite_master is read once.
+# Opening a database and migrate_to_normalized drop the entry.
+_layouts: Dict[str, bool] = {}
+
+
+def _forget_layout(conn: Conn):
+    for shard in shards_of(conn):
+        _layouts.pop(getattr(shard, "cache_key", None), None)
+
+
+def is_normalized(conn: Conn) -> bool:
+    """True if the database uses the normalized (append-only history) layout."""
+    conn = shards_of(conn)[0]
+    key = getattr(conn, "cache_key", None)
+    normalized = _layouts.get(key)
+    if normalized is None:
+        with reading(conn) as c:
+            normalized = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='memory_profile'"
+            ).fetchone() is not None
+        if key is not None:
+            _layouts[key] = normalized
+    return normalized
+
+
+def migrate_to_normalized(conn: Conn) -> int:
+    """
+    Move every memory blob into the normalized tables.
+    Idempotent: rows already migrated are removed from `memory`, so running it
+    again only picks up blobs written since. Returns the number of users moved.
+    """
+    if isinstance(conn, ShardedStore):
+        return sum(migrate_to_normalized(shard) for shard in conn.shards)
+    with writing(conn) as c:
+        _create_normalized_tables(c)
+        rows = c.execute("SELECT user_id, data FROM memory").fetchall()
+        for user_id, data in rows:
+            _write_normalized(c, user_id, decode_memory(data), _stamp())
+            c.execute("DELETE FROM memory WHERE user_id=?", (user_id,))
+        c.commit()
+    _forget_layout(conn)
+    if rows:
+        memory_cache.clear()
+        log(f"[OK] Migrated {len(rows)} memory blobs to normalized tables.", "green")
+    return len(rows)
+
+
+class _Pending:
+    """Placeholder for a history list that has not been read from its table yet."""
+
+    def __repr__(self):
+        return "<pending>"
+
+
+_PENDING = _Pending()
+
+
+class LazyMemory(dict):
+    """
+    Memory dict returned by load_memory() for normalized databases.
+    It has the same shape as the blob-mode dict, but each history list is only
+    read from its table the first time it is accessed. save_memory() uses the
+    bookkeeping kept here to write just the new entries of each list.
+    """
+
+    def __init__(self, conn, user_id: str, profile: Dict[str, Any], counts: Dict[str, int]):
+        super().__init__(profile)
+        self._conn = conn
+        self._user_id = user_id
+        # rows currently stored per history key, and the stored JSON of the newest one
+        self._counts = dict(counts)
+        self._tails: Dict[str, str] = {}
+        for key, n in counts.items():
+            if n:
+                dict.__setitem__(self, key, _PENDING)
+
+    def _materialize(self, key):
+        value = dict.get(self, key)
+        if value is _PENDING:
+            with reading(self._conn) as c:
+                rows = c.execute(
+                    f"SELECT data FROM {key} WHERE user_id=? ORDER BY seq", (self._user_id,)
+                ).fetchall()
+            value = [json.loads(r[0]) for r in rows]
+            if rows:
+                self._tails[key] = rows[-1][0]
+            dict.__setitem__(self, key, value)
+        return value
+
+    def _materialize_all(self):
+        for key in HISTORY_KEYS:
+            self._materialize(key)
+
+    def __getitem__(self, key):
+        if dict.get(self, key) is _PENDING:
+            return self._materialize(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            self._materialize(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._materialize_all()
+        return dict.popitem(self)
+
+    def __iter__(self):
+        # Overriding __iter__ keeps dict(mem) / {**mem} from copying raw placeholders
+        return dict.__iter__(self)
+
+    def values(self):
+        self._materialize_all()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize_all()
+        return dict.items(self)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        self._materialize_all()
+        return dict.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._materialize_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
+def _copy_value(value: Any) -> Any:
+    """Deep copy of a JSON-shaped value (a marshal round trip, several times faster than deepcopy)."""
+    try:
+        return marshal.loads(marshal.dumps(value, MARSHAL_VERSION))
+    except ValueError:  # not marshallable (e.g. a dict subclass somewhere inside)
+        return copy.deepcopy(value)
+
+
+def _private_copy(memory: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    A copy of a memory dict that shares nothing mutable with it. A LazyMemory stays lazy:
+    unread history lists are still read on first access, and its save bookkeeping is kept.
+    """
+    if memory is None:
+        return None
+    if not isinstance(memory, LazyMemory):
+        return _copy_value(memory)
+    clone = LazyMemory(memory._conn, memory._user_id, {}, {})
+    for key, value in dict.items(memory):
+        dict.__setitem__(clone, key, value if value is _PENDING else _copy_value(value))
+    clone._counts = dict(memory._counts)
+    clone._tails = dict(memory._tails)
+    return clone
+
+
+def _split_profile(memory: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything except non-empty history lists goes into the profile row."""
+    return {
+        k: v for k, v in dict.items(memory)
+        if not (k in HISTORY_KEYS and (v is _PENDING or (isinstance(v, list) and v)))
+    }
+
+
+def _write_normalized(conn: sqlite3.Connection, user_id: str, memory: Dict[str, Any], stamp: str):
+    lazy = memory if isinstance(memory, LazyMemory) else None
+    for key in HISTORY_KEYS:
+        value = dict.get(memory, key)
+        if value is _PENDING:
+            # never read, so never changed
+            continue
+        if not isinstance(value, list) or not value:
+            conn.execute(f"DELETE FROM {key} WHERE user_id=?", (user_id,))
+            if lazy is not None:
+                lazy._counts[key] = 0
+                lazy._tails.pop(key, None)
+            continue
+
+        stored = lazy._counts.get(key, 0) if lazy is not None else None
+        if stored is None:
+            # A plain dict replaces the stored history
+            conn.execute(f"DELETE FROM {key} WHERE user_id=?", (user_id,))
+            stored = 0
+        elif len(value) < stored:
+            conn.execute(f"DELETE FROM {key} WHERE user_id=? AND seq>=?", (user_id, len(value)))
+            stored = len(value)
+
+        # History is append-only, but the newest stored entry may be amended
+        # (e.g. grade_quiz fills in the answers of the last quiz).
+        if stored:
+            tail = json.dumps(value[stored - 1], ensure_ascii=False)
+            if lazy is None or tail != lazy._tails.get(key):
+                conn.execute(
+                    f"UPDATE {key} SET data=? WHERE user_id=? AND seq=?",
+                    (tail, user_id, stored - 1)
+                )
+        new_rows = [
+            (user_id, seq, json.dumps(value[seq], ensure_ascii=False))
+            for seq in range(stored, len(value))
+        ]
+        conn.executemany(f"INSERT INTO {key}(user_id, seq, data) VALUES (?, ?, ?)", new_rows)
+
+        if lazy is not None:
+            lazy._counts[key] = len(value)
+            lazy._tails[key] = new_rows[-1][2] if new_rows else tail
+
     conn.execute(
         """
-        INSERT INTO memory(user_id, data)
-        VALUES (?, ?)
+        INSERT INTO memory_profile(user_id, data, updated_at)
+        VALUES (?, ?, ?)
         ON CONFLICT(user_id)
-        DO UPDATE SET data=excluded.data, updated_at=CURRENT_TIMESTAMP
+        DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at, version=version+1
         """,
-        (user_id, data)
+        (user_id, json.dumps(_split_profile(memory), ensure_ascii=False), stamp)
     )
-    conn.commit()
+
+
+def _load_normalized(conn: Conn, user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    with reading(conn) as c:
+        row = c.execute(
+            "SELECT data, updated_at FROM memory_profile WHERE user_id=?", (user_id,)
+        ).fetchone()
+        if not row:
+            return None, None
+        counts_sql = " UNION ALL ".join(
+            f"SELECT '{key}', COUNT(*) FROM {key} WHERE user_id=:u" for key in HISTORY_KEYS
+        )
+        counts = dict(c.execute(counts_sql, {"u": user_id}).fetchall())
+    return LazyMemory(conn, user_id, json.loads(row[0]), counts), row[1]
+
+
+# ------------------------------------------------------------------
+# Decoded memory cache
+# ------------------------------------------------------------------
+class MemoryCache:
+    """
+    Bounded LRU cache of decoded memory dicts, keyed by (database, user_id).
+
+    - max_entries: least recently used entries are evicted beyond this size (0 disables the cache)
+    - ttl: entries older than this many seconds are dropped and reloaded
+    - revalidate_after: a hit older than this is checked against the row's updated_at
+      (one indexed lookup, no decoding) to pick up writes from other processes
+
+    save_memory/delete_memory write through, so reads after a local write never hit the DB.
+    The cache keeps its own copy of every memory and load_memory hands out a fresh copy on
+    each hit, so a dict mutated (and not saved) by one caller is never seen by the next.
+
+    A reader that fills the cache from the database takes generation() before its query and
+    passes it to put(); any invalidate() or write-through put() in between makes that put a
+    no-op, so a value read just before a concurrent commit is never cached after it.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 revalidate_after: float = CACHE_REVALIDATE_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate_after = revalidate_after
+        # key -> [memory or None, updated_at, stored_at, checked_at]
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def get(self, key) -> Optional[list]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if now - entry[2] > self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def needs_revalidation(self, entry: list) -> bool:
+        return time.monotonic() - entry[3] > self.revalidate_after
+
+    def record_hit(self, entry: list, revalidated: bool = False):
+        with self._lock:
+            self.hits += 1
+            if revalidated:
+                self.revalidations += 1
+                entry[3] = time.monotonic()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def put(self, key, memory: Optional[Dict[str, Any]], updated_at: Optional[str],
+            generation: Optional[int] = None):
+        if key is None or self.max_entries <= 0:
+            return
+        memory = _private_copy(memory)
+        now = time.monotonic()
+        with self._lock:
+            if generation is None:
+                self._generation += 1  # a write-through: supersedes copies being read meanwhile
+            elif generation != self._generation:
+                return  # invalidated while the caller was reading: its copy may be stale
+            self._entries[key] = [memory, updated_at, now, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+memory_cache = MemoryCache()
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the shared memory cache."""
+    return memory_cache.stats()
+
+
+def _cache_key(conn, user_id: str):
+    db = getattr(conn, "cache_key", None)
+    if db is None or memory_cache.max_entries <= 0:
+        return None
+    return (db, user_id)
+
+
+def _stamp() -> str:
+    # sub-second resolution so two saves within the same second still look different
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _commit_write(c: sqlite3.Connection, conn: Conn, user_id: str,
+                  memory: Optional[Dict[str, Any]] = None, stamp: Optional[str] = None):
+    """
+    Commit a learner's write transaction and keep the cache coherent with it, while the
+    writer is still held: the entry is dropped before the commit (no hit can return the old
+    value once the new one is committed) and, after it, replaced by `memory` (write-through)
+    or dropped again, which also discards a copy a reader loaded from the database meanwhile.
+    """
+    key = _cache_key(conn, user_id)
+    memory_cache.invalidate(key)
+    c.commit()
+    if memory is None:
+        memory_cache.invalidate(key)
+    else:
+        memory_cache.put(key, memory, stamp)
+
+
+def _read_stamp(conn: Conn, user_id: str) -> Optional[str]:
+    writer = _writer_for(conn)
+    pending = writer.pending(user_id) if writer else None
+    if pending is not None:
+        return pending[1]
+    table = "memory_profile" if is_normalized(conn) else "memory"
+    with reading(conn) as c:
+        row = c.execute(f"SELECT updated_at FROM {table} WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+# ------------------------------------------------------------------
+# Write-behind (group commit) mode
+# ------------------------------------------------------------------
+class WriteBehindWriter:
+    """
+    Background thread that owns a dedicated writer connection and commits
+    queued saves in batches. Saves for the same user_id are coalesced, so
+    only the newest document is written. A batch is committed once
+    batch_size users are pending or interval seconds after the first save
+    was queued, whichever comes first.
+    """
+
+    def __init__(self, path: str, interval: float = WRITE_BEHIND_INTERVAL,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE):
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        _register_functions(self._conn)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # user_id -> (encoded data, updated_at); _inflight holds the batch being committed
+        self._pending: "OrderedDict[str, Tuple[Union[str, bytes], str]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[Union[str, bytes], str]] = {}
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._committed = 0
+        self._first_pending_at: Optional[float] = None
+        self._flush_requested = False
+        self._closed = False
+        self.error: Optional[BaseException] = None
+        self.saves = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.rows_written = 0
+        self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: str, data: str, stamp: str):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind writer is closed")
+            if self.error is not None:
+                raise RuntimeError("write-behind writer failed") from self.error
+            if user_id in self._pending:
+                self.coalesced += 1
+            else:
+                if not self._pending:
+                    self._first_pending_at = time.monotonic()
+            self._pending[user_id] = (data, stamp)
+            self._submitted += 1
+            self.saves += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def pending(self, user_id: str) -> Optional[Tuple[str, str]]:
+        """Newest queued-but-not-yet-committed (data, updated_at) for user_id, if any."""
+        with self._cond:
+            return self._pending.get(user_id) or self._inflight.get(user_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Durability barrier: block until every save queued before this call is committed.
+        Returns False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._committed < target and self.error is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            if self.error is not None:
+                raise RuntimeError("write-behind writer failed") from self.error
+            return True
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._conn.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending:
+                        due = self._first_pending_at + self.interval
+                        if (self._flush_requested or len(self._pending) >= self.batch_size
+                                or time.monotonic() >= due):
+                            break
+                        self._cond.wait(max(0.0, due - time.monotonic()))
+                    else:
+                        self._flush_requested = False
+                        self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+                batch, self._pending = self._pending, OrderedDict()
+                self._inflight = dict(batch)
+                target = self._submitted
+                self._flush_requested = False
+            try:
+                self._conn.executemany(
+                    _UPSERT_MEMORY_SQL,
+                    [(user_id, data, stamp) for user_id, (data, stamp) in batch.items()]
+                )
+                _refresh_summaries(self._conn, list(batch), normalized=False)
+                self._conn.commit()
+            except BaseException as e:
+                self.error = e
+                with self._cond:
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._inflight = {}
+                self._committed = target
+                self.batches += 1
+                self.rows_written += len(batch)
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "saves": self.saves,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "rows_written": self.rows_written,
+                "pending": len(self._pending) + len(self._inflight),
+            }
+
+
+_writers: Dict[str, WriteBehindWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def _writer_for(conn) -> Optional[WriteBehindWriter]:
+    if not _writers:
+        return None
+    return _writers.get(getattr(conn, "cache_key", None))
+
+
+def enable_write_behind(conn: Conn, interval: float = WRITE_BEHIND_INTERVAL,
+                        batch_size: int = WRITE_BEHIND_BATCH_SIZE) -> WriteBehindWriter:
+    """
+    Switch a file database opened with init_db() to write-behind mode:
+    save_memory() queues the document and returns, and a background writer
+    group-commits queued saves (WAL mode, one fsync per batch).
+    Loads see queued saves immediately; call flush() when durability matters.
+    Only blob-mode databases are supported. For a ShardedStore every shard gets
+    its own writer and a list of them is returned.
+    """
+    if isinstance(conn, ShardedStore):
+        return [enable_write_behind(shard, interval, batch_size) for shard in conn.shards]
+    db = getattr(conn, "cache_key", None)
+    if db is None or db.startswith(":memory:"):
+        raise ValueError("write-behind needs a file database opened with init_db()")
+    if is_normalized(conn):
+        raise ValueError("write-behind is not supported for normalized databases")
+    with _writers_lock:
+        writer = _writers.get(db)
+        if writer is None:
+            with writing(conn) as c:
+                c.execute("PRAGMA journal_mode=WAL")
+            writer = _writers[db] = WriteBehindWriter(db, interval=interval, batch_size=batch_size)
+            log(f"[OK] Write-behind enabled (interval={interval}s, batch={batch_size}).", "green")
+        return writer
+
+
+def disable_write_behind(conn: Conn):
+    """Flush and stop the write-behind writer for this database (saves become synchronous again)."""
+    if isinstance(conn, ShardedStore):
+        for shard in conn.shards:
+            disable_write_behind(shard)
+        return
+    with _writers_lock:
+        writer = _writers.pop(getattr(conn, "cache_key", None), None)
+    if writer is not None:
+        writer.close()
+
+
+def flush(conn: Optional[Conn] = None, timeout: Optional[float] = None) -> bool:
+    """
+    Wait until queued write-behind saves are committed, for one database or all of them.
+    A no-op when write-behind is not enabled.
+    """
+    writers = [_writer_for(c) for c in shards_of(conn)] if conn is not None else list(_writers.values())
+    return all(w.flush(timeout) for w in writers if w is not None)
+
+
+def _close_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(_close_writers)
+
+
+# ------------------------------------------------------------------
+# Public API
+# ------------------------------------------------------------------
+def save_memory(conn: Conn, user_id: str, memory: Dict[str, Any], expected_version: Optional[int] = None,
+                in_transaction: Optional[Callable[[sqlite3.Connection], None]] = None):
+    """
+    Store a learner's whole memory document (last writer wins).
+    expected_version: compare-and-swap against the version from load_memory_versioned()
+    (0 = the learner must not exist yet). Raises VersionConflict if another write got
+    there first; on success the stored version is expected_version + 1.
+    in_transaction: called with the write connection after the document is written and
+    before the commit, for rows that must land (or roll back) together with it.
+    """
+    conn = shard_for(conn, user_id)
+    stamp = _stamp()
+    writer = _writer_for(conn)
+    direct = expected_version is not None or in_transaction is not None
+    if writer is not None and direct and writer.pending(user_id) is not None:
+        writer.flush()
+    if writer is not None and not direct:
+        # encode now so later mutations of `memory` don't leak into the queued write (or,
+        # since the cache stores its own copy, into later loads)
+        writer.submit(user_id, encode_memory(memory), stamp)
+    elif is_normalized(conn):
+        with writing(conn) as c:
+            if expected_version is not None:
+                _claim_version(conn, c, "memory_profile", user_id, expected_version, stamp)
+            _write_normalized(c, user_id, memory, stamp)
+            if in_transaction is not None:
+                in_transaction(c)
+            _refresh_summaries(c, [user_id], normalized=True)
+            _commit_write(c, conn, user_id, memory, stamp)
+    else:
+        data = encode_memory(memory)
+        with writing(conn) as c:
+            if expected_version is None:
+                c.execute(_UPSERT_MEMORY_SQL, (user_id, data, stamp))
+            elif expected_version == 0:
+                cur = c.execute(
+                    "INSERT INTO memory(user_id, data, updated_at, version) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(user_id) DO NOTHING",
+                    (user_id, data, stamp)
+                )
+                _check_swapped(conn, c, cur, user_id, expected_version)
+            else:
+                cur = c.execute(
+                    "UPDATE memory SET data=?, updated_at=?, version=version+1 WHERE user_id=? AND version=?",
+                    (data, stamp, user_id, expected_version)
+                )
+                _check_swapped(conn, c, cur, user_id, expected_version)
+            if in_transaction is not None:
+                in_transaction(c)
+            _refresh_summaries(c, [user_id], normalized=False)
+            _commit_write(c, conn, user_id, memory, stamp)
+    if writer is not None and not direct:
+        memory_cache.put(_cache_key(conn, user_id), memory, stamp)
     log(f"[OK] Memory saved for {user_id}", "cyan")
 
 
-def load_memory(conn: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
-    cur = conn.execute("SELECT data FROM memory WHERE user_id=?", (user_id,))
-    row = cur.fetchone()
-    if not row:
+def load_memory(conn: Conn, user_id: str) -> Dict[str, Any]:
+    conn = shard_for(conn, user_id)
+    key = _cache_key(conn, user_id)
+    entry = memory_cache.get(key) if key else None
+    if entry is not None:
+        stale = memory_cache.needs_revalidation(entry)
+        if not stale or _read_stamp(conn, user_id) == entry[1]:
+            memory_cache.record_hit(entry, revalidated=stale)
+            log(f"[OK] Memory loaded for {user_id} (cached)", "cyan")
+            return _private_copy(entry[0]) if entry[0] is not None else {}
+        memory_cache.invalidate(key)
+
+    generation = memory_cache.generation()
+    writer = _writer_for(conn)
+    pending = writer.pending(user_id) if writer else None
+    if pending is not None:
+        mem, stamp = decode_memory(pending[0]), pending[1]
+    elif is_normalized(conn):
+        mem, stamp = _load_normalized(conn, user_id)
+    else:
+        with reading(conn) as c:
+            row = c.execute("SELECT data, updated_at FROM memory WHERE user_id=?", (user_id,)).fetchone()
+        mem, stamp = (decode_memory(row[0]), row[1]) if row else (None, None)
+
+    memory_cache.put(key, mem, stamp, generation)
+    if not mem:
         log(f"[OK] No memory found for {user_id}. Returning empty object.", "yellow")
         return {}
 
     log(f"[OK] Memory loaded for {user_id}", "cyan")
-    return json.loads(row[0])
+    return mem
 
 
-def delete_memory(conn: sqlite3.Connection, user_id: str):
-    conn.execute("DELETE FROM memory WHERE user_id=?", (user_id,))
-    conn.commit()
+def delete_memory(conn: Conn, user_id: str):
+    conn = shard_for(conn, user_id)
+    # queued saves must land first, or they would resurrect the row afterwards
+    flush(conn)
+    normalized = is_normalized(conn)
+    with writing(conn) as c:
+        c.execute("DELETE FROM memory WHERE user_id=?", (user_id,))
+        if normalized:
+            c.execute("DELETE FROM memory_profile WHERE user_id=?", (user_id,))
+            for key in HISTORY_KEYS:
+                c.execute(f"DELETE FROM {key} WHERE user_id=?", (user_id,))
+        c.execute("DELETE FROM mastery_history WHERE user_id=?", (user_id,))
+        c.execute("DELETE FROM learner_summary WHERE user_id=?", (user_id,))
+        c.commit()
+    memory_cache.put(_cache_key(conn, user_id), None, None)
     log(f"[OK] Memory deleted for {user_id}", "red")
+
+
+# ------------------------------------------------------------------
+# Optimistic concurrency
+# ------------------------------------------------------------------
+# Every write bumps the learner's `version`. Read-modify-write callers pass the version
+# they read as expected_version; the write is a compare-and-swap inside the write
+# transaction, so concurrent sessions never silently overwrite each other and no lock
+# is held while the caller computes its changes.
+class VersionConflict(Exception):
+    """The learner's memory changed since it was read (expected_version no longer matches)."""
+
+    def __init__(self, user_id: str, expected_version: int):
+        super().__init__(f"memory of {user_id} is no longer at version {expected_version}")
+        self.user_id = user_id
+        self.expected_version = expected_version
+
+
+_cas_lock = threading.Lock()
+_cas_metrics = {"cas_writes": 0, "conflicts": 0, "retries": 0, "gave_up": 0}
+
+
+def _count(metric: str):
+    with _cas_lock:
+        _cas_metrics[metric] += 1
+
+
+def concurrency_stats() -> Dict[str, Any]:
+    """Compare-and-swap outcomes since start: successful writes, conflicts, retries, give-ups."""
+    with _cas_lock:
+        m = dict(_cas_metrics)
+    attempts = m["cas_writes"] + m["conflicts"]
+    m["conflict_rate"] = m["conflicts"] / attempts if attempts else 0.0
+    return m
+
+
+def _check_swapped(conn: Conn, c: sqlite3.Connection, cur: sqlite3.Cursor, user_id: str, expected_version: int):
+    if cur.rowcount == 0:
+        c.rollback()
+        _count("conflicts")
+        memory_cache.invalidate(_cache_key(conn, user_id))
+        raise VersionConflict(user_id, expected_version)
+    _count("cas_writes")
+
+
+def _claim_version(conn: Conn, c: sqlite3.Connection, table: str, user_id: str, expected_version: int, stamp: str):
+    """First statement of a guarded write: take the row at expected_version or raise VersionConflict."""
+    if expected_version == 0:
+        cur = c.execute(
+            f"INSERT INTO {table}(user_id, data, updated_at, version) VALUES (?, '{{}}', ?, 0) "
+            "ON CONFLICT(user_id) DO NOTHING",
+            (user_id, stamp)
+        )
+    else:
+        cur = c.execute(
+            f"UPDATE {table} SET updated_at=? WHERE user_id=? AND version=?",
+            (stamp, user_id, expected_version)
+        )
+    _check_swapped(conn, c, cur, user_id, expected_version)
+
+
+def get_version(conn: Conn, user_id: str) -> int:
+    """Current version of a learner's memory (0 if the learner doesn't exist)."""
+    conn = shard_for(conn, user_id)
+    writer = _writer_for(conn)
+    if writer is not None and writer.pending(user_id) is not None:
+        writer.flush()
+    table = "memory_profile" if is_normalized(conn) else "memory"
+    with reading(conn) as c:
+        row = c.execute(f"SELECT version FROM {table} WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_memory_versioned(conn: Conn, user_id: str) -> Tuple[Dict[str, Any], int]:
+    """
+    (memory, version) read straight from the database, for a later
+    save_memory(..., expected_version=version). The dict is private to the caller
+    (never the shared cached one), so it can be mutated freely before saving.
+    """
+    conn = shard_for(conn, user_id)
+    if is_normalized(conn):
+        # version first: anything written after it also bumped it, so the CAS catches it
+        version = get_version(conn, user_id)
+        mem, _ = _load_normalized(conn, user_id)
+        return (mem if mem is not None else {}), version
+    writer = _writer_for(conn)
+    if writer is not None and writer.pending(user_id) is not None:
+        writer.flush()
+    with reading(conn) as c:
+        row = c.execute("SELECT data, version FROM memory WHERE user_id=?", (user_id,)).fetchone()
+    return (decode_memory(row[0]) if row else {}), (row[1] if row else 0)
+
+
+def retry_on_conflict(fn: Callable[[], Any], retries: int = CAS_RETRIES,
+                      backoff: float = CAS_BACKOFF_SECONDS) -> Any:
+    """
+    Call fn() until it completes without VersionConflict, at most retries + 1 times,
+    sleeping a jittered exponential backoff (capped at CAS_BACKOFF_MAX_SECONDS) in between.
+    fn must re-read what it depends on.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except VersionConflict as e:
+            if attempt == retries:
+                _count("gave_up")
+                log(f"[WARN] Gave up on {e.user_id} after {retries + 1} conflicting attempts", "red")
+                raise
+            _count("retries")
+            time.sleep(random.uniform(0, min(backoff * (2 ** attempt), CAS_BACKOFF_MAX_SECONDS)))
+
+
+def update_memory(conn: Conn, user_id: str, mutate: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                  retries: int = CAS_RETRIES) -> Dict[str, Any]:
+    """
+    Read-modify-write of a learner's whole memory without lost updates.
+    mutate(memory) changes the dict in place (or returns a replacement); on a conflicting
+    concurrent write it is re-applied to a fresh copy. Returns the memory that was saved.
+    """
+    def attempt():
+        memory, version = load_memory_versioned(conn, user_id)
+        result = mutate(memory)
+        memory = memory if result is None else result
+        save_memory(conn, user_id, memory, expected_version=version)
+        return memory
+
+    return retry_on_conflict(attempt, retries)
+
+
+# ------------------------------------------------------------------
+# Partial updates (SQLite JSON1)
+# ------------------------------------------------------------------
+# Paths are dotted keys with optional list indexes, e.g. "topic_mastery.linear_equations",
+# "last_quiz.answers" or "quizzes[-1].answers" (negative indexes count from the end,
+# "[#-1]" is accepted too). A leading "$." is optional.
+_PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[(#?-?\d+)\]")
+_MISSING = object()
+
+
+def _parse_path(path: str) -> List[Union[str, int]]:
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    segments: List[Union[str, int]] = []
+    pos = 0
+    while pos < len(path):
+        m = _PATH_TOKEN.match(path, pos)
+        if not m:
+            raise ValueError(f"invalid memory path: {path!r}")
+        if m.group(1) is not None:
+            segments.append(m.group(1))
+        else:
+            segments.append(int(m.group(2).lstrip("#")))
+        pos = m.end()
+    if not segments or not isinstance(segments[0], str):
+        raise ValueError(f"memory path must start with a key: {path!r}")
+    return segments
+
+
+def _json_path(segments) -> str:
+    parts = ["$"]
+    for seg in segments:
+        if isinstance(seg, int):
+            parts.append(f"[{seg}]" if seg >= 0 else f"[#{seg}]")
+        else:
+            parts.append('."' + seg.replace('"', '\\"') + '"')
+    return "".join(parts)
+
+
+def _json_update_expr(op: str, segments, value) -> Tuple[str, list]:
+    """
+    Build a JSON1 expression that applies `op` to the `data` column.
+    Missing parent objects (and the target list for appends) are created first,
+    because json_set/json_insert don't create intermediate containers.
+    """
+    expr, params = f"COALESCE({json_column()}, '{{}}')", []
+    last = len(segments) if op == "append" else len(segments) - 1
+    for i in range(1, last + 1):
+        nxt = segments[i] if i < len(segments) else None
+        if isinstance(segments[i - 1], int):
+            continue  # can't create list elements, only containers under keys
+        container = "{}" if isinstance(nxt, str) else "[]"
+        expr = f"json_insert({expr}, ?, json(?))"
+        params += [_json_path(segments[:i]), container]
+    encoded = json.dumps(value, ensure_ascii=False)
+    if op == "append":
+        expr = f"json_insert({expr}, ?, json(?))"
+        params += [_json_path(segments) + "[#]", encoded]
+    else:
+        expr = f"json_set({expr}, ?, json(?))"
+        params += [_json_path(segments), encoded]
+    return expr, params
+
+
+def _decode_json_value(json_type: Optional[str], value, default):
+    if json_type is None:
+        return default
+    if json_type in ("object", "array"):
+        return json.loads(value)
+    if json_type in ("true", "false"):
+        return json_type == "true"
+    return value
+
+
+def _history_seq_sql(table: str, index: int, user_id: str) -> Tuple[str, list]:
+    if index >= 0:
+        return "?", [index]
+    return f"(SELECT MAX(seq) + 1 + ? FROM {table} WHERE user_id=?)", [index, user_id]
+
+
+def _apply_normalized(c: sqlite3.Connection, user_id: str, op: str, segments, value, stamp: str):
+    c.execute(
+        "INSERT OR IGNORE INTO memory_profile(user_id, data, updated_at) VALUES (?, '{}', ?)",
+        (user_id, stamp)
+    )
+    head, rest = segments[0], segments[1:]
+    if head not in HISTORY_KEYS:
+        expr, params = _json_update_expr(op, segments, value)
+        c.execute(f"UPDATE memory_profile SET data={expr} WHERE user_id=?", params + [user_id])
+    elif not rest and op == "append":
+        c.execute(
+            f"""
+            INSERT INTO {head}(user_id, seq, data)
+            VALUES (?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM {head} WHERE user_id=?), ?)
+            """,
+            (user_id, user_id, json.dumps(value, ensure_ascii=False))
+        )
+        # an empty list kept in the profile row would now shadow the table
+        c.execute("UPDATE memory_profile SET data=json_remove(data, ?) WHERE user_id=?",
+                  (_json_path([head]), user_id))
+    elif not rest:
+        if not isinstance(value, list):
+            raise ValueError(f"{head} must be a list")
+        c.execute(f"DELETE FROM {head} WHERE user_id=?", (user_id,))
+        c.executemany(
+            f"INSERT INTO {head}(user_id, seq, data) VALUES (?, ?, ?)",
+            [(user_id, seq, json.dumps(v, ensure_ascii=False)) for seq, v in enumerate(value)]
+        )
+        c.execute("UPDATE memory_profile SET data=json_remove(data, ?) WHERE user_id=?",
+                  (_json_path([head]), user_id))
+    elif isinstance(rest[0], int):
+        seq_sql, seq_params = _history_seq_sql(head, rest[0], user_id)
+        if len(rest) == 1 and op == "set":
+            expr, params = "json(?)", [json.dumps(value, ensure_ascii=False)]
+        elif len(rest) == 1:
+            expr, params = "json_insert(data, '$[#]', json(?))", [json.dumps(value, ensure_ascii=False)]
+        else:
+            expr, params = _json_update_expr(op, rest[1:], value)
+        c.execute(
+            f"UPDATE {head} SET data={expr} WHERE user_id=? AND seq={seq_sql}",
+            params + [user_id] + seq_params
+        )
+    else:
+        raise ValueError(f"history paths must index an entry, e.g. '{head}[-1].answers'")
+    c.execute("UPDATE memory_profile SET updated_at=? WHERE user_id=?", (stamp, user_id))
+
+
+def apply_updates(conn: Conn, user_id: str, ops: List[Tuple[str, str, Any]],
+                  expected_version: Optional[int] = None):
+    """
+    Apply several partial updates in one transaction, without loading the document.
+    ops: list of ("set", path, value) or ("append", path, item) tuples.
+    Creates the learner's row if it doesn't exist yet.
+    expected_version: only apply if the learner is still at this version (see get_version);
+    raises VersionConflict otherwise. Use it when the values were computed from earlier reads.
+    """
+    conn = shard_for(conn, user_id)
+    parsed = []
+    for op, path, value in ops:
+        if op not in ("set", "append"):
+            raise ValueError(f"unknown update op: {op!r}")
+        parsed.append((op, _parse_path(path), value))
+
+    writer = _writer_for(conn)
+    if writer is not None and writer.pending(user_id) is not None:
+        # a queued full-document save would otherwise overwrite these updates
+        writer.flush()
+
+    stamp = _stamp()
+    normalized = is_normalized(conn)
+    table = "memory_profile" if normalized else "memory"
+    with writing(conn) as c:
+        if expected_version is not None:
+            _claim_version(conn, c, table, user_id, expected_version, stamp)
+        if normalized:
+            for op, segments, value in parsed:
+                _apply_normalized(c, user_id, op, segments, value, stamp)
+        else:
+            c.execute(
+                "INSERT OR IGNORE INTO memory(user_id, data, updated_at) VALUES (?, '{}', ?)",
+                (user_id, stamp)
+            )
+            for op, segments, value in parsed:
+                expr, params = _json_update_expr(op, segments, value)
+                c.execute(f"UPDATE memory SET data=memory_encode({expr}) WHERE user_id=?", params + [user_id])
+        c.execute(f"UPDATE {table} SET updated_at=?, version=version+1 WHERE user_id=?", (stamp, user_id))
+        # every mastery update also lands in the time series, in the same transaction
+        points = _mastery_points(parsed)
+        if points:
+            ts = datetime.utcnow().isoformat() + "Z"
+            c.executemany(
+                "INSERT INTO mastery_history(user_id, topic, ts, mastery) VALUES (?, ?, ?, ?)",
+                [(user_id, topic, ts, mastery) for topic, mastery in points]
+            )
+        _refresh_summaries(c, [user_id], normalized)
+        _commit_write(c, conn, user_id)
+    log(f"[OK] Memory updated for {user_id} ({len(parsed)} change(s))", "cyan")
+
+
+def append_to(conn: Conn, user_id: str, path: str, item: Any):
+    """Append `item` to the list at `path` (created if missing), e.g. append_to(conn, uid, "quizzes", q)."""
+    apply_updates(conn, user_id, [("append", path, item)])
+
+
+def set_path(conn: Conn, user_id: str, path: str, value: Any):
+    """Set the value at `path`, e.g. set_path(conn, uid, "topic_mastery.linear_equations", 80)."""
+    apply_updates(conn, user_id, [("set", path, value)])
+
+
+def _lookup(memory: Dict[str, Any], segments):
+    node = memory
+    for i, seg in enumerate(segments):
+        if i == 0 and isinstance(memory, LazyMemory) and dict.get(memory, seg) is _PENDING:
+            return _MISSING  # answer it from the table instead of reading the whole list
+        try:
+            node = node[seg]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return node
+
+
+def get_path(conn: Conn, user_id: str, path: str, default: Any = None) -> Any:
+    """
+    Read one value from a learner's memory, e.g. get_path(conn, uid, "last_quiz.answers").
+    Served from the memory cache when possible, otherwise extracted inside SQLite.
+    """
+    conn = shard_for(conn, user_id)
+    segments = _parse_path(path)
+
+    key = _cache_key(conn, user_id)
+    entry = memory_cache.get(key) if key else None
+    if entry is not None and not memory_cache.needs_revalidation(entry):
+        found = _lookup(entry[0] or {}, segments)
+        if found is not _MISSING:
+            memory_cache.record_hit(entry)
+            return default if found is None else _copy_value(found) if isinstance(found, (dict, list)) else found
+
+    writer = _writer_for(conn)
+    pending = writer.pending(user_id) if writer else None
+    if pending is not None:
+        found = _lookup(decode_memory(pending[0]), segments)
+        return default if found is None else found
+    return _read_path(conn, user_id, segments, default)
+
+
+def get_paths_versioned(conn: Conn, user_id: str, paths: List[str],
+                        default: Any = None) -> Tuple[List[Any], int]:
+    """
+    ([value at each path], version) read from the database, never from the cache, for a
+    later apply_updates(..., expected_version=version). The version is read first: a write
+    landing between the reads bumps it, so the guarded write conflicts instead of
+    committing values computed from a mix of old and new data.
+    """
+    conn = shard_for(conn, user_id)
+    version = get_version(conn, user_id)  # also lands a queued write-behind save
+    return [_read_path(conn, user_id, _parse_path(path), default) for path in paths], version
+
+
+def _read_path(conn: Conn, user_id: str, segments, default: Any) -> Any:
+    """get_path's database read: the value is extracted inside SQLite."""
+    head, rest = segments[0], segments[1:]
+    normalized = is_normalized(conn)
+    with reading(conn) as c:
+        if not normalized:
+            row = c.execute(
+                f"SELECT json_type({json_column()}, :p), json_extract({json_column()}, :p) FROM memory WHERE user_id=:u",
+                {"p": _json_path(segments), "u": user_id}
+            ).fetchone()
+        elif head not in HISTORY_KEYS:
+            row = c.execute(
+                "SELECT json_type(data, :p), json_extract(data, :p) FROM memory_profile WHERE user_id=:u",
+                {"p": _json_path(segments), "u": user_id}
+            ).fetchone()
+        elif not rest:
+            rows = c.execute(f"SELECT data FROM {head} WHERE user_id=? ORDER BY seq", (user_id,)).fetchall()
+            if rows:
+                return [json.loads(r[0]) for r in rows]
+            row = c.execute(
+                "SELECT json_type(data, :p), json_extract(data, :p) FROM memory_profile WHERE user_id=:u",
+                {"p": _json_path(segments), "u": user_id}
+            ).fetchone()
+        elif isinstance(rest[0], int):
+            seq_sql, seq_params = _history_seq_sql(head, rest[0], user_id)
+            sub = _json_path(rest[1:])
+            row = c.execute(
+                f"SELECT json_type(data, ?), json_extract(data, ?) FROM {head} WHERE user_id=? AND seq={seq_sql}",
+                [sub, sub, user_id] + seq_params
+            ).fetchone()
+        else:
+            row = None
+    if not row:
+        return default
+    return _decode_json_value(row[0], row[1], default)
+
+
+# ------------------------------------------------------------------
+# Mastery time series
+# ------------------------------------------------------------------
+# Downsampling buckets: SQL expression giving the bucket start for a `ts` value
+_MASTERY_BUCKETS = {
+    "hour": "substr(ts, 1, 13) || ':00:00Z'",
+    "day": "date(ts)",
+    "week": "date(ts, 'weekday 0', '-6 days')",
+}
+# bucket="auto" switches to daily points once a series spans more than this many days
+AUTO_BUCKET_DAYS = 3
+
+
+def _mastery_points(parsed) -> List[Tuple[str, int]]:
+    """(topic, mastery) pairs set by a batch of partial updates."""
+    points = []
+    for op, segments, value in parsed:
+        if op != "set" or segments[0] != "topic_mastery":
+            continue
+        if len(segments) == 2 and isinstance(segments[1], str) and isinstance(value, (int, float)):
+            points.append((segments[1], value))
+        elif len(segments) == 1 and isinstance(value, dict):
+            points += [(t, v) for t, v in value.items() if isinstance(v, (int, float))]
+    return points
+
+
+def record_mastery(conn: Conn, user_id: str, topic: str, mastery: int, ts: Optional[str] = None):
+    """Add one point to the mastery time series (set_path on topic_mastery does this automatically)."""
+    conn = shard_for(conn, user_id)
+    with writing(conn) as c:
+        c.execute(
+            "INSERT INTO mastery_history(user_id, topic, ts, mastery) VALUES (?, ?, ?, ?)",
+            (user_id, topic, ts or datetime.utcnow().isoformat() + "Z", mastery)
+        )
+        c.commit()
+
+
+def mastery_series(conn: Conn, user_id: str, topic: str = "linear_equations",
+                   since: Optional[str] = None, until: Optional[str] = None,
+                   bucket: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Mastery points for one learner and topic, oldest first, as [{"timestamp", "mastery", "samples"}].
+    since/until: ISO timestamps bounding the range (index range scan).
+    bucket: None for raw points, "hour"/"day"/"week" to average per bucket, or "auto"
+            to use daily buckets once the range spans more than AUTO_BUCKET_DAYS days.
+    """
+    conn = shard_for(conn, user_id)
+    where = "user_id=? AND topic=?"
+    params: List[Any] = [user_id, topic]
+    if since:
+        where += " AND ts>=?"
+        params.append(since)
+    if until:
+        where += " AND ts<=?"
+        params.append(until)
+
+    with reading(conn) as c:
+        if bucket == "auto":
+            lo, hi = c.execute(f"SELECT MIN(ts), MAX(ts) FROM mastery_history WHERE {where}", params).fetchone()
+            span = c.execute("SELECT julianday(?) - julianday(?)", (hi, lo)).fetchone()[0] if lo else 0
+            bucket = "day" if span and span > AUTO_BUCKET_DAYS else None
+        if bucket is None:
+            rows = c.execute(
+                f"SELECT ts, mastery, 1 FROM mastery_history WHERE {where} ORDER BY ts", params
+            ).fetchall()
+        elif bucket in _MASTERY_BUCKETS:
+            expr = _MASTERY_BUCKETS[bucket]
+            rows = c.execute(
+                f"""
+                SELECT {expr} AS b, ROUND(AVG(mastery), 1), COUNT(*)
+                FROM mastery_history WHERE {where}
+                GROUP BY b ORDER BY b
+                """,
+                params
+            ).fetchall()
+        else:
+            raise ValueError(f"unknown bucket: {bucket!r}")
+    return [{"timestamp": ts, "mastery": m, "samples": n} for ts, m, n in rows]
+
+
+# ------------------------------------------------------------------
+# Learner summaries (cohort analytics)
+# ------------------------------------------------------------------
+# One narrow, indexed row per learner, rewritten in the same transaction as every
+# write so class-level queries (eval/cohort.py) never have to decode memory blobs.
+SUMMARY_TOPIC = "linear_equations"
+# learners refreshed per statement (stays well under SQLite's bound-parameter limit)
+SUMMARY_CHUNK = 500
+
+
+def _create_summary_table(conn: sqlite3.Connection) -> bool:
+    """Create learner_summary if missing. Returns True if it was just created."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='learner_summary'"
+    ).fetchone()
+    if exists:
+        return False
+    conn.execute("""
+    CREATE TABLE learner_summary (
+        user_id TEXT PRIMARY KEY,
+        mastery INTEGER,
+        pre_score INTEGER,
+        post_score INTEGER,
+        delta INTEGER,
+        diagnostics INTEGER NOT NULL DEFAULT 0,
+        quizzes INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX idx_learner_summary_mastery ON learner_summary(mastery)")
+    conn.execute("CREATE INDEX idx_learner_summary_delta ON learner_summary(delta)")
+    return True
+
+
+def _summary_select(normalized: bool, where: str) -> str:
+    """SELECT producing learner_summary rows straight from the stored JSON."""
+    doc = "p.data" if normalized else json_column("p.data")
+    archived = "COALESCE(json_extract(" + doc + ", '$.history_summary.{key}.archived'), 0)"
+    if normalized:
+        pre = ("(SELECT json_extract(d.data, '$.score_percent') FROM diagnostics d "
+               "WHERE d.user_id=p.user_id ORDER BY d.seq DESC LIMIT 1)")
+        counts = [
+            f"(SELECT COUNT(*) FROM {key} h WHERE h.user_id=p.user_id) + " + archived.format(key=key)
+            for key in ("diagnostics", "quizzes")
+        ]
+        source = "memory_profile p"
+    else:
+        pre = f"json_extract({doc}, '$.diagnostics[#-1].score_percent')"
+        counts = [
+            f"COALESCE(json_array_length({doc}, '$.{key}'), 0) + " + archived.format(key=key)
+            for key in ("diagnostics", "quizzes")
+        ]
+        source = "memory p"
+    return f"""
+        SELECT user_id, mastery, pre_score, post_score, post_score - pre_score, diagnostics, quizzes, updated_at
+        FROM (
+            SELECT p.user_id AS user_id,
+                   json_extract({doc}, '$.topic_mastery.{SUMMARY_TOPIC}') AS mastery,
+                   {pre} AS pre_score,
+                   json_extract({doc}, '$.last_quiz.answers.score_percent') AS post_score,
+                   {counts[0]} AS diagnostics,
+                   {counts[1]} AS quizzes,
+                   p.updated_at AS updated_at
+            FROM {source} WHERE {where}
+        )
+    """
+
+
+def _refresh_summaries(c: sqlite3.Connection, user_ids: Optional[List[str]], normalized: bool):
+    """Recompute learner_summary rows for user_ids (None: every learner) inside the caller's transaction."""
+    if user_ids is None:
+        c.execute("DELETE FROM learner_summary")
+        c.execute(f"INSERT INTO learner_summary {_summary_select(normalized, '1')}")
+        return
+    for i in range(0, len(user_ids), SUMMARY_CHUNK):
+        chunk = user_ids[i:i + SUMMARY_CHUNK]
+        marks = ", ".join("?" * len(chunk))
+        c.execute(
+            f"INSERT OR REPLACE INTO learner_summary {_summary_select(normalized, f'p.user_id IN ({marks})')}",
+            chunk
+        )
+
+
+def rebuild_summaries(conn: Conn) -> int:
+    """Recompute every learner_summary row (backfill for databases written before it existed)."""
+    if isinstance(conn, ShardedStore):
+        return sum(rebuild_summaries(shard) for shard in conn.shards)
+    flush(conn)
+    normalized = is_normalized(conn)
+    with writing(conn) as c:
+        _create_summary_table(c)
+        _refresh_summaries(c, None, normalized)
+        c.commit()
+        count = c.execute("SELECT COUNT(*) FROM learner_summary").fetchone()[0]
+    log(f"[OK] Rebuilt {count} learner summaries.", "green")
+    return count
+
+
+def iter_history(conn: Conn, key: str, batch_size: int = 1000) -> Iterator[Tuple[str, Any]]:
+    """
+    (user_id, entry) for every entry of one history list (e.g. "quizzes") of every learner,
+    shard by shard. Entries are expanded with json_each, so whole memories are never decoded
+    in Python. Entries moved to the archive by compaction are not included
+    (tools.compaction.iter_full_history adds them).
+    """
+    if key not in HISTORY_KEYS:
+        raise ValueError(f"unknown history key: {key!r} (expected one of {HISTORY_KEYS})")
+    flush(conn)
+    for shard in shards_of(conn):
+        if is_normalized(shard):
+            sql = f"SELECT user_id, data FROM {key} ORDER BY user_id, seq"
+        else:
+            sql = f"SELECT m.user_id, j.value FROM memory m, json_each({json_column('m.data')}, '$.{key}') j"
+        with reading(shard) as c:
+            cur = c.execute(sql)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for user_id, data in rows:
+                    yield user_id, json.loads(data)
+
+
+# ------------------------------------------------------------------
+# Asyncio API
+# ------------------------------------------------------------------
+# Blocking sqlite3 calls run on a dedicated I/O thread pool so they never stall the
+# event loop. Use a ConnectionPool as `conn` when many coroutines share a database.
+IO_WORKERS = 8
+_io_executor: Optional[ThreadPoolExecutor] = None
+_io_executor_lock = threading.Lock()
+
+
+def io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        with _io_executor_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="memory-io")
+    return _io_executor
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """Run a blocking (I/O-bound) call on the memory I/O executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def load_memory_async(conn: Conn, user_id: str) -> Dict[str, Any]:
+    return await run_io(load_memory, conn, user_id)
+
+
+async def save_memory_async(conn: Conn, user_id: str, memory: Dict[str, Any],
+                            expected_version: Optional[int] = None):
+    return await run_io(save_memory, conn, user_id, memory, expected_version)
+
+
+async def delete_memory_async(conn: Conn, user_id: str):
+    return await run_io(delete_memory, conn, user_id)
+
+
+async def apply_updates_async(conn: Conn, user_id: str, ops: List[Tuple[str, str, Any]],
+                              expected_version: Optional[int] = None):
+    return await run_io(apply_updates, conn, user_id, ops, expected_version)
+
+
+async def update_memory_async(conn: Conn, user_id: str,
+                              mutate: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+                              retries: int = CAS_RETRIES) -> Dict[str, Any]:
+    return await run_io(update_memory, conn, user_id, mutate, retries)
+
+
+async def get_path_async(conn: Conn, user_id: str, path: str, default: Any = None) -> Any:
+    return await run_io(get_path, conn, user_id, path, default)
+
+
+# ------------------------------------------------------------------
+# Bulk NDJSON export / import
+# ------------------------------------------------------------------
+# One learner per line: {"user_id": ..., "updated_at": ..., "data": {...memory...}}
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 5000
+PROGRESS_EVERY = 10000
+
+ProgressFn = Callable[[int, float], None]
+
+
+def _open_stream(target, mode: str) -> Tuple[IO[str], bool]:
+    """Open a path (gzip if it ends with .gz) or pass an open text stream through."""
+    if not isinstance(target, (str, os.PathLike)):
+        return target, False
+    if str(target).endswith(".gz"):
+        return gzip.open(target, mode + "t", encoding="utf-8"), True
+    return open(target, mode, encoding="utf-8", newline="\n"), True
+
+
+def _log_progress(done: int, elapsed: float):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    log(f"[OK] {done} records ({rate:.0f}/s)", "cyan")
+
+
+def _export_rows(conn: Conn, normalized: bool, offset: int, batch_size: int) -> Iterator[Tuple[str, str, str]]:
+    """
+    (user_id, JSON text, updated_at) for every learner in one database, ordered by user_id.
+    Only binary-codec blobs and normalized learners are decoded; JSON text rows pass through.
+    """
+    table = "memory_profile" if normalized else "memory"
+    with reading(conn) as c:
+        cur = c.execute(
+            f"SELECT user_id, data, updated_at FROM {table} ORDER BY user_id LIMIT -1 OFFSET ?",
+            (offset,)
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for user_id, data, updated_at in rows:
+                if normalized:
+                    mem, _ = _load_normalized(conn, user_id)
+                    data = json.dumps(mem.copy() if mem else {}, ensure_ascii=False)
+                elif isinstance(data, bytes):
+                    data = json.dumps(decode_memory(data), ensure_ascii=False)
+                yield user_id, data, updated_at
+
+
+def export_ndjson(conn: Conn, out, offset: int = 0, batch_size: int = EXPORT_BATCH_SIZE,
+                  progress: Optional[ProgressFn] = _log_progress, progress_every: int = PROGRESS_EVERY) -> Dict[str, Any]:
+    """
+    Stream every learner's memory to `out` (path or text stream) as NDJSON, ordered by user_id.
+    Rows are fetched batch_size at a time from one cursor and converted one at a time, so
+    memory use stays flat however many learners there are. "data" is always the memory as
+    JSON: text (JSON codec) rows are copied through without being parsed, binary rows
+    (marshal or zlib codecs, see encode_memory) are decoded and re-serialized as JSON, and
+    normalized learners are assembled from their profile and history tables.
+    offset: skip the first N learners (resume an interrupted export by appending to the file).
+    A ShardedStore is exported as one stream, merged across shards in user_id order.
+    """
+    flush(conn)
+    normalized = is_normalized(conn)
+    shards = shards_of(conn)
+    stream, owned = _open_stream(out, "a" if offset else "w")
+    start = time.perf_counter()
+    done = 0
+    try:
+        if len(shards) == 1:
+            rows = _export_rows(conn, normalized, offset, batch_size)
+        else:
+            merged = heapq.merge(*(_export_rows(s, normalized, 0, batch_size) for s in shards),
+                                 key=lambda row: row[0])
+            rows = itertools.islice(merged, offset, None)
+        for user_id, data, updated_at in rows:
+            stream.write('{"user_id": %s, "updated_at": %s, "data": %s}\n' % (
+                json.dumps(user_id, ensure_ascii=False), json.dumps(updated_at), data or "{}"))
+            done += 1
+            if progress and done % progress_every == 0:
+                progress(offset + done, time.perf_counter() - start)
+    finally:
+        if owned:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    stats = {"records": done, "offset": offset, "next_offset": offset + done, "seconds": elapsed,
+             "records_per_sec": done / elapsed if elapsed > 0 else 0.0}
+    log(f"[OK] Exported {done} learners in {elapsed:.2f}s.", "green")
+    return stats
+
+
+def import_ndjson(conn: Conn, src, offset: int = 0, batch_size: int = IMPORT_BATCH_SIZE,
+                  progress: Optional[ProgressFn] = _log_progress) -> Dict[str, Any]:
+    """
+    Load an NDJSON export into the database, upserting batch_size learners per transaction.
+    offset: skip the first N lines. Progress is reported after each committed batch, so the
+    last reported count is a safe offset to resume from after an interruption.
+    With a ShardedStore each batch is split by shard (one transaction per shard).
+    """
+    flush(conn)
+    normalized = is_normalized(conn)
+    stream, owned = _open_stream(src, "r")
+    start = time.perf_counter()
+    done = 0
+    batch: List[Tuple[str, Dict[str, Any], str]] = []
+
+    def commit_batch():
+        nonlocal done
+        if not batch:
+            return
+        by_shard: Dict[int, List[Tuple[str, Dict[str, Any], str]]] = {}
+        for record in batch:
+            by_shard.setdefault(id(shard_for(conn, record[0])), []).append(record)
+        for shard in shards_of(conn):
+            rows = by_shard.get(id(shard))
+            if not rows:
+                continue
+            with writing(shard) as c:
+                if normalized:
+                    for user_id, mem, stamp in rows:
+                        _write_normalized(c, user_id, mem, stamp)
+                else:
+                    c.executemany(_UPSERT_MEMORY_SQL, [
+                        (user_id, encode_memory(mem), stamp) for user_id, mem, stamp in rows
+                    ])
+                _refresh_summaries(c, [user_id for user_id, _, _ in rows], normalized)
+                c.commit()
+        done += len(batch)
+        batch.clear()
+        if progress:
+            progress(offset + done, time.perf_counter() - start)
+
+    try:
+        for lineno, line in enumerate(stream):
+            if lineno < offset or not line.strip():
+                continue
+            record = json.loads(line)
+            batch.append((record["user_id"], record.get("data") or {}, record.get("updated_at") or _stamp()))
+            if len(batch) >= batch_size:
+                commit_batch()
+        commit_batch()
+    finally:
+        if owned:
+            stream.close()
+        memory_cache.clear()
+    elapsed = time.perf_counter() - start
+    stats = {"records": done, "offset": offset, "next_offset": offset + done, "seconds": elapsed,
+             "records_per_sec": done / elapsed if elapsed > 0 else 0.0}
+    log(f"[OK] Imported {done} learners in {elapsed:.2f}s.", "green")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    CLI (run from the src folder):
+      python -m tools.persistence export backup.ndjson.gz [--db PATH] [--offset N]
+      python -m tools.persistence import backup.ndjson.gz [--db PATH] [--offset N] [--batch-size N]
+      python -m tools.persistence migrate [--db PATH]      # switch to normalized tables
+    --storage SPEC (e.g. "sharded:data?shards=8", see tools/storage.py) replaces --db.
+    """
+    parser = argparse.ArgumentParser(prog="python -m tools.persistence", description="Memory database tools")
+    parser.add_argument("command", choices=["export", "import", "migrate"])
+    parser.add_argument("file", nargs="?", help="NDJSON file (.gz for gzip)")
+    parser.add_argument("--db", default=DB_PATH, help="database path (default: %(default)s)")
+    parser.add_argument("--storage", help="storage backend spec, overrides --db")
+    parser.add_argument("--offset", type=int, default=0, help="skip the first N records (resume)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command != "migrate" and not args.file:
+        parser.error(f"{args.command} needs a file")
+    if args.storage:
+        from tools.storage import open_storage
+        conn = open_storage(args.storage)
+    else:
+        conn = init_db(args.db)
+    if args.command == "migrate":
+        migrate_to_normalized(conn)
+        return
+    if args.command == "export":
+        stats = export_ndjson(conn, args.file, offset=args.offset,
+                              batch_size=args.batch_size or EXPORT_BATCH_SIZE)
+    else:
+        stats = import_ndjson(conn, args.file, offset=args.offset,
+                              batch_size=args.batch_size or IMPORT_BATCH_SIZE)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    # Run the CLI from the importable module, so backends opened through
+    # tools.storage are instances of the same classes it checks against.
+    from tools.persistence import main as _main
+    _main()
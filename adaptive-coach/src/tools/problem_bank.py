@@ -0,0 +1,354 @@
+# src/tools/problem_bank.py
+"""
+Precomputed bank of linear practice problems  a*x + b = c  for LessonAgent and QuizAgent.
+
+Every (a, b, x_sol) combination over the configured ranges is enumerated once, with its
+equation string, exact solution and worked steps, into an SQLite table. Rows are tagged
+with difficulty features:
+
+  negative_constant     b < 0                        "3*x + (-4) = 8"
+  non_unit_coefficient  a != 1                       "3*x + 2 = 11"
+  fractional_solution   x_sol is not an integer      "2*x + 1 = 8"  (x = 3.5)
+  negative_solution     x_sol < 0                    "2*x + 3 = -1"
+
+Rows are written grouped by feature combination, so each combination (a "stratum") is a
+contiguous rowid range recorded in the `strata` table. Sampling a problem that matches
+some features is then a weighted pick among the (at most 16) matching strata plus one
+rowid lookup, with no enumeration or symbolic work per call.
+
+The bank file (COACH_PROBLEM_BANK, default problem_bank.db in persistence.DATA_DIR;
+"" keeps it in memory) is built on first use and rebuilt when the ranges change.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+from bisect import bisect_right
+from fractions import Fraction
+from itertools import accumulate
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from tools.persistence import data_path
+
+FEATURES = ("negative_constant", "non_unit_coefficient", "fractional_solution", "negative_solution")
+
+BANK_PATH = os.environ.get("COACH_PROBLEM_BANK", data_path("problem_bank.db"))
+# Default ranges: coefficients a, constants b, |x_sol| <= MAX_SOLUTION, and the denominators
+# allowed for fractional solutions (ones with a short exact decimal, so "3.5" grades correctly)
+BANK_COEFFICIENTS = tuple(range(1, 10))
+BANK_CONSTANTS = tuple(range(-12, 13))
+BANK_MAX_SOLUTION = 10
+BANK_DENOMINATORS = (2, 4, 5)
+# bump when the row layout or step wording changes, so existing bank files are rebuilt
+BANK_FORMAT = 1
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE problems (
+    id INTEGER PRIMARY KEY,
+    a INTEGER NOT NULL, b INTEGER NOT NULL, c INTEGER NOT NULL,
+    solution REAL NOT NULL,
+    equation TEXT NOT NULL,
+    steps TEXT NOT NULL,
+    features INTEGER NOT NULL
+);
+CREATE INDEX problems_by_features ON problems(features);
+CREATE UNIQUE INDEX problems_by_equation ON problems(a, b, c);
+CREATE TABLE strata (features INTEGER PRIMARY KEY, first_id INTEGER NOT NULL, count INTEGER NOT NULL);
+"""
+
+
+def feature_mask(a: int, b: int, solution: Fraction) -> int:
+    """Bitmask of FEATURES for a*x + b = c with the given exact solution."""
+    flags = (b < 0, a != 1, solution.denominator != 1, solution < 0)
+    return sum(1 << i for i, flag in enumerate(flags) if flag)
+
+
+def feature_names(mask: int) -> List[str]:
+    return [name for i, name in enumerate(FEATURES) if mask >> i & 1]
+
+
+def format_equation(a: int, b: int, c: int) -> str:
+    """Canonical text of a*x + b = c: "3*x + 2 = 11", "3*x + (-4) = 8"."""
+    left = f"{a}*x + ({b})" if b < 0 else f"{a}*x + {b}"
+    return f"{left} = {c}"
+
+
+def make_problem(a: int, b: int, c: int) -> Dict[str, Any]:
+    """
+    Worked problem for a*x + b = c (integers, a != 0):
+      {"equation_str": "2*x + 3 = 11", "coefficients": [2, 3, 11], "solution": 4.0,
+       "steps": ["Start: 2*x + 3 = 11", "Subtract 3 from both sides: 2*x = 8", "Divide both sides by 2: x = 4.0"],
+       "features": ["non_unit_coefficient"]}
+    """
+    if a == 0:
+        raise ValueError("coefficient a must be non-zero")
+    equation = format_equation(a, b, c)
+    solution = Fraction(c - b, a)
+
+    steps = [f"Start: {equation}"]
+    # isolate ax term
+    if b != 0:
+        steps.append(f"Subtract {b} from both sides: {a}*x = {c - b}")
+    else:
+        steps.append(f"No subtraction needed: {a}*x = {c}")
+    # divide by a
+    if a != 1:
+        steps.append(f"Divide both sides by {a}: x = {(c - b)/a}")
+    else:
+        steps.append(f"x = {c - b}")
+    return {
+        "equation_str": equation,
+        "coefficients": [a, b, c],
+        "solution": float(solution),
+        "steps": steps,
+        "features": feature_names(feature_mask(a, b, solution)),
+    }
+
+
+def enumerate_problems(coefficients: Iterable[int] = BANK_COEFFICIENTS,
+                       constants: Iterable[int] = BANK_CONSTANTS,
+                       max_solution: int = BANK_MAX_SOLUTION,
+                       denominators: Iterable[int] = BANK_DENOMINATORS) -> Iterator[Tuple[int, int, int]]:
+    """Every (a, b, c) with a non-zero solution x = (c - b) / a, |x| <= max_solution, and an allowed denominator."""
+    allowed = {1, *denominators}
+    constants = list(constants)
+    for a in coefficients:
+        if a == 0:
+            continue
+        bound = max_solution * abs(a)
+        for b in constants:
+            for n in range(-bound, bound + 1):
+                if n != 0 and Fraction(n, a).denominator in allowed:
+                    yield a, b, b + n
+
+
+class ProblemBank:
+    """
+    Read side of a built bank: sample(**features) / sample_many(k, **features) / count(**features).
+    Feature arguments are True (must have), False (must not have) or omitted (either).
+    """
+
+    def __init__(self, path: str = BANK_PATH, coefficients: Sequence[int] = BANK_COEFFICIENTS,
+                 constants: Sequence[int] = BANK_CONSTANTS, max_solution: int = BANK_MAX_SOLUTION,
+                 denominators: Sequence[int] = BANK_DENOMINATORS):
+        self.path = path or ":memory:"
+        self.config = {
+            "format": BANK_FORMAT,
+            "coefficients": list(coefficients),
+            "constants": list(constants),
+            "max_solution": max_solution,
+            "denominators": list(denominators),
+        }
+        self._lock = threading.Lock()
+        # one connection per process (see code_executor.SolveCache)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+        # {mask: (first_id, count)} and {filter: (masks, cumulative counts)}
+        self._strata: Dict[int, Tuple[int, int]] = {}
+        self._selections: Dict[Tuple[int, int], Tuple[List[int], List[int]]] = {}
+        self.samples = 0
+
+    # ---------------- building ----------------
+    def _fill(self, db: sqlite3.Connection):
+        db.executescript(_SCHEMA)
+        cfg = self.config
+        rows = sorted(
+            (feature_mask(a, b, Fraction(c - b, a)), a, b, c)
+            for a, b, c in enumerate_problems(cfg["coefficients"], cfg["constants"],
+                                              cfg["max_solution"], cfg["denominators"])
+        )
+        strata: Dict[int, List[int]] = {}
+        batch = []
+        for rowid, (mask, a, b, c) in enumerate(rows, start=1):
+            problem = make_problem(a, b, c)
+            batch.append((rowid, a, b, c, problem["solution"], problem["equation_str"],
+                          json.dumps(problem["steps"]), mask))
+            first_count = strata.setdefault(mask, [rowid, 0])
+            first_count[1] += 1
+        db.executemany("INSERT INTO problems VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        db.executemany("INSERT INTO strata VALUES (?, ?, ?)", [(m, fc[0], fc[1]) for m, fc in strata.items()])
+        db.execute("INSERT INTO meta VALUES ('config', ?)", (json.dumps(cfg, sort_keys=True),))
+        db.commit()
+
+    def _is_current(self, db: sqlite3.Connection) -> bool:
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key='config'").fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == json.dumps(self.config, sort_keys=True)
+
+    def build(self, force: bool = False):
+        """Create (or re-create, when the ranges changed or force=True) the bank file."""
+        with self._lock:
+            self._close()
+            self._build_file(force)
+
+    def _build_file(self, force: bool = False):
+        if self.path == ":memory:":
+            return
+        if not force and os.path.exists(self.path):
+            existing = sqlite3.connect(self.path)
+            try:
+                if self._is_current(existing):
+                    return
+            finally:
+                existing.close()
+        # build next to the target and swap it in, so concurrent readers never see a partial bank
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        db = sqlite3.connect(tmp)
+        try:
+            self._fill(db)
+        finally:
+            db.close()
+        os.replace(tmp, self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None or self._db_pid != os.getpid():
+            if self.path == ":memory:":
+                db = sqlite3.connect(":memory:", check_same_thread=False)
+                self._fill(db)
+            else:
+                self._build_file()
+                db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+                # the bank is read-only: map it instead of copying pages through the cache
+                db.execute(f"PRAGMA mmap_size={max(os.path.getsize(self.path), 1 << 20)}")
+            self._strata = {m: (first, count) for m, first, count in db.execute("SELECT * FROM strata")}
+            self._selections.clear()
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _close(self):
+        if self._db is not None and self._db_pid == os.getpid():
+            self._db.close()
+        self._db = self._db_pid = None
+
+    # ---------------- sampling ----------------
+    @staticmethod
+    def _filter(features: Dict[str, Optional[bool]]) -> Tuple[int, int]:
+        """(care, want) bitmasks: a stratum matches when mask & care == want."""
+        care = want = 0
+        for name, value in features.items():
+            if name not in FEATURES:
+                raise ValueError(f"unknown problem feature {name!r}; expected one of {FEATURES}")
+            if value is None:
+                continue
+            bit = 1 << FEATURES.index(name)
+            care |= bit
+            if value:
+                want |= bit
+        return care, want
+
+    def _selection(self, features: Dict[str, Optional[bool]]) -> Tuple[List[int], List[int]]:
+        key = self._filter(features)
+        selection = self._selections.get(key)
+        if selection is None:
+            care, want = key
+            masks = sorted(m for m in self._strata if m & care == want)
+            selection = (masks, list(accumulate(self._strata[m][1] for m in masks)))
+            self._selections[key] = selection
+        return selection
+
+    def count(self, **features: Optional[bool]) -> int:
+        with self._lock:
+            self._connection()
+            totals = self._selection(features)[1]
+        return totals[-1] if totals else 0
+
+    def _row(self, db: sqlite3.Connection, rowid: int) -> Dict[str, Any]:
+        a, b, c, solution, equation, steps, mask = db.execute(
+            "SELECT a, b, c, solution, equation, steps, features FROM problems WHERE id=?", (rowid,)
+        ).fetchone()
+        return {"equation_str": equation, "coefficients": [a, b, c], "solution": solution, "steps": json.loads(steps),
+                "features": feature_names(mask)}
+
+    def sample_many(self, k: int, rng: Optional[random.Random] = None, exclude: Iterable[str] = (),
+                    **features: Optional[bool]) -> List[Dict[str, Any]]:
+        """
+        k distinct problems matching features (fewer if the bank has fewer), none of whose
+        equation_str is in exclude. Raises ValueError when nothing matches.
+        """
+        rng = rng or random
+        excluded = set(exclude)
+        with self._lock:
+            db = self._connection()
+            masks, totals = self._selection(features)
+            if not totals:
+                raise ValueError(f"no problems in the bank match {features}")
+            picked: Dict[int, Dict[str, Any]] = {}
+            # bounded retries: duplicates/exclusions are rare unless k is close to the stratum size
+            for _ in range(8 * k + 8):
+                if len(picked) == k:
+                    break
+                offset = rng.randrange(totals[-1])
+                i = bisect_right(totals, offset)
+                first, _ = self._strata[masks[i]]
+                rowid = first + offset - (totals[i - 1] if i else 0)
+                if rowid in picked:
+                    continue
+                problem = self._row(db, rowid)
+                if problem["equation_str"] in excluded:
+                    continue
+                picked[rowid] = problem
+            self.samples += len(picked)
+        return list(picked.values())
+
+    def sample(self, rng: Optional[random.Random] = None, exclude: Iterable[str] = (),
+               **features: Optional[bool]) -> Dict[str, Any]:
+        """One problem matching features, e.g. sample(negative_constant=True, fractional_solution=False)."""
+        problems = self.sample_many(1, rng, exclude, **features)
+        if not problems:
+            raise ValueError(f"no problems in the bank match {features} outside {list(exclude)}")
+        return problems[0]
+
+    def rows(self) -> List[Tuple[int, int, int, str, int]]:
+        """Every problem as (a, b, c, equation, feature mask), in stratum order (see item_bank)."""
+        with self._lock:
+            return self._connection().execute("SELECT a, b, c, equation, features FROM problems ORDER BY id").fetchall()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._connection()
+            strata = {"+".join(feature_names(m)) or "plain": count for m, (_, count) in sorted(self._strata.items())}
+        return {"path": self.path, "problems": sum(strata.values()), "strata": strata, "samples": self.samples}
+
+
+_bank: Optional[ProblemBank] = None
+_bank_lock = threading.Lock()
+
+
+def get_problem_bank() -> ProblemBank:
+    """Shared bank at COACH_PROBLEM_BANK (built on first use)."""
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = ProblemBank()
+    return _bank
+
+
+def configure_problem_bank(path: str = BANK_PATH, **ranges) -> ProblemBank:
+    """Point the shared bank at another file and/or other ranges (see ProblemBank)."""
+    global _bank
+    with _bank_lock:
+        if _bank is not None:
+            with _bank._lock:
+                _bank._close()
+        _bank = ProblemBank(path, **ranges)
+    return _bank
+
+
+def main(argv: Optional[List[str]] = None):
+    """python src/tools/problem_bank.py [path]  -- (re)build the bank and print its strata."""
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    bank = ProblemBank(argv[0] if argv else BANK_PATH)
+    bank.build(force=True)
+    print(json.dumps(bank.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
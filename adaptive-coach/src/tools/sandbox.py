@@ -0,0 +1,391 @@
+# src/tools/sandbox.py
+"""
+Isolated grading for untrusted answer text.
+
+grade_answer() hands anything the exact linear parser can't read to sp.sympify,
+which evaluates it: "9**9**9" or "factorial(10**6)" pins a CPU (or eats all memory)
+for as long as it takes, inside the Streamlit worker that every session shares.
+grade_answer_safe() grades the same way, but:
+
+  1. precheck(): length, character set, nesting, power and literal-size limits;
+     a failing answer is graded as status "rejected" without evaluating anything
+  2. plain numbers ("4", "x=-1.5", "1/2") and cached answers are parsed in-process
+     (they never reach sympy)
+  3. everything else is parsed in a warm pool of worker processes, each with an
+     address-space limit; a call that exceeds the wall-clock timeout gets its worker
+     killed and replaced, and grades as status "timeout"
+
+Workers are recycled after SANDBOX_MAX_TASKS calls. Results carry "status":
+"ok", "rejected", "timeout" or "error" on top of the usual grade_answer fields.
+See bench/stress_sandbox.py for latency under adversarial input mixes.
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools.code_executor import (
+    _answer_text, _compute_number, _compute_solution, _expected_value, _grade_values,
+    parse_linear, solve_cache,
+)
+
+SANDBOX_WORKERS = int(os.environ.get("COACH_SANDBOX_WORKERS", min(2, os.cpu_count() or 1)))
+SANDBOX_TIMEOUT_SECONDS = float(os.environ.get("COACH_SANDBOX_TIMEOUT", 1.0))
+# address space a worker may add on top of what it uses after importing sympy
+SANDBOX_MEMORY_MB = int(os.environ.get("COACH_SANDBOX_MEMORY_MB", 256))
+SANDBOX_MAX_TASKS = int(os.environ.get("COACH_SANDBOX_MAX_TASKS", 500))
+# latencies kept for the percentiles in stats()
+LATENCY_WINDOW = 10000
+
+# precheck limits (answers are numbers like "4", "-1.5", "x = 7/2")
+MAX_ANSWER_CHARS = 100
+MAX_NESTING = 6
+MAX_POWERS = 1
+MAX_DIGITS = 30
+MAX_EXPONENT_DIGITS = 3
+_ALLOWED = re.compile(r"[0-9A-Za-z+\-*/^()., =]*")
+_ATTRIBUTE = re.compile(r"[A-Za-z)]\s*\.")      # x.__class__, (1).real
+_LONG_NUMBER = re.compile(rf"\d{{{MAX_DIGITS + 1},}}")
+_BIG_EXPONENT = re.compile(rf"\d[eE][+-]?\d{{{MAX_EXPONENT_DIGITS + 1},}}")
+
+STATUS_OK = "ok"
+STATUS_REJECTED = "rejected"
+STATUS_TIMEOUT = "timeout"
+STATUS_ERROR = "error"
+
+
+class SandboxTimeout(Exception):
+    """The call did not finish within the wall-clock limit; its worker was killed."""
+
+
+class SandboxError(Exception):
+    """The worker failed (memory limit, crash) instead of returning a result."""
+
+
+def precheck(text: Any) -> Optional[str]:
+    """Why an answer is too risky to evaluate, or None if it may be parsed."""
+    if not isinstance(text, str):
+        return None
+    if len(text) > MAX_ANSWER_CHARS:
+        return f"longer than {MAX_ANSWER_CHARS} characters"
+    if not _ALLOWED.fullmatch(text):
+        return "unsupported characters"
+    if _ATTRIBUTE.search(text):
+        return "attribute access"
+    depth = deepest = 0
+    for ch in text:
+        depth += (ch == "(") - (ch == ")")
+        deepest = max(deepest, depth)
+    if deepest > MAX_NESTING:
+        return f"nested deeper than {MAX_NESTING}"
+    if text.count("**") + text.count("^") > MAX_POWERS:
+        return f"more than {MAX_POWERS} power(s)"
+    if _LONG_NUMBER.search(text) or _BIG_EXPONENT.search(text):
+        return "number too large"
+    return None
+
+
+# ------------------------------------------------------------------
+# Worker processes
+# ------------------------------------------------------------------
+_TASKS = {"number": _compute_number, "solve": _compute_solution}
+
+
+def _limit_memory(headroom_mb: int):
+    try:
+        import resource
+    except ImportError:  # not available on Windows: run without a memory cap
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            in_use = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        in_use = 512 * 2 ** 20
+    limit = in_use + headroom_mb * 2 ** 20
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _worker_main(conn, headroom_mb: int):
+    _limit_memory(headroom_mb)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        kind, text = message
+        try:
+            conn.send((STATUS_OK, _TASKS[kind](text)))
+        except MemoryError:
+            conn.send((STATUS_ERROR, "memory limit exceeded"))
+        except Exception as e:
+            conn.send((STATUS_ERROR, f"{type(e).__name__}: {e}"))
+
+
+def _context():
+    # forkserver forks workers from a clean process that has already imported sympy,
+    # so a replacement starts in milliseconds and never inherits the app's threads
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["sympy", "tools.code_executor"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class _Worker:
+    def __init__(self, ctx, headroom_mb: int):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, headroom_mb), daemon=True)
+        self.process.start()
+        child.close()
+        self.tasks = 0
+
+    def call(self, kind: str, text: str, timeout: float) -> Tuple[str, Any]:
+        self.tasks += 1
+        self.conn.send((kind, text))
+        if not self.conn.poll(timeout):
+            raise SandboxTimeout(f"no result within {timeout}s")
+        return self.conn.recv()
+
+    def stop(self, kill: bool = False):
+        """Kill the process, or ask it to exit (without waiting: multiprocessing reaps it later)."""
+        if kill:
+            self.process.kill()
+            self.process.join()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                self.process.kill()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Warm pool of worker processes that evaluate untrusted text under limits.
+
+    - workers: processes started up front (calls beyond that wait for a free worker)
+    - timeout: wall-clock seconds a call may run; waiting for a free worker is bounded
+      by the same amount separately, so answers queued behind a hostile one are graded late
+      rather than failed
+    - memory_mb: address space each worker may grow by
+    - max_tasks: calls after which a worker is replaced by a fresh one
+    """
+
+    def __init__(self, workers: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT_SECONDS,
+                 memory_mb: int = SANDBOX_MEMORY_MB, max_tasks: int = SANDBOX_MAX_TASKS):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tasks = max_tasks
+        self._ctx = _context()
+        self._lock = threading.Lock()
+        self._idle: List[_Worker] = []
+        # callers waiting for a worker, served first come first served: [worker or None, Event]
+        self._waiters: deque = deque()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._closed = False
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.recycled = 0
+        self.size = workers
+        for _ in range(workers):
+            self._idle.append(_Worker(self._ctx, memory_mb))
+
+    def _acquire(self, timeout: float) -> _Worker:
+        with self._lock:
+            if self._idle and not self._waiters:
+                return self._idle.pop()
+            slot = [None, threading.Event()]
+            self._waiters.append(slot)
+        slot[1].wait(timeout)
+        with self._lock:
+            if slot[0] is None:
+                self._waiters.remove(slot)
+                raise SandboxTimeout("no free sandbox worker")
+        return slot[0]
+
+    def _release(self, worker: _Worker):
+        # hand the worker straight to the longest waiting caller; with a plain queue the
+        # releasing thread tends to take it right back and the others starve (high p99)
+        with self._lock:
+            if not self._closed:
+                if self._waiters:
+                    slot = self._waiters.popleft()
+                    slot[0] = worker
+                    slot[1].set()
+                else:
+                    self._idle.append(worker)
+                return
+        worker.stop()
+
+    def run(self, kind: str, text: str, timeout: Optional[float] = None) -> Any:
+        """Result of _TASKS[kind](text) computed in a worker. Raises SandboxTimeout / SandboxError."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            worker = self._acquire(timeout)
+        except SandboxTimeout:
+            self._record(start, timeouts=1)
+            raise
+        try:
+            status, value = worker.call(kind, text, timeout)
+        except SandboxTimeout:
+            self._retire(worker, kill=True)
+            self._record(start, timeouts=1)
+            raise
+        except (EOFError, OSError) as e:
+            # the worker died (e.g. killed by the OS)
+            self._retire(worker, kill=True)
+            self._record(start, errors=1)
+            raise SandboxError(f"sandbox worker died: {e!r}") from None
+        if status != STATUS_OK:
+            # e.g. a MemoryError: start over with a fresh process rather than a fragmented one
+            self._retire(worker)
+            self._record(start, errors=1)
+            raise SandboxError(value)
+        if worker.tasks >= self.max_tasks:
+            self._retire(worker, recycled=True)
+        else:
+            self._release(worker)
+        self._record(start)
+        return value
+
+    def _retire(self, worker: _Worker, kill: bool = False, recycled: bool = False):
+        """Stop a worker and put a fresh one in its place."""
+        worker.stop(kill=kill)
+        if recycled:
+            with self._lock:
+                self.recycled += 1
+        if not self._closed:
+            self._release(_Worker(self._ctx, self.memory_mb))
+
+    def _record(self, start: float, timeouts: int = 0, errors: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.timeouts += timeouts
+            self.errors += errors
+            self._latencies.append(time.perf_counter() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, timeouts, errors, recycled = self.calls, self.timeouts, self.errors, self.recycled
+        pct = lambda p: round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e3, 2) \
+            if latencies else None
+        return {
+            "workers": self.size,
+            "calls": calls,
+            "timeouts": timeouts,
+            "errors": errors,
+            "recycled": recycled,
+            "p50_ms": pct(50),
+            "p99_ms": pct(99),
+            "max_ms": round(latencies[-1] * 1e3, 2) if latencies else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+_sandbox: Optional[SandboxPool] = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sandbox() -> SandboxPool:
+    """The shared pool for this process, started on first use."""
+    global _sandbox
+    if _sandbox is None:
+        with _sandbox_lock:
+            if _sandbox is None:
+                _sandbox = SandboxPool()
+                atexit.register(lambda: _sandbox.close())
+    return _sandbox
+
+
+def configure_sandbox(workers: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT_SECONDS,
+                      memory_mb: int = SANDBOX_MEMORY_MB, max_tasks: int = SANDBOX_MAX_TASKS) -> SandboxPool:
+    """Replace the shared pool (the old one is shut down)."""
+    global _sandbox
+    pool = SandboxPool(workers, timeout, memory_mb, max_tasks)
+    with _sandbox_lock:
+        old, _sandbox = _sandbox, pool
+    if old is None:
+        atexit.register(lambda: _sandbox.close())
+    else:
+        old.close()
+    return pool
+
+
+def sandbox_stats() -> Dict[str, Any]:
+    """Counters and latency percentiles of the shared pool (None before it is started)."""
+    return _sandbox.stats() if _sandbox is not None else None
+
+
+# ------------------------------------------------------------------
+# Safe grading
+# ------------------------------------------------------------------
+def _in_process(text: str) -> bool:
+    """True if text is a plain number the exact parser reads (never reaches sympy)."""
+    try:
+        a, _ = parse_linear(text)
+        return not a
+    except ValueError:
+        return False
+
+
+def _sandboxed_number(text: str) -> Optional[float]:
+    if _in_process(text):
+        return _compute_number(text)
+    return get_sandbox().run("number", text)
+
+
+def parse_answer_safe(text: Optional[str]) -> Optional[float]:
+    """Number in an untrusted (normalized) answer; None if unparseable, rejected or too slow."""
+    if text is None or precheck(text):
+        return None
+    try:
+        return solve_cache.lookup("number", text, _sandboxed_number)
+    except (SandboxTimeout, SandboxError):
+        return None
+
+
+def _blocked(expected_val: Optional[float], status: str, explanation: str) -> Dict[str, Any]:
+    return {"correct": False, "expected": expected_val, "user": None, "explanation": explanation, "status": status}
+
+
+def grade_answer_safe(expected_expr: str, user_answer: str, tolerance: float = 1e-6) -> Dict[str, Any]:
+    """
+    grade_answer for untrusted user_answer text (expected_expr comes from the app and is trusted).
+    Same fields as grade_answer, plus "status" ("ok", "rejected", "timeout" or "error").
+    """
+    expected_val = _expected_value(expected_expr)
+    reason = precheck(user_answer)
+    if reason:
+        return _blocked(expected_val, STATUS_REJECTED, f"Answer not graded: {reason}.")
+    text = _answer_text(user_answer)
+    try:
+        # timeouts/errors propagate out of lookup, so they are not cached as "unparseable"
+        user_val = None if text is None else solve_cache.lookup("number", text, _sandboxed_number)
+    except SandboxTimeout:
+        return _blocked(expected_val, STATUS_TIMEOUT, "Answer not graded: it took too long to evaluate.")
+    except SandboxError as e:
+        return _blocked(expected_val, STATUS_ERROR, f"Answer not graded: {e}.")
+    result = _grade_values(expected_val, user_val, tolerance)
+    result["status"] = STATUS_OK
+    return result
+
+
+async def grade_answer_safe_async(expected_expr: str, user_answer: str, tolerance: float = 1e-6) -> Dict[str, Any]:
+    # the event loop thread only waits on the worker's pipe
+    return await asyncio.to_thread(grade_answer_safe, expected_expr, user_answer, tolerance)
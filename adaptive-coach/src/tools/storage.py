@@ -0,0 +1,253 @@
+# src/tools/storage.py
+"""
+Storage backends for learner memory, and the one place that decides where it lives.
+
+A backend is anything the persistence functions accept as `conn`:
+
+  sqlite:PATH             one SQLite file behind a ConnectionPool (default: memory.db in
+                          persistence.DATA_DIR)
+  memory:                 a private in-memory SQLite database (tests, demos)
+  sharded:DIR?shards=N    N SQLite files DIR/shard_000.db ... routed by a stable hash
+                          of user_id (persistence.shard_index), so writers on different
+                          shards never contend
+
+Options go in the query string: ?pool=4 (pool size per database), ?normalized=1.
+The spec comes from configure(), else the COACH_STORAGE environment variable, else
+sqlite:DB_PATH. Paths written in a spec are taken as given (relative ones against the
+working directory); a spec without one uses the defaults under persistence.DATA_DIR.
+get_storage() returns the shared instance used by api.get_conn() and by every agent
+constructed without conn=.
+
+Moving learners between layouts (e.g. 4 -> 8 shards, or one file -> shards) is done
+with rebalance():  python -m tools.storage rebalance sqlite:memory.db "sharded:data?shards=8"
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import parse_qs
+
+from tools.persistence import (
+    DB_PATH, POOL_SIZE, Conn, ConnectionPool, ShardedStore, data_path, shard_for, writing, reading,
+    flush, is_normalized, log, memory_cache, shards_of,
+)
+
+STORAGE_ENV = "COACH_STORAGE"
+POOL_SIZE_ENV = "COACH_DB_POOL_SIZE"
+BACKENDS = ("sqlite", "memory", "sharded")
+SHARD_FILE = "shard_{:03d}.db"
+# learners copied per transaction by rebalance()
+REBALANCE_BATCH = 500
+
+
+class StorageConfig:
+    """
+    Which backend to open and how.
+    backend: "sqlite", "memory" or "sharded"
+    path: database file (sqlite) or directory holding the shard files (sharded)
+    shards: number of shard files (sharded only)
+    pool_size: reader connections per database
+    normalized: use the normalized (append-only history) layout
+    """
+
+    def __init__(self, backend: str = "sqlite", path: str = DB_PATH, shards: int = 1,
+                 pool_size: int = POOL_SIZE, normalized: bool = False):
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown storage backend: {backend!r} (expected one of {BACKENDS})")
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.backend = backend
+        self.path = path
+        self.shards = shards
+        self.pool_size = pool_size
+        self.normalized = normalized
+
+    @classmethod
+    def parse(cls, spec: str) -> "StorageConfig":
+        """Build a config from a spec string such as "sharded:data/shards?shards=8"."""
+        spec, _, query = spec.partition("?")
+        options = {k: v[-1] for k, v in parse_qs(query).items()}
+        scheme, sep, rest = spec.partition(":")
+        if spec == ":memory:":
+            scheme, rest = "memory", ""
+        elif not sep or scheme not in BACKENDS:
+            # a bare path (including Windows drive letters) means one SQLite file
+            scheme, rest = "sqlite", spec
+        default_path = {"sqlite": DB_PATH, "memory": ":memory:", "sharded": data_path("shards")}[scheme]
+        return cls(
+            backend=scheme,
+            path=rest or default_path,
+            shards=int(options.get("shards", 1)),
+            pool_size=int(options.get("pool", os.environ.get(POOL_SIZE_ENV, POOL_SIZE))),
+            normalized=options.get("normalized", "0").lower() in ("1", "true", "yes"),
+        )
+
+    @classmethod
+    def from_env(cls) -> "StorageConfig":
+        return cls.parse(os.environ.get(STORAGE_ENV, f"sqlite:{DB_PATH}"))
+
+    def shard_paths(self) -> List[str]:
+        return [os.path.join(self.path, SHARD_FILE.format(i)) for i in range(self.shards)]
+
+    def open(self) -> Conn:
+        if self.backend == "memory":
+            return ConnectionPool(":memory:", size=self.pool_size, normalized=self.normalized)
+        if self.backend == "sqlite":
+            return ConnectionPool(self.path, size=self.pool_size, normalized=self.normalized)
+        os.makedirs(self.path, exist_ok=True)
+        return ShardedStore([
+            ConnectionPool(path, size=self.pool_size, normalized=self.normalized)
+            for path in self.shard_paths()
+        ])
+
+    def __repr__(self):
+        return (f"StorageConfig(backend={self.backend!r}, path={self.path!r}, shards={self.shards}, "
+                f"pool_size={self.pool_size}, normalized={self.normalized})")
+
+
+def open_storage(config: Union[str, StorageConfig, None] = None) -> Conn:
+    """Open a new backend from a spec string or StorageConfig (default: from the environment)."""
+    if config is None:
+        config = StorageConfig.from_env()
+    elif isinstance(config, str):
+        config = StorageConfig.parse(config)
+    return config.open()
+
+
+_storage: Optional[Conn] = None
+_storage_config: Optional[StorageConfig] = None
+_storage_lock = threading.Lock()
+
+
+def configure(config: Union[str, StorageConfig, None] = None):
+    """Choose the shared backend (closes the previous one). Call before the first get_storage()."""
+    global _storage, _storage_config
+    if isinstance(config, str):
+        config = StorageConfig.parse(config)
+    with _storage_lock:
+        old, _storage, _storage_config = _storage, None, config
+    if old is not None:
+        flush(old)
+        old.close()
+
+
+def get_storage() -> Conn:
+    """The shared backend for this process, opened on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = open_storage(_storage_config)
+    return _storage
+
+
+# ------------------------------------------------------------------
+# Rebalancing
+# ------------------------------------------------------------------
+def _user_tables(c) -> List[str]:
+    """Tables of one database that hold per-learner rows (they all have a user_id column)."""
+    names = [r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+    return [n for n in names if any(col[1] == "user_id" for col in c.execute(f"PRAGMA table_info({n})"))]
+
+
+def _move_learners(src: Conn, dst: Conn, user_ids: List[str], tables: List[str]):
+    """Copy every row of user_ids from src to dst, then delete them from src."""
+    marks = ", ".join("?" * len(user_ids))
+    with reading(src) as s:
+        copies = []
+        for table in tables:
+            cur = s.execute(f"SELECT * FROM {table} WHERE user_id IN ({marks})", user_ids)
+            columns = [d[0] for d in cur.description]
+            create = s.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+            copies.append((table, columns, cur.fetchall(), create))
+    with writing(dst) as d:
+        for table, columns, rows, create in copies:
+            d.execute(create.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1))
+            # idempotent: a rerun after an interruption replaces what was already copied
+            d.execute(f"DELETE FROM {table} WHERE user_id IN ({marks})", user_ids)
+            d.executemany(
+                f"INSERT INTO {table}({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+        d.commit()
+    with writing(src) as s:
+        for table in tables:
+            s.execute(f"DELETE FROM {table} WHERE user_id IN ({marks})", user_ids)
+        s.commit()
+
+
+def rebalance(src: Conn, dst: Conn, dry_run: bool = False, batch_size: int = REBALANCE_BATCH) -> Dict[str, Any]:
+    """
+    Move every learner from the databases behind `src` to where `dst` routes them.
+    src/dst can be any backends (one file, shards); databases present in both (same file)
+    only give up the learners that now hash elsewhere. Run it while the app is stopped.
+    Safe to rerun after an interruption. Returns move counts per source database.
+    """
+    if is_normalized(src) != is_normalized(dst):
+        raise ValueError("source and destination must use the same layout (blob or normalized)")
+    flush(src)
+    flush(dst)
+    report = {"moved": 0, "kept": 0, "sources": []}
+    for shard in shards_of(src):
+        with reading(shard) as c:
+            tables = _user_tables(c)
+            users = sorted({r[0] for t in tables for r in c.execute(f"SELECT DISTINCT user_id FROM {t}")})
+        moves: Dict[int, List[str]] = {}
+        targets = {}
+        kept = 0
+        for user_id in users:
+            target = shard_for(dst, user_id)
+            if getattr(target, "cache_key", None) == getattr(shard, "cache_key", None):
+                kept += 1
+                continue
+            moves.setdefault(id(target), []).append(user_id)
+            targets[id(target)] = target
+        moved = sum(len(u) for u in moves.values())
+        if not dry_run:
+            for key, user_ids in moves.items():
+                for i in range(0, len(user_ids), batch_size):
+                    _move_learners(shard, targets[key], user_ids[i:i + batch_size], tables)
+        report["sources"].append({"db": getattr(shard, "cache_key", None), "learners": len(users),
+                                  "moved": moved, "kept": kept})
+        report["moved"] += moved
+        report["kept"] += kept
+    memory_cache.clear()
+    verb = "Would move" if dry_run else "Moved"
+    log(f"[OK] {verb} {report['moved']} learners ({report['kept']} already in place).", "green")
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    CLI (run from the src folder):
+      python -m tools.storage info [SPEC]
+      python -m tools.storage rebalance SRC_SPEC DST_SPEC [--dry-run]
+    """
+    parser = argparse.ArgumentParser(prog="python -m tools.storage", description="Storage backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="show the configured backend and learners per database")
+    info.add_argument("spec", nargs="?", help=f"storage spec (default: ${STORAGE_ENV} or sqlite:{DB_PATH})")
+    move = sub.add_parser("rebalance", help="move learners from one layout to another")
+    move.add_argument("src")
+    move.add_argument("dst")
+    move.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        config = StorageConfig.parse(args.spec) if args.spec else StorageConfig.from_env()
+        conn = config.open()
+        counts = {}
+        for shard in shards_of(conn):
+            with reading(shard) as c:
+                counts[shard.cache_key] = c.execute("SELECT COUNT(*) FROM learner_summary").fetchone()[0]
+        print(json.dumps({"config": repr(config), "learners": counts}, indent=2))
+    else:
+        src, dst = open_storage(args.src), open_storage(args.dst)
+        print(json.dumps(rebalance(src, dst, dry_run=args.dry_run), indent=2))
+        src.close()
+        dst.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# src/tools/variants.py
+"""
+Structured variants of linear equations  a*x + b = c  for quiz questions.
+
+Variants are built on coefficient arrays, never on equation text: for every base equation
+a batch of candidate (a, b, solution) triples is drawn with numpy around it, c follows in
+closed form (c = a*x + b, so the solution is exact by construction), and the constraints
+(a != 0 with the base's sign, solution != 0 and within range, integer or short-decimal solution, optionally the
+same difficulty features as the base, different from the base, no duplicates) are applied
+as boolean masks over the whole batch. Strings are rendered once, for the kept variants.
+
+    batch = equation_variants([2, 5], [3, -4], [11, 21], n=2)
+    batch["a"].shape == (2, 2)           # 2 bases x 2 variants
+    render(batch)[0] == ["3*x + 1 = 13", "2*x + (-1) = 9"]   (for example)
+"""
+import re
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from utils.lazy import lazy_import
+from tools.problem_bank import BANK_DENOMINATORS, BANK_MAX_SOLUTION, format_equation
+
+np = lazy_import("numpy")
+
+# How far variants stray from the base: coefficient a +/- COEFFICIENT_SPREAD, constant
+# b +/- CONSTANT_SPREAD; the solution is drawn anywhere in [-max_solution, max_solution]
+COEFFICIENT_SPREAD = 2
+CONSTANT_SPREAD = 5
+# candidates drawn per requested variant (constraints and duplicates discard some)
+OVERSAMPLE = 8
+
+Ints = Union[int, Sequence[int]]
+
+# "2*x + 3 = 11", "5*x - 4 = 21", "3*x + (-4) = 8", "-x + 2 = 0", "x = 7"
+_EQUATION = re.compile(
+    r"^\s*(?P<a>[+-]?\d*)\s*\*?\s*x\s*(?:(?P<sign>[+-])\s*\(?\s*(?P<b>[+-]?\d+)\s*\)?)?\s*=\s*(?P<c>[+-]?\d+)\s*$"
+)
+
+
+def parse_equation(equation: str) -> Optional[Tuple[int, int, int]]:
+    """(a, b, c) of an integer linear equation in x, None if it is not of the form a*x + b = c."""
+    m = _EQUATION.match(equation or "")
+    if not m:
+        return None
+    a = m.group("a")
+    a = -1 if a == "-" else 1 if a in ("", "+") else int(a)
+    b = int(m.group("b") or 0) * (-1 if m.group("sign") == "-" else 1)
+    return (a, b, int(m.group("c"))) if a != 0 else None
+
+
+def _feature_masks(a, b, numerator, denominator):
+    """problem_bank.feature_mask over arrays, for solutions numerator / denominator (denominator > 0)."""
+    fractional = (numerator % denominator) != 0
+    return (b < 0) * 1 + (a != 1) * 2 + fractional * 4 + (numerator < 0) * 8
+
+
+def equation_variants(a: Ints, b: Ints, c: Ints, n: int = 2, rng=None,
+                      integer_solution=True, same_features: bool = False,
+                      max_solution: int = BANK_MAX_SOLUTION,
+                      denominators: Sequence[int] = BANK_DENOMINATORS) -> Dict[str, Any]:
+    """
+    n distinct variants of each base equation a*x + b = c (scalars or arrays of E bases).
+    Returns numpy arrays shaped (E, n): "a", "b", "c" (ints), "solution" (floats) and "valid"
+    (False in the slots of bases for which fewer than n variants satisfy the constraints).
+
+    integer_solution: only whole-number solutions (bool, or one per base); otherwise solutions
+      may also have one of `denominators` (short exact decimals, so "3.5" grades correctly)
+    same_features: keep the base's difficulty features (problem_bank.FEATURES)
+    rng: numpy Generator or seed
+    """
+    rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+    base_a, base_b, base_c = (np.atleast_1d(np.asarray(v, dtype=np.int64))[:, None] for v in (a, b, c))
+    if np.any(base_a == 0):
+        raise ValueError("coefficient a must be non-zero")
+    shape = (base_a.shape[0], max(1, n) * OVERSAMPLE)
+    base_num = (base_c - base_b) * np.sign(base_a)
+    base_den = np.abs(base_a)
+    integer = np.atleast_1d(np.asarray(integer_solution, dtype=bool))[:, None, None]
+
+    va = base_a + rng.integers(-COEFFICIENT_SPREAD, COEFFICIENT_SPREAD + 1, shape)
+    vb = base_b + rng.integers(-CONSTANT_SPREAD, CONSTANT_SPREAD + 1, shape)
+    if same_features:
+        va = np.where(base_a == 1, 1, va)
+    # solution = num / den with den dividing a, so c = a*x + b is an integer: draw den among
+    # the allowed denominators that divide each candidate's a (random scores, best allowed wins)
+    dens = np.array((1, *denominators), dtype=np.int64)
+    allowed = (va[..., None] % dens == 0) & ~(integer & (dens > 1))
+    if same_features:
+        allowed &= (dens > 1) == (base_num % base_den != 0)[..., None]
+    pick = np.argmax(rng.random(allowed.shape) * allowed, axis=-1)
+    den = dens[pick]
+    sign = np.sign(base_num) if same_features else rng.choice(np.array([-1, 1]), shape)
+    num = rng.integers(1, max_solution * den + 1) * sign
+    vc = (va * num) // den + vb
+
+    keep = np.take_along_axis(allowed, pick[..., None], axis=-1)[..., 0]
+    keep &= (np.sign(va) == np.sign(base_a)) & (num != 0) & ((den == 1) | (np.gcd(num, den) == 1))
+    keep &= (va != base_a) | (vb != base_b) | (vc != base_c)
+    if same_features:
+        keep &= _feature_masks(va, vb, num, den) == _feature_masks(base_a, base_b, base_num, base_den)
+
+    # duplicates within a base: equal packed (a, b, c) keys; keep the first occurrence
+    key = np.where(keep, ((va + (1 << 20)) << 42) | ((vb + (1 << 20)) << 21) | (vc + (1 << 20)), -1)
+    order = np.argsort(key, axis=1, kind="stable")
+    ranked = np.take_along_axis(key, order, axis=1)
+    repeat = np.zeros_like(keep)
+    np.put_along_axis(repeat, order, np.concatenate(
+        [np.zeros((shape[0], 1), dtype=bool), ranked[:, 1:] == ranked[:, :-1]], axis=1), axis=1)
+    keep &= ~repeat
+
+    # first n kept candidates of every base, in draw order
+    pick = np.argsort(~keep, axis=1, kind="stable")[:, :n]
+    take = lambda v: np.take_along_axis(v, pick, axis=1)
+    return {"a": take(va), "b": take(vb), "c": take(vc), "solution": take(num) / take(den), "valid": take(keep)}
+
+
+def render(batch: Dict[str, Any]) -> List[List[str]]:
+    """Equation strings of the valid variants, one list per base."""
+    valid = batch["valid"]
+    flat = iter([format_equation(a, b, c) for a, b, c in zip(
+        batch["a"][valid].tolist(), batch["b"][valid].tolist(), batch["c"][valid].tolist())])
+    return [list(islice(flat, count)) for count in valid.sum(axis=1).tolist()]
@@ -0,0 +1,64 @@
+# src/utils/lazy.py
+"""
+Lazy imports for heavy optional-at-startup dependencies (sympy, numpy, ...),
+and LazyObject for module-level objects built from them (the rich Console).
+
+    sp = lazy_import("sympy")   # costs a spec lookup, nothing is executed
+    sp.sympify("2*x")           # the real import happens here, once
+
+The module is registered in sys.modules right away, so a later plain
+`import sympy` anywhere gets the same (lazy, then real) module object.
+tests/test_import_time.py guards that the app's entry points stay lazy.
+"""
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Callable
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Module `name`, executed on first attribute access (or the real one if already imported)."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class LazyObject:
+    """
+    Stand-in for an object that is expensive to build (and whose module is expensive to import).
+    factory() runs on the first attribute get or set; after that every access is forwarded.
+
+        console = LazyObject(lambda: Console(soft_wrap=True))
+        console.quiet = True        # builds the Console, then sets the attribute on it
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> Any:
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            with object.__getattribute__(self, "_lock"):
+                target = object.__getattribute__(self, "_target")
+                if target is None:
+                    target = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._resolve(), name, value)
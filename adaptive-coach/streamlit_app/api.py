@@ -1,7 +1,7 @@
 # streamlit_app/api.py
 import os
 import sys
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 
 # Ensure src is importable when running from streamlit_app
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,21 +11,42 @@ if SRC not in sys.path:
 
 # Import your agents (adjust names if different)
 from agents.assessment_agent import AssessmentAgent
-from agents.lesson_agent import LessonAgent
+from agents.lesson_agent import LessonAgent, lesson_cache_stats
 from agents.quiz_agent import QuizAgent
 from agents.feedback_agent import FeedbackAgent
 from eval.evaluator import run_evaluation  # or your report builder
+from eval.cohort import at_risk, cohort_overview, histogram, percentiles
 
 # Persistence helpers
-from tools.persistence import init_db, save_memory, load_memory
+from tools.persistence import apply_updates, get_path, load_memory, mastery_series
+from tools.storage import get_storage
+from tools.llm import llm_stats
+from tools.item_bank import get_item_bank
 
-# make sure init_db is called once
-_conn = None
+# Shared by every Streamlit session/thread. The backend (one SQLite file, in-memory or
+# sharded files) and pool size come from COACH_STORAGE / COACH_DB_POOL_SIZE, see tools/storage.py.
 def get_conn():
-    global _conn
-    if _conn is None:
-        _conn = init_db()  # uses DB_PATH in persistence
-    return _conn
+    return get_storage()
+
+def connection_stats() -> Dict[str, Any]:
+    """Checkout counts and wait times of the shared connection pool(s)."""
+    return get_conn().stats()
+
+def lesson_template_stats() -> Dict[str, Any]:
+    """Hit rate of the cross-user lesson template cache (LLM expansions saved)."""
+    return lesson_cache_stats()
+
+def llm_executor_stats() -> Dict[str, Any]:
+    """Calls, batches, cache hits, timeouts and breaker state of the shared LLM backend (COACH_LLM_BACKEND)."""
+    return llm_stats()
+
+def recalibrate_items() -> Dict[str, Any]:
+    """Refit the quiz item bank (COACH_ITEM_BANK) from every learner's graded quizzes."""
+    return get_item_bank().recalibrate(get_conn())
+
+def item_bank_stats() -> Dict[str, Any]:
+    """Size, difficulty range and last calibration of the quiz item bank."""
+    return get_item_bank().stats()
 
 # UI-facing wrapper functions
 def run_assessment(user_id: str, answers: list) -> Dict[str, Any]:
@@ -40,22 +61,50 @@ def run_assessment(user_id: str, answers: list) -> Dict[str, Any]:
 
     return result
 
+def start_adaptive_assessment(user_id: str) -> Dict[str, Any]:
+    """Open an adaptive diagnostic session; returns its first question (with session_id)."""
+    return AssessmentAgent(conn=get_conn()).start_adaptive(user_id)
+
+def submit_adaptive_answer(session_id: str, answer: str) -> Dict[str, Any]:
+    """
+    Grade one answer of an adaptive diagnostic. The reply carries the next question
+    (next_item), or done=True and the saved result once the assessment has stopped.
+    """
+    return AssessmentAgent(conn=get_conn()).submit(session_id, answer)
+
+
+
+def _latest_diagnostics(conn, user_id: str) -> list:
+    """[latest diagnostic] (or []): one history entry read in place, not the whole list."""
+    latest = get_path(conn, user_id, "diagnostics[-1]")
+    return [latest] if latest else []
 
 
 def generate_lesson(user_id: str, preferences: dict = None):
     conn = get_conn()
     agent = LessonAgent(conn=conn)
 
-    # Load previous diagnostic results from memory
-    mem = read_memory(user_id)
-    diagnostics = mem.get("diagnostics", [])
+    # Load the latest diagnostic result from memory (the planner only looks at that one)
+    diagnostics = _latest_diagnostics(conn, user_id)
 
-    # Call the real method name
-    lesson = agent.plan(user_id, diagnostics)
+    # Call the real method name; preferences pick the lesson tier/style (saved ones if not given)
+    if preferences is None:
+        preferences = get_path(conn, user_id, "preferences", {})
+    lesson = agent.plan(user_id, diagnostics, preferences)
 
     return lesson
 
 
+def generate_lesson_stream(user_id: str, preferences: dict = None) -> Iterator[Dict[str, Any]]:
+    """Streaming generate_lesson: LessonAgent.plan_stream sections, ending with {"section": "done", "lesson"}."""
+    conn = get_conn()
+    agent = LessonAgent(conn=conn)
+    diagnostics = _latest_diagnostics(conn, user_id)
+    if preferences is None:
+        preferences = get_path(conn, user_id, "preferences", {})
+    yield from agent.plan_stream(user_id, diagnostics, preferences)
+
+
 def generate_quiz(user_id: str, lesson: Dict[str, Any]) -> Dict[str, Any]:
     """
     UI wrapper: generate a quiz based on the lesson.
@@ -80,9 +129,8 @@ def grade_quiz(user_id: str, answers_dict: dict):
     conn = get_conn()
     agent = QuizAgent(conn=conn)
 
-    # Load memory
-    mem = read_memory(user_id)
-    last_quiz = mem.get("last_quiz")
+    # Load the last quiz only
+    last_quiz = get_path(conn, user_id, "last_quiz")
 
     if not last_quiz:
         raise ValueError("No quiz found. Please generate a quiz first.")
@@ -109,9 +157,8 @@ def generate_feedback(user_id: str):
     conn = get_conn()
     agent = FeedbackAgent(conn=conn)
 
-    # Load memory
-    mem = read_memory(user_id)
-    last_quiz = mem.get("last_quiz")
+    # Load the last quiz only
+    last_quiz = get_path(conn, user_id, "last_quiz")
 
     if not last_quiz or not last_quiz.get("answers"):
         raise ValueError("No graded quiz found. Please complete a quiz before requesting feedback.")
@@ -124,6 +171,16 @@ def generate_feedback(user_id: str):
     return feedback
 
 
+def generate_feedback_stream(user_id: str) -> Iterator[Dict[str, Any]]:
+    """Streaming generate_feedback: FeedbackAgent.provide_feedback_stream sections, ending with {"section": "done", "report"}."""
+    conn = get_conn()
+    agent = FeedbackAgent(conn=conn)
+    last_quiz = get_path(conn, user_id, "last_quiz")
+    if not last_quiz or not last_quiz.get("answers"):
+        raise ValueError("No graded quiz found. Please complete a quiz before requesting feedback.")
+    yield from agent.provide_feedback_stream(user_id, last_quiz["answers"])
+
+
 def evaluation_report(user_id: str) -> Dict[str, Any]:
     # If you have a function that builds a report and returns a dict
     conn = get_conn()
@@ -131,17 +188,30 @@ def evaluation_report(user_id: str) -> Dict[str, Any]:
     results = run_evaluation(conn=conn, golden_path=os.path.join(SRC, "eval", "golden_cases.json"))
     return results
 
+def cohort_report(threshold: int = 50) -> Dict[str, Any]:
+    """Class-level view for tutors: overview, mastery distribution/percentiles and at-risk learners."""
+    conn = get_conn()
+    return {
+        "overview": cohort_overview(conn, threshold),
+        "mastery_histogram": histogram(conn, "mastery"),
+        "mastery_percentiles": percentiles(conn, "mastery"),
+        "at_risk": at_risk(conn, threshold),
+    }
+
 # memory helpers
 def read_memory(user_id: str) -> Dict[str, Any]:
     conn = get_conn()
     return load_memory(conn, user_id)
 
+def mastery_history(user_id: str, topic: str = "linear_equations", bucket: str = "auto"):
+    """Mastery time series for the Report tab chart (daily averages for long histories)."""
+    conn = get_conn()
+    return mastery_series(conn, user_id, topic, bucket=bucket)
+
 def write_preference(user_id: str, learning_style: str, difficulty: str):
     conn = get_conn()
-    mem = load_memory(conn, user_id) or {}
-    prefs = mem.get("preferences", {})
-    prefs["learning_style"] = learning_style
-    prefs["difficulty_curve"] = difficulty
-    mem["preferences"] = prefs
-    save_memory(conn, user_id, mem)
-    return mem
+    apply_updates(conn, user_id, [
+        ("set", "preferences.learning_style", learning_style),
+        ("set", "preferences.difficulty_curve", difficulty),
+    ])
+    return load_memory(conn, user_id)
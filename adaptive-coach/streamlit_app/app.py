@@ -1,17 +1,19 @@
 # streamlit_app/app.py
 import streamlit as st
 import json
-import pandas as pd
 
 # local imports
 from api import (
     run_assessment,
-    generate_lesson,
+    start_adaptive_assessment,
+    submit_adaptive_answer,
+    generate_lesson_stream,
     generate_quiz,
     grade_quiz,
-    generate_feedback,
+    generate_feedback_stream,
     evaluation_report,
     read_memory,
+    mastery_history,
     write_preference
 )
 
@@ -52,6 +54,55 @@ def show_json(obj):
     st.code(json.dumps(obj, indent=2, ensure_ascii=False), language="json")
 
 
+def render_lesson_stream(events):
+    """Draw lesson sections as generate_lesson_stream yields them; returns the saved lesson."""
+    expanded, expanded_box, lesson = "", None, None
+    for event in events:
+        section = event["section"]
+        if section == "overview":
+            st.subheader(f"{event['difficulty']} lesson")
+            st.write(event["focus"])
+            st.markdown("\n".join(f"- {o}" for o in event["learning_objectives"]))
+        elif section == "explanation":
+            st.markdown("### Explanation")
+            st.write(event["text"])
+        elif section == "worked_example":
+            st.markdown(f"### Worked example: `{event['equation_str']}`")
+        elif section == "example_step":
+            st.write(f"{event['index'] + 1}. {event['text']}")
+        elif section == "practice":
+            st.info(event["text"])
+        elif section == "llm_token":
+            if expanded_box is None:
+                st.markdown("### In more detail")
+                expanded_box = st.empty()
+            expanded += event["text"]
+            expanded_box.markdown(expanded)
+        elif section == "done":
+            lesson = event["lesson"]
+    return lesson
+
+
+def render_feedback_stream(events):
+    """Draw feedback items (then their LLM expansions) as generate_feedback_stream yields them; returns the report."""
+    boxes, texts, report = {}, {}, None
+    for event in events:
+        section = event["section"]
+        if section == "item":
+            item = event["item"]
+            st.markdown(f"**Q{item['q_index'] + 1}** — {item['status']}: {item['message']}")
+            if item["status"] == "incorrect":
+                st.write("Hint:", item["details"]["hint"])
+                boxes[item["q_index"]] = st.empty()
+        elif section == "llm_token":
+            q_index = event["q_index"]
+            texts[q_index] = texts.get(q_index, "") + event["text"]
+            boxes[q_index].markdown(f"> {texts[q_index]}")
+        elif section == "done":
+            report = event["report"]
+    return report
+
+
 # ------------------------------------------------------------------
 # Session state
 # ------------------------------------------------------------------
@@ -108,25 +159,51 @@ tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
 # ============================================================
 with tab1:
     st.header("📝 Assessment")
-    st.write("Answer the diagnostic questions.")
+    uid = st.session_state.user_id.strip() or "student_demo"
+    mode = st.radio("Mode", ["Fixed (3 questions)", "Adaptive"], horizontal=True)
+
+    if mode == "Adaptive":
+        st.write("Each question is chosen from your previous answers; the assessment stops "
+                 "as soon as your level is known precisely enough.")
+        if st.button("Start adaptive assessment"):
+            st.session_state.adaptive_question = start_adaptive_assessment(uid)
+            st.session_state.pop("adaptive_step", None)
+
+        question = st.session_state.get("adaptive_question")
+        step = st.session_state.get("adaptive_step")
+        if step:
+            verdict = "✅ Correct" if step["correct"] else "❌ Incorrect"
+            st.write(f"{verdict} — level estimate {step['ability']:+.2f} ± {step['ability_se']:.2f}")
+        if question:
+            st.write(f"Q{question['q_index'] + 1}: {question['q']}")
+            answer = st.text_input("Your answer", key=f"adaptive_{question['session_id']}_{question['q_index']}")
+            if st.button("Submit answer"):
+                step = submit_adaptive_answer(question["session_id"], answer)
+                st.session_state.adaptive_step = step
+                st.session_state.adaptive_question = step["next_item"]
+                st.rerun()
+        elif step and step["done"]:
+            st.success(f"Assessment complete after {step['result']['total_questions']} questions.")
+            show_json(step["result"])
+    else:
+        st.write("Answer the diagnostic questions.")
 
-    q1 = st.text_input("1) Solve for x: 2*x + 3 = 11")
-    q2 = st.text_input("2) Solve for x: 5*x - 4 = 21")
-    q3 = st.text_input("3) Solve for x: 3*x + 9 = 0")
+        q1 = st.text_input("1) Solve for x: 2*x + 3 = 11")
+        q2 = st.text_input("2) Solve for x: 5*x - 4 = 21")
+        q3 = st.text_input("3) Solve for x: 3*x + 9 = 0")
 
-    answers = [q1, q2, q3]
-    uid = st.session_state.user_id.strip() or "student_demo"
+        answers = [q1, q2, q3]
 
-    if st.button("Submit Assessment"):
-        with st.spinner("Grading assessment..."):
-            result = run_assessment(uid, answers)
+        if st.button("Submit Assessment"):
+            with st.spinner("Grading assessment..."):
+                result = run_assessment(uid, answers)
 
-        st.success("Assessment complete.")
-        show_json(result)
+            st.success("Assessment complete.")
+            show_json(result)
 
-        mem = read_memory(uid)
-        st.subheader("Stored Memory")
-        show_json(mem)
+            mem = read_memory(uid)
+            st.subheader("Stored Memory")
+            show_json(mem)
 
 
 # ============================================================
@@ -140,14 +217,11 @@ with tab2:
         uid = st.session_state.user_id.strip() or "student_demo"
         prefs = read_memory(uid).get("preferences", {})
 
-        with st.spinner("Generating lesson..."):
-            lesson = generate_lesson(uid, prefs)
-
-        st.subheader("Lesson Details")
-        show_json(lesson)
+        # sections appear as they are ready instead of behind a spinner
+        lesson = render_lesson_stream(generate_lesson_stream(uid, prefs))
 
-        st.markdown("### Explanation")
-        st.write(lesson.get("short_explanation", "No explanation available."))
+        with st.expander("Lesson Details"):
+            show_json(lesson)
 
 
 # ============================================================
@@ -199,11 +273,14 @@ with tab4:
     if st.button("Generate Feedback"):
         uid = st.session_state.user_id.strip() or "student_demo"
 
-        with st.spinner("Analyzing your quiz answers..."):
-            fb = generate_feedback(uid)
-
-        st.success("Feedback generated!")
-        show_json(fb)
+        try:
+            fb = render_feedback_stream(generate_feedback_stream(uid))
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success("Feedback generated!")
+            with st.expander("Feedback details"):
+                show_json(fb)
 
     if st.button("Show Stored Memory"):
         uid = st.session_state.user_id.strip() or "student_demo"
@@ -230,8 +307,10 @@ with tab5:
     st.metric("Mastery (%)", mastery)
 
     # Line chart (mastery history)
-    history = read_memory(uid).get("mastery_history", [])
+    history = mastery_history(uid)
     if history:
+        import pandas as pd  # only needed for this chart; keeps app start-up light
+
         df = pd.DataFrame(history)
         df["timestamp"] = pd.to_datetime(df["timestamp"])
         st.line_chart(df.set_index("timestamp")["mastery"])
@@ -258,8 +337,7 @@ with tab6:
 
         # Lesson
         prefs = read_memory(uid).get("preferences", {})
-        with st.spinner("Generating lesson..."):
-            lesson = generate_lesson(uid, prefs)
+        lesson = render_lesson_stream(generate_lesson_stream(uid, prefs))
         st.session_state.loop_lesson = lesson
         st.success("Lesson created.")
 
@@ -290,9 +368,9 @@ with tab6:
     if graded:
         st.subheader("Feedback")
 
-        with st.spinner("Generating feedback..."):
-            fb = generate_feedback(uid)
-        st.json(fb)
+        fb = render_feedback_stream(generate_feedback_stream(uid))
+        with st.expander("Feedback details"):
+            st.json(fb)
 
         st.markdown("### Next Cycle")
         if st.button("Next Lesson"):
@@ -0,0 +1,49 @@
+# tests/conftest.py
+"""
+Run from the adaptive-coach folder:  python -m pytest -q tests
+
+src/ goes on sys.path (the layout the app and bench/ scripts use), and COACH_DATA_DIR points
+at a throwaway directory before tools.persistence is imported, so nothing a test does
+touches the memory, problem bank or item bank files of the checkout.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix="coach-tests-")
+os.environ["COACH_DATA_DIR"] = DATA_DIR
+
+import pytest
+
+from tools import persistence
+
+persistence.console.quiet = True
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "memory.db")
+
+
+@pytest.fixture
+def conn(db_path):
+    c = persistence.init_db(db_path)
+    yield c
+    c.close()
+
+
+@pytest.fixture(params=[False, True], ids=["blob", "normalized"])
+def any_layout(request, tmp_path):
+    """A memory database in either layout."""
+    c = persistence.init_db(str(tmp_path / "memory.db"), normalized=request.param)
+    yield c
+    c.close()
@@ -0,0 +1,132 @@
+# tests/test_adaptive_diagnostic.py
+"""Adaptive diagnostic sessions: one item per answer, concurrent answers folded in one at a time."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agents import assessment_agent
+from agents.assessment_agent import AssessmentAgent
+from tools import item_bank
+from tools.item_bank import ItemBank
+from tools.persistence import load_memory
+
+# equation -> solution: every item has its own, so a grade shows which item it was made for
+SOLUTIONS = {f"{i + 2}*x + {i} = {(i + 2) * (i + 1) + i}": i + 1 for i in range(40)}
+
+
+@pytest.fixture(autouse=True)
+def bank(tmp_path, monkeypatch):
+    bank = ItemBank(str(tmp_path / "items.db"), seed=False)
+    bank.add_items([(eq, 0, (x - 20) / 10, 1.0) for eq, x in SOLUTIONS.items()])
+    monkeypatch.setattr(item_bank, "_item_bank", bank)
+    yield bank
+    bank._close()
+
+
+@pytest.fixture
+def slow_grading(monkeypatch):
+    """Grading takes a while, so answers sent together overlap."""
+    grade, grade_async = assessment_agent.grade_answer_safe, assessment_agent.grade_answer_safe_async
+
+    def slow(expected, answer):
+        time.sleep(0.05)
+        return grade(expected, answer)
+
+    async def slow_async(expected, answer):
+        await asyncio.sleep(0.05)
+        return await grade_async(expected, answer)
+
+    monkeypatch.setattr(assessment_agent, "grade_answer_safe", slow)
+    monkeypatch.setattr(assessment_agent, "grade_answer_safe_async", slow_async)
+
+
+def assert_one_item_per_answer(conn, user_id, answers):
+    result = load_memory(conn, user_id)["diagnostics"][-1]
+    asked = [q["expected_expr"] for q in result["per_question"]]
+    assert [q["q_index"] for q in result["per_question"]] == list(range(answers))
+    assert len(set(asked)) == len(asked) == answers
+    assert [q["expected"] for q in result["per_question"]] == [SOLUTIONS[eq] for eq in asked]
+
+
+def test_a_session_runs_to_max_items(conn):
+    agent = AssessmentAgent(conn)
+    question = agent.start_adaptive("u1", max_items=4, se_target=0.0)
+    for index in range(4):
+        assert question["q_index"] == index
+        out = agent.submit(question["session_id"], "3")
+        question = out["next_item"]
+    assert out["done"] and out["result"]["stop_reason"] == "max_items" and question is None
+    assert_one_item_per_answer(conn, "u1", 4)
+    with pytest.raises(KeyError):
+        agent.submit(out["session_id"], "3")
+
+
+def test_concurrent_submits_to_one_session_grade_each_item_once(conn, slow_grading):
+    agent = AssessmentAgent(conn)
+    session_id = agent.start_adaptive("u1", max_items=6, se_target=0.0)["session_id"]
+    gate = threading.Barrier(6)
+    outs, errors = [], []
+
+    def answer():
+        gate.wait()
+        try:
+            outs.append(agent.submit(session_id, "3"))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=answer) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sum(out["done"] for out in outs) == 1
+    assert_one_item_per_answer(conn, "u1", 6)
+
+
+def test_an_answer_after_the_last_one_is_rejected(conn, slow_grading):
+    agent = AssessmentAgent(conn)
+    session_id = agent.start_adaptive("u1", max_items=1, se_target=0.0)["session_id"]
+    gate = threading.Barrier(2)
+    outs, errors = [], []
+
+    def answer():
+        gate.wait()
+        try:
+            outs.append(agent.submit(session_id, "3"))
+        except ValueError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=answer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(outs) == len(errors) == 1
+    assert len(load_memory(conn, "u1")["diagnostics"]) == 1
+
+
+def test_concurrent_async_submits_grade_each_item_once(conn, slow_grading):
+    agent = AssessmentAgent(conn)
+    session_id = agent.start_adaptive("u1", max_items=5, se_target=0.0)["session_id"]
+
+    async def main():
+        return await asyncio.gather(*(agent.submit_async(session_id, "3") for _ in range(5)))
+
+    outs = asyncio.run(main())
+    assert sum(out["done"] for out in outs) == 1
+    assert_one_item_per_answer(conn, "u1", 5)
+
+
+def test_submit_many_and_submit_on_the_same_session_do_not_overlap(conn, slow_grading):
+    agent = AssessmentAgent(conn)
+    first = agent.start_adaptive("u1", max_items=2, se_target=0.0)["session_id"]
+    second = agent.start_adaptive("u2", max_items=2, se_target=0.0)["session_id"]
+    thread = threading.Thread(target=agent.submit, args=(first, "3"))
+    thread.start()
+    agent.submit_many({second: "3", first: "3"})
+    thread.join()
+    assert_one_item_per_answer(conn, "u1", 2)
+    assert "diagnostics" not in load_memory(conn, "u2")
@@ -0,0 +1,82 @@
+# tests/test_async.py
+"""run_io and the asyncio persistence and agent APIs: same results as the sync calls, off the loop."""
+import asyncio
+import threading
+
+from agents.assessment_agent import AssessmentAgent
+from agents.feedback_agent import FeedbackAgent
+from agents.quiz_agent import QuizAgent
+from tools import persistence
+from tools.persistence import (
+    apply_updates_async, delete_memory_async, get_path_async, load_memory, load_memory_async, run_io,
+    save_memory_async, update_memory_async,
+)
+
+LESSON = {"worked_example": {"equation_str": "2*x + 3 = 11", "features": ["non_unit_coefficient"]}}
+
+
+def test_run_io_runs_on_the_io_executor_and_passes_arguments():
+    async def main():
+        loop_thread = threading.current_thread().name
+        name, total = await run_io(lambda a, b=0: (threading.current_thread().name, a + b), 1, b=2)
+        return loop_thread, name, total
+
+    loop_thread, name, total = asyncio.run(main())
+    assert total == 3
+    assert name.startswith("memory-io") and name != loop_thread
+
+
+def test_async_persistence_round_trip(any_layout):
+    async def main():
+        await save_memory_async(any_layout, "u1", {"topic_mastery": {"linear_equations": 40}, "quizzes": []})
+        await apply_updates_async(any_layout, "u1", [("append", "quizzes", {"answers": None})])
+        await update_memory_async(any_layout, "u1", lambda m: dict(m, name="Ada"))
+        memory = await load_memory_async(any_layout, "u1")
+        mastery = await get_path_async(any_layout, "u1", "topic_mastery.linear_equations")
+        await delete_memory_async(any_layout, "u1")
+        return memory, mastery
+
+    memory, mastery = asyncio.run(main())
+    assert memory == {"topic_mastery": {"linear_equations": 40}, "quizzes": [{"answers": None}], "name": "Ada"}
+    assert mastery == 40
+    assert load_memory(any_layout, "u1") == {}
+
+
+def test_concurrent_async_saves_of_many_learners(conn):
+    async def main():
+        await asyncio.gather(*(save_memory_async(conn, f"u{u}", {"n": u}) for u in range(20)))
+        return await asyncio.gather(*(load_memory_async(conn, f"u{u}") for u in range(20)))
+
+    assert asyncio.run(main()) == [{"n": u} for u in range(20)]
+
+
+def test_async_diagnostic_matches_the_sync_one(conn):
+    agent = AssessmentAgent(conn)
+    answers = ["4", "x = 5", "2"]
+    expected = agent.run_diagnostic("sync", answers)
+    result = asyncio.run(agent.run_diagnostic_async("async", answers))
+    assert [q["correct"] for q in result["per_question"]] == [q["correct"] for q in expected["per_question"]]
+    assert result["score_percent"] == expected["score_percent"] == 66
+    persistence.memory_cache.clear()
+    assert load_memory(conn, "async")["diagnostics"][-1]["score_percent"] == 66
+    assert load_memory(conn, "async")["topic_mastery"]["linear_equations"] == 66
+
+
+def test_async_quiz_and_feedback_are_saved(conn):
+    quizzes, feedback = QuizAgent(conn), FeedbackAgent(conn)
+
+    async def main():
+        quiz = await quizzes.generate_quiz_async("u1", LESSON)
+        graded = await quizzes.grade_quiz_async("u1", quiz, ["4"])
+        report = await feedback.provide_feedback_async("u1", graded)
+        return quiz, graded, report
+
+    quiz, graded, report = asyncio.run(main())
+    assert quiz["questions"][0]["expected_expr"] == "2*x + 3 = 11"
+    assert graded["per_question"][0]["correct"]
+    assert graded["total_questions"] == len(quiz["questions"])
+    persistence.memory_cache.clear()
+    memory = load_memory(conn, "u1")
+    assert memory["last_quiz"]["answers"]["score_percent"] == graded["score_percent"]
+    assert memory["quizzes"][-1]["answers"]["score_percent"] == graded["score_percent"]
+    assert memory["feedbacks"][-1]["quiz_score"] == report["quiz_score"] == graded["score_percent"]
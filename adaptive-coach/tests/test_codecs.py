@@ -0,0 +1,57 @@
+# tests/test_codecs.py
+"""Memory row codecs: round trips, compression threshold, rows readable by JSON1 queries."""
+import json
+
+import pytest
+
+from tools import persistence
+from tools.persistence import (
+    CODECS, COMPRESS_MIN_BYTES, decode_memory, encode_memory, get_path, load_memory, save_memory, set_codec,
+)
+
+MEMORY = {
+    "name": "Zoë Student",
+    "topic_mastery": {"linear_equations": 55},
+    "preferences": {"learning_style": "visual", "difficulty_curve": None},
+    "quizzes": [{"quiz_meta": {"questions": [{"q": "Solve for x: 2*x + (-3) = 7"}]},
+                 "answers": {"score_percent": 66, "per_question": [{"correct": True}, {"correct": False}]}}] * 20,
+    "ratio": 0.5,
+}
+
+
+@pytest.fixture
+def codec():
+    yield set_codec
+    set_codec("json")
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_round_trip(name):
+    data = encode_memory(MEMORY, name)
+    assert decode_memory(data) == MEMORY
+    assert isinstance(data, str) == (name == "json")
+
+
+def test_small_documents_are_not_compressed():
+    small = {"name": "A"}
+    assert len(json.dumps(small)) < COMPRESS_MIN_BYTES
+    assert decode_memory(encode_memory(small, "json+zlib")) == small
+    assert encode_memory(small, "json+zlib")[1:] == json.dumps(small).encode("utf-8")
+
+
+def test_unknown_codec_and_tag_are_rejected():
+    with pytest.raises(ValueError):
+        encode_memory(MEMORY, "pickle")
+    with pytest.raises(ValueError):
+        decode_memory(b"\x7f{}")
+    assert decode_memory(None) == {}
+
+
+@pytest.mark.parametrize("name", CODECS)
+def test_rows_in_every_codec_stay_queryable(name, conn, codec):
+    codec(name)
+    save_memory(conn, "u1", MEMORY)
+    persistence.memory_cache.clear()
+    assert load_memory(conn, "u1") == MEMORY
+    assert get_path(conn, "u1", "quizzes[-1].answers.score_percent") == 66
+
@@ -0,0 +1,90 @@
+# tests/test_cohort.py
+"""Cohort analytics over learner_summary: overview, at_risk, percentiles and histograms, sharded or not."""
+import pytest
+
+from eval.cohort import at_risk, build_cohort_report, cohort_overview, histogram, percentiles
+from tools.persistence import ConnectionPool, ShardedStore, rebuild_summaries, save_memory
+
+MASTERY = {"u0": 5, "u1": 15, "u2": 35, "u3": 45, "u4": 55, "u5": 65, "u6": 75, "u7": 85, "u8": 95, "u9": 100}
+
+
+def learner(mastery, pre=None, post=None):
+    memory = {"topic_mastery": {"linear_equations": mastery}}
+    if pre is not None:
+        memory["diagnostics"] = [{"score_percent": 0}, {"score_percent": pre}]
+    if post is not None:
+        memory["last_quiz"] = {"quiz_meta": {}, "answers": {"score_percent": post}}
+    return memory
+
+
+@pytest.fixture(params=["single", "sharded"])
+def cohort(request, tmp_path):
+    if request.param == "single":
+        conn = ConnectionPool(str(tmp_path / "memory.db"), size=2)
+    else:
+        conn = ShardedStore([ConnectionPool(str(tmp_path / f"s{i}.db"), size=2) for i in range(3)])
+    for user_id, mastery in MASTERY.items():
+        save_memory(conn, user_id, learner(mastery, pre=mastery - 10, post=mastery + (5 if mastery < 50 else -5)))
+    save_memory(conn, "new", {"name": "not assessed yet"})
+    yield conn
+    conn.close()
+
+
+def test_overview(cohort):
+    overview = cohort_overview(cohort, at_risk_threshold=50)
+    assert overview["learners"] == 11
+    assert overview["with_mastery"] == 10
+    assert overview["avg_mastery"] == 57.5
+    assert overview["with_pre_and_post"] == 10
+    # pre = mastery - 10; post = mastery + 5 below 50, mastery - 5 above
+    assert overview["avg_delta"] == 9.0
+    assert overview["improved"] == 10
+    assert overview["at_risk"] == 4
+
+
+def test_at_risk_is_weakest_first_and_limited(cohort):
+    assert [(r["user_id"], r["mastery"]) for r in at_risk(cohort, threshold=50)] == [
+        ("u0", 5), ("u1", 15), ("u2", 35), ("u3", 45)]
+    assert [r["user_id"] for r in at_risk(cohort, threshold=50, limit=2)] == ["u0", "u1"]
+    assert [r["user_id"] for r in at_risk(cohort, threshold=10, include_unassessed=True)] == ["u0", "new"]
+    first = at_risk(cohort, threshold=10)[0]
+    assert (first["pre_score"], first["post_score"], first["delta"]) == (-5, 10, 15)
+
+
+def test_nearest_rank_percentiles(cohort):
+    assert percentiles(cohort, "mastery", (10, 25, 50, 75, 90, 100)) == {
+        10: 5, 25: 35, 50: 55, 75: 85, 90: 95, 100: 100}
+    assert percentiles(cohort, "delta", (50, 70)) == {50: 5, 70: 15}  # six learners at 5, four at 15
+
+
+def test_histogram_clamps_into_the_edge_buckets(cohort):
+    bins = histogram(cohort, "mastery", bins=5)
+    assert [(b["from"], b["to"], b["count"]) for b in bins] == [
+        (0, 20, 2), (20, 40, 1), (40, 60, 2), (60, 80, 2), (80, 100, 3)]
+    assert sum(b["count"] for b in histogram(cohort, "pre_score", bins=4)) == 10
+    assert histogram(cohort, "pre_score", bins=4)[0]["count"] == 2  # -5 is clamped into the first bin
+
+
+def test_empty_cohort_and_unknown_column(conn):
+    assert percentiles(conn, "mastery", (50,)) == {50: None}
+    assert cohort_overview(conn)["avg_mastery"] is None
+    with pytest.raises(ValueError):
+        histogram(conn, "data")
+
+
+def test_summaries_follow_writes_and_rebuilds(conn):
+    save_memory(conn, "u1", learner(20))
+    assert [r["mastery"] for r in at_risk(conn)] == [20]
+    save_memory(conn, "u1", learner(80))
+    assert at_risk(conn) == []
+    conn.execute("DELETE FROM learner_summary")
+    conn.commit()
+    rebuild_summaries(conn)
+    assert cohort_overview(conn)["avg_mastery"] == 80
+
+
+def test_report_mentions_the_at_risk_learners(cohort):
+    report = build_cohort_report(cohort, threshold=20)
+    assert "Learners: 11 (10 with stored mastery)" in report
+    assert "At risk (mastery < 20%): 2" in report
+    assert "  - u0: 5%" in report
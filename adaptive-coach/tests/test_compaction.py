@@ -0,0 +1,94 @@
+# tests/test_compaction.py
+"""History compaction: what moves, what stays readable, and concurrent writes during it."""
+import pytest
+
+from tools import compaction
+from tools.compaction import RetentionPolicy, compact_all, compact_memory, iter_full_history, load_history
+from tools.persistence import apply_updates, load_memory, save_memory
+
+POLICY = RetentionPolicy(keep_last=5, min_batch=3)
+
+
+def learner(sessions: int):
+    return {
+        "name": "Long-term Student",
+        "topic_mastery": {"linear_equations": 60},
+        "diagnostics": [{"score_percent": i % 101, "timestamp": f"2025-01-{i % 28 + 1:02d}T00:00:00Z"}
+                        for i in range(sessions)],
+        "quizzes": [{"quiz_meta": {"created_at": f"2025-02-{i % 28 + 1:02d}T00:00:00Z"},
+                     "answers": {"score_percent": (10 * i) % 101}} for i in range(sessions)],
+        "lessons": [],
+        "feedbacks": [],
+    }
+
+
+def test_compaction_moves_old_entries_and_keeps_full_history(any_layout):
+    memory = learner(12)
+    save_memory(any_layout, "u1", memory)
+
+    assert compact_memory(any_layout, "u1", POLICY) == {"diagnostics": 7, "quizzes": 7}
+    hot = load_memory(any_layout, "u1")
+    assert hot["diagnostics"] == memory["diagnostics"][-5:]
+    assert hot["quizzes"] == memory["quizzes"][-5:]
+    summary = hot["history_summary"]["quizzes"]
+    assert summary["archived"] == 7
+    assert summary["by_topic"]["linear_equations"]["score_sum"] == sum(
+        q["answers"]["score_percent"] for q in memory["quizzes"][:7])
+    assert load_history(any_layout, "u1", "diagnostics") == memory["diagnostics"]
+    assert load_history(any_layout, "u1", "quizzes") == memory["quizzes"]
+
+
+def test_compaction_below_min_batch_does_nothing(any_layout):
+    save_memory(any_layout, "u1", learner(7))
+    assert compact_memory(any_layout, "u1", POLICY) == {}
+    assert len(load_memory(any_layout, "u1")["diagnostics"]) == 7
+
+
+def test_repeated_compaction_appends_to_the_archive(any_layout):
+    memory = learner(10)
+    save_memory(any_layout, "u1", memory)
+    compact_memory(any_layout, "u1", POLICY)
+    extra = [{"score_percent": 99, "timestamp": "2025-03-01T00:00:00Z"}] * 4
+    for entry in extra:
+        apply_updates(any_layout, "u1", [("append", "diagnostics", entry)])
+
+    assert compact_memory(any_layout, "u1", POLICY)["diagnostics"] == 4
+    assert load_history(any_layout, "u1", "diagnostics") == memory["diagnostics"] + extra
+    assert load_memory(any_layout, "u1")["history_summary"]["diagnostics"]["archived"] == 9
+
+
+def test_write_during_compaction_is_kept(any_layout, monkeypatch):
+    """A write between compaction's read and its write makes it redo the work, not drop the write."""
+    save_memory(any_layout, "u1", learner(12))
+    read = compaction.load_memory_versioned
+    interfered = []
+
+    def read_then_interfere(conn, user_id):
+        snapshot = read(conn, user_id)
+        if not interfered:
+            interfered.append(1)
+            apply_updates(any_layout, user_id, [("append", "diagnostics", {"score_percent": 77}),
+                                                ("set", "topic_mastery.linear_equations", 80)])
+        return snapshot
+
+    monkeypatch.setattr(compaction, "load_memory_versioned", read_then_interfere)
+    assert compact_memory(any_layout, "u1", POLICY) == {"diagnostics": 8, "quizzes": 7}
+    hot = load_memory(any_layout, "u1")
+    assert hot["topic_mastery"]["linear_equations"] == 80
+    assert hot["diagnostics"][-1] == {"score_percent": 77}
+    assert len(load_history(any_layout, "u1", "diagnostics")) == 13
+
+
+def test_compact_all_and_iter_full_history(any_layout):
+    for u in range(3):
+        save_memory(any_layout, f"u{u}", learner(6 + 3 * u))
+
+    assert set(compact_all(any_layout, POLICY)) == {"u1", "u2"}
+    entries = list(iter_full_history(any_layout, "quizzes"))
+    assert sorted(user_id for user_id, _ in entries) == ["u0"] * 6 + ["u1"] * 9 + ["u2"] * 12
+    assert [e for user_id, e in entries if user_id == "u2"] == learner(12)["quizzes"]
+
+
+def test_unknown_history_key_is_rejected(conn):
+    with pytest.raises(ValueError):
+        load_history(conn, "u1", "notes")
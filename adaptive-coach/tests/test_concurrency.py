@@ -0,0 +1,140 @@
+# tests/test_concurrency.py
+"""Optimistic concurrency: version checks, retry_on_conflict, update_memory, guarded reads."""
+import sqlite3
+import threading
+
+import pytest
+
+from tools.persistence import (
+    ConnectionPool, VersionConflict, apply_updates, concurrency_stats, get_path, get_paths_versioned,
+    get_version, load_memory, load_memory_versioned, retry_on_conflict, save_memory, set_path, update_memory,
+)
+from agents.quiz_agent import QuizAgent
+
+
+def test_save_with_stale_version_raises_and_keeps_newer_write(any_layout):
+    save_memory(any_layout, "u1", {"name": "A", "topic_mastery": {"linear_equations": 10}})
+    memory, version = load_memory_versioned(any_layout, "u1")
+    set_path(any_layout, "u1", "topic_mastery.linear_equations", 50)
+
+    memory["topic_mastery"]["linear_equations"] = 99
+    with pytest.raises(VersionConflict):
+        save_memory(any_layout, "u1", memory, expected_version=version)
+    assert load_memory(any_layout, "u1")["topic_mastery"]["linear_equations"] == 50
+
+
+def test_save_with_current_version_bumps_it(any_layout):
+    save_memory(any_layout, "u1", {"name": "A"})
+    memory, version = load_memory_versioned(any_layout, "u1")
+    memory["name"] = "B"
+    save_memory(any_layout, "u1", memory, expected_version=version)
+    assert get_version(any_layout, "u1") == version + 1
+    assert load_memory(any_layout, "u1")["name"] == "B"
+
+
+def test_expected_version_zero_only_creates(conn):
+    save_memory(conn, "new", {"name": "A"}, expected_version=0)
+    with pytest.raises(VersionConflict):
+        save_memory(conn, "new", {"name": "B"}, expected_version=0)
+    assert load_memory(conn, "new")["name"] == "A"
+
+
+def test_apply_updates_with_stale_version_changes_nothing(any_layout):
+    save_memory(any_layout, "u1", {"quizzes": [], "topic_mastery": {"linear_equations": 10}})
+    version = get_version(any_layout, "u1")
+    apply_updates(any_layout, "u1", [("set", "topic_mastery.linear_equations", 20)])
+    with pytest.raises(VersionConflict):
+        apply_updates(any_layout, "u1", [("append", "quizzes", {"answers": None}),
+                                         ("set", "topic_mastery.linear_equations", 30)],
+                      expected_version=version)
+    memory = load_memory(any_layout, "u1")
+    assert memory["topic_mastery"]["linear_equations"] == 20
+    assert memory["quizzes"] == []
+
+
+def test_retry_on_conflict_reruns_until_it_commits():
+    calls = []
+    before = concurrency_stats()["retries"]
+
+    def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise VersionConflict("u1", len(calls))
+        return "done"
+
+    assert retry_on_conflict(attempt, retries=5, backoff=0) == "done"
+    assert len(calls) == 3
+    assert concurrency_stats()["retries"] - before == 2
+
+
+def test_retry_on_conflict_gives_up_after_retries():
+    calls = []
+    before = concurrency_stats()["gave_up"]
+
+    def attempt():
+        calls.append(1)
+        raise VersionConflict("u1", 1)
+
+    with pytest.raises(VersionConflict):
+        retry_on_conflict(attempt, retries=2, backoff=0)
+    assert len(calls) == 3
+    assert concurrency_stats()["gave_up"] - before == 1
+
+
+def test_update_memory_loses_no_concurrent_increment(db_path):
+    threads, increments = 8, 25
+    pool = ConnectionPool(db_path, size=threads)
+    save_memory(pool, "shared", {"counter": 0})
+    gate = threading.Barrier(threads)
+    errors = []
+
+    def increment(memory):
+        memory["counter"] += 1
+
+    def worker():
+        gate.wait()
+        try:
+            for _ in range(increments):
+                update_memory(pool, "shared", increment)
+        except Exception as e:  # surfaced after join
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert not errors
+    assert load_memory(pool, "shared")["counter"] == threads * increments
+    pool.close()
+
+
+def test_guarded_read_ignores_a_stale_cached_value(conn, db_path):
+    save_memory(conn, "u1", {"topic_mastery": {"linear_equations": 20}})
+    assert get_path(conn, "u1", "topic_mastery.linear_equations") == 20  # now cached
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE memory SET data=json_set(data, '$.topic_mastery.linear_equations', 90), "
+                  "version=version+1 WHERE user_id='u1'")
+    other.commit()
+    other.close()
+
+    (mastery,), version = get_paths_versioned(conn, "u1", ["topic_mastery.linear_equations"])
+    assert (mastery, version) == (90, 2)
+
+
+def test_graded_quiz_builds_on_the_stored_mastery(conn, db_path):
+    quiz = {"questions": [{"q": "Solve for x: 2*x + 3 = 11", "expected_expr": "2*x + 3 = 11"}]}
+    save_memory(conn, "u1", {"topic_mastery": {"linear_equations": 20},
+                             "quizzes": [{"quiz_meta": quiz, "answers": None}],
+                             "last_quiz": {"quiz_meta": quiz, "answers": None}})
+    assert load_memory(conn, "u1")["topic_mastery"]["linear_equations"] == 20  # now cached
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE memory SET data=json_set(data, '$.topic_mastery.linear_equations', 90), "
+                  "version=version+1 WHERE user_id='u1'")
+    other.commit()
+    other.close()
+
+    assert QuizAgent(conn=conn)._save_graded("u1", quiz, {"score_percent": 100}) == 95
+    memory = load_memory(conn, "u1")
+    assert memory["topic_mastery"]["linear_equations"] == 95
+    assert memory["quizzes"][-1]["answers"] == {"score_percent": 100}
@@ -0,0 +1,98 @@
+# tests/test_connection_pool.py
+"""ConnectionPool: readers alongside the writer, one writer at a time, bounded readers."""
+import threading
+
+import pytest
+
+from tools.persistence import ConnectionPool, load_memory, reading, save_memory
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(db_path, size=2, timeout=0.5)
+    yield pool
+    pool.close()
+
+
+def test_readers_see_committed_data_while_a_write_is_open(pool):
+    save_memory(pool, "u1", {"n": 1})
+    with pool.writer() as w:
+        w.execute("UPDATE memory SET data='{\"n\": 2}' WHERE user_id='u1'")
+        with pool.reader() as r:  # WAL: no wait for the open write transaction
+            assert r.execute("SELECT data FROM memory WHERE user_id='u1'").fetchone()[0] == '{"n": 1}'
+        w.commit()
+    with pool.reader() as r:
+        assert r.execute("SELECT data FROM memory WHERE user_id='u1'").fetchone()[0] == '{"n": 2}'
+
+
+def test_writers_never_overlap(pool):
+    inside, overlaps = [0], []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            with pool.writer():
+                with lock:
+                    inside[0] += 1
+                    overlaps.append(inside[0])
+                with lock:
+                    inside[0] -= 1
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(overlaps) == 1
+    assert pool.stats()["write_checkouts"] >= 80
+
+
+def test_nested_reads_reuse_the_thread_connection(pool):
+    with pool.reader() as outer:
+        with reading(pool) as inner:
+            assert inner is outer
+
+
+def test_readers_are_bounded_by_size(pool):
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with pool.reader():
+            held.set()
+            release.wait()
+
+    holders = [threading.Thread(target=hold) for _ in range(2)]
+    for t in holders:
+        t.start()
+        held.wait()
+        held.clear()
+    with pytest.raises(TimeoutError):
+        with pool.reader():
+            pass
+    release.set()
+    for t in holders:
+        t.join()
+    assert pool.stats()["timeouts"] == 1
+    assert pool.stats()["readers_open"] == 2
+
+
+def test_concurrent_sessions_on_different_learners(db_path):
+    pool = ConnectionPool(db_path, size=4)
+    errors = []
+
+    def session(u):
+        try:
+            for n in range(20):
+                save_memory(pool, f"u{u}", {"n": n})
+                assert load_memory(pool, f"u{u}") == {"n": n}
+        except Exception as e:  # surfaced after join
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(u,)) for u in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert all(load_memory(pool, f"u{u}") == {"n": 19} for u in range(8))
+    pool.close()
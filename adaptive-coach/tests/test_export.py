@@ -0,0 +1,83 @@
+# tests/test_export.py
+"""Streaming NDJSON export/import: round trips across codecs and layouts, resume offsets, CLI."""
+import io
+import json
+
+import pytest
+
+from tools.persistence import CODECS, export_ndjson, import_ndjson, init_db, load_memory, main, save_memory, set_codec
+
+
+def memory(i: int):
+    return {"name": f"Student {i}", "topic_mastery": {"linear_equations": i},
+            "quizzes": [{"quiz_meta": {}, "answers": {"score_percent": i}}], "note": "ünïcode"}
+
+
+@pytest.fixture
+def codec():
+    yield set_codec
+    set_codec("json")
+
+
+def test_round_trip_across_codecs_into_the_normalized_layout(tmp_path, codec):
+    source = init_db(str(tmp_path / "source.db"))
+    for i, name in enumerate(CODECS):
+        codec(name)
+        save_memory(source, f"u{i}", memory(i))
+    out = io.StringIO()
+    assert export_ndjson(source, out, progress=None)["records"] == len(CODECS)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [(line["user_id"], line["data"]) for line in lines] == [(f"u{i}", memory(i)) for i in range(len(CODECS))]
+
+    codec("json")
+    target = init_db(str(tmp_path / "target.db"), normalized=True)
+    assert import_ndjson(target, io.StringIO(out.getvalue()), progress=None)["records"] == len(CODECS)
+    assert [load_memory(target, f"u{i}") for i in range(len(CODECS))] == [memory(i) for i in range(len(CODECS))]
+    source.close()
+    target.close()
+
+
+def test_normalized_learners_export_as_whole_documents(tmp_path):
+    conn = init_db(str(tmp_path / "n.db"), normalized=True)
+    save_memory(conn, "u1", memory(1))
+    out = io.StringIO()
+    export_ndjson(conn, out, progress=None)
+    assert json.loads(out.getvalue())["data"] == memory(1)
+    conn.close()
+
+
+def test_interrupted_export_and_import_resume_from_the_offset(tmp_path):
+    source = init_db(str(tmp_path / "source.db"))
+    for i in range(7):
+        save_memory(source, f"u{i}", memory(i))
+    path = str(tmp_path / "backup.ndjson")
+    progress = []
+    first = export_ndjson(source, path, batch_size=2, progress=lambda done, _: progress.append(done),
+                          progress_every=3)
+    assert (first["records"], progress) == (7, [3, 6])
+
+    # an export that stopped after 3 learners, resumed by appending
+    partial = str(tmp_path / "partial.ndjson")
+    with open(path) as f, open(partial, "w") as g:
+        g.writelines(f.readlines()[:3])
+    assert export_ndjson(source, partial, offset=3, progress=None)["next_offset"] == 7
+    assert open(partial).read() == open(path).read()
+
+    target = init_db(str(tmp_path / "target.db"))
+    import_ndjson(target, path, batch_size=3, progress=None)
+    assert import_ndjson(target, path, offset=5, progress=None)["records"] == 2
+    assert [load_memory(target, f"u{i}") for i in range(7)] == [memory(i) for i in range(7)]
+    source.close()
+    target.close()
+
+
+def test_gzip_files_through_the_cli(tmp_path, capsys):
+    db, copy_db = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    conn = init_db(db)
+    save_memory(conn, "u1", memory(1))
+    conn.close()
+    backup = str(tmp_path / "backup.ndjson.gz")
+    main(["export", backup, "--db", db])
+    assert json.loads(capsys.readouterr().out.strip().splitlines()[-1])["records"] == 1
+    main(["import", backup, "--db", copy_db])
+    assert load_memory(init_db(copy_db), "u1") == memory(1)
@@ -0,0 +1,52 @@
+# tests/test_grade_batch.py
+"""grade_batch / run_diagnostic_batch give exactly what grade_answer / run_diagnostic give, one by one."""
+import random
+
+import numpy as np
+import pytest
+
+from agents.assessment_agent import AssessmentAgent
+from tools import persistence
+from tools.code_executor import grade_answer, grade_batch, grades_from_batch
+from tools.persistence import load_memory
+
+EXPECTED = ["2*x + 3 = 11", "5x - 4 = 21", "3*x + 9 = 0", "x**2 = 4", "7", "1/2", "x = x", "2*x + = 3"]
+ANSWERS = ["4", "x = 5", "-3", "2", "7.0", "0.5", "", "abc", "1/2", " X=4 ", "4.0000001", "3**2", "-2", "1e400"]
+
+
+def test_a_class_grades_like_grade_answer_one_by_one():
+    rng = random.Random(7)
+    answers = [[rng.choice(ANSWERS) for _ in EXPECTED] for _ in range(40)]
+    batch = grade_batch(EXPECTED, answers)
+    assert batch["correct"].shape == batch["expected"].shape == batch["user"].shape == (40, len(EXPECTED))
+    for row, learner in enumerate(answers):
+        assert grades_from_batch(batch, row) == [grade_answer(e, a) for e, a in zip(EXPECTED, learner)]
+
+
+def test_one_learner_and_the_tolerance():
+    answers = ["4.0000001", "5", "-3.1", "-2", "7", "0.5", "1", "3"]
+    batch = grade_batch(EXPECTED, answers, tolerance=1e-3)
+    assert grades_from_batch(batch) == [grade_answer(e, a, tolerance=1e-3) for e, a in zip(EXPECTED, answers)]
+    assert batch["correct"].tolist()[:3] == [True, True, False]
+    assert np.isnan(batch["expected"][-1])  # unsolvable: None in grade_answer
+
+
+def test_shapes_are_checked():
+    assert grade_batch(EXPECTED, [])["correct"].shape == (0, len(EXPECTED))
+    with pytest.raises(ValueError):
+        grade_batch(EXPECTED, [["4"] * (len(EXPECTED) - 1)])
+
+
+def test_run_diagnostic_batch_matches_run_diagnostic(conn):
+    agent = AssessmentAgent(conn)
+    answers = {"a": ["4", "5", "-3"], "b": ["x=4", "abc"], "c": [], "d": ["9**9**9", "5", "-3"]}
+    results = agent.run_diagnostic_batch(answers)
+    assert list(results) == list(answers)
+    for user_id, learner in answers.items():
+        single = agent.run_diagnostic(f"single-{user_id}", learner)
+        strip = lambda r: [(q["correct"], q["expected"], q["user_answer_parsed"]) for q in r["per_question"]]
+        assert strip(results[user_id]) == strip(single)
+        assert results[user_id]["score_percent"] == single["score_percent"]
+    persistence.memory_cache.clear()
+    assert load_memory(conn, "a")["diagnostics"][-1]["score_percent"] == 100
+    assert load_memory(conn, "d")["topic_mastery"]["linear_equations"] == 66
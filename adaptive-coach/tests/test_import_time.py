@@ -0,0 +1,65 @@
+# tests/test_import_time.py
+"""
+Import-time budget: a cold `import api` (streamlit_app/api.py) must stay under
+COACH_IMPORT_BUDGET_MS and must not pull in the libraries deferred until first use.
+
+Each measurement is a fresh interpreter run with `python -X importtime -c "import api"`,
+whose stderr lines
+    import time: self [us] | cumulative | imported package
+are parsed. A warm-up run writes the bytecode caches first, so the number is a normal
+process start (what every run_demo.py stage and streamlit worker pays), and the best of
+a few runs is compared with the budget to keep a busy machine from failing the test.
+"""
+import os
+import re
+import subprocess
+import sys
+from typing import List, Tuple
+
+import pytest
+
+IMPORT_BUDGET_MS = float(os.environ.get("COACH_IMPORT_BUDGET_MS", "300"))
+RUNS = 3
+# imported on first use only (utils.lazy, observability.tracing.get_tracer, app.py chart)
+DEFERRED = ("sympy", "numpy", "opentelemetry", "pandas", "rich")
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app")
+_LINE = re.compile(r"^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|(?P<indent>\s+)(?P<name>\S+)\s*$")
+
+
+def measure(module: str = "api") -> List[Tuple[str, int, int]]:
+    """(module, depth, cumulative_us) for every line of a cold import's -X importtime output."""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=APP_DIR, env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, f"import {module} failed:\n{proc.stderr[-2000:]}"
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m.group("name"), (len(m.group("indent")) - 1) // 2, int(m.group("cumulative"))))
+    return rows
+
+
+def total_ms(rows: List[Tuple[str, int, int]], module: str = "api") -> float:
+    return next(cum for name, depth, cum in rows if name == module and depth == 0) / 1e3
+
+
+@pytest.fixture(scope="module")
+def samples():
+    measure()  # warm-up: write bytecode caches
+    return [measure() for _ in range(RUNS)]
+
+
+def test_cold_import_stays_under_budget(samples):
+    best = min(samples, key=total_ms)
+    heaviest = sorted((r for r in best if r[1] <= 1 and r[0] != "api"), key=lambda r: -r[2])[:5]
+    assert total_ms(best) <= IMPORT_BUDGET_MS, (
+        f"import api took {total_ms(best):.1f} ms (budget {IMPORT_BUDGET_MS:.0f} ms); heaviest: "
+        + ", ".join(f"{name} {cum / 1e3:.1f} ms" for name, _, cum in heaviest))
+
+
+def test_deferred_libraries_are_not_imported_at_startup(samples):
+    imported = {name for name, _, _ in samples[0]}
+    assert sorted(imported.intersection(DEFERRED)) == []
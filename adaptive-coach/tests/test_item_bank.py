@@ -0,0 +1,88 @@
+# tests/test_item_bank.py
+"""Item selection (against an exhaustive search) and recalibration from stored history."""
+import random
+
+import pytest
+
+from tools.compaction import RetentionPolicy, compact_all
+from tools.item_bank import QUESTION_PREFIX, ItemBank, information
+from tools.persistence import save_memory
+from tools.problem_bank import FEATURES
+
+
+def synthetic_items(n: int = 300, seed: int = 3):
+    """(equation, feature mask, difficulty, discrimination) rows with spread-out parameters."""
+    rng = random.Random(seed)
+    return [(f"{i + 2}*x + {i} = {3 * i + 4}", rng.randrange(1 << len(FEATURES)),
+             rng.gauss(0.0, 1.5), rng.lognormvariate(0.0, 0.4)) for i in range(n)]
+
+
+@pytest.fixture
+def bank(tmp_path):
+    bank = ItemBank(str(tmp_path / "items.db"), seed=False)
+    bank.add_items(synthetic_items())
+    yield bank
+    bank._close()
+
+
+def exhaustive(items, theta, k, exclude=(), want=0, care=0):
+    ranked = sorted(((information(theta, b, a), eq) for eq, mask, b, a in items
+                     if eq not in exclude and mask & care == want), reverse=True)
+    return [eq for _, eq in ranked[:k]]
+
+
+@pytest.mark.parametrize("theta", [-3.0, -0.7, 0.0, 0.4, 2.5])
+def test_select_matches_exhaustive_search(bank, theta):
+    picked = bank.select(theta, k=3, window=50)
+    assert [item["equation"] for item in picked] == exhaustive(synthetic_items(), theta, 3)
+    infos = [item["information"] for item in picked]
+    assert infos == sorted(infos, reverse=True)
+
+
+def test_default_window_is_close_to_the_maximum(bank):
+    items = synthetic_items()
+    for theta in (-2.0, -0.5, 0.5, 2.0):
+        best = max(information(theta, b, a) for _, _, b, a in items)
+        assert bank.select(theta)[0]["information"] >= 0.95 * best
+
+
+def test_select_skips_excluded_equations(bank):
+    items = synthetic_items()
+    first = exhaustive(items, 0.3, 2)
+    picked = bank.select(0.3, k=2, exclude=first, window=50)
+    assert [item["equation"] for item in picked] == exhaustive(items, 0.3, 2, exclude=first)
+
+
+def test_select_honours_feature_filters(bank):
+    negative, unit = 1 << FEATURES.index("negative_constant"), 1 << FEATURES.index("non_unit_coefficient")
+    picked = bank.select(0.0, k=4, features={"negative_constant": True, "non_unit_coefficient": False}, window=50)
+    assert [item["equation"] for item in picked] == exhaustive(
+        synthetic_items(), 0.0, 4, want=negative, care=negative | unit)
+    for item in picked:
+        assert "negative_constant" in item["features"] and "non_unit_coefficient" not in item["features"]
+    with pytest.raises(ValueError):
+        bank.select(0.0, features={"hard": True})
+
+
+def test_select_returns_fewer_when_the_bank_runs_out(tmp_path):
+    small = ItemBank(str(tmp_path / "small.db"), seed=False)
+    small.add_items(synthetic_items(2))
+    assert len(small.select(0.0, k=5)) == 2
+    assert small.select(0.0, k=1, exclude=[eq for eq, _, _, _ in synthetic_items(2)]) == []
+    small._close()
+
+
+def test_recalibrate_counts_archived_responses(bank, conn):
+    rng = random.Random(5)
+    items = synthetic_items()[:30]
+    for u in range(10):
+        quizzes = [{"quiz_meta": {}, "answers": {"per_question": [
+            {"q_index": q, "question": QUESTION_PREFIX + eq, "correct": rng.random() < 0.6}
+            for q, (eq, _, _, _) in enumerate(rng.sample(items, 3))]}} for _ in range(8)]
+        save_memory(conn, f"learner_{u}", {"quizzes": quizzes})
+    compact_all(conn, RetentionPolicy(keep_last=2, min_batch=1))
+
+    summary = bank.recalibrate(conn)
+    assert summary["responses"] == 10 * 8 * 3
+    assert summary["learners"] == 10
+    assert 0 < summary["items"] <= 30
@@ -0,0 +1,102 @@
+# tests/test_lesson_cache.py
+"""LessonTemplateCache: TTL, LRU eviction, single-flight builds, copies, and sharing across learners."""
+import threading
+import time
+
+import pytest
+
+from agents import lesson_agent
+from agents.lesson_agent import LessonAgent, LessonTemplateCache, configure_lesson_cache, lesson_cache_stats
+
+KEY = ("linear_equations", "basic", "visual", "normal", False)
+
+
+class Builder:
+    def __init__(self, cacheable=True, delay=0.0):
+        self.calls = 0
+        self.cacheable = cacheable
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.delay)
+        return {"text": f"build {n}", "objectives": ["a"]}, self.cacheable
+
+
+def test_hits_return_copies_of_the_stored_template():
+    cache, build = LessonTemplateCache(max_entries=4, ttl=60), Builder()
+    first, hit = cache.get_or_build(KEY, build)
+    assert not hit
+    first["objectives"].append("changed by the caller")
+    second, hit = cache.get_or_build(KEY, build)
+    assert hit and second == {"text": "build 1", "objectives": ["a"]}
+    assert build.calls == 1
+
+
+def test_expired_templates_are_rebuilt():
+    cache, build = LessonTemplateCache(max_entries=4, ttl=0.05), Builder()
+    cache.get_or_build(KEY, build)
+    time.sleep(0.1)
+    assert cache.get(KEY) is None
+    assert cache.get_or_build(KEY, build) == ({"text": "build 2", "objectives": ["a"]}, False)
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_templates_are_evicted():
+    cache, build = LessonTemplateCache(max_entries=2, ttl=60), Builder()
+    for key in ("a", "b", "a", "c"):
+        cache.get_or_build(key, build)
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_failed_builds_are_not_stored_and_zero_entries_disables_the_cache():
+    cache, build = LessonTemplateCache(max_entries=4, ttl=60), Builder(cacheable=False)
+    cache.get_or_build(KEY, build)
+    cache.get_or_build(KEY, build)
+    assert build.calls == 2
+    disabled, build = LessonTemplateCache(max_entries=0), Builder()
+    disabled.get_or_build(KEY, build)
+    disabled.get_or_build(KEY, build)
+    assert build.calls == 2 and disabled.stats()["entries"] == 0
+
+
+def test_concurrent_misses_build_once():
+    cache, build = LessonTemplateCache(max_entries=4, ttl=60), Builder(delay=0.2)
+    gate = threading.Barrier(8)
+    results = []
+
+    def request():
+        gate.wait()
+        results.append(cache.get_or_build(KEY, build))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert build.calls == 1
+    assert [template for template, _ in results] == [{"text": "build 1", "objectives": ["a"]}] * 8
+    assert sorted(hit for _, hit in results) == [False] + [True] * 7
+
+
+@pytest.fixture
+def shared_cache():
+    yield configure_lesson_cache(max_entries=8, ttl=60)
+    configure_lesson_cache()
+
+
+def test_learners_in_one_tier_share_a_template(conn, shared_cache):
+    calls = []
+    agent = LessonAgent(conn, llm_hook=lambda text: calls.append(text) or text.upper())
+    first = agent.plan("u1", [{"score_percent": 30}], {"learning_style": "visual"})
+    second = agent.plan("u2", [{"score_percent": 40}], {"learning_style": "visual"})
+    other = agent.plan("u3", [{"score_percent": 90}], {"learning_style": "visual"})
+    assert first["expanded_explanation"] == second["expanded_explanation"]
+    assert first["difficulty"] == second["difficulty"] != other["difficulty"]
+    assert lesson_cache_stats()["hits"] == 1 and lesson_cache_stats()["builds"] == 2
+    assert len(calls) <= 2
+    assert lesson_agent.lesson_template_cache is shared_cache
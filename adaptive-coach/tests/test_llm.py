@@ -0,0 +1,151 @@
+# tests/test_llm.py
+"""LLMExecutor: batching, caching, timeouts, the circuit breaker, streams, and per-hook executors."""
+import gc
+import threading
+import time
+import weakref
+
+from tools import llm
+from tools.llm import CallableBackend, CircuitBreaker, LLMExecutor, LLMUnavailable, executor_for
+
+
+class Backend:
+    """Upper-cases prompts after a delay; records every call; fails while .failing is set."""
+
+    supports_batch = False
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.failing = False
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _run(self, prompts):
+        with self._lock:
+            self.calls.append(list(prompts))
+        time.sleep(self.delay)
+        if self.failing:
+            raise LLMUnavailable("down")
+        return [p.upper() for p in prompts]
+
+    def complete(self, prompt):
+        return self._run([prompt])[0]
+
+
+class BatchBackend(Backend):
+    supports_batch = True
+
+    def complete_batch(self, prompts):
+        return self._run(prompts)
+
+
+def test_prompts_arriving_together_go_out_as_one_batch():
+    backend = BatchBackend()
+    executor = LLMExecutor(backend, max_batch=8, batch_window=0.05)
+    prompts = [f"prompt {i}" for i in range(8)]
+    assert executor.expand_many(prompts, timeout=5) == [p.upper() for p in prompts]
+    assert [len(c) for c in backend.calls] == [8]
+    assert executor.stats()["batches"] == 1
+    executor.close()
+
+
+def test_identical_prompts_share_one_call_and_the_cache():
+    backend = Backend(delay=0.1)
+    executor = LLMExecutor(backend)
+    assert executor.expand_many(["a  b", " a b "], timeout=5) == ["A  B", "A  B"]
+    assert executor.expand("a\nb") == "A  B"
+    assert len(backend.calls) == 1
+    assert executor.stats()["cache_hits"] == 2
+    executor.close()
+
+
+def test_a_slow_call_gives_the_fallback_and_still_fills_the_cache():
+    backend = Backend(delay=0.3)
+    executor = LLMExecutor(backend)
+    assert executor.expand("slow", fallback="fallback", timeout=0.05) == "fallback"
+    assert executor.stats()["timeouts"] == 1
+    time.sleep(0.4)
+    assert executor.expand("slow", timeout=0.05) == "SLOW"
+    assert len(backend.calls) == 1
+    executor.close()
+
+
+def test_the_breaker_opens_after_repeated_failures_and_recovers():
+    backend = Backend()
+    backend.failing = True
+    executor = LLMExecutor(backend, breaker=CircuitBreaker(threshold=3, reset_after=0.2))
+    assert [executor.expand(f"p{i}", fallback="-") for i in range(5)] == ["-"] * 5
+    stats = executor.stats()
+    assert (len(backend.calls), stats["errors"], stats["short_circuited"], stats["breaker"]) == (3, 3, 2, "open")
+
+    time.sleep(0.25)
+    backend.failing = False
+    assert executor.breaker.state == "half-open"
+    assert executor.expand("trial") == "TRIAL"
+    assert executor.breaker.state == "closed"
+    executor.close()
+
+
+def test_streams_yield_chunks_and_the_full_text():
+    def hook(prompt):
+        return prompt.upper()
+    hook.stream = lambda prompt: iter(["one ", "two"])
+    executor = LLMExecutor(CallableBackend(hook))
+    stream = executor.stream("p")
+    assert list(stream) == ["one ", "two"] and stream.text == "one two"
+    assert list(executor.stream("p")) == ["one two"]  # cached: one chunk
+    executor.close()
+
+
+def test_hooks_share_an_executor():
+    def hook(prompt):
+        return prompt
+
+    class Model:
+        def __call__(self, prompt):
+            return prompt
+
+        def complete(self, prompt):
+            return prompt
+
+        __eq__ = lambda self, other: self is other  # defining __eq__ makes instances unhashable
+
+    model = Model()
+    assert executor_for(hook) is executor_for(hook)
+    assert executor_for(model.complete) is executor_for(model.complete)
+    assert executor_for(model) is executor_for(model)
+    assert executor_for(model).expand("x") == "x"
+
+
+def threads_named(prefix):
+    return [t for t in threading.enumerate() if t.name.startswith(prefix)]
+
+
+def test_executors_of_collected_hooks_are_released():
+    gc.collect()
+    before_threads, before_entries = len(threads_named("llm")), len(llm._by_hook)
+    hooks = [lambda prompt, i=i: f"{prompt} {i}" for i in range(20)]
+    executors = [executor_for(hook) for hook in hooks]
+    assert [e.expand("p", timeout=5) for e in executors] == [f"p {i}" for i in range(20)]
+    assert len(llm._by_hook) == before_entries + 20
+    refs = [weakref.ref(e) for e in executors]
+
+    del hooks, executors
+    gc.collect()
+    assert len(llm._by_hook) == before_entries
+    assert all(ref() is None for ref in refs)
+    deadline = time.monotonic() + 5.0
+    while len(threads_named("llm")) > before_threads and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert len(threads_named("llm")) == before_threads
+
+
+def test_a_released_hook_gives_the_fallback():
+    def hook(prompt):
+        return prompt
+
+    executor = executor_for(hook)
+    backend = executor.backend
+    del hook
+    gc.collect()
+    assert LLMExecutor(backend).expand("p", fallback="-") == "-"
@@ -0,0 +1,66 @@
+# tests/test_mastery_series.py
+"""Mastery time series: points recorded by topic_mastery writes, range queries and bucketing."""
+import pytest
+
+from tools.persistence import apply_updates, mastery_series, record_mastery, save_memory, set_path
+
+# 2026-10-12 is a Monday
+POINTS = [
+    ("2026-10-12T09:10:00Z", 10), ("2026-10-12T09:50:00Z", 20), ("2026-10-12T15:00:00Z", 30),
+    ("2026-10-14T08:00:00Z", 40), ("2026-10-18T23:59:00Z", 50),  # Sunday, same week
+    ("2026-10-19T00:01:00Z", 60),  # next Monday
+]
+
+
+@pytest.fixture
+def series(conn):
+    for ts, mastery in POINTS:
+        record_mastery(conn, "u1", "linear_equations", mastery, ts=ts)
+    record_mastery(conn, "u1", "fractions", 99, ts="2026-10-12T09:00:00Z")
+    record_mastery(conn, "u2", "linear_equations", 99, ts="2026-10-12T09:00:00Z")
+    return conn
+
+
+def test_mastery_writes_record_points(any_layout):
+    save_memory(any_layout, "u1", {})
+    set_path(any_layout, "u1", "topic_mastery.linear_equations", 40)
+    apply_updates(any_layout, "u1", [("set", "topic_mastery", {"linear_equations": 55, "fractions": 10}),
+                                     ("set", "topic_mastery_note", 1)])
+    assert [p["mastery"] for p in mastery_series(any_layout, "u1")] == [40, 55]
+    assert [p["mastery"] for p in mastery_series(any_layout, "u1", "fractions")] == [10]
+
+
+def test_raw_points_are_per_learner_and_topic_oldest_first(series):
+    assert mastery_series(series, "u1") == [{"timestamp": ts, "mastery": m, "samples": 1} for ts, m in POINTS]
+
+
+def test_range_bounds_are_inclusive(series):
+    points = mastery_series(series, "u1", since="2026-10-12T15:00:00Z", until="2026-10-18T23:59:00Z")
+    assert [p["mastery"] for p in points] == [30, 40, 50]
+
+
+def test_hour_and_day_buckets_average_their_points(series):
+    hours = mastery_series(series, "u1", bucket="hour")
+    assert hours[0] == {"timestamp": "2026-10-12T09:00:00Z", "mastery": 15.0, "samples": 2}
+    assert len(hours) == 5
+    days = mastery_series(series, "u1", bucket="day")
+    assert [(d["timestamp"], d["mastery"], d["samples"]) for d in days] == [
+        ("2026-10-12", 20.0, 3), ("2026-10-14", 40.0, 1), ("2026-10-18", 50.0, 1), ("2026-10-19", 60.0, 1)]
+
+
+def test_weeks_start_on_monday(series):
+    weeks = mastery_series(series, "u1", bucket="week")
+    assert [(w["timestamp"], w["mastery"], w["samples"]) for w in weeks] == [
+        ("2026-10-12", 30.0, 5), ("2026-10-19", 60.0, 1)]
+
+
+def test_auto_bucket_depends_on_the_span(series):
+    assert mastery_series(series, "u1", bucket="auto") == mastery_series(series, "u1", bucket="day")
+    short = mastery_series(series, "u1", until="2026-10-14T08:00:00Z", bucket="auto")
+    assert [p["samples"] for p in short] == [1, 1, 1, 1]
+    assert mastery_series(series, "nobody", bucket="auto") == []
+
+
+def test_unknown_bucket_is_rejected(series):
+    with pytest.raises(ValueError):
+        mastery_series(series, "u1", bucket="month")
@@ -0,0 +1,91 @@
+# tests/test_memory_cache.py
+"""The decoded-memory cache: hits, isolation from callers' mutations, revalidation."""
+import sqlite3
+
+import pytest
+
+from tools import persistence
+from tools.persistence import (
+    LazyMemory, disable_write_behind, enable_write_behind, flush, get_path, init_db, load_memory, save_memory,
+)
+
+
+@pytest.fixture(params=["sync", "write_behind"])
+def mode_conn(request, db_path):
+    conn = init_db(db_path)
+    if request.param == "write_behind":
+        enable_write_behind(conn)
+    yield conn
+    if request.param == "write_behind":
+        disable_write_behind(conn)
+    conn.close()
+
+
+def stored(db_path, user_id):
+    flush()
+    other = sqlite3.connect(db_path)
+    row = other.execute("SELECT data FROM memory WHERE user_id=?", (user_id,)).fetchone()
+    other.close()
+    return persistence.decode_memory(row[0])
+
+
+def test_mutating_a_saved_dict_does_not_change_later_loads(mode_conn, db_path):
+    memory = {"topic_mastery": {"linear_equations": 10}}
+    save_memory(mode_conn, "u1", memory)
+    memory["topic_mastery"]["linear_equations"] = 99  # never saved
+
+    assert load_memory(mode_conn, "u1")["topic_mastery"]["linear_equations"] == 10
+    assert get_path(mode_conn, "u1", "topic_mastery.linear_equations") == 10
+    assert stored(db_path, "u1")["topic_mastery"]["linear_equations"] == 10
+
+
+def test_mutating_a_loaded_dict_does_not_change_later_loads(mode_conn):
+    save_memory(mode_conn, "u1", {"topic_mastery": {"linear_equations": 10}, "quizzes": []})
+    first = load_memory(mode_conn, "u1")
+    first["junk"] = True
+    first["quizzes"].append({"answers": None})
+    first["topic_mastery"]["linear_equations"] = 99
+
+    again = load_memory(mode_conn, "u1")
+    assert again == {"topic_mastery": {"linear_equations": 10}, "quizzes": []}
+    assert again is not first
+    mastery = get_path(mode_conn, "u1", "topic_mastery")
+    mastery["linear_equations"] = 0
+    assert get_path(mode_conn, "u1", "topic_mastery.linear_equations") == 10
+
+
+def test_repeated_loads_are_served_from_the_cache(conn):
+    save_memory(conn, "u1", {"name": "A"})
+    before = persistence.cache_stats()["hits"]
+    for _ in range(3):
+        assert load_memory(conn, "u1") == {"name": "A"}
+    assert persistence.cache_stats()["hits"] - before == 3
+
+
+def test_revalidation_picks_up_another_process_write(conn, db_path, monkeypatch):
+    save_memory(conn, "u1", {"name": "A"})
+    load_memory(conn, "u1")
+    other = sqlite3.connect(db_path)
+    other.execute("UPDATE memory SET data='{\"name\": \"B\"}', updated_at='2099-01-01' WHERE user_id='u1'")
+    other.commit()
+    other.close()
+    monkeypatch.setattr(persistence.memory_cache, "revalidate_after", 0.0)
+    assert load_memory(conn, "u1") == {"name": "B"}
+
+
+def test_cached_lazy_memory_stays_lazy_and_private(tmp_path):
+    conn = init_db(str(tmp_path / "n.db"), normalized=True)
+    save_memory(conn, "u1", {"name": "A", "quizzes": [{"answers": None}] * 3})
+    persistence.memory_cache.clear()
+    load_memory(conn, "u1")  # fills the cache from the database
+
+    hit = load_memory(conn, "u1")
+    assert isinstance(hit, LazyMemory)
+    assert dict.get(hit, "quizzes") is persistence._PENDING
+    hit["quizzes"].append({"answers": {"score_percent": 50}})
+    assert len(load_memory(conn, "u1")["quizzes"]) == 3
+
+    save_memory(conn, "u1", hit)  # only the new entry is written
+    assert conn.execute("SELECT COUNT(*) FROM quizzes WHERE user_id='u1'").fetchone()[0] == 4
+    assert load_memory(conn, "u1")["quizzes"][-1] == {"answers": {"score_percent": 50}}
+    conn.close()
@@ -0,0 +1,68 @@
+# tests/test_normalized.py
+"""Normalized layout: same documents as the blob layout, migration, and the cached layout check."""
+from tools.persistence import (
+    ConnectionPool, append_to, init_db, is_normalized, load_memory, migrate_to_normalized, save_memory,
+)
+
+MEMORY = {
+    "name": "A",
+    "topic_mastery": {"linear_equations": 40},
+    "preferences": {"learning_style": "visual"},
+    "diagnostics": [{"score_percent": 33}],
+    "lessons": [{"topic": "linear_equations"}],
+    "quizzes": [{"quiz_meta": {}, "answers": {"score_percent": 66}}, {"quiz_meta": {}, "answers": None}],
+    "feedbacks": [],
+    "last_quiz": {"quiz_meta": {}, "answers": None},
+}
+
+
+def test_documents_round_trip_in_both_layouts(any_layout):
+    save_memory(any_layout, "u1", MEMORY)
+    assert load_memory(any_layout, "u1") == MEMORY
+    append_to(any_layout, "u1", "diagnostics", {"score_percent": 100})
+    assert load_memory(any_layout, "u1")["diagnostics"] == MEMORY["diagnostics"] + [{"score_percent": 100}]
+
+
+def test_history_is_stored_one_row_per_entry(tmp_path):
+    conn = init_db(str(tmp_path / "n.db"), normalized=True)
+    save_memory(conn, "u1", MEMORY)
+    assert conn.execute("SELECT COUNT(*) FROM quizzes WHERE user_id='u1'").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM memory").fetchone()[0] == 0
+    conn.close()
+
+
+def test_migration_moves_blobs_and_switches_the_layout(tmp_path):
+    conn = init_db(str(tmp_path / "m.db"))
+    save_memory(conn, "u1", MEMORY)
+    assert not is_normalized(conn)
+
+    assert migrate_to_normalized(conn) == 1
+    assert is_normalized(conn)
+    assert load_memory(conn, "u1") == MEMORY
+    assert migrate_to_normalized(conn) == 0
+    conn.close()
+
+
+def test_layout_check_does_not_query_the_schema_per_call(tmp_path):
+    conn = init_db(str(tmp_path / "t.db"), normalized=True)
+    save_memory(conn, "u1", MEMORY)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    for _ in range(3):
+        save_memory(conn, "u1", MEMORY)
+        load_memory(conn, "u1")
+    assert not [s for s in statements if "sqlite_master" in s]
+    conn.close()
+
+
+def test_reopening_a_migrated_pool_sees_the_new_layout(tmp_path):
+    path = str(tmp_path / "p.db")
+    pool = ConnectionPool(path, size=2)
+    save_memory(pool, "u1", MEMORY)
+    assert not is_normalized(pool)
+    pool.close()
+
+    pool = ConnectionPool(path, size=2, normalized=True)
+    assert is_normalized(pool)
+    assert load_memory(pool, "u1") == MEMORY
+    pool.close()
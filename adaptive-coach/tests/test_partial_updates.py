@@ -0,0 +1,73 @@
+# tests/test_partial_updates.py
+"""JSON1 partial updates and path reads, on both layouts."""
+import os
+import sys
+
+import pytest
+
+from tools import persistence
+from tools.persistence import append_to, apply_updates, get_path, load_memory, save_memory, set_path
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app")
+
+
+def test_set_creates_missing_objects_and_the_learner(any_layout):
+    set_path(any_layout, "new", "topic_mastery.linear_equations", 40)
+    set_path(any_layout, "new", "preferences", {"learning_style": "visual"})
+    assert load_memory(any_layout, "new") == {
+        "topic_mastery": {"linear_equations": 40}, "preferences": {"learning_style": "visual"}}
+
+
+def test_append_and_amend_the_newest_history_entry(any_layout):
+    save_memory(any_layout, "u1", {"quizzes": [{"quiz_meta": {"n": 0}, "answers": None}]})
+    apply_updates(any_layout, "u1", [
+        ("append", "quizzes", {"quiz_meta": {"n": 1}, "answers": None}),
+        ("set", "last_quiz", {"quiz_meta": {"n": 1}, "answers": None}),
+    ])
+    apply_updates(any_layout, "u1", [
+        ("set", "quizzes[-1].answers", {"score_percent": 66}),
+        ("set", "last_quiz.answers", {"score_percent": 66}),
+    ])
+    memory = load_memory(any_layout, "u1")
+    assert memory["quizzes"] == [{"quiz_meta": {"n": 0}, "answers": None},
+                                 {"quiz_meta": {"n": 1}, "answers": {"score_percent": 66}}]
+    assert memory["last_quiz"]["answers"] == {"score_percent": 66}
+
+
+def test_append_creates_the_list(any_layout):
+    append_to(any_layout, "u1", "feedbacks", {"quiz_score": 10})
+    append_to(any_layout, "u1", "feedbacks", {"quiz_score": 20})
+    assert load_memory(any_layout, "u1")["feedbacks"] == [{"quiz_score": 10}, {"quiz_score": 20}]
+
+
+def test_get_path_reads_from_the_database(any_layout):
+    save_memory(any_layout, "u1", {"diagnostics": [{"score_percent": s} for s in (10, 20, 30)],
+                                   "topic_mastery": {"linear_equations": 55}, "flag": False})
+    persistence.memory_cache.clear()
+    assert get_path(any_layout, "u1", "diagnostics[-1]") == {"score_percent": 30}
+    assert get_path(any_layout, "u1", "diagnostics[0].score_percent") == 10
+    assert get_path(any_layout, "u1", "$.topic_mastery.linear_equations") == 55
+    assert get_path(any_layout, "u1", "flag") is False
+    assert get_path(any_layout, "u1", "missing.key", "default") == "default"
+    assert get_path(any_layout, "nobody", "diagnostics[-1]") is None
+
+
+def test_one_transaction_per_batch_of_updates(any_layout):
+    save_memory(any_layout, "u1", {"n": 1})
+    with pytest.raises(ValueError):
+        apply_updates(any_layout, "u1", [("set", "n", 2), ("remove", "n", None)])
+    assert load_memory(any_layout, "u1") == {"n": 1}
+
+
+def test_lesson_planning_reads_only_the_latest_diagnostic(conn):
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import api
+
+    save_memory(conn, "u1", {"diagnostics": [{"score_percent": s} for s in range(50)]})
+    persistence.memory_cache.clear()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert api._latest_diagnostics(conn, "u1") == [{"score_percent": 49}]
+    assert any("json_extract" in s for s in statements)
+    assert api._latest_diagnostics(conn, "nobody") == []
@@ -0,0 +1,88 @@
+# tests/test_problem_bank.py
+"""Problem bank: feature tags, feature queries (count / sample / sample_many) and the bank file."""
+import os
+import random
+from fractions import Fraction
+
+import pytest
+
+from tools.problem_bank import FEATURES, ProblemBank, enumerate_problems, feature_mask, make_problem
+
+RANGES = {"coefficients": (1, 2, 3), "constants": tuple(range(-3, 4)), "max_solution": 4, "denominators": (2,)}
+
+
+@pytest.fixture
+def bank():
+    return ProblemBank("", **RANGES)  # in memory
+
+
+def brute_force(**features):
+    """(a, b, c) of every problem with the given features, from the enumeration itself."""
+    def matches(a, b, c):
+        names = make_problem(a, b, c)["features"]
+        return all((name in names) == wanted for name, wanted in features.items() if wanted is not None)
+    return [p for p in enumerate_problems(**RANGES) if matches(*p)]
+
+
+def test_make_problem_tags_and_solves():
+    problem = make_problem(2, -3, 4)
+    assert problem["equation_str"] == "2*x + (-3) = 4"
+    assert problem["solution"] == 3.5
+    assert problem["features"] == ["negative_constant", "non_unit_coefficient", "fractional_solution"]
+    assert make_problem(1, 2, -1)["features"] == ["negative_solution"]
+    assert feature_mask(1, 0, Fraction(1)) == 0
+    with pytest.raises(ValueError):
+        make_problem(0, 1, 2)
+
+
+@pytest.mark.parametrize("features", [
+    {}, {"negative_constant": True}, {"fractional_solution": False},
+    {"non_unit_coefficient": True, "negative_solution": True, "negative_constant": False},
+    {name: True for name in FEATURES}, {"fractional_solution": None},
+])
+def test_count_matches_the_enumeration(bank, features):
+    assert bank.count(**features) == len(brute_force(**features))
+
+
+def test_samples_have_the_requested_features(bank):
+    rng = random.Random(3)
+    for _ in range(50):
+        problem = bank.sample(rng, negative_constant=True, fractional_solution=False)
+        assert "negative_constant" in problem["features"] and "fractional_solution" not in problem["features"]
+        a, b, c = problem["coefficients"]
+        assert a * problem["solution"] + b == c
+        assert problem == make_problem(a, b, c)
+
+
+def test_sample_many_is_distinct_and_honours_exclude(bank):
+    everything = [make_problem(*p)["equation_str"] for p in brute_force(negative_solution=True, negative_constant=True,
+                                                                         non_unit_coefficient=False)]
+    assert len(everything) > 3
+    exclude = everything[:2]
+    picked = bank.sample_many(len(everything), random.Random(1), exclude=exclude, negative_solution=True,
+                              negative_constant=True, non_unit_coefficient=False)
+    equations = [p["equation_str"] for p in picked]
+    assert len(set(equations)) == len(equations)
+    assert not set(equations) & set(exclude)
+    assert set(equations) <= set(everything)
+
+
+def test_unknown_or_unmatched_features_are_errors(bank):
+    with pytest.raises(ValueError):
+        bank.count(hard=True)
+    # with a = 1 the solution c - b is always a whole number
+    with pytest.raises(ValueError):
+        bank.sample(fractional_solution=True, non_unit_coefficient=False)
+
+
+def test_the_bank_file_is_reused_until_its_ranges_change(tmp_path):
+    path = str(tmp_path / "bank.db")
+    first = ProblemBank(path, **RANGES)
+    total = first.count()
+    built = os.stat(path).st_mtime_ns
+    assert ProblemBank(path, **RANGES).count() == total
+    assert os.stat(path).st_mtime_ns == built
+    wider = ProblemBank(path, **dict(RANGES, coefficients=(1, 2, 3, 4)))
+    assert wider.count() > total
+    assert ProblemBank(path, **RANGES).count() == total  # rebuilt back
+    assert first.stats()["problems"] == total
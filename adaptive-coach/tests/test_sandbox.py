@@ -0,0 +1,93 @@
+# tests/test_sandbox.py
+"""
+Sandboxed grading: hostile answers come back as structured "rejected"/"timeout"/"error"
+results, ordinary ones grade exactly like grade_answer, workers are memory-capped and recycled.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from tools.code_executor import grade_answer
+from tools.sandbox import (
+    STATUS_ERROR, STATUS_OK, STATUS_REJECTED, STATUS_TIMEOUT, SandboxPool, configure_sandbox,
+    grade_answer_safe, parse_answer_safe, precheck,
+)
+
+EXPECTED = "2*x + 3 = 11"
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+@pytest.fixture
+def sandbox():
+    yield configure_sandbox(workers=1, timeout=2.0)
+    configure_sandbox()
+
+
+@pytest.mark.parametrize("answer", ["9**9**9", "(" * 8 + "1" + ")" * 8, "x.__class__", "9" * 200, "__import__('os')"])
+def test_hostile_answers_are_rejected_before_evaluation(answer, sandbox):
+    result = grade_answer_safe(EXPECTED, answer)
+    assert (result["status"], result["correct"], result["user"], result["expected"]) == (
+        STATUS_REJECTED, False, None, 4.0)
+    assert result["explanation"].startswith("Answer not graded")
+    assert sandbox.stats()["calls"] == 0
+
+
+def test_a_runaway_answer_times_out_and_its_worker_is_replaced(sandbox):
+    result = grade_answer_safe(EXPECTED, "factorial(9999999)")
+    assert (result["status"], result["correct"], result["expected"]) == (STATUS_TIMEOUT, False, 4.0)
+    assert sandbox.stats()["timeouts"] == 1
+    # the replacement worker grades the next answer
+    assert grade_answer_safe(EXPECTED, "sqrt(16)")["correct"]
+    assert parse_answer_safe("factorial(9999998)") is None
+
+
+@pytest.mark.parametrize("answer", ["4", "x = 4", " X=4 ", "4.0000001", "-3", "1/2", "sqrt(16)", "2^2", "pi",
+                                    "abc", "", "4,", "Rational(8, 2)"])
+def test_ordinary_answers_grade_like_grade_answer(answer, sandbox):
+    result = grade_answer_safe(EXPECTED, answer)
+    assert result.pop("status") == STATUS_OK
+    assert result == grade_answer(EXPECTED, answer)
+
+
+def test_a_crashed_worker_is_an_error_result(sandbox):
+    worker = sandbox._idle[0]
+    worker.process.kill()
+    worker.process.join()
+    result = grade_answer_safe(EXPECTED, "sqrt(25)")
+    assert (result["status"], result["correct"]) == (STATUS_ERROR, False)
+    assert grade_answer_safe(EXPECTED, "sqrt(25)")["status"] == STATUS_OK  # not cached as unparseable
+
+
+def test_workers_are_recycled_after_max_tasks():
+    pool = SandboxPool(workers=1, timeout=5.0, max_tasks=3)
+    pids = []
+    for i in range(7):
+        pids.append(pool._idle[0].process.pid)
+        assert pool.run("number", f"sqrt({i * i})") == i
+    pool.close()
+    assert pool.stats()["recycled"] == 2
+    assert len(set(pids)) == 3 and pids[:3] == [pids[0]] * 3
+
+
+def test_workers_cannot_grow_past_their_memory_cap():
+    pytest.importorskip("resource")
+    script = textwrap.dedent("""
+        from tools.sandbox import _limit_memory
+        _limit_memory(64)
+        try:
+            block = bytearray(512 * 2 ** 20)
+        except MemoryError:
+            print("capped")
+    """)
+    out = subprocess.run([sys.executable, "-c", script], cwd=SRC_DIR, capture_output=True, text=True, timeout=60)
+    assert out.stdout.strip() == "capped", out.stderr
+
+
+def test_precheck_reasons():
+    assert precheck("4") is None and precheck("x = 2.5") is None and precheck(None) is None
+    assert precheck("2**3**4") == "more than 1 power(s)"
+    assert precheck("1" * 31) == "number too large"
+    assert precheck("1e9999") == "number too large"
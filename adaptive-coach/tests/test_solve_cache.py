@@ -0,0 +1,81 @@
+# tests/test_solve_cache.py
+"""SolveCache: LRU eviction, cached None results, the shared SQLite file, and solve_for_x keys."""
+import pytest
+
+from tools import code_executor
+from tools.code_executor import SolveCache, configure_solve_cache, solve_cache_stats, solve_for_x
+
+
+class Counter:
+    def __init__(self, result=lambda text: float(len(text))):
+        self.calls = []
+        self.result = result
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return self.result(text)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache, compute = SolveCache(max_entries=2, path=None), Counter()
+    cache.lookup("solve", "a", compute)
+    cache.lookup("solve", "bb", compute)
+    assert cache.lookup("solve", "a", compute) == 1.0  # "a" is now the most recent
+    cache.lookup("solve", "ccc", compute)  # evicts "bb"
+    cache.lookup("solve", "a", compute)
+    cache.lookup("solve", "bb", compute)
+    assert compute.calls == ["a", "bb", "ccc", "bb"]
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 4, 2)
+
+
+def test_none_results_and_kinds_are_cached_separately():
+    cache, compute = SolveCache(max_entries=8, path=None), Counter(lambda text: None)
+    assert cache.lookup("solve", "x", compute) is None
+    assert cache.lookup("solve", "x", compute) is None
+    assert cache.lookup("number", "x", compute) is None
+    assert compute.calls == ["x", "x"]
+
+
+def test_zero_entries_disables_the_lru():
+    cache, compute = SolveCache(max_entries=0, path=None), Counter()
+    cache.lookup("solve", "a", compute)
+    cache.lookup("solve", "a", compute)
+    assert compute.calls == ["a", "a"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_the_disk_cache_is_shared_and_outlives_the_process_cache(tmp_path):
+    path = str(tmp_path / "solve_cache.db")
+    first, compute = SolveCache(max_entries=8, path=path), Counter()
+    first.lookup("solve", "2*x+3=11", compute)
+    first.lookup("solve", "none", Counter(lambda text: None))
+    first.clear()
+    assert first.lookup("solve", "2*x+3=11", compute) == 8.0
+    assert first.stats()["disk_hits"] == 1
+
+    second = SolveCache(max_entries=8, path=path)  # e.g. another worker process
+    assert second.lookup("solve", "2*x+3=11", compute) == 8.0
+    assert second.lookup("solve", "none", compute) is None
+    assert compute.calls == ["2*x+3=11"]
+    assert second.stats()["hit_rate"] == 1.0
+
+
+def test_disk_errors_fall_back_to_computing(tmp_path):
+    cache, compute = SolveCache(max_entries=8, path=str(tmp_path)), Counter()  # a directory: unopenable
+    assert cache.lookup("solve", "a", compute) == 1.0
+    assert cache.stats()["disk_errors"] == 2  # the read and the write
+
+
+@pytest.fixture
+def shared_cache():
+    yield configure_solve_cache(max_entries=16, path=None)
+    configure_solve_cache()
+
+
+def test_solve_for_x_ignores_spacing_and_case_in_its_key(shared_cache):
+    assert solve_for_x("2*x + 3 = 11") == 4.0
+    assert solve_for_x("2*X+3=11") == 4.0
+    stats = solve_cache_stats()
+    assert (stats["computed"], stats["hits"]) == (1, 1)
+    assert code_executor.solve_cache is shared_cache
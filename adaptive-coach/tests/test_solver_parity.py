@@ -0,0 +1,108 @@
+# tests/test_solver_parity.py
+"""
+The exact linear fast path (parse_linear / solve_linear) against the sympy path, on a seeded
+corpus of equations in the shapes the app produces or a learner might type.
+bench/parity_solver.py runs a larger corpus the same way.
+"""
+import math
+import random
+from fractions import Fraction
+
+import pytest
+import sympy as sp
+
+from tools import code_executor
+from tools.code_executor import _solve_for_x_sympy, grade_answer, parse_linear, solve_for_x, solve_linear
+
+SEED, CASES = 1234, 150
+x = sp.Symbol("x")
+
+
+def number(rng):
+    return rng.choice([
+        str(rng.randint(-20, 20)), f"{rng.uniform(-20, 20):.{rng.randint(1, 3)}f}",
+        rng.choice(["0.5", ".25", "2.", "1e2", "2.5E-1", "0"]), f"({rng.randint(-9, 9)}/{rng.randint(1, 9)})",
+    ])
+
+
+def side(rng):
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        n = number(rng)
+        if rng.random() < 0.3:
+            parts.append(n)
+        elif n[0] in "-(" or n.endswith("."):
+            parts.append(f"{n}*x")  # implicit multiplication only follows a digit
+        else:
+            parts.append(rng.choice([f"{n}*x", f"{n}x", f"{n} x", f"{n}*X"]))
+    text = parts[0] + "".join(rng.choice([" + ", " - ", "-"]) + p for p in parts[1:])
+    shape = rng.random()
+    if shape < 0.15:
+        return f"{number(rng)}*({text})"
+    if shape < 0.3:
+        return f"({text})/{rng.choice(['2', '3', '-4', '0.5'])}"
+    return text
+
+
+def corpus():
+    rng = random.Random(SEED)
+    equations = [f"{side(rng)} = {side(rng) if rng.random() < 0.3 else number(rng)}" for _ in range(CASES)]
+    same = side(rng)
+    return equations + [f"{same} = {same}", f"{same} = {same} + 1"]
+
+
+def close(a, b):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+
+
+@pytest.fixture
+def uncached():
+    # compare computations, not memoized results
+    code_executor.configure_solve_cache(max_entries=0, path=None)
+    yield
+    code_executor.FAST_PATH = True
+    code_executor.configure_solve_cache()
+
+
+@pytest.mark.parametrize("equation", corpus())
+def test_solve_linear_matches_sympy(equation):
+    exact = solve_linear(equation)
+    assert close(None if exact is None else float(exact), _solve_for_x_sympy(equation))
+
+
+def test_parse_linear_gives_sympys_coefficients():
+    rng = random.Random(SEED)
+    for _ in range(CASES):
+        text = side(rng)
+        a, b = parse_linear(text.replace(" ", "").replace("X", "x"))
+        expr = sp.expand(sp.sympify(code_executor._IMPLICIT_MUL.sub(r"\g<num>*\g<var>",
+                                                                   text.replace(" ", "").replace("X", "x"))))
+        assert isinstance(a, Fraction) and isinstance(b, Fraction)
+        assert close(float(a), float(expr.coeff(x, 1))) and close(float(b), float(expr.coeff(x, 0))), text
+
+
+@pytest.mark.parametrize("expr", [
+    "x**2", "x^2", "x*x", "1/x", "y + 1", "2(x+1)", "007x", "x2", "2*x +", "sqrt(x)", "x/0", "1e401*x", "((x)", "",
+])
+def test_inputs_outside_the_grammar_are_refused(expr):
+    with pytest.raises(ValueError):
+        parse_linear(expr)
+
+
+def test_solve_and_grade_agree_with_fast_path_on_and_off(uncached):
+    rng = random.Random(SEED + 1)
+    equations = corpus()[:40] + ["x**2 = 4", "2/x = 2", "y + 1 = 3", "x = 1 = 2", "2*x + 3", "007x = 14"]
+    for eq in equations:
+        code_executor.FAST_PATH = False
+        slow = solve_for_x(eq)
+        answers = [number(rng), "x=4", "abc", "", "1/3", "007"] + ([str(slow), f"x = {slow}"] if slow is not None else [])
+        slow_grades = [grade_answer(eq, a) for a in answers]
+        code_executor.FAST_PATH = True
+        assert close(solve_for_x(eq), slow), eq
+        for answer, slow_grade in zip(answers, slow_grades):
+            fast_grade = grade_answer(eq, answer)
+            assert fast_grade["correct"] == slow_grade["correct"], (eq, answer)
+            assert close(fast_grade["expected"], slow_grade["expected"]), (eq, answer)
+            assert close(fast_grade["user"], slow_grade["user"]), (eq, answer)
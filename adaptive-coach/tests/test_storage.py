@@ -0,0 +1,85 @@
+# tests/test_storage.py
+"""Storage backends: spec parsing, jump-hash shard routing and rebalancing between layouts."""
+import pytest
+
+from tools.persistence import (
+    ConnectionPool, ShardedStore, get_path, load_memory, mastery_series, save_memory, set_path, shard_index,
+)
+from tools.storage import StorageConfig, open_storage, rebalance
+
+USERS = [f"learner-{i}" for i in range(400)]
+
+
+def test_spec_parsing():
+    config = StorageConfig.parse("sharded:/tmp/shards?shards=8&pool=2&normalized=1")
+    assert (config.backend, config.path, config.shards, config.pool_size, config.normalized) == (
+        "sharded", "/tmp/shards", 8, 2, True)
+    assert StorageConfig.parse(":memory:").backend == "memory"
+    assert StorageConfig.parse("C:/data/memory.db").backend == "sqlite"
+    with pytest.raises(ValueError):
+        StorageConfig(backend="redis")
+    with pytest.raises(ValueError):
+        StorageConfig(backend="sharded", shards=0)
+
+
+def test_shard_index_is_stable_and_in_range():
+    # pinned: a change of hash would strand every stored learner on the wrong shard
+    assert [shard_index(u, 8) for u in ("u0", "alice", "student_test_01")] == [5, 5, 0]
+    assert all(shard_index(u, 1) == 0 for u in USERS)
+    assert {shard_index(u, 8) for u in USERS} == set(range(8))
+
+
+def test_growing_moves_only_learners_bound_for_new_shards():
+    moved = [u for u in USERS if shard_index(u, 4) != shard_index(u, 8)]
+    assert all(shard_index(u, 8) >= 4 for u in moved)
+    # about (8 - 4) / 8 of the learners
+    assert 0.4 < len(moved) / len(USERS) < 0.6
+
+
+def memory(user_id):
+    return {"name": user_id, "quizzes": [{"answers": None}], "topic_mastery": {"linear_equations": len(user_id)}}
+
+
+@pytest.mark.parametrize("normalized", [False, True], ids=["blob", "normalized"])
+def test_rebalance_from_four_to_eight_shards(tmp_path, normalized):
+    flag = "&normalized=1" if normalized else ""
+    src = open_storage(f"sharded:{tmp_path / 'shards'}?shards=4{flag}")
+    for u in USERS[:60]:
+        save_memory(src, u, {"name": u, "quizzes": [{"answers": None}]})
+        set_path(src, u, "topic_mastery.linear_equations", len(u))  # also a mastery_history row
+    dst = open_storage(f"sharded:{tmp_path / 'shards'}?shards=8{flag}")
+
+    plan = rebalance(src, dst, dry_run=True)
+    assert plan["moved"] == sum(shard_index(u, 4) != shard_index(u, 8) for u in USERS[:60])
+    assert plan["moved"] + plan["kept"] == 60
+    report = rebalance(src, dst)
+    assert report["moved"] == plan["moved"]
+    assert rebalance(src, dst)["moved"] == 0  # already in place
+
+    for u in USERS[:60]:
+        assert load_memory(dst, u) == memory(u)
+        assert [p["mastery"] for p in mastery_series(dst, u)] == [len(u)]
+    src.close()
+    dst.close()
+
+
+def test_rebalance_one_file_into_shards(tmp_path):
+    src = ConnectionPool(str(tmp_path / "memory.db"), size=2)
+    for u in USERS[:30]:
+        save_memory(src, u, memory(u))
+    dst = ShardedStore([ConnectionPool(str(tmp_path / f"s{i}.db"), size=2) for i in range(3)])
+    assert rebalance(src, dst)["moved"] == 30
+    with src.reader() as c:
+        assert c.execute("SELECT COUNT(*) FROM memory").fetchone()[0] == 0
+    assert all(get_path(dst, u, "name") == u for u in USERS[:30])
+    src.close()
+    dst.close()
+
+
+def test_rebalance_refuses_mixed_layouts(tmp_path):
+    src = ConnectionPool(str(tmp_path / "a.db"), size=1)
+    dst = ConnectionPool(str(tmp_path / "b.db"), size=1, normalized=True)
+    with pytest.raises(ValueError):
+        rebalance(src, dst)
+    src.close()
+    dst.close()
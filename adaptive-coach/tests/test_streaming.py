@@ -0,0 +1,101 @@
+# tests/test_streaming.py
+"""plan_stream / provide_feedback_stream: section order, streamed LLM text, and what gets saved."""
+import pytest
+
+from agents.feedback_agent import FeedbackAgent
+from agents.lesson_agent import LessonAgent, configure_lesson_cache
+from tools import persistence
+from tools.llm import LLMExecutor, StubBackend
+from tools.persistence import load_memory
+
+DIAGNOSTICS = [{"score_percent": 40}]
+QUIZ = {
+    "score_percent": 33,
+    "per_question": [
+        {"q_index": 0, "question": "Solve for x: 2*x + 3 = 11", "expected": 4.0, "user_answer_raw": "4",
+         "user_answer_parsed": 4.0, "correct": True},
+        {"q_index": 1, "question": "Solve for x: 9*x + 0 = 36", "expected": 4.0, "user_answer_raw": "1",
+         "user_answer_parsed": 1.0, "correct": False},
+        {"q_index": 2, "question": "Solve for x: 7*x + 12 = 26", "expected": 2.0, "user_answer_raw": "",
+         "user_answer_parsed": None, "correct": False},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def lesson_cache():
+    yield configure_lesson_cache(max_entries=8, ttl=60)
+    configure_lesson_cache()
+
+
+@pytest.fixture
+def llm():
+    executor = LLMExecutor(StubBackend(latency_ms=0))
+    yield executor
+    executor.close()
+
+
+def saved(conn, user_id, key):
+    persistence.memory_cache.clear()
+    return load_memory(conn, user_id)[key]
+
+
+def test_lesson_sections_come_in_order_and_the_lesson_is_saved_once(conn):
+    sections = list(LessonAgent(conn).plan_stream("u1", DIAGNOSTICS))
+    names = [s["section"] for s in sections]
+    steps = names.count("example_step")
+    assert steps > 0
+    assert names == ["overview", "explanation", "worked_example"] + ["example_step"] * steps + ["practice", "done"]
+
+    lesson = sections[-1]["lesson"]
+    assert [s["index"] for s in sections if s["section"] == "example_step"] == list(range(steps))
+    assert [s["text"] for s in sections if s["section"] == "example_step"] == lesson["worked_example"]["steps"]
+    assert sections[0]["difficulty"] == lesson["difficulty"] and sections[1]["text"] == lesson["short_explanation"]
+    assert sections[2]["equation_str"] == lesson["worked_example"]["equation_str"]
+    assert set(lesson) == set(LessonAgent(conn).plan("u2", DIAGNOSTICS))
+    assert saved(conn, "u1", "last_lesson")["created_at"] == lesson["created_at"]
+    assert len(saved(conn, "u1", "lessons")) == 1
+
+
+def test_lesson_expansion_is_streamed_then_served_from_the_template_cache(conn, llm):
+    agent = LessonAgent(conn, llm=llm)
+    first = list(agent.plan_stream("u1", DIAGNOSTICS))
+    tokens = [s["text"] for s in first if s["section"] == "llm_token"]
+    lesson = first[-1]["lesson"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == lesson["expanded_explanation"] == saved(conn, "u1", "last_lesson")["expanded_explanation"]
+    assert [s["section"] for s in first][-len(tokens) - 2:] == ["practice"] + ["llm_token"] * len(tokens) + ["done"]
+
+    again = [s["text"] for s in agent.plan_stream("u2", DIAGNOSTICS) if s["section"] == "llm_token"]
+    assert again == [lesson["expanded_explanation"]]
+
+
+def test_feedback_items_come_first_then_each_expansion_in_question_order(conn, llm):
+    sections = list(FeedbackAgent(conn, llm=llm).provide_feedback_stream("u1", QUIZ))
+    names = [s["section"] for s in sections]
+    assert names[:3] == ["item"] * 3 and names[-1] == "done"
+    assert set(names[3:-1]) == {"llm_token"}
+    assert [s["item"]["status"] for s in sections[:3]] == ["correct", "incorrect", "incorrect"]
+
+    token_order = [s["q_index"] for s in sections if s["section"] == "llm_token"]
+    assert token_order == sorted(token_order) and set(token_order) == {1, 2}
+    report = sections[-1]["report"]
+    for item in report["items"][1:]:
+        streamed = "".join(s["text"] for s in sections if s.get("q_index") == item["q_index"])
+        assert item["llm_expanded"] == streamed
+    assert "llm_expanded" not in report["items"][0]
+
+
+def test_the_streamed_report_matches_provide_feedback_and_is_saved(conn, llm):
+    report = list(FeedbackAgent(conn, llm=llm).provide_feedback_stream("u1", QUIZ))[-1]["report"]
+    blocking = FeedbackAgent(conn, llm=llm).provide_feedback("u2", QUIZ)
+    assert report["quiz_score"] == blocking["quiz_score"] == 33
+    assert report["items"] == blocking["items"]
+    assert saved(conn, "u1", "last_feedback") == report
+    assert saved(conn, "u1", "feedbacks") == [report]
+
+
+def test_feedback_without_an_llm_streams_only_items(conn):
+    sections = list(FeedbackAgent(conn).provide_feedback_stream("u1", QUIZ))
+    assert [s["section"] for s in sections] == ["item", "item", "item", "done"]
+    assert [s["item"] for s in sections[:3]] == sections[-1]["report"]["items"]
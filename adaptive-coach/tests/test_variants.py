@@ -0,0 +1,111 @@
+# tests/test_variants.py
+"""equation_variants: every kept variant satisfies the constraints; parse_equation / render round trip."""
+import random
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from tools.problem_bank import BANK_DENOMINATORS, BANK_MAX_SOLUTION, make_problem
+from tools.variants import equation_variants, parse_equation, render
+
+
+def bases(n=60, seed=5):
+    rng = random.Random(seed)
+    out = []
+    while len(out) < n:
+        a, b, c = rng.choice([-4, -3, -2, -1, 1, 2, 3, 4, 5]), rng.randint(-6, 6), rng.randint(-10, 20)
+        if c != b:  # solution 0 has no variants of the same sign
+            out.append((a, b, c))
+    return out
+
+
+def variants(batch):
+    """(base index, a, b, c, solution) of every valid variant."""
+    a, b, c, x, valid = (batch[k].tolist() for k in ("a", "b", "c", "solution", "valid"))
+    return [(i, a[i][j], b[i][j], c[i][j], x[i][j])
+            for i in range(len(valid)) for j in range(len(valid[i])) if valid[i][j]]
+
+
+@pytest.fixture(scope="module")
+def base():
+    return bases()
+
+
+def solution(a, b, c):
+    return Fraction(c - b, a)
+
+
+def test_parse_equation():
+    assert parse_equation("2*x + 3 = 11") == (2, 3, 11)
+    assert parse_equation("5*x - 4 = 21") == (5, -4, 21)
+    assert parse_equation("3*x + (-4) = 8") == (3, -4, 8)
+    assert parse_equation("-x + 2 = 0") == (-1, 2, 0)
+    assert parse_equation("x = 7") == (1, 0, 7)
+    assert parse_equation("0*x + 1 = 2") is None
+    assert parse_equation("x**2 = 4") is None and parse_equation("") is None
+
+
+def test_a_zero_coefficient_is_rejected():
+    with pytest.raises(ValueError):
+        equation_variants([2, 0], [1, 1], [5, 5])
+
+
+def test_variants_keep_the_sign_of_a_and_solve_exactly(base):
+    a, b, c = zip(*base)
+    batch = equation_variants(a, b, c, n=3, rng=1)
+    assert batch["a"].shape == (len(base), 3)
+    kept = variants(batch)
+    assert len(kept) > 2 * len(base)
+    for i, va, vb, vc, x in kept:
+        assert va != 0 and (va > 0) == (base[i][0] > 0)
+        exact = solution(va, vb, vc)
+        assert exact.denominator == 1 and x == exact
+        assert 0 < abs(exact) <= BANK_MAX_SOLUTION
+
+
+def test_fractional_solutions_use_the_allowed_denominators(base):
+    a, b, c = zip(*base)
+    kept = variants(equation_variants(a, b, c, n=3, rng=2, integer_solution=False))
+    denominators = {solution(va, vb, vc).denominator for _, va, vb, vc, _ in kept}
+    assert denominators <= {1, *BANK_DENOMINATORS} and len(denominators) > 1
+    for _, va, vb, vc, x in kept:
+        assert x == float(solution(va, vb, vc))
+
+
+def test_integer_solution_can_be_chosen_per_base(base):
+    a, b, c = zip(*base)
+    integer = [i % 2 == 0 for i in range(len(base))]
+    for i, va, vb, vc, _ in variants(equation_variants(a, b, c, n=3, rng=3, integer_solution=integer)):
+        if integer[i]:
+            assert solution(va, vb, vc).denominator == 1
+
+
+def test_no_duplicates_and_never_the_base(base):
+    a, b, c = zip(*base)
+    batch = equation_variants(a, b, c, n=4, rng=4)
+    per_base = {}
+    for i, va, vb, vc, _ in variants(batch):
+        per_base.setdefault(i, []).append((va, vb, vc))
+    for i, triples in per_base.items():
+        assert len(set(triples)) == len(triples)
+        assert base[i] not in triples
+
+
+def test_same_features_keeps_the_difficulty_features(base):
+    a, b, c = zip(*base)
+    integer = [solution(*t).denominator == 1 for t in base]
+    kept = variants(equation_variants(a, b, c, n=2, rng=5, same_features=True, integer_solution=integer))
+    assert len(kept) > len(base)
+    for i, va, vb, vc, _ in kept:
+        assert make_problem(va, vb, vc)["features"] == make_problem(*base[i])["features"]
+
+
+def test_render_round_trips_and_the_seed_fixes_the_draw(base):
+    a, b, c = zip(*base)
+    batch = equation_variants(a, b, c, n=2, rng=6)
+    rendered = render(batch)
+    assert len(rendered) == len(base)
+    assert [parse_equation(eq) for eqs in rendered for eq in eqs] == [(va, vb, vc) for _, va, vb, vc, _ in variants(batch)]
+    again = equation_variants(a, b, c, n=2, rng=np.random.default_rng(6))
+    assert render(again) == rendered
@@ -0,0 +1,95 @@
+# tests/test_write_behind.py
+"""Write-behind mode: queued saves are visible at once, coalesced, and durable after flush."""
+import sqlite3
+import time
+
+import pytest
+
+from tools.persistence import (
+    ConnectionPool, apply_updates, disable_write_behind, enable_write_behind, flush, get_version, init_db,
+    load_memory, save_memory,
+)
+
+
+@pytest.fixture
+def wb_conn(db_path):
+    conn = init_db(db_path)
+    # a long interval: nothing commits until a flush or a full batch
+    writer = enable_write_behind(conn, interval=60.0, batch_size=50)
+    yield conn, writer
+    disable_write_behind(conn)
+    conn.close()
+
+
+def committed(db_path):
+    other = sqlite3.connect(db_path)
+    rows = dict(other.execute("SELECT user_id, data FROM memory").fetchall())
+    other.close()
+    return rows
+
+
+def test_queued_saves_are_read_back_before_they_commit(wb_conn, db_path):
+    conn, writer = wb_conn
+    save_memory(conn, "u1", {"n": 1})
+    assert committed(db_path) == {}
+    assert load_memory(conn, "u1") == {"n": 1}
+    assert writer.pending("u1") is not None
+
+    assert flush(conn)
+    assert committed(db_path) == {"u1": '{"n": 1}'}
+    assert writer.pending("u1") is None
+
+
+def test_saves_of_one_learner_coalesce_to_the_newest(wb_conn, db_path):
+    conn, writer = wb_conn
+    for n in range(10):
+        save_memory(conn, "u1", {"n": n})
+        save_memory(conn, "u2", {"n": -n})
+    flush(conn)
+    assert committed(db_path) == {"u1": '{"n": 9}', "u2": '{"n": -9}'}
+    stats = writer.stats()
+    assert (stats["saves"], stats["coalesced"], stats["rows_written"]) == (20, 18, 2)
+
+
+def test_full_batch_commits_without_a_flush(db_path):
+    conn = init_db(db_path)
+    writer = enable_write_behind(conn, interval=60.0, batch_size=5)
+    for u in range(5):
+        save_memory(conn, f"u{u}", {"n": u})
+    deadline = time.monotonic() + 5.0
+    while writer.stats()["batches"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(committed(db_path)) == 5
+    disable_write_behind(conn)
+    conn.close()
+
+
+def test_direct_writes_land_after_the_queued_save(wb_conn):
+    """A guarded or partial write first lands the learner's queued save, so order is kept."""
+    conn, _ = wb_conn
+    save_memory(conn, "u1", {"quizzes": [], "n": 1})
+    version = get_version(conn, "u1")  # flushes the queued save
+    apply_updates(conn, "u1", [("append", "quizzes", {"answers": None})], expected_version=version)
+    save_memory(conn, "u1", dict(load_memory(conn, "u1"), n=2))
+    flush(conn)
+    assert load_memory(conn, "u1") == {"quizzes": [{"answers": None}], "n": 2}
+
+
+def test_disable_flushes_and_makes_saves_synchronous(db_path):
+    conn = init_db(db_path)
+    enable_write_behind(conn, interval=60.0)
+    save_memory(conn, "u1", {"n": 1})
+    disable_write_behind(conn)
+    assert committed(db_path) == {"u1": '{"n": 1}'}
+    save_memory(conn, "u1", {"n": 2})
+    assert committed(db_path) == {"u1": '{"n": 2}'}
+    conn.close()
+
+
+def test_in_memory_and_pooled_normalized_databases_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        enable_write_behind(init_db(":memory:"))
+    pool = ConnectionPool(str(tmp_path / "n.db"), size=2, normalized=True)
+    with pytest.raises(ValueError):
+        enable_write_behind(pool)
+    pool.close()